@@ -1,17 +1,141 @@
 """
 title: Assistente Libri
 author: Carlo
-version: 1.0.0
-description: Strumento per analisi, riassunti e studio di libri e testi letterari
+version: 1.1.0
+description: Strumento per analisi, riassunti e studio di libri e testi letterari, con lettura a pagine di e-book locali
 """
 
+import sys
+from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import Optional
 
+# Protezione path traversal, API key e digest dei file (moduli nella root)
+_security_path = str(Path(__file__).parent.parent)
+if _security_path not in sys.path:
+    sys.path.insert(0, _security_path)
+from security import API_KEY, validate_path
+from content_store import content_digest
+
+# Requests per chiamate API
+try:
+    import requests
+    HAS_REQUESTS = True
+except ImportError:
+    HAS_REQUESTS = False
+
 
 class Tools:
+    class Valves(BaseModel):
+        """Configurazione del tool."""
+        DOCUMENT_SERVICE_URL: str = Field(
+            default="http://localhost:5557",
+            description="URL del Document Reader Service (lettura degli e-book)"
+        )
+        PAGE_CHARS: int = Field(
+            default=20000,
+            description="Caratteri per pagina quando si legge un libro"
+        )
+
     def __init__(self):
-        pass
+        self.valves = self.Valves()
+
+    def _book_request(self, file_path: str, **params) -> dict:
+        """
+        Chiede una pagina del libro al Document Reader Service.
+
+        Il libro viene inviato solo la prima volta: le pagine successive
+        usano la copia in cache del servizio (GET /book/{hash}).
+        """
+        if not HAS_REQUESTS:
+            return {"error": "Libreria 'requests' non installata. Esegui: pip install requests"}
+
+        try:
+            safe_path = validate_path(file_path)
+            file_bytes = safe_path.read_bytes()
+        except ValueError as e:
+            return {"error": f"Accesso negato: {e}"}
+        except OSError as e:
+            return {"error": f"Errore lettura file: {e}"}
+
+        url = self.valves.DOCUMENT_SERVICE_URL
+        params = {k: v for k, v in params.items() if v is not None}
+        params.setdefault("limit", self.valves.PAGE_CHARS)
+
+        try:
+            resp = requests.get(
+                f"{url}/book/{content_digest(file_bytes)}",
+                params=params,
+                headers={"X-API-Key": API_KEY},
+                timeout=30
+            )
+            if resp.status_code == 404:
+                resp = requests.post(
+                    f"{url}/book",
+                    params=params,
+                    files={"file": (safe_path.name, file_bytes)},
+                    headers={"X-API-Key": API_KEY},
+                    timeout=300
+                )
+            if resp.status_code != 200:
+                return {"error": f"Errore servizio: {resp.status_code} - {resp.text}"}
+            return resp.json()
+        except requests.ConnectionError:
+            return {"error": f"Document Reader Service non raggiungibile su {url}"}
+        except requests.Timeout:
+            return {"error": "Timeout nella lettura del libro"}
+
+    def indice_libro(
+        self,
+        percorso_file: str = Field(..., description="Percorso del file e-book (EPUB, MOBI, AZW3, FB2)"),
+    ) -> str:
+        """
+        Mostra titolo, autore e indice dei capitoli di un e-book locale.
+        Usalo prima di leggere il libro con leggi_libro.
+        """
+        result = self._book_request(percorso_file, limit=1, toc="true")
+        if "error" in result:
+            return f"Errore: {result['error']}"
+
+        righe = [
+            f"📚 **{result.get('title') or result.get('filename')}**",
+            f"**Capitoli:** {result.get('chapters_count', 0)} "
+            f"| **Caratteri:** {result.get('total_characters', 0)}",
+            "",
+        ]
+        for capitolo in result.get("chapters", []):
+            righe.append(f"{capitolo['index']}. {capitolo['title']} ({capitolo['length']} caratteri)")
+        return "\n".join(righe)
+
+    def leggi_libro(
+        self,
+        percorso_file: str = Field(..., description="Percorso del file e-book (EPUB, MOBI, AZW3, FB2)"),
+        capitolo: Optional[int] = Field(default=None, description="Indice del capitolo (vedi indice_libro); vuoto = tutto il libro"),
+        offset: int = Field(default=0, description="Carattere da cui riprendere (next_offset della pagina precedente)"),
+    ) -> str:
+        """
+        Legge un e-book locale una pagina alla volta, fino alla fine.
+        Ogni risposta indica come chiedere la pagina successiva.
+        """
+        result = self._book_request(percorso_file, chapter=capitolo, offset=offset)
+        if "error" in result:
+            return f"Errore: {result['error']}"
+
+        intestazione = f"📖 **{result.get('title') or result.get('filename')}**"
+        if result.get("chapter") is not None:
+            intestazione += f" — capitolo {result['chapter']}: {result.get('chapter_title')}"
+
+        if result.get("next_offset") is not None:
+            seguito = (
+                f"Continua con: leggi_libro(percorso_file, capitolo={capitolo}, "
+                f"offset={result['next_offset']})"
+            )
+        elif result.get("next_chapter") is not None:
+            seguito = f"Fine del capitolo. Continua con: leggi_libro(percorso_file, capitolo={result['next_chapter']})"
+        else:
+            seguito = "Fine del libro."
+
+        return f"{intestazione}\n\n{result.get('text', '')}\n\n---\n{seguito}"
 
     def analizza_libro(
         self,
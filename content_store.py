@@ -0,0 +1,337 @@
+"""
+Archivio content-addressed condiviso dai servizi locali.
+
+- Ogni contenuto (upload, testo, audio generato) è identificato dal suo
+  digest BLAKE2b: due copie identiche hanno lo stesso indirizzo
+- I byte di un blob sono salvati una sola volta, anche se arrivano da
+  servizi o tool diversi
+- Per ogni blob si registra quali risultati derivati esistono
+  (servizio + tipo), con il risultato JSON o il blob prodotto
+
+Uso:
+    store = get_store()
+    digest = store.put_blob(audio_bytes)
+    store.put_result(text_digest, "tts", "edge-tts:it-IT-ElsaNeural", output=digest)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Cartella dell'archivio (condivisa da document, image e TTS service)
+CONTENT_STORE_DIR = Path(
+    os.getenv("OWUI_CONTENT_STORE", str(Path(__file__).parent / ".content_store"))
+)
+
+# BLAKE2b a 256 bit: più veloce di MD5/SHA-256 e senza collisioni pratiche
+CONTENT_DIGEST_SIZE = 32
+
+
+def new_hasher() -> "hashlib._Hash":
+    """Hasher incrementale per i digest dell'archivio."""
+    return hashlib.blake2b(digest_size=CONTENT_DIGEST_SIZE)
+
+
+def content_digest(data: Any) -> str:
+    """Digest esadecimale di un contenuto (bytes, mmap o memoryview)."""
+    hasher = new_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+class ContentStore:
+    """
+    Blob indirizzati per contenuto più indice dei risultati derivati.
+
+    Tabelle SQLite (store.db, journal WAL: più processi possono usarlo):
+        blobs:   digest, dimensione, se i byte sono salvati, accessi
+        results: (blob, servizio, tipo) -> risultato JSON e/o blob prodotto
+
+    Un blob può essere solo registrato (digest e dimensione, es. un upload
+    di cui non serve conservare i byte) oppure salvato su disco in
+    blobs/<2 caratteri>/<digest>.
+
+    Esempio:
+        store = ContentStore(Path("./store"))
+        store.put_result(upload.digest, "image", "describe", {"description": "..."})
+        hit = store.get_result(upload.digest, "image", "describe")
+    """
+
+    def __init__(self, root: Path = CONTENT_STORE_DIR) -> None:
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = self.root / "store.db"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " digest TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " stored INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " blob TEXT NOT NULL,"
+            " service TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT,"
+            " output TEXT,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " PRIMARY KEY (blob, service, kind))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON results (created)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_output ON results (output)")
+        self._conn.commit()
+
+    # ------------------------------------------------------------------------
+    # Blob
+    # ------------------------------------------------------------------------
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def register_blob(self, digest: str, size: int) -> None:
+        """Registra un blob senza salvarne i byte (es. un upload già hashato)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO blobs (digest, size, stored, created, accessed)"
+                " VALUES (?, ?, 0, ?, ?)"
+                " ON CONFLICT(digest) DO UPDATE SET accessed = excluded.accessed",
+                (digest, size, now, now)
+            )
+            self._conn.commit()
+
+    def put_blob(self, data: Any, digest: Optional[str] = None) -> str:
+        """
+        Salva i byte di un blob (una sola volta per contenuto).
+
+        Args:
+            data: Contenuto (bytes o mmap)
+            digest: Digest già calcolato (opzionale)
+
+        Returns:
+            Digest del blob
+        """
+        digest = digest or content_digest(data)
+        path = self._blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Scrittura atomica: un lettore non vede mai un blob a metà
+            fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as tmp:
+                    tmp.write(data)
+                os.replace(tmp_name, path)
+            except BaseException:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+                raise
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO blobs (digest, size, stored, created, accessed)"
+                " VALUES (?, ?, 1, ?, ?)"
+                " ON CONFLICT(digest) DO UPDATE SET stored = 1, accessed = excluded.accessed",
+                (digest, len(data), now, now)
+            )
+            self._conn.commit()
+        return digest
+
+    def get_blob(self, digest: str) -> Optional[bytes]:
+        """Restituisce i byte di un blob salvato, o None."""
+        path = self._blob_path(digest)
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    # ------------------------------------------------------------------------
+    # Risultati derivati
+    # ------------------------------------------------------------------------
+
+    def put_result(
+        self,
+        blob: str,
+        service: str,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        output: Optional[str] = None
+    ) -> None:
+        """
+        Registra un risultato derivato da un blob.
+
+        Args:
+            blob: Digest del contenuto di partenza
+            service: Servizio che ha prodotto il risultato (document, image, tts)
+            kind: Tipo di risultato nel servizio (es. "describe", "edge-tts:voce")
+            payload: Risultato JSON (opzionale)
+            output: Digest del blob prodotto, es. l'audio (opzionale)
+        """
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False) if payload is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results"
+                " (blob, service, kind, payload, output, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (blob, service, kind, data, output, now, now)
+            )
+            self._conn.commit()
+
+    def get_result(
+        self,
+        blob: str,
+        service: str,
+        kind: str,
+        max_age_hours: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Cerca un risultato derivato.
+
+        Returns:
+            {"payload": dict | None, "output": digest | None, "created": timestamp}
+            oppure None se assente o più vecchio di max_age_hours
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, output, created FROM results"
+                " WHERE blob = ? AND service = ? AND kind = ?",
+                (blob, service, kind)
+            ).fetchone()
+            if row is None:
+                return None
+            if max_age_hours is not None and time.time() - row[2] > max_age_hours * 3600:
+                return None
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE blob = ? AND service = ? AND kind = ?",
+                (time.time(), blob, service, kind)
+            )
+            self._conn.commit()
+
+        payload, output, created = row
+        return {
+            "payload": json.loads(payload) if payload is not None else None,
+            "output": output,
+            "created": created,
+        }
+
+    def find_results(
+        self,
+        service: str,
+        kind: str,
+        max_age_hours: Optional[float] = None
+    ) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Tutti i risultati di un tipo (es. per ricostruire un indice all'avvio).
+
+        Returns:
+            Lista di (digest del blob, payload)
+        """
+        query = "SELECT blob, payload FROM results WHERE service = ? AND kind = ?"
+        params: Tuple[Any, ...] = (service, kind)
+        if max_age_hours is not None:
+            query += " AND created >= ?"
+            params += (time.time() - max_age_hours * 3600,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            (blob, json.loads(payload) if payload is not None else None)
+            for blob, payload in rows
+        ]
+
+    def derived(self, blob: str) -> List[Dict[str, Any]]:
+        """Elenco dei risultati derivati da un blob (tutti i servizi)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT service, kind, output, created FROM results WHERE blob = ?"
+                " ORDER BY created",
+                (blob,)
+            ).fetchall()
+        return [
+            {"service": service, "kind": kind, "output": output, "created": created}
+            for service, kind, output, created in rows
+        ]
+
+    # ------------------------------------------------------------------------
+    # Manutenzione
+    # ------------------------------------------------------------------------
+
+    def cleanup(self, max_age_hours: float, service: Optional[str] = None) -> int:
+        """
+        Rimuove i risultati più vecchi di max_age_hours e i blob rimasti orfani.
+
+        Args:
+            max_age_hours: Età massima dei risultati
+            service: Limita la pulizia ai risultati di un servizio
+
+        Returns:
+            Numero di risultati rimossi
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock:
+            if service is None:
+                cursor = self._conn.execute("DELETE FROM results WHERE created < ?", (cutoff,))
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM results WHERE created < ? AND service = ?", (cutoff, service)
+                )
+            removed = cursor.rowcount
+
+            # Blob non più usati né come origine né come prodotto di un risultato
+            orphans = self._conn.execute(
+                "SELECT digest, stored FROM blobs WHERE accessed < ?"
+                " AND digest NOT IN (SELECT blob FROM results)"
+                " AND digest NOT IN (SELECT output FROM results WHERE output IS NOT NULL)",
+                (cutoff,)
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM blobs WHERE digest = ?", [(digest,) for digest, _ in orphans]
+            )
+            self._conn.commit()
+
+        for digest, stored in orphans:
+            if stored:
+                try:
+                    self._blob_path(digest).unlink()
+                except OSError:
+                    pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Numero di blob, byte salvati e risultati per servizio."""
+        with self._lock:
+            blobs, stored_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(CASE WHEN stored THEN size ELSE 0 END), 0)"
+                " FROM blobs"
+            ).fetchone()
+            per_service = dict(self._conn.execute(
+                "SELECT service, COUNT(*) FROM results GROUP BY service"
+            ).fetchall())
+        return {"blobs": blobs, "stored_bytes": stored_bytes, "results": per_service}
+
+
+_store: Optional[ContentStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ContentStore:
+    """Istanza condivisa dell'archivio (creata al primo uso)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ContentStore(CONTENT_STORE_DIR)
+        return _store
@@ -35,14 +35,36 @@ import sys
 import json
 import hashlib
 import time
+_MODULE_START = time.perf_counter()  # Per il tempo di avvio riportato da /stats
+import importlib
+import importlib.util
 import tempfile
 import subprocess
 import re
 import csv
+import queue
+import shutil
+import sqlite3
+import asyncio
+import functools
+import heapq
+import threading
+import multiprocessing
+import zipfile
+import bisect
+import codecs
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import asynccontextmanager, closing
 from pathlib import Path
 from io import StringIO, BytesIO
 from datetime import datetime
-from typing import Optional, Dict, Any, List, Callable
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import unquote
+from typing import Optional, Dict, Any, List, Callable, Iterator, Tuple, Union
 
 # ============================================================================
 # VERIFICA DIPENDENZE
@@ -51,9 +73,9 @@ from typing import Optional, Dict, Any, List, Callable
 
 # FastAPI - Framework web per le API REST
 try:
-    from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+    from fastapi import Depends, FastAPI, File, UploadFile, Form, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, StreamingResponse
     import uvicorn
     HAS_FASTAPI = True
 except ImportError:
@@ -63,68 +85,149 @@ except ImportError:
 _security_path = str(Path(__file__).parent.parent)
 if _security_path not in sys.path:
     sys.path.insert(0, _security_path)
-from security import ALLOWED_ORIGINS, create_api_key_middleware, SAFE_HOST
-
-# pypdf - Lettura file PDF
+from security import (
+    ALLOWED_ORIGINS, create_api_key_middleware, get_api_key_header, SAFE_HOST, validate_path
+)
+from uploads import (
+    SpooledUpload, UploadTooLarge, as_stream, spool_upload,
+    create_upload_limit_middleware
+)
+from content_store import content_digest, get_store
+
+# System Profiler - dimensiona il worker pool in base alle risorse
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 try:
-    import pypdf
-    HAS_PYPDF = True
+    from system_profiler import get_profile
+    HAS_PROFILER = True
 except ImportError:
-    # Prova con il vecchio nome PyPDF2
+    HAS_PROFILER = False
+
+# ============================================================================
+# PARSER OPZIONALI (import al primo uso)
+# ============================================================================
+# All'avvio si verifica solo la presenza dei moduli (find_spec, nessun
+# import): il modulo vero viene importato alla prima lettura di un formato
+# che lo usa. L'avvio resta rapido e la memoria è occupata solo dai
+# parser effettivamente usati.
+
+# Nome parser -> moduli candidati, in ordine di preferenza
+_OPTIONAL_PARSERS: Dict[str, Tuple[str, ...]] = {
+    "pypdf": ("pypdf", "PyPDF2"),  # PyPDF2 è il vecchio nome di pypdf
+    "docx": ("docx",),             # python-docx
+    "openpyxl": ("openpyxl",),
+    "pptx": ("pptx",),             # python-pptx
+    "markdown": ("markdown",),
+    "bs4": ("bs4",),               # beautifulsoup4
+    "PIL": ("PIL.Image",),         # Pillow
+    "lxml": ("lxml.html",),        # Parsing veloce dei capitoli EPUB
+    "pytesseract": ("pytesseract",),  # OCR delle pagine PDF scansionate
+    "yaml": ("yaml",),             # PyYAML
+    "rawpy": ("rawpy",),
+    "cairosvg": ("cairosvg",),
+    "uno": ("uno",),               # Bridge Python di LibreOffice
+}
+
+
+def _module_available(module_name: str) -> bool:
+    """Verifica se un modulo è installato senza importarlo."""
     try:
-        import PyPDF2 as pypdf
-        HAS_PYPDF = True
-    except ImportError:
-        HAS_PYPDF = False
+        return importlib.util.find_spec(module_name.split(".")[0]) is not None
+    except (ImportError, ValueError):
+        return False
 
-# python-docx - Lettura file Word (.docx)
-try:
-    from docx import Document as WordDocument
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
 
-# openpyxl - Lettura file Excel (.xlsx)
-try:
-    import openpyxl
-    HAS_OPENPYXL = True
-except ImportError:
-    HAS_OPENPYXL = False
+# Nome parser -> modulo da importare (None se non installato)
+_PARSER_MODULES: Dict[str, Optional[str]] = {
+    name: next((m for m in candidates if _module_available(m)), None)
+    for name, candidates in _OPTIONAL_PARSERS.items()
+}
 
-# python-pptx - Lettura file PowerPoint (.pptx)
-try:
-    from pptx import Presentation
-    HAS_PPTX = True
-except ImportError:
-    HAS_PPTX = False
+HAS_PYPDF = _PARSER_MODULES["pypdf"] is not None
+HAS_DOCX = _PARSER_MODULES["docx"] is not None
+HAS_OPENPYXL = _PARSER_MODULES["openpyxl"] is not None
+HAS_PPTX = _PARSER_MODULES["pptx"] is not None
+HAS_MARKDOWN = _PARSER_MODULES["markdown"] is not None
+HAS_BS4 = _PARSER_MODULES["bs4"] is not None
+HAS_PIL = _PARSER_MODULES["PIL"] is not None
+HAS_LXML = _PARSER_MODULES["lxml"] is not None
+HAS_TESSERACT = _PARSER_MODULES["pytesseract"] is not None
+HAS_YAML = _PARSER_MODULES["yaml"] is not None
+HAS_UNO = _PARSER_MODULES["uno"] is not None
+
+# Parser già importati e costo del loro import
+_loaded_parsers: Dict[str, Any] = {}
+_parser_import_stats: Dict[str, Dict[str, Any]] = {}
+_parser_lock = threading.Lock()
+
+
+def _rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """Memoria residente di un processo, default quello corrente (None se non misurabile)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if _module_available("psutil"):
+        import psutil
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    return None
 
-# markdown - Conversione Markdown in HTML
-try:
-    import markdown
-    HAS_MARKDOWN = True
-except ImportError:
-    HAS_MARKDOWN = False
 
-# beautifulsoup4 - Parsing HTML
-try:
-    from bs4 import BeautifulSoup
-    HAS_BS4 = True
-except ImportError:
-    HAS_BS4 = False
+def _load_parser(name: str) -> Any:
+    """
+    Restituisce il modulo di un parser opzionale, importandolo al primo uso.
 
-# Pillow - Elaborazione immagini
-try:
-    from PIL import Image
-    HAS_PIL = True
-except ImportError:
-    HAS_PIL = False
+    Il primo import registra durata e memoria aggiunta (stima: altri
+    thread possono allocare nello stesso momento), esposte da /stats.
 
-# ebooklib - Lettura EPUB
-try:
-    from ebooklib import epub
-    HAS_EBOOKLIB = True
-except ImportError:
-    HAS_EBOOKLIB = False
+    Raises:
+        ImportError: Se il parser non è installato
+    """
+    module = _loaded_parsers.get(name)
+    if module is not None:
+        return module
+
+    with _parser_lock:
+        module = _loaded_parsers.get(name)
+        if module is not None:
+            return module
+
+        module_name = _PARSER_MODULES.get(name)
+        if module_name is None:
+            raise ImportError(f"Parser non installato: {name}")
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        _parser_import_stats[name] = {
+            "module": module_name,
+            "import_ms": round(elapsed * 1000, 1),
+            "rss_delta_kb": (
+                (rss_after - rss_before) // 1024
+                if rss_before is not None and rss_after is not None else None
+            ),
+        }
+        _loaded_parsers[name] = module
+    return module
+
+
+def parser_stats() -> Dict[str, Dict[str, Any]]:
+    """Stato di ogni parser opzionale: installato, caricato, costo dell'import."""
+    with _parser_lock:
+        return {
+            name: {
+                "available": module_name is not None,
+                "loaded": name in _loaded_parsers,
+                **_parser_import_stats.get(name, {}),
+            }
+            for name, module_name in _PARSER_MODULES.items()
+        }
 
 
 # ============================================================================
@@ -142,8 +245,89 @@ CACHE_DIR.mkdir(exist_ok=True)  # Crea la cartella se non esiste
 # Dopo quante ore i file in cache vengono considerati "vecchi" e rimossi
 CACHE_EXPIRY_HOURS = 24
 
+# Budget della cache: oltre queste soglie si eliminano le entry meno usate
+CACHE_MEMORY_MB = int(os.getenv("DOC_CACHE_MEMORY_MB", "64"))  # Tier in RAM
+CACHE_MAX_SIZE_MB = int(os.getenv("DOC_CACHE_MAX_MB", "500"))  # Tier su disco
+
 # Dimensione massima dei file accettati (in megabyte)
 MAX_FILE_SIZE_MB = 50
+# Dimensione massima dell'intera richiesta per /batch e /batch/stream
+BATCH_MAX_MB = int(os.getenv("DOC_BATCH_MAX_MB", "200"))
+
+# Worker pool per il parsing (fuori dall'event loop di uvicorn)
+# DOC_WORKERS=0 -> usa SystemProfile.max_parallel_ops del profiler
+DOC_WORKERS = int(os.getenv("DOC_WORKERS", "0"))
+# "process" (default): worker terminabili, il budget di lettura è garantito
+DOC_WORKER_MODE = os.getenv("DOC_WORKER_MODE", "process")  # process | thread
+# Richieste in attesa oltre ai worker occupati, poi 503
+DOC_QUEUE_MAX = int(os.getenv("DOC_QUEUE_MAX", "16"))
+# Secondi suggeriti al client (header Retry-After) quando la coda è piena
+RETRY_AFTER_SECONDS = 5
+
+# Estrazione PDF in parallelo su più processi (solo per documenti grandi)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("DOC_PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PARALLEL_WORKERS = int(os.getenv("DOC_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = 8  # Pagine estratte da ogni task del pool
+
+# OCR delle pagine PDF senza testo (scansioni): pdftoppm + Tesseract,
+# sullo stesso pool di processi dell'estrazione parallela
+OCR_ENABLED = os.getenv("DOC_OCR", "1") != "0"
+OCR_DPI = int(os.getenv("DOC_OCR_DPI", "200"))  # Risoluzione della rasterizzazione
+OCR_LANG = os.getenv("DOC_OCR_LANG", "ita+eng")  # Lingue Tesseract
+OCR_PAGE_TIMEOUT = 120  # Secondi massimi per pagina (rasterizzazione e OCR)
+
+# Tabelle (XLSX/CSV): righe conservate per foglio, colonne, campione per i tipi
+TABLE_MAX_ROWS = int(os.getenv("DOC_TABLE_MAX_ROWS", "10000"))
+TABLE_MAX_COLS = int(os.getenv("DOC_TABLE_MAX_COLS", "256"))
+TABLE_SAMPLE_ROWS = 1000
+
+# Segmentazione per /chunks (stima: circa 4 caratteri per token)
+CHARS_PER_TOKEN = 4
+CHUNK_MAX_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Indice di ricerca: dimensione dei passaggi per i formati senza pagine
+SEARCH_PASSAGE_TOKENS = 256
+
+# Campi strutturati omessi dai risultati "solo testo" (text_only)
+STRUCTURED_FIELDS = (
+    "content", "paragraphs", "tables", "sheets", "slides", "data",
+    "headers", "html", "plain_text", "chapters", "functions", "classes",
+    "imports", "methods", "root_element", "schema",
+)
+
+# Pool LibreOffice per i formati legacy (.doc, .xls, .odt, ...)
+LIBREOFFICE_INSTANCES = int(os.getenv("DOC_LO_INSTANCES", "2"))
+LIBREOFFICE_TIMEOUT = int(os.getenv("DOC_LO_TIMEOUT", "60"))  # Secondi per conversione
+LIBREOFFICE_START_TIMEOUT = 30  # Attesa massima per l'avvio di un'istanza
+
+# Formati leggeri (solo libreria standard) sotto questa soglia sono letti
+# subito, senza passare dal worker pool
+INLINE_MAX_BYTES = int(os.getenv("DOC_INLINE_MAX_KB", "256")) * 1024
+
+# Byte iniziali esaminati per riconoscere il formato dal contenuto
+SNIFF_BYTES = 4096
+
+# Byte iniziali esaminati per stimare la codifica dei file di testo
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# Pre-elaborazione delle cartelle collegate (widget Archivio)
+INGEST_WORKERS = int(os.getenv("DOC_INGEST_WORKERS", "1"))
+INGEST_INTERVAL = int(os.getenv("DOC_INGEST_INTERVAL", "300"))  # Secondi tra due scansioni
+
+# Budget di ogni lettura (0 = dal profilo di sistema: timeout_document del
+# tier e RAM divisa tra le letture parallele)
+DOC_READ_TIMEOUT = int(os.getenv("DOC_READ_TIMEOUT", "0"))  # Secondi
+DOC_READ_MAX_RSS_MB = int(os.getenv("DOC_READ_MAX_RSS_MB", "0"))  # Memoria aggiunta dalla lettura
+READ_DEFAULT_TIMEOUT = 60  # Senza profiler
+READ_MIN_RSS_MB = 256  # Tetto minimo ricavato dal profilo
+# Modalità "process": il worker che non si ferma da solo viene terminato
+READ_KILL_GRACE_SECONDS = 5  # Secondi oltre la scadenza
+READ_KILL_RSS_FACTOR = 1.5  # Volte il tetto di memoria
+
+# Libri: thread per il parsing dei capitoli EPUB, caratteri per pagina di /book
+EPUB_PARSE_THREADS = int(os.getenv("DOC_EPUB_THREADS", str(min(4, os.cpu_count() or 1))))
+BOOK_PAGE_CHARS = int(os.getenv("DOC_BOOK_PAGE_CHARS", "20000"))
 
 
 # ============================================================================
@@ -315,6 +499,557 @@ SUPPORTED_FORMATS: Dict[str, Dict[str, str]] = {
 }
 
 
+# ============================================================================
+# REGISTRO DEI READER
+# ============================================================================
+# Ogni reader dichiara estensioni, firme binarie (magic bytes), classe di
+# costo e capacità. Il registro sostituisce la mappa estensione -> lambda:
+# permette di riconoscere il formato dal contenuto e di decidere dove
+# eseguire la lettura (subito, nel pool di thread o di processi).
+
+# Classi di costo
+COST_CHEAP = "cheap"            # Solo libreria standard, lineare nella dimensione
+COST_CPU = "cpu"                # Parser Python pesanti (PDF, Office, immagini)
+COST_SUBPROCESS = "subprocess"  # Programmi esterni (LibreOffice, GIMP, Calibre)
+
+
+class ReaderSpec:
+    """
+    Descrizione di un reader del registro.
+
+    Attributi:
+        name: Nome del reader (campo "reader" di SUPPORTED_FORMATS)
+        method: Nome del metodo di DocumentReader che esegue la lettura,
+            oppure funzione (reader, file_bytes, [ext], **opzioni)
+        extensions: Estensioni gestite
+        magic: Firme (offset, byte, estensioni): la prima estensione è
+            quella assegnata quando il contenuto viene riconosciuto
+        cost: COST_CHEAP, COST_CPU o COST_SUBPROCESS
+        streaming: Legge il file in streaming (senza copie intere in memoria)
+        budget: Rispetta max_chars/max_pages fermando l'estrazione
+        text_only: Supporta la modalità solo testo
+        table_summary: Supporta il riepilogo per colonna (XLSX/CSV)
+        pass_ext: Il metodo riceve anche l'estensione
+        pass_hash: Il metodo riceve anche l'hash del file (cache per pagina)
+        metadata: Nome del metodo di DocumentReader (file_bytes, ext) che
+            legge solo i metadati (intestazioni, proprietà) senza estrarre
+            il contenuto; None = metadati ricavati dalla lettura completa
+
+    Esempio:
+        def read_log(reader, file_bytes, text_only=False):
+            return {"format": "Log", "full_text": bytes(file_bytes).decode("utf-8", "replace")}
+
+        register_reader(
+            ReaderSpec("log", read_log, cost=COST_CHEAP, text_only=True),
+            formats={".log": "Log File"}
+        )
+    """
+
+    def __init__(
+        self,
+        name: str,
+        method: Union[str, Callable[..., Dict[str, Any]]],
+        extensions: Tuple[str, ...] = (),
+        magic: Tuple[Tuple[int, bytes, Tuple[str, ...]], ...] = (),
+        cost: str = COST_CPU,
+        streaming: bool = False,
+        budget: bool = False,
+        text_only: bool = False,
+        table_summary: bool = False,
+        pass_ext: bool = False,
+        pass_hash: bool = False,
+        metadata: Optional[str] = None
+    ) -> None:
+        self.name = name
+        self.method = method
+        self.extensions = tuple(extensions)
+        self.magic = tuple(magic)
+        self.cost = cost
+        self.streaming = streaming
+        self.budget = budget
+        self.text_only = text_only
+        self.table_summary = table_summary
+        self.pass_ext = pass_ext
+        self.pass_hash = pass_hash
+        self.metadata = metadata
+
+    def match(self, head: bytes) -> Optional[str]:
+        """Estensione indicata dalla prima firma presente in head, o None."""
+        for offset, signature, exts in self.magic:
+            if head[offset:offset + len(signature)] == signature:
+                return exts[0]
+        return None
+
+    def checks(self, ext: str) -> bool:
+        """True se per questa estensione esiste una firma da verificare."""
+        return any(ext in exts for _, _, exts in self.magic)
+
+    def call(self, reader: "DocumentReader", file_bytes: Any, ext: str, **options: Any) -> Dict[str, Any]:
+        """Esegue il reader passando solo le opzioni che supporta."""
+        kwargs: Dict[str, Any] = {}
+        if self.budget:
+            kwargs["max_chars"] = options.get("max_chars")
+            kwargs["max_pages"] = options.get("max_pages")
+        if self.text_only and options.get("text_only"):
+            kwargs["text_only"] = True
+        if self.table_summary and options.get("table_summary"):
+            kwargs["table_summary"] = True
+        if self.pass_hash:
+            kwargs["file_hash"] = options.get("file_hash")
+        if callable(self.method):
+            method = functools.partial(self.method, reader)
+        else:
+            method = getattr(reader, self.method)
+        if self.pass_ext:
+            return method(file_bytes, ext, **kwargs)
+        return method(file_bytes, **kwargs)
+
+    def call_metadata(self, reader: "DocumentReader", file_bytes: Any, ext: str) -> Dict[str, Any]:
+        """Legge solo i metadati (richiede metadata non None)."""
+        return getattr(reader, self.metadata)(file_bytes, ext)
+
+    def capabilities(self) -> Dict[str, Any]:
+        """Capacità esposte da /formats."""
+        return {
+            "reader": self.name,
+            "cost": self.cost,
+            "streaming": self.streaming,
+            "text_only": self.text_only,
+            "metadata_only": self.metadata is not None,
+        }
+
+
+READER_REGISTRY: Dict[str, ReaderSpec] = {}
+
+
+def register_reader(spec: ReaderSpec, formats: Optional[Dict[str, str]] = None) -> ReaderSpec:
+    """
+    Registra (o sostituisce) un reader.
+
+    Args:
+        spec: Descrizione del reader
+        formats: Estensioni aggiuntive con nome visualizzato ({".ext": "Nome"})
+
+    Returns:
+        Lo spec registrato, con tutte le estensioni che gestisce
+    """
+    for ext, label in (formats or {}).items():
+        SUPPORTED_FORMATS[ext] = {"name": label, "reader": spec.name}
+    for ext in spec.extensions:
+        SUPPORTED_FORMATS.setdefault(ext, {"name": ext.lstrip(".").upper(), "reader": spec.name})
+    spec.extensions = tuple(
+        ext for ext, info in SUPPORTED_FORMATS.items() if info["reader"] == spec.name
+    )
+    READER_REGISTRY[spec.name] = spec
+    return spec
+
+
+def reader_for(ext: str) -> Optional[ReaderSpec]:
+    """Reader registrato per un'estensione, o None."""
+    info = SUPPORTED_FORMATS.get(ext)
+    return READER_REGISTRY.get(info["reader"]) if info else None
+
+
+_ZIP_SIGNATURE = b"PK\x03\x04"
+_OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# Contenitori ZIP riconosciuti dal file "mimetype" (ODF, EPUB, OpenRaster, Krita)
+_ZIP_MIMETYPES = {
+    "application/epub+zip": ".epub",
+    "application/vnd.oasis.opendocument.text": ".odt",
+    "application/vnd.oasis.opendocument.spreadsheet": ".ods",
+    "application/vnd.oasis.opendocument.presentation": ".odp",
+    "application/vnd.oasis.opendocument.graphics": ".odg",
+    "application/vnd.oasis.opendocument.formula": ".odf",
+    "image/openraster": ".ora",
+    "application/x-krita": ".kra",
+}
+
+# Contenitori Office Open XML riconosciuti dalla cartella principale
+_OOXML_PREFIXES = (("word/", ".docx"), ("xl/", ".xlsx"), ("ppt/", ".pptx"))
+
+for _spec in (
+    ReaderSpec(
+        "pdf", "_read_pdf", magic=((0, b"%PDF-", (".pdf",)),),
+        streaming=True, budget=True, text_only=True, pass_hash=True, metadata="_meta_pdf"
+    ),
+    ReaderSpec(
+        "docx", "_read_docx", magic=((0, _ZIP_SIGNATURE, (".docx",)),),
+        text_only=True, metadata="_meta_ooxml"
+    ),
+    ReaderSpec(
+        "xlsx", "_read_xlsx", magic=((0, _ZIP_SIGNATURE, (".xlsx",)),),
+        streaming=True, text_only=True, table_summary=True, metadata="_meta_ooxml"
+    ),
+    ReaderSpec(
+        "pptx", "_read_pptx", magic=((0, _ZIP_SIGNATURE, (".pptx",)),),
+        text_only=True, metadata="_meta_ooxml"
+    ),
+    ReaderSpec("text", "_read_text", cost=COST_CHEAP),
+    ReaderSpec("markdown", "_read_markdown", cost=COST_CHEAP, text_only=True),
+    ReaderSpec(
+        "csv", "_read_csv", cost=COST_CHEAP, streaming=True, text_only=True, table_summary=True
+    ),
+    ReaderSpec("json", "_read_json", cost=COST_CHEAP, text_only=True),
+    ReaderSpec("xml", "_read_xml", cost=COST_CHEAP, text_only=True),
+    ReaderSpec("html", "_read_html", cost=COST_CHEAP, text_only=True),
+    ReaderSpec("yaml", "_read_yaml", cost=COST_CHEAP, text_only=True),
+    ReaderSpec("code", "_read_code", cost=COST_CHEAP, text_only=True, pass_ext=True),
+    ReaderSpec(
+        "libreoffice", "_read_with_libreoffice",
+        magic=(
+            (0, _OLE2_SIGNATURE, (".doc", ".xls", ".ppt", ".wps")),
+            (0, b"{\\rtf", (".rtf", ".doc")),
+            (0, _ZIP_SIGNATURE, (".odt", ".ods", ".odp", ".odg", ".odf", ".odb", ".ott", ".ots", ".otp")),
+            (0, b"\xd7\xcd\xc6\x9a", (".wmf",)),
+            (40, b" EMF", (".emf",)),
+        ),
+        cost=COST_SUBPROCESS, pass_ext=True
+    ),
+    ReaderSpec(
+        "image", "_read_image",
+        magic=(
+            (0, b"\x89PNG\r\n\x1a\n", (".png",)),
+            (0, b"\xff\xd8\xff", (".jpg", ".jpeg")),
+            (0, b"GIF87a", (".gif",)),
+            (0, b"GIF89a", (".gif",)),
+            (0, b"BM", (".bmp",)),
+            (0, b"II*\x00", (".tiff", ".tif")),
+            (0, b"MM\x00*", (".tiff", ".tif")),
+            (8, b"WEBP", (".webp",)),
+            (0, b"\x00\x00\x01\x00", (".ico",)),
+        ),
+        pass_ext=True, metadata="_meta_image"
+    ),
+    ReaderSpec(
+        "gimp", "_read_gimp",
+        magic=((0, b"gimp xcf", (".xcf",)), (0, b"8BPS", (".psd", ".psb"))),
+        cost=COST_SUBPROCESS, pass_ext=True
+    ),
+    ReaderSpec("raw", "_read_raw", cost=COST_SUBPROCESS, pass_ext=True),
+    ReaderSpec("svg", "_read_svg", cost=COST_CHEAP),
+    ReaderSpec(
+        "epub", "_read_epub", magic=((0, _ZIP_SIGNATURE, (".epub",)),),
+        text_only=True, metadata="_meta_epub"
+    ),
+    ReaderSpec(
+        "ebook", "_read_ebook", magic=((60, b"BOOKMOBI", (".mobi", ".azw", ".azw3")),),
+        cost=COST_SUBPROCESS, pass_ext=True
+    ),
+):
+    register_reader(_spec)
+
+
+def _sniff_zip(data: Any) -> Optional[str]:
+    """Riconosce il tipo di un contenitore ZIP (ODF, EPUB, Office Open XML)."""
+    try:
+        with zipfile.ZipFile(as_stream(data)) as zf:
+            names = zf.namelist()
+            if "mimetype" in names:
+                mimetype = zf.read("mimetype")[:100].decode("ascii", "ignore").strip()
+                return _ZIP_MIMETYPES.get(mimetype)
+    except (zipfile.BadZipFile, OSError, ValueError):
+        return None
+    for prefix, ext in _OOXML_PREFIXES:
+        if any(name.startswith(prefix) for name in names):
+            return ext
+    return None
+
+
+def _sniff_text(head: bytes) -> Optional[str]:
+    """Riconosce formati testuali dall'inizio del contenuto (None se binario)."""
+    if b"\x00" in head:
+        return None
+    text = head.decode("utf-8", errors="replace").lstrip("\ufeff \t\r\n")
+    lower = text[:1024].lower()
+    if lower.startswith("<svg") or (lower.startswith("<?xml") and "<svg" in lower):
+        return ".svg"
+    if lower.startswith(("<!doctype html", "<html")):
+        return ".html"
+    if lower.startswith("<?xml"):
+        return ".xml"
+    if lower[:1] in ("{", "["):
+        return ".json"
+    if lower.startswith("%!ps"):
+        return ".eps"
+    return ".txt"
+
+
+def sniff_format(data: Any, binary_only: bool = False) -> Optional[str]:
+    """
+    Riconosce il formato dal contenuto.
+
+    Args:
+        data: Contenuto del file (bytes o mmap)
+        binary_only: Solo firme binarie affidabili, senza euristiche sul testo
+
+    Returns:
+        Estensione riconosciuta (es. ".pdf") o None
+    """
+    head = bytes(data[:SNIFF_BYTES])
+    if head.startswith(_ZIP_SIGNATURE):
+        return _sniff_zip(data)
+    for spec in READER_REGISTRY.values():
+        if spec.name in ("docx", "xlsx", "pptx", "epub"):
+            continue  # Contenitori ZIP: già gestiti sopra
+        ext = spec.match(head)
+        if ext is not None:
+            return ext
+    return None if binary_only else _sniff_text(head)
+
+
+def resolve_format(filename: str, data: Any) -> Tuple[str, bool]:
+    """
+    Estensione con cui leggere un file.
+
+    Si usa l'estensione del nome, salvo che manchi, non sia supportata o
+    che il contenuto contraddica le firme del suo reader (es. un PNG
+    salvato come .pdf): in quei casi il formato viene riconosciuto dal
+    contenuto.
+
+    Returns:
+        (estensione, True se ricavata dal contenuto)
+    """
+    ext = Path(filename).suffix.lower()
+    spec = reader_for(ext)
+    if spec is not None:
+        if not spec.checks(ext) or spec.match(bytes(data[:SNIFF_BYTES])) is not None:
+            return ext, False
+        # Estensione nota ma contenuto diverso: solo firme binarie affidabili
+        detected = sniff_format(data, binary_only=True)
+    else:
+        detected = sniff_format(data)
+
+    if detected and detected != ext and detected in SUPPORTED_FORMATS:
+        return detected, True
+    return ext, False
+
+
+# ============================================================================
+# CODIFICA DEL TESTO
+# ============================================================================
+# La codifica si decide su un campione iniziale (BOM, validità UTF-8,
+# distribuzione dei byte) e il file viene decodificato una sola volta.
+
+# BOM più lunghi prima: il BOM UTF-32 LE inizia come quello UTF-16 LE
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Byte 0x80-0x9F che cp1252 definisce (virgolette curve, €, trattini):
+# in latin-1 sono caratteri di controllo, quindi indicano un file Windows
+_CP1252_EXTRA = frozenset(range(0x80, 0xA0)) - {0x81, 0x8D, 0x8F, 0x90, 0x9D}
+
+
+def detect_encoding(data: Any, sample_size: int = ENCODING_SAMPLE_BYTES) -> str:
+    """
+    Stima la codifica di un testo esaminando solo i primi byte.
+
+    Ordine: BOM, UTF-16 senza BOM (byte nulli alternati), UTF-8 valido,
+    altrimenti cp1252 se compaiono i suoi caratteri tipici, latin-1 negli
+    altri casi.
+
+    Args:
+        data: Contenuto (bytes, mmap o memoryview)
+        sample_size: Byte iniziali esaminati
+
+    Returns:
+        Nome della codifica per bytes.decode()
+    """
+    sample = bytes(data[:sample_size])
+
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    # UTF-16 senza BOM: testo latino con un byte nullo ogni due
+    if len(sample) >= 4:
+        even_zeros = sample[0::2].count(0)
+        odd_zeros = sample[1::2].count(0)
+        half = len(sample) // 2
+        if odd_zeros > half * 0.3 and even_zeros < half * 0.05:
+            return "utf-16-le"
+        if even_zeros > half * 0.3 and odd_zeros < half * 0.05:
+            return "utf-16-be"
+
+    if sample.isascii():
+        return "utf-8"
+    try:
+        # Campione parziale: un carattere multibyte tagliato alla fine è valido
+        truncated = len(data) > len(sample)
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=not truncated)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if any(byte in _CP1252_EXTRA for byte in sample):
+        return "cp1252"
+    return "latin-1"
+
+
+def decode_text(data: Any) -> Tuple[str, str]:
+    """
+    Decodifica un testo con la codifica stimata da detect_encoding().
+
+    Il buffer (anche un mmap) è decodificato direttamente, senza copiarlo.
+    Se il resto del file smentisce il campione (es. un byte non UTF-8 dopo
+    i primi 64 KB) si ripiega su cp1252/latin-1, che non falliscono.
+
+    Returns:
+        (testo, codifica usata)
+    """
+    encoding = detect_encoding(data)
+    view = memoryview(data)
+    try:
+        try:
+            return str(view, encoding), encoding
+        except UnicodeDecodeError:
+            if encoding.startswith(("utf-16", "utf-32")):
+                return str(view, encoding, "replace"), encoding
+        try:
+            return str(view, "cp1252"), "cp1252"
+        except UnicodeDecodeError:
+            return str(view, "latin-1"), "latin-1"
+    finally:
+        view.release()
+
+
+# ============================================================================
+# BUDGET DI LETTURA
+# ============================================================================
+# Ogni lettura ha una scadenza e un tetto di memoria. I reader li
+# controllano nei loro cicli (pagine, paragrafi, righe, capitoli) e, se il
+# budget è esaurito, si fermano restituendo quanto già letto: parse()
+# marca il risultato con truncated e truncated_reason.
+
+TRUNCATED_TIMEOUT = "timeout"
+TRUNCATED_MEMORY = "memory"
+
+
+class BudgetExceeded(Exception):
+    """Una lettura ha superato il budget e il suo worker è stato terminato."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Budget di lettura superato: {reason}")
+
+
+class ReadBudget:
+    """
+    Scadenza e memoria massima di una lettura.
+
+    Il tempo parte da start() (chiamato da parse()), non dalla creazione:
+    l'attesa in coda non consuma il budget. La memoria è quella aggiunta
+    al processo durante la lettura, ed è controllata solo nei worker di
+    processo, dove ogni processo esegue una lettura alla volta. In
+    modalità thread le letture concorrenti condividono il processo: la
+    crescita dovuta a un documento grande fermerebbe anche le altre, quindi
+    vale solo la scadenza.
+
+    Attributi:
+        timeout: Secondi disponibili (None = nessun limite)
+        max_rss: Byte di memoria aggiuntiva (None = nessun limite)
+        reason: TRUNCATED_TIMEOUT o TRUNCATED_MEMORY quando esaurito
+
+    Esempio:
+        budget = ReadBudget(*read_budget_limits())
+        result = reader.read(data, "file.pdf", budget=budget)
+        if result.get("truncated_reason"):
+            print("Lettura parziale:", result["truncated_reason"])
+    """
+
+    # Intervallo minimo tra due letture della memoria residente
+    RSS_CHECK_SECONDS = 0.05
+
+    def __init__(self, timeout: Optional[float] = None, max_rss: Optional[int] = None) -> None:
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.reason: Optional[str] = None
+        self._deadline: Optional[float] = None
+        self._rss_start: Optional[int] = None
+        self._next_rss_check = 0.0
+
+    def start(self) -> None:
+        """Avvia il conteggio (tempo e memoria di partenza)."""
+        self.reason = None
+        self._deadline = time.monotonic() + self.timeout if self.timeout else None
+        self._rss_start = _rss_bytes() if self.max_rss and _IN_WORKER_PROCESS else None
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Scadenza in time.monotonic() (None = nessun limite o non avviato)."""
+        return self._deadline
+
+    def exceeded(self) -> Optional[str]:
+        """Motivo dell'esaurimento del budget, o None se c'è ancora margine."""
+        if self.reason is not None:
+            return self.reason
+        now = time.monotonic()
+        if self._deadline is not None and now > self._deadline:
+            self.reason = TRUNCATED_TIMEOUT
+        elif self._rss_start is not None and now >= self._next_rss_check:
+            self._next_rss_check = now + self.RSS_CHECK_SECONDS
+            rss = _rss_bytes()
+            if rss is not None and rss - self._rss_start > self.max_rss:
+                self.reason = TRUNCATED_MEMORY
+        return self.reason
+
+
+# Budget della lettura in corso nel thread
+_active_budget = threading.local()
+
+
+def _budget_exceeded() -> Optional[str]:
+    """Da chiamare nei cicli dei reader: motivo per fermarsi, o None."""
+    budget = getattr(_active_budget, "budget", None)
+    return budget.exceeded() if budget is not None else None
+
+
+def _budget_deadline() -> Optional[float]:
+    """Scadenza della lettura in corso nel thread, o None."""
+    budget = getattr(_active_budget, "budget", None)
+    return budget.deadline if budget is not None else None
+
+
+def read_budget_limits() -> Tuple[float, Optional[int]]:
+    """
+    Budget di default di una lettura.
+
+    DOC_READ_TIMEOUT e DOC_READ_MAX_RSS_MB se impostati, altrimenti dal
+    profilo di sistema: timeout_document del tier e metà della RAM divisa
+    tra le letture parallele (almeno READ_MIN_RSS_MB).
+
+    Returns:
+        (secondi, byte di memoria aggiuntiva o None)
+    """
+    timeout: Optional[float] = DOC_READ_TIMEOUT or None
+    max_rss_mb: Optional[int] = DOC_READ_MAX_RSS_MB or None
+
+    if HAS_PROFILER and (timeout is None or max_rss_mb is None):
+        try:
+            profile = get_profile()
+            timeout = timeout or profile.timeout_document
+            max_rss_mb = max_rss_mb or max(
+                READ_MIN_RSS_MB,
+                int(profile.ram_total_gb * 1024 / (2 * max(1, profile.max_parallel_ops)))
+            )
+        except Exception:
+            pass
+
+    return timeout or READ_DEFAULT_TIMEOUT, max_rss_mb * 1024 * 1024 if max_rss_mb else None
+
+
+def budget_message(reason: str, budget: ReadBudget) -> str:
+    """Messaggio per una lettura interrotta dal budget."""
+    if reason == TRUNCATED_MEMORY and budget.max_rss:
+        return f"Lettura interrotta: superato il limite di memoria ({budget.max_rss // (1024 * 1024)} MB)"
+    return f"Lettura interrotta: superato il tempo massimo ({budget.timeout} s)"
+
+
 # ============================================================================
 # CLASSE: DocumentCache
 # ============================================================================
@@ -324,12 +1059,21 @@ class DocumentCache:
 
     La cache evita di rileggere lo stesso documento più volte,
     risparmiando tempo e risorse. I documenti sono identificati
-    tramite il loro hash MD5.
+    tramite il digest BLAKE2b dell'archivio condiviso (content_store).
+
+    Le entry sono salvate in un database SQLite (una riga per hash):
+    lettura e scrittura toccano solo la riga interessata, e grazie al
+    journal WAL una scrittura interrotta non corrompe le altre entry.
+
+    Sopra il database c'è un tier in memoria (LRU) con i risultati più
+    recenti. Entrambi i tier hanno un budget in byte: quando viene
+    superato si eliminano le entry usate meno di recente.
 
     Attributi:
         cache_dir: Cartella dove salvare i file di cache
-        index_file: File JSON con l'indice della cache
-        index: Dizionario con i metadati dei file in cache
+        db_file: Database SQLite con le entry della cache
+        memory_budget: Byte massimi del tier in memoria
+        disk_budget: Byte massimi del tier su disco
 
     Esempio:
         cache = DocumentCache(Path("./cache"))
@@ -341,43 +1085,131 @@ class DocumentCache:
         cache.set("abc123hash", {"text": "contenuto..."})
     """
 
-    def __init__(self, cache_dir: Path) -> None:
+    def __init__(
+        self,
+        cache_dir: Path,
+        memory_budget_mb: float = CACHE_MEMORY_MB,
+        disk_budget_mb: float = CACHE_MAX_SIZE_MB
+    ) -> None:
         """
         Inizializza la cache.
 
         Args:
             cache_dir: Percorso della cartella cache
+            memory_budget_mb: Budget del tier in memoria (MB)
+            disk_budget_mb: Budget del tier su disco (MB)
         """
         self.cache_dir = cache_dir
         self.cache_dir.mkdir(exist_ok=True)
-        self.index_file = cache_dir / "index.json"
-        self.index = self._load_index()
-
-    def _load_index(self) -> Dict[str, Any]:
+        self.db_file = cache_dir / "cache.db"
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.disk_budget = int(disk_budget_mb * 1024 * 1024)
+
+        # Tier in memoria: hash -> (timestamp, dimensione, risultato)
+        self._memory: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._memory_bytes = 0
+        # Accessi serviti dalla memoria, riportati su disco prima dell'eviction
+        self._touched: Dict[str, float] = {}
+
+        # Contatori esposti nell'health check
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions_memory = 0
+        self.evictions_disk = 0
+
+        # La cache è usata dai thread del worker pool
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._migrate_legacy_index()
+        self._disk_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
         """
-        Carica l'indice della cache dal file JSON.
+        Apre (o crea) il database della cache.
+
+        Se il file è illeggibile viene messo da parte e ricreato vuoto.
 
         Returns:
-            Dizionario con i metadati della cache
+            Connessione SQLite
         """
-        if self.index_file.exists():
-            try:
-                return json.loads(self.index_file.read_text(encoding="utf-8"))
-            except (json.JSONDecodeError, OSError):
-                # Se il file è corrotto, ricomincia da zero
-                return {}
-        return {}
-
-    def _save_index(self) -> None:
-        """Salva l'indice della cache su disco."""
-        self.index_file.write_text(
-            json.dumps(self.index, indent=2, ensure_ascii=False),
-            encoding="utf-8"
+        try:
+            conn = self._open_db()
+        except sqlite3.DatabaseError:
+            # Database corrotto: ricomincia da zero senza bloccare il servizio
+            self.db_file.replace(self.db_file.with_suffix(".corrupt"))
+            conn = self._open_db()
+        return conn
+
+    def _open_db(self) -> sqlite3.Connection:
+        """Apre il database e crea la tabella se non esiste."""
+        conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " hash TEXT PRIMARY KEY,"
+            " timestamp REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"
+            " accessed REAL NOT NULL DEFAULT 0)"
+        )
+        # Database creati prima dell'eviction LRU non hanno la colonna accessed
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+        if "accessed" not in columns:
+            conn.execute("ALTER TABLE entries ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+            conn.execute("UPDATE entries SET accessed = timestamp")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_ts ON entries (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)")
+        # Testo OCR per pagina: una scansione riletta non ripete Tesseract
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_pages ("
+            " hash TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " dpi INTEGER NOT NULL,"
+            " lang TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " timestamp REAL NOT NULL,"
+            " PRIMARY KEY (hash, page, dpi, lang))"
         )
+        conn.commit()
+        return conn
+
+    def _migrate_legacy_index(self) -> None:
+        """
+        Importa il vecchio index.json (versioni <= 2.0) e lo rimuove.
+
+        Le entry vengono copiate una sola volta nel database.
+        """
+        legacy_file = self.cache_dir / "index.json"
+        if not legacy_file.exists():
+            return
+
+        try:
+            legacy = json.loads(legacy_file.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            legacy = {}
+
+        with self._lock:
+            for file_hash, entry in legacy.items():
+                if not isinstance(entry, dict) or "result" not in entry:
+                    continue
+                payload = json.dumps(entry["result"], ensure_ascii=False)
+                timestamp = entry.get("timestamp", 0)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (hash, timestamp, size, result, accessed)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (file_hash, timestamp, len(payload), payload, timestamp)
+                )
+            self._conn.commit()
+
+        legacy_file.unlink()
 
     def get_hash(self, file_bytes: bytes) -> str:
         """
-        Calcola l'hash MD5 di un file.
+        Calcola il digest di un file (lo stesso degli upload e degli altri servizi).
 
         L'hash viene usato come identificatore univoco del file.
         Due file identici avranno lo stesso hash.
@@ -386,43 +1218,216 @@ class DocumentCache:
             file_bytes: Contenuto del file in bytes
 
         Returns:
-            Stringa esadecimale con l'hash MD5
+            Stringa esadecimale con il digest BLAKE2b
         """
-        return hashlib.md5(file_bytes).hexdigest()
+        return content_digest(file_bytes)
 
     def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
         """
         Recupera un documento dalla cache.
 
+        Cerca prima nel tier in memoria, poi nel database. Un risultato
+        trovato su disco viene promosso in memoria.
+
         Args:
-            file_hash: Hash MD5 del documento
+            file_hash: Hash del documento
 
         Returns:
             Dizionario con il risultato, o None se non in cache/scaduto
         """
-        if file_hash in self.index:
-            entry = self.index[file_hash]
-            # Controlla se il documento è ancora valido (non scaduto)
-            age_seconds = time.time() - entry.get("timestamp", 0)
-            max_age_seconds = CACHE_EXPIRY_HOURS * 3600
+        now = time.time()
+        min_timestamp = now - CACHE_EXPIRY_HOURS * 3600
+
+        with self._lock:
+            entry = self._memory.get(file_hash)
+            if entry is not None and entry[0] > min_timestamp:
+                self._memory.move_to_end(file_hash)
+                self._touched[file_hash] = now
+                self.hits_memory += 1
+                # Copia: il chiamante può modificare il risultato (es. from_cache)
+                return dict(entry[2])
+
+            row = self._conn.execute(
+                "SELECT timestamp, size, result FROM entries WHERE hash = ? AND timestamp > ?",
+                (file_hash, min_timestamp)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE entries SET accessed = ? WHERE hash = ?",
+                (now, file_hash)
+            )
+            self._conn.commit()
 
-            if age_seconds < max_age_seconds:
-                return entry.get("result")
-        return None
+        timestamp, size, payload = row
+        try:
+            result = json.loads(payload)
+        except json.JSONDecodeError:
+            # Entry danneggiata: la scarta senza toccare le altre
+            self.delete(file_hash)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits_disk += 1
+            self._memory_put(file_hash, timestamp, size, result)
+        return dict(result)
+
+    def contains(self, file_hash: str) -> bool:
+        """Verifica se un documento è in cache senza caricarne il risultato."""
+        min_timestamp = time.time() - CACHE_EXPIRY_HOURS * 3600
+        with self._lock:
+            entry = self._memory.get(file_hash)
+            if entry is not None and entry[0] > min_timestamp:
+                return True
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE hash = ? AND timestamp > ?",
+                (file_hash, min_timestamp)
+            ).fetchone()
+        return row is not None
 
     def set(self, file_hash: str, result: Dict[str, Any]) -> None:
         """
         Salva un documento nella cache.
 
         Args:
-            file_hash: Hash MD5 del documento
+            file_hash: Digest del documento (BLAKE2b dell'archivio, content_digest)
             result: Risultato da salvare
         """
-        self.index[file_hash] = {
-            "timestamp": time.time(),
-            "result": result
-        }
-        self._save_index()
+        payload = json.dumps(result, ensure_ascii=False)
+        size = len(payload)
+        now = time.time()
+
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM entries WHERE hash = ?", (file_hash,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (hash, timestamp, size, result, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (file_hash, now, size, payload, now)
+            )
+            self._conn.commit()
+            self._disk_bytes += size - (old[0] if old else 0)
+
+            self._memory_put(file_hash, now, size, dict(result))
+            self._evict_disk()
+
+    def _memory_put(
+        self,
+        file_hash: str,
+        timestamp: float,
+        size: int,
+        result: Dict[str, Any]
+    ) -> None:
+        """
+        Inserisce un risultato nel tier in memoria (chiamare con il lock).
+
+        Le entry più grandi dell'intero budget restano solo su disco.
+        """
+        old = self._memory.pop(file_hash, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+
+        if size > self.memory_budget:
+            return
+
+        self._memory[file_hash] = (timestamp, size, result)
+        self._memory_bytes += size
+
+        while self._memory_bytes > self.memory_budget:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.evictions_memory += 1
+
+    def _evict_disk(self) -> None:
+        """
+        Elimina dal database le entry usate meno di recente finché
+        la dimensione totale rientra nel budget (chiamare con il lock).
+        """
+        if self._disk_bytes <= self.disk_budget:
+            return
+
+        # Allinea la colonna accessed con gli hit serviti dalla memoria
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE entries SET accessed = ? WHERE hash = ?",
+                [(ts, h) for h, ts in self._touched.items()]
+            )
+            self._touched.clear()
+
+        while self._disk_bytes > self.disk_budget:
+            rows = self._conn.execute(
+                "SELECT hash, size FROM entries ORDER BY accessed LIMIT 32"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+
+            for file_hash, size in rows:
+                if self._disk_bytes <= self.disk_budget:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE hash = ?", (file_hash,))
+                self._disk_bytes -= size
+                self.evictions_disk += 1
+                entry = self._memory.pop(file_hash, None)
+                if entry is not None:
+                    self._memory_bytes -= entry[1]
+
+            self._conn.commit()
+
+    def delete(self, file_hash: str) -> None:
+        """
+        Rimuove un documento dalla cache.
+
+        Args:
+            file_hash: Digest del documento (BLAKE2b dell'archivio, content_digest)
+        """
+        with self._lock:
+            entry = self._memory.pop(file_hash, None)
+            if entry is not None:
+                self._memory_bytes -= entry[1]
+
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE hash = ?", (file_hash,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM entries WHERE hash = ?", (file_hash,))
+                self._conn.commit()
+                self._disk_bytes -= row[0]
+
+    def get_ocr_pages(self, file_hash: str, dpi: int, lang: str) -> Dict[int, str]:
+        """
+        Testo OCR già calcolato per le pagine di un PDF.
+
+        Args:
+            file_hash: Hash del PDF
+            dpi: Risoluzione usata per la rasterizzazione
+            lang: Lingue Tesseract
+
+        Returns:
+            Dizionario {numero di pagina: testo}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM ocr_pages WHERE hash = ? AND dpi = ? AND lang = ?",
+                (file_hash, dpi, lang)
+            ).fetchall()
+        return dict(rows)
+
+    def set_ocr_page(self, file_hash: str, page: int, dpi: int, lang: str, text: str) -> None:
+        """Salva il testo OCR di una pagina (anche vuoto: pagina bianca)."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_pages (hash, page, dpi, lang, text, timestamp)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, page, dpi, lang, text, time.time())
+            )
+            self._conn.commit()
 
     def cleanup(self) -> int:
         """
@@ -431,67 +1436,1689 @@ class DocumentCache:
         Returns:
             Numero di documenti rimossi
         """
-        now = time.time()
-        max_age_seconds = CACHE_EXPIRY_HOURS * 3600
+        min_timestamp = time.time() - CACHE_EXPIRY_HOURS * 3600
 
-        # Trova le entry scadute
-        expired = [
-            h for h, entry in self.index.items()
-            if now - entry.get("timestamp", 0) > max_age_seconds
-        ]
+        with self._lock:
+            expired = [
+                h for h, entry in self._memory.items()
+                if entry[0] < min_timestamp
+            ]
+            for h in expired:
+                self._memory_bytes -= self._memory.pop(h)[1]
 
-        # Rimuovi le entry scadute
-        for h in expired:
-            del self.index[h]
+            cursor = self._conn.execute(
+                "DELETE FROM entries WHERE timestamp < ?",
+                (min_timestamp,)
+            )
+            self._conn.execute("DELETE FROM ocr_pages WHERE timestamp < ?", (min_timestamp,))
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Statistiche della cache per l'health check.
 
-        self._save_index()
-        return len(expired)
+        Returns:
+            Dizionario con occupazione, hit, miss ed eviction
+        """
+        with self._lock:
+            disk_entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            ocr_pages = self._conn.execute("SELECT COUNT(*) FROM ocr_pages").fetchone()[0]
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget,
+                "disk_entries": disk_entries,
+                "disk_bytes": self._disk_bytes,
+                "disk_budget_bytes": self.disk_budget,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions_memory": self.evictions_memory,
+                "evictions_disk": self.evictions_disk,
+                "ocr_pages": ocr_pages,
+            }
 
 
 # ============================================================================
-# CLASSE: DocumentReader
+# CLASSE: SearchIndex
 # ============================================================================
-class DocumentReader:
+class SearchIndex:
     """
-    Classe principale per leggere documenti di vari formati.
-
-    Questa classe contiene tutti i metodi per leggere i diversi tipi
-    di file. Ogni formato ha il suo metodo dedicato (es. _read_pdf,
-    _read_docx, etc.).
+    Indice full-text (SQLite FTS5) dei documenti già letti.
 
-    Attributi:
-        cache: Istanza di DocumentCache per la cache
-        available_readers: Dizionario con i reader disponibili
+    Ogni documento viene diviso in passaggi con la loro posizione
+    (pagina del PDF, slide, foglio, titoli della sezione): una ricerca
+    restituisce i passaggi migliori per BM25 con uno snippet, senza
+    dover ricaricare e rileggere i file. L'indice è separato dalla
+    cache, quindi l'eviction della cache non lo svuota.
 
     Esempio:
-        reader = DocumentReader()
-
-        # Leggi un file
-        with open("documento.pdf", "rb") as f:
-            result = reader.read(f.read(), "documento.pdf")
-
-        print(result["full_text"])
+        index = SearchIndex(Path("./cache"))
+        index.add("abc123hash", reader.read(contents, "documento.pdf"))
+        hits = index.search("fattura 2026")
     """
 
-    def __init__(self) -> None:
-        """Inizializza il reader e verifica le dipendenze."""
-        self.cache = DocumentCache(CACHE_DIR)
-        self.available_readers = self._check_readers()
-
-    def _check_readers(self) -> Dict[str, bool]:
+    def __init__(self, cache_dir: Path) -> None:
         """
-        Verifica quali reader sono disponibili sul sistema.
+        Apre (o crea) l'indice.
 
-        Controlla sia le librerie Python che i programmi esterni
-        (LibreOffice, GIMP, ImageMagick, etc.).
+        Args:
+            cache_dir: Cartella in cui creare search.db
+        """
+        self.db_file = cache_dir / "search.db"
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " hash TEXT PRIMARY KEY,"
+                " filename TEXT,"
+                " format TEXT,"
+                " structured INTEGER NOT NULL,"
+                " passage_count INTEGER NOT NULL,"
+                " indexed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5("
+                " text, hash UNINDEXED, location UNINDEXED,"
+                " tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            self._conn.commit()
+            self.enabled = True
+        except sqlite3.DatabaseError:
+            # SQLite compilato senza FTS5 (o database illeggibile)
+            self.enabled = False
+
+    @staticmethod
+    def _passages(result: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Divide un risultato di read() in passaggi con posizione.
 
         Returns:
-            Dizionario {nome_reader: disponibile}
+            Lista di (testo, posizione)
         """
-        import shutil  # Per cercare programmi nel PATH
+        if result.get("content"):
+            return [(page["text"], {"page": page["page"]}) for page in result["content"]]
+
+        if result.get("slides"):
+            passages = []
+            for slide in result["slides"]:
+                text = "\n".join(slide["texts"] + ([slide["notes"]] if slide["notes"] else []))
+                if text.strip():
+                    passages.append((text, {"slide": slide["number"]}))
+            return passages
+
+        if result.get("sheets"):
+            passages = []
+            for name, sheet in result["sheets"].items():
+                rows = sheet.get("data") or []
+                text = "\n".join("\t".join(row) for row in rows)
+                if text.strip():
+                    passages.append((text, {"sheet": name}))
+            return passages
+
+        # Altri formati: segmenti con i titoli della sezione
+        passages = []
+        for chunk in chunk_document(result, SEARCH_PASSAGE_TOKENS):
+            location: Dict[str, Any] = {"passage": chunk["index"] + 1}
+            if chunk.get("headings"):
+                location["headings"] = chunk["headings"]
+            passages.append((chunk["text"], location))
+        return passages
+
+    def add(self, file_hash: str, result: Dict[str, Any]) -> bool:
+        """
+        Indicizza un risultato di read().
 
-        readers = {
-            # Librerie Python
+        Risultati parziali (budget, riepiloghi tabellari) ed errori sono
+        ignorati. Un documento già indicizzato viene reindicizzato solo se
+        il nuovo risultato è strutturato e il precedente era solo testo.
+
+        Returns:
+            True se il documento è stato (re)indicizzato
+        """
+        if (
+            not self.enabled or "error" in result
+            or result.get("truncated") or result.get("table_summary")
+        ):
+            return False
+
+        structured = 0 if result.get("text_only") else 1
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT structured FROM documents WHERE hash = ?", (file_hash,)
+            ).fetchone()
+            if row is not None and row[0] >= structured:
+                return False
+
+        passages = self._passages(result)
+        if not passages:
+            return False
+
+        with self._lock:
+            self._conn.execute("DELETE FROM passages WHERE hash = ?", (file_hash,))
+            self._conn.executemany(
+                "INSERT INTO passages (text, hash, location) VALUES (?, ?, ?)",
+                [(text, file_hash, json.dumps(location, ensure_ascii=False))
+                 for text, location in passages]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents"
+                " (hash, filename, format, structured, passage_count, indexed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, result.get("filename"), result.get("format"),
+                 structured, len(passages), time.time())
+            )
+            self._conn.commit()
+        return True
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Cerca nei documenti indicizzati (ranking BM25).
+
+        La query accetta la sintassi FTS5 (AND, OR, "frase", prefisso*);
+        se non è valida viene cercata come semplice elenco di parole.
+
+        Returns:
+            Lista di risultati con filename, posizione, snippet e punteggio
+        """
+        if not self.enabled or not query.strip():
+            return []
+
+        sql = (
+            "SELECT p.hash, d.filename, d.format, p.location,"
+            " snippet(passages, 0, '[', ']', '…', 24), bm25(passages) AS score"
+            " FROM passages AS p JOIN documents AS d ON d.hash = p.hash"
+            " WHERE passages MATCH ? ORDER BY score LIMIT ?"
+        )
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Sintassi FTS non valida: ogni parola tra virgolette
+                quoted = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                rows = self._conn.execute(sql, (quoted, limit)).fetchall()
+
+        return [
+            {
+                "hash": file_hash,
+                "filename": filename,
+                "format": fmt,
+                "location": json.loads(location),
+                "snippet": snippet,
+                "score": round(-score, 4),  # BM25 di SQLite: più basso = migliore
+            }
+            for file_hash, filename, fmt, location, snippet, score in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Numero di documenti e passaggi indicizzati."""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            documents, passages = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(passage_count), 0) FROM documents"
+            ).fetchone()
+        return {"enabled": True, "documents": documents, "passages": passages}
+
+
+# ============================================================================
+# ESTRAZIONE PDF
+# ============================================================================
+# Funzioni di modulo (non metodi) perché devono poter girare in altri processi
+
+# True dentro i processi del worker pool: evita pool annidati
+_IN_WORKER_PROCESS = False
+
+# Pool terminabile: i task di una lettura fermata dal budget vengono
+# uccisi alla scadenza invece di occupare i processi fino alla fine
+_pdf_executor: Optional["KillableProcessPool"] = None
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor() -> "KillableProcessPool":
+    """Restituisce (creandolo al primo uso) il pool per le pagine PDF."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = KillableProcessPool(PDF_PARALLEL_WORKERS)
+        return _pdf_executor
+
+
+def shutdown_pdf_executor() -> None:
+    """Chiude il pool delle pagine PDF, se creato."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is not None:
+            _pdf_executor.shutdown(wait=False)
+            _pdf_executor = None
+
+
+def _pdf_extract_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """
+    Estrae il testo delle pagine [start, end) di un PDF su disco.
+
+    Eseguita nei processi del pool: ogni task riapre il file.
+
+    Returns:
+        Lista di testi, uno per pagina (stringa vuota se senza testo)
+    """
+    reader = _load_parser("pypdf").PdfReader(pdf_path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def _collect_pdf_pages(
+    texts: List[str],
+    first_page: int,
+    pages_content: List[Dict[str, Any]],
+    chars: int,
+    max_chars: Optional[int]
+) -> Tuple[int, int, bool]:
+    """
+    Aggiunge a pages_content le pagine con testo, fermandosi al budget.
+
+    Returns:
+        (pagine consumate, caratteri totali, budget raggiunto)
+    """
+    for offset, text in enumerate(texts):
+        text = text.strip()
+        if text:
+            pages_content.append({"page": first_page + offset, "text": text})
+            chars += len(text)
+        if max_chars is not None and chars >= max_chars:
+            return offset + 1, chars, True
+    return len(texts), chars, False
+
+
+def _extract_pdf_pages_parallel(
+    file_bytes: bytes,
+    page_limit: int,
+    max_chars: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Estrae le prime page_limit pagine distribuendole su più processi.
+
+    I risultati sono consumati in ordine di pagina: appena il budget di
+    caratteri è raggiunto i task non ancora avviati vengono annullati.
+    I task hanno la scadenza della lettura: se il budget di tempo si
+    esaurisce, quelli in corso vengono terminati con il loro processo.
+
+    Returns:
+        (pagine con testo, numero di pagine lette)
+    """
+    # I processi leggono il PDF da disco invece di ricevere copie dei bytes
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(file_bytes)
+        pdf_path = tmp.name
+
+    executor = _get_pdf_executor()
+    deadline = _budget_deadline()
+    futures = [
+        executor.submit_until(deadline, _pdf_extract_range, pdf_path, start,
+                              min(start + PDF_PAGES_PER_TASK, page_limit))
+        for start in range(0, page_limit, PDF_PAGES_PER_TASK)
+    ]
+
+    pages_content: List[Dict[str, Any]] = []
+    pages_read = 0
+    chars = 0
+    stopped = False
+    try:
+        for index, future in enumerate(futures):
+            # Attesa a intervalli: il budget di lettura può scadere nel frattempo
+            while not stopped:
+                try:
+                    texts = future.result(timeout=0.25)
+                    break
+                except FuturesTimeoutError:
+                    stopped = _budget_exceeded() is not None
+                except BudgetExceeded:
+                    # Task terminato alla scadenza della lettura
+                    stopped = True
+            if stopped or _budget_exceeded():
+                stopped = True
+                break
+            consumed, chars, done = _collect_pdf_pages(
+                texts, index * PDF_PAGES_PER_TASK + 1,
+                pages_content, chars, max_chars
+            )
+            pages_read += consumed
+            if done:
+                break
+    finally:
+        # Annulla i task in coda, attende quelli già avviati (salvo budget
+        # esaurito: vengono terminati alla scadenza) e pulisce
+        running = [f for f in futures if not f.cancel()]
+        if not stopped:
+            wait(running)
+        os.unlink(pdf_path)
+
+    return pages_content, pages_read
+
+
+def _ocr_pdf_page(pdf_path: str, page: int, dpi: int, lang: str) -> str:
+    """
+    Rasterizza una pagina PDF con pdftoppm e ne estrae il testo con Tesseract.
+
+    Eseguita nei processi del pool: l'immagine resta in una cartella
+    temporanea e viene rimossa subito dopo l'OCR.
+
+    Returns:
+        Testo riconosciuto (stringa vuota per una pagina bianca)
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prefix = os.path.join(tmp_dir, "pagina")
+        subprocess.run(
+            [
+                shutil.which("pdftoppm") or "pdftoppm", "-r", str(dpi),
+                "-f", str(page), "-l", str(page),
+                "-gray", "-png", "-singlefile", pdf_path, prefix
+            ],
+            check=True, capture_output=True, timeout=OCR_PAGE_TIMEOUT
+        )
+        with _load_parser("PIL").open(prefix + ".png") as image:
+            text = _load_parser("pytesseract").image_to_string(
+                image, lang=lang, timeout=OCR_PAGE_TIMEOUT
+            )
+    return text.strip()
+
+
+# Voci del dizionario Info dei PDF -> nomi nei risultati
+_PDF_INFO_KEYS = {
+    "/Title": "title",
+    "/Author": "author",
+    "/Subject": "subject",
+    "/Creator": "creator",
+    "/Producer": "producer",
+}
+# Voci aggiuntive lette dal percorso solo metadati
+_PDF_INFO_EXTRA_KEYS = {
+    **_PDF_INFO_KEYS,
+    "/Keywords": "keywords",
+    "/CreationDate": "created",
+    "/ModDate": "modified",
+}
+
+# Errori di una singola pagina OCR (pdftoppm, Tesseract, pool interrotto)
+_OCR_ERRORS = (OSError, RuntimeError, ValueError, ImportError, subprocess.SubprocessError)
+
+
+def _ocr_pdf_pages(
+    file_bytes: Any,
+    pages: List[int],
+    dpi: int,
+    lang: str
+) -> Iterator[Tuple[int, Optional[str]]]:
+    """
+    OCR delle pagine indicate, restituite in ordine man mano che sono pronte.
+
+    Con più pagine le rasterizzazioni e l'OCR sono distribuiti sul pool
+    dei PDF; chiudere l'iteratore annulla le pagine non ancora avviate.
+    Si ferma quando il budget di lettura è esaurito.
+
+    Yields:
+        (numero di pagina, testo) - testo None se l'OCR della pagina è fallito
+    """
+    if not pages:
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(file_bytes)
+        pdf_path = tmp.name
+
+    futures = []
+    try:
+        if len(pages) > 1 and PDF_PARALLEL_WORKERS > 1 and not _IN_WORKER_PROCESS:
+            executor = _get_pdf_executor()
+            deadline = _budget_deadline()
+            futures = [
+                executor.submit_until(deadline, _ocr_pdf_page, pdf_path, page, dpi, lang)
+                for page in pages
+            ]
+            for page, future in zip(pages, futures):
+                while True:
+                    try:
+                        text = future.result(timeout=0.25)
+                        break
+                    except FuturesTimeoutError:
+                        if _budget_exceeded():
+                            return
+                    except BudgetExceeded:
+                        return
+                    except _OCR_ERRORS:
+                        text = None
+                        break
+                yield page, text
+        else:
+            for page in pages:
+                if _budget_exceeded():
+                    return
+                try:
+                    text = _ocr_pdf_page(pdf_path, page, dpi, lang)
+                except _OCR_ERRORS:
+                    text = None
+                yield page, text
+    finally:
+        running = [f for f in futures if not f.cancel()]
+        if running and not _budget_exceeded():
+            wait(running)
+        os.unlink(pdf_path)
+
+
+# ============================================================================
+# TABELLE (XLSX / CSV)
+# ============================================================================
+# Lettura in streaming: le righe arrivano una alla volta e solo le prime
+# TABLE_MAX_ROWS restano in memoria
+
+_INT_RE = re.compile(r"^[+-]?\d+$")
+_FLOAT_RE = re.compile(r"^[+-]?(\d+[.,]?\d*|[.,]\d+)([eE][+-]?\d+)?$")
+_DATE_RE = re.compile(r"^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}")
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M")
+_BOOL_VALUES = {"true", "false", "vero", "falso"}
+
+
+def _parse_cell(value: Any) -> Tuple[str, Any]:
+    """
+    Classifica una cella e ne restituisce il valore normalizzato.
+
+    Returns:
+        (tipo, valore) con tipo tra empty, bool, int, float, date, text
+    """
+    if value is None:
+        return "empty", None
+    if isinstance(value, bool):
+        return "bool", value
+    if isinstance(value, int):
+        return "int", value
+    if isinstance(value, float):
+        return "float", value
+    if hasattr(value, "isoformat"):
+        # datetime/date/time restituiti da openpyxl
+        return "date", value
+
+    text = str(value).strip()
+    if not text:
+        return "empty", None
+    if text.lower() in _BOOL_VALUES:
+        return "bool", text.lower()
+    if _INT_RE.match(text):
+        return "int", int(text)
+    if _FLOAT_RE.match(text):
+        # Virgola decimale all'italiana (1,5) se non c'è anche il punto
+        return "float", float(text.replace(",", ".") if "." not in text else text.replace(",", ""))
+    if _DATE_RE.match(text):
+        for fmt in _DATE_FORMATS:
+            try:
+                return "date", datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+    return "text", text
+
+
+def _merge_types(current: str, new: str) -> str:
+    """Tipo di colonna compatibile con entrambi i valori."""
+    if current == "empty" or current == new:
+        return new
+    if new == "empty":
+        return current
+    if {current, new} == {"int", "float"}:
+        return "float"
+    return "text"
+
+
+class _DistinctSketch:
+    """
+    Stima del numero di valori distinti (K Minimum Values).
+
+    Memoria costante: conserva solo i K hash più piccoli. Con meno di
+    K valori distinti il conteggio è esatto.
+    """
+
+    K = 256
+
+    def __init__(self) -> None:
+        self._heap: List[int] = []  # Max-heap (valori negati)
+        self._seen: set = set()
+
+    def add(self, text: str) -> None:
+        h = int.from_bytes(
+            hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=8).digest(), "big"
+        )
+        if h in self._seen:
+            return
+        if len(self._heap) < self.K:
+            heapq.heappush(self._heap, -h)
+            self._seen.add(h)
+        elif h < -self._heap[0]:
+            removed = -heapq.heapreplace(self._heap, -h)
+            self._seen.discard(removed)
+            self._seen.add(h)
+
+    def estimate(self) -> int:
+        if len(self._heap) < self.K:
+            return len(self._heap)
+        return int((self.K - 1) * (1 << 64) / -self._heap[0])
+
+
+class _ColumnStats:
+    """Tipo e statistiche di una colonna, aggiornati riga per riga."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.type = "empty"
+        self.count = 0
+        self.empty = 0
+        self.min: Any = None
+        self.max: Any = None
+        self._distinct = _DistinctSketch()
+
+    def add(self, kind: str, value: Any, sampling: bool, summary: bool) -> None:
+        if kind == "empty":
+            self.empty += 1
+            return
+        self.count += 1
+        if sampling:
+            self.type = _merge_types(self.type, kind)
+        if not summary:
+            return
+        if kind in ("int", "float", "date"):
+            try:
+                if self.min is None or value < self.min:
+                    self.min = value
+                if self.max is None or value > self.max:
+                    self.max = value
+            except TypeError:
+                pass  # Colonna mista (es. numeri e date)
+        self._distinct.add(str(value))
+
+    def to_dict(self, summary: bool) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"name": self.name, "type": self.type}
+        if summary:
+            info["count"] = self.count
+            info["empty"] = self.empty
+            if self.type in ("int", "float", "date"):
+                info["min"] = self.min.isoformat() if hasattr(self.min, "isoformat") else self.min
+                info["max"] = self.max.isoformat() if hasattr(self.max, "isoformat") else self.max
+            info["distinct"] = self._distinct.estimate()
+        return info
+
+
+class _TableBuilder:
+    """
+    Accumula una tabella (foglio XLSX o file CSV) consumando le righe in streaming.
+
+    La prima riga non vuota è l'intestazione. Delle righe successive:
+    - sono conservate solo le prime max_rows (e max_cols colonne)
+    - i tipi di colonna sono inferiti sulle prime TABLE_SAMPLE_ROWS
+    - in modalità summary le statistiche coprono tutte le righe e
+      nessuna riga viene conservata
+    """
+
+    def __init__(
+        self,
+        max_rows: Optional[int] = None,
+        max_cols: Optional[int] = None,
+        summary: bool = False
+    ) -> None:
+        self.max_rows = TABLE_MAX_ROWS if max_rows is None else max_rows
+        self.max_cols = TABLE_MAX_COLS if max_cols is None else max_cols
+        self.summary = summary
+        self.header: Optional[List[str]] = None
+        self.rows: List[List[str]] = []
+        self.total_rows = 0  # Righe di dati, intestazione esclusa
+        self.columns: List[_ColumnStats] = []
+
+    def add(self, row: Any) -> None:
+        """Consuma una riga (sequenza di celle)."""
+        cells = list(row[:self.max_cols])
+        # Celle vuote in coda (openpyxl allinea le righe alla larghezza del foglio)
+        while cells and (cells[-1] is None or not str(cells[-1]).strip()):
+            cells.pop()
+        if not cells:
+            return  # Riga vuota
+        texts = ["" if cell is None else str(cell) for cell in cells]
+
+        if self.header is None:
+            self.header = texts
+            self.columns = [
+                _ColumnStats(text.strip() or f"col{i + 1}") for i, text in enumerate(texts)
+            ]
+            return
+
+        self.total_rows += 1
+        if not self.summary and len(self.rows) < self.max_rows:
+            self.rows.append(texts)
+
+        sampling = self.total_rows <= TABLE_SAMPLE_ROWS
+        if sampling or self.summary:
+            for i, cell in enumerate(cells):
+                if i >= len(self.columns):
+                    self.columns.append(_ColumnStats(f"col{i + 1}"))
+                kind, value = _parse_cell(cell)
+                self.columns[i].add(kind, value, sampling, self.summary)
+
+    @property
+    def rows_truncated(self) -> bool:
+        return not self.summary and self.total_rows > self.max_rows
+
+    def schema(self) -> List[Dict[str, Any]]:
+        """Colonne con tipo (e statistiche in modalità summary)."""
+        return [column.to_dict(self.summary) for column in self.columns]
+
+    def to_text(self) -> str:
+        """Testo leggibile: righe separate da tab, oppure il riepilogo per colonna."""
+        if self.summary:
+            lines = [f"{self.total_rows} righe, {len(self.columns)} colonne"]
+            for info in self.schema():
+                line = f"- {info['name']} ({info['type']}): {info['count']} valori, ~{info['distinct']} distinti"
+                if "min" in info:
+                    line += f", min {info['min']}, max {info['max']}"
+                lines.append(line)
+            return "\n".join(lines)
+
+        lines = ["\t".join(row) for row in ([self.header] if self.header else []) + self.rows]
+        if self.rows_truncated:
+            lines.append(f"...[{self.total_rows - self.max_rows} righe omesse]")
+        return "\n".join(lines)
+
+
+# ============================================================================
+# CHUNKING
+# ============================================================================
+# Suddivide il testo estratto in segmenti con budget di token, rispettando
+# pagine (PDF), titoli (Markdown, stili Word) e paragrafi
+
+_MD_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_DOCX_HEADING_RE = re.compile(r"^(?:heading|titolo)\s*(\d)$", re.IGNORECASE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima dei token di un testo (circa CHARS_PER_TOKEN caratteri per token)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _text_blocks(text: str, markdown_headings: bool) -> List[Dict[str, Any]]:
+    """Divide un testo in paragrafi (righe vuote) e, per il Markdown, titoli."""
+    blocks: List[Dict[str, Any]] = []
+    lines: List[str] = []
+
+    def flush() -> None:
+        paragraph = "\n".join(lines).strip()
+        if paragraph:
+            blocks.append({"text": paragraph})
+        lines.clear()
+
+    for line in text.splitlines():
+        heading = _MD_HEADING_RE.match(line) if markdown_headings else None
+        if heading:
+            flush()
+            blocks.append({"text": heading.group(2), "level": len(heading.group(1))})
+        elif not line.strip():
+            flush()
+        else:
+            lines.append(line)
+    flush()
+    return blocks
+
+
+def _document_blocks(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Blocchi atomici di un risultato di read(), con pagina o livello di titolo.
+
+    Returns:
+        Lista di {"text", "page"?, "level"?} nell'ordine del documento
+    """
+    # PDF: paragrafi di ogni pagina (un blocco non attraversa mai una pagina)
+    if result.get("content"):
+        blocks = []
+        for page in result["content"]:
+            for block in _text_blocks(page["text"], markdown_headings=False):
+                block["page"] = page["page"]
+                blocks.append(block)
+        return blocks
+
+    # Word: i titoli si riconoscono dallo stile del paragrafo
+    if result.get("paragraphs"):
+        blocks = []
+        for paragraph in result["paragraphs"]:
+            style = paragraph.get("style") or ""
+            match = _DOCX_HEADING_RE.match(style)
+            block: Dict[str, Any] = {"text": paragraph["text"].strip()}
+            if match:
+                block["level"] = int(match.group(1))
+            elif style.lower() in ("title", "titolo"):
+                block["level"] = 1
+            if block["text"]:
+                blocks.append(block)
+        return blocks
+
+    # EPUB: il titolo di ogni capitolo apre i suoi paragrafi
+    if result.get("chapters") and result.get("full_text"):
+        blocks = []
+        for chapter in iter_book_chapters(result):
+            body = _text_blocks(chapter["text"], markdown_headings=False)
+            if body and body[0]["text"] == chapter["title"]:
+                body = body[1:]  # Titolo già presente nel testo del capitolo
+            blocks.append({"text": chapter["title"], "level": 1})
+            blocks.extend(body)
+        return blocks
+
+    # HTML: testo leggibile invece del sorgente
+    text = result.get("plain_text") or result.get("full_text", "")
+    return _text_blocks(text, markdown_headings=result.get("format") == "Markdown")
+
+
+def _split_long_text(text: str, max_chars: int) -> List[str]:
+    """Divide un blocco troppo lungo: righe, poi frasi, poi parole."""
+    if len(text) <= max_chars:
+        return [text]
+
+    for separator in ("\n", _SENTENCE_END_RE, " "):
+        if isinstance(separator, str):
+            parts = text.split(separator)
+            joiner = separator
+        else:
+            parts = separator.split(text)
+            joiner = " "
+        if len(parts) < 2:
+            continue
+
+        pieces: List[str] = []
+        current = ""
+        for part in parts:
+            candidate = f"{current}{joiner}{part}" if current else part
+            if len(candidate) <= max_chars:
+                current = candidate
+                continue
+            if current:
+                pieces.append(current)
+            current = part
+        if current:
+            pieces.append(current)
+
+        # Le parti ancora troppo lunghe passano al separatore successivo
+        result: List[str] = []
+        for piece in pieces:
+            result.extend(_split_long_text(piece, max_chars) if len(piece) > max_chars else [piece])
+        return result
+
+    # Nessun separatore: taglio netto
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def _overlap_tail(text: str, max_chars: int) -> str:
+    """Coda del testo (al più max_chars) che inizia a inizio parola."""
+    if max_chars <= 0 or not text:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    space = tail.find(" ")
+    return tail[space + 1:] if 0 <= space < len(tail) - 1 else tail
+
+
+def chunk_document(
+    result: Dict[str, Any],
+    max_tokens: int,
+    overlap_tokens: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Suddivide un risultato di read() in segmenti pronti per embedding.
+
+    I blocchi (paragrafi) vengono accumulati finché il segmento resta entro
+    max_tokens; un titolo apre sempre un nuovo segmento. Tra segmenti
+    consecutivi della stessa sezione vengono ripetuti circa
+    overlap_tokens token di contesto.
+
+    Returns:
+        Lista di segmenti {"index", "text", "tokens", "headings", "page_start", "page_end"}
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+
+    chunks: List[Dict[str, Any]] = []
+    headings: List[Tuple[int, str]] = []  # Percorso dei titoli correnti
+    parts: List[Tuple[str, Optional[int]]] = []  # (testo, pagina)
+    size = 0
+
+    def flush() -> str:
+        text = "\n\n".join(part for part, _ in parts)
+        if not text.strip():
+            return ""
+        chunk: Dict[str, Any] = {
+            "index": len(chunks),
+            "text": text,
+            "tokens": estimate_tokens(text),
+        }
+        if headings:
+            chunk["headings"] = [title for _, title in headings]
+        pages = [page for _, page in parts if page is not None]
+        if pages:
+            chunk["page_start"] = min(pages)
+            chunk["page_end"] = max(pages)
+        chunks.append(chunk)
+        return text
+
+    for block in _document_blocks(result):
+        page = block.get("page")
+        level = block.get("level")
+
+        if level:
+            # Nuova sezione: chiude il segmento, nessuna sovrapposizione
+            flush()
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, block["text"]))
+            parts, size = [], 0
+
+        # I pezzi di un blocco lungo lasciano spazio alla sovrapposizione
+        piece_chars = max(max_chars - overlap_chars, CHARS_PER_TOKEN)
+        for piece in _split_long_text(block["text"], piece_chars):
+            if parts and size + len(piece) > max_chars:
+                tail = _overlap_tail(flush(), overlap_chars)
+                last_page = parts[-1][1]
+                parts, size = [], 0
+                if tail and len(tail) + len(piece) <= max_chars:
+                    parts.append((tail, last_page))
+                    size = len(tail) + 2
+            parts.append((piece, page))
+            size += len(piece) + 2  # Separatore "\n\n"
+
+    flush()
+    return chunks
+
+
+# ============================================================================
+# LIBRI (EPUB)
+# ============================================================================
+# Un EPUB è uno ZIP di pagine XHTML: il pacchetto OPF indica metadati e
+# ordine di lettura (spine), il sommario (nav o NCX) i titoli dei capitoli.
+# I capitoli sono analizzati in parallelo con lxml, che rilascia il GIL
+# durante il parsing; senza lxml si usa html.parser della libreria standard.
+
+_CONTAINER_NS = "urn:oasis:names:tc:opendocument:xmlns:container"
+_OPF_NS = "http://www.idpf.org/2007/opf"
+_DC_NS = "http://purl.org/dc/elements/1.1/"
+_NCX_NS = "http://www.daisy.org/z3986/2005/ncx/"
+_XHTML_NS = "http://www.w3.org/1999/xhtml"
+_OPS_NS = "http://www.idpf.org/2007/ops"
+
+# Tag che chiudono un paragrafo nel testo estratto (<br> va solo a capo)
+_BLOCK_TAGS = frozenset((
+    "p", "div", "section", "article", "aside", "blockquote", "pre", "li",
+    "tr", "table", "ul", "ol", "dl", "dt", "dd", "figure", "figcaption",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr",
+))
+_SKIP_TAGS = frozenset(("head", "script", "style", "title"))
+_HEADING_TAGS = ("h1", "h2", "h3")
+_XML_ENCODING_RE = re.compile(rb"""encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+
+def _normalize_book_text(text: str) -> str:
+    """Spazi compattati in ogni riga, al massimo una riga vuota tra paragrafi."""
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+class _XHTMLText(HTMLParser):
+    """Testo e primo titolo di una pagina XHTML (fallback senza lxml)."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.heading: Optional[str] = None
+        self._heading_parts: Optional[List[str]] = None
+        self._skip = 0
+
+    def handle_starttag(self, tag: str, attrs: Any) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag in _HEADING_TAGS and self.heading is None:
+            self._heading_parts = []
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n\n")
+        if tag in _HEADING_TAGS and self._heading_parts is not None:
+            self.heading = " ".join("".join(self._heading_parts).split()) or None
+            self._heading_parts = None
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        self.parts.append(data)
+        if self._heading_parts is not None:
+            self._heading_parts.append(data)
+
+
+def _decode_markup(content: bytes) -> str:
+    """Decodifica una pagina XHTML secondo la dichiarazione XML (default UTF-8)."""
+    match = _XML_ENCODING_RE.search(content[:200])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def _xhtml_text(content: bytes) -> Tuple[str, Optional[str]]:
+    """
+    Estrae testo e primo titolo (h1-h3) da un capitolo XHTML.
+
+    Con lxml il parsing avviene senza GIL: più capitoli possono essere
+    analizzati in parallelo da thread diversi.
+
+    Returns:
+        (testo normalizzato, titolo o None)
+    """
+    if not content.strip():
+        return "", None
+
+    if HAS_LXML:
+        root = _load_parser("lxml").document_fromstring(content)
+        for element in list(root.iter(*_SKIP_TAGS)):
+            element.drop_tree()
+        heading = None
+        for element in root.iter(*_HEADING_TAGS):
+            heading = " ".join(element.text_content().split()) or None
+            if heading:
+                break
+        for element in root.iter("br"):
+            element.tail = "\n" + (element.tail or "")
+        for element in root.iter(*_BLOCK_TAGS):
+            element.tail = "\n\n" + (element.tail or "")
+        return _normalize_book_text(root.text_content()), heading
+
+    parser = _XHTMLText()
+    parser.feed(_decode_markup(content))
+    parser.close()
+    return _normalize_book_text("".join(parser.parts)), parser.heading
+
+
+def _epub_toc(zf: zipfile.ZipFile, manifest: Dict[str, Dict[str, str]], toc_id: Optional[str]) -> Dict[str, str]:
+    """
+    Titoli dei capitoli dal sommario: nav di EPUB 3, altrimenti NCX di EPUB 2.
+
+    Returns:
+        {percorso nello ZIP: titolo} (il primo titolo che punta al file)
+    """
+    def add(titles: Dict[str, str], base: str, href: Optional[str], label: str) -> None:
+        label = " ".join(label.split())
+        if href and label:
+            path = posixpath.normpath(posixpath.join(base, unquote(href.split("#")[0])))
+            titles.setdefault(path, label)
+
+    titles: Dict[str, str] = {}
+    nav = next((item for item in manifest.values() if "nav" in item["properties"].split()), None)
+    try:
+        if nav is not None:
+            root = ET.fromstring(zf.read(nav["href"]))
+            navs = list(root.iter(f"{{{_XHTML_NS}}}nav"))
+            toc = next((n for n in navs if n.get(f"{{{_OPS_NS}}}type") == "toc"), navs[0] if navs else None)
+            if toc is not None:
+                base = posixpath.dirname(nav["href"])
+                for link in toc.iter(f"{{{_XHTML_NS}}}a"):
+                    add(titles, base, link.get("href"), "".join(link.itertext()))
+        if not titles and toc_id in manifest:
+            ncx = manifest[toc_id]["href"]
+            root = ET.fromstring(zf.read(ncx))
+            base = posixpath.dirname(ncx)
+            for point in root.iter(f"{{{_NCX_NS}}}navPoint"):
+                label = point.find(f"{{{_NCX_NS}}}navLabel/{{{_NCX_NS}}}text")
+                content = point.find(f"{{{_NCX_NS}}}content")
+                if label is not None and content is not None:
+                    add(titles, base, content.get("src"), label.text or "")
+    except (KeyError, ET.ParseError):
+        pass  # Sommario assente o non valido: titoli dai capitoli stessi
+    return titles
+
+
+def _epub_package(zf: zipfile.ZipFile) -> Tuple[str, ET.Element]:
+    """
+    Percorso e contenuto del pacchetto OPF (da container.xml, o il primo .opf).
+
+    Raises:
+        StopIteration, KeyError, ET.ParseError: EPUB senza pacchetto valido
+    """
+    try:
+        container = ET.fromstring(zf.read("META-INF/container.xml"))
+        rootfile = container.find(f".//{{{_CONTAINER_NS}}}rootfile")
+        opf_path = rootfile.get("full-path") if rootfile is not None else None
+    except KeyError:
+        opf_path = None
+    if not opf_path:
+        opf_path = next(name for name in zf.namelist() if name.endswith(".opf"))
+    return opf_path, ET.fromstring(zf.read(opf_path))
+
+
+def _opf_meta(opf: ET.Element, tag: str) -> Optional[str]:
+    """Primo valore Dublin Core del pacchetto OPF (es. "title", "creator")."""
+    element = opf.find(f".//{{{_DC_NS}}}{tag}")
+    return element.text.strip() if element is not None and element.text else None
+
+
+def epub_metadata(data: Any) -> Dict[str, Any]:
+    """
+    Metadati di un EPUB letti dal solo pacchetto OPF, senza aprire i capitoli.
+
+    Returns:
+        {"title", "author", "language", "publisher", "date", "identifier",
+         "subjects", "spine_items"}
+
+    Raises:
+        zipfile.BadZipFile, KeyError, ET.ParseError: EPUB non valido
+    """
+    with zipfile.ZipFile(as_stream(data)) as zf:
+        _, opf = _epub_package(zf)
+    spine = opf.find(f"{{{_OPF_NS}}}spine")
+    return {
+        "title": _opf_meta(opf, "title"),
+        "author": _opf_meta(opf, "creator"),
+        "language": _opf_meta(opf, "language"),
+        "publisher": _opf_meta(opf, "publisher"),
+        "date": _opf_meta(opf, "date"),
+        "identifier": _opf_meta(opf, "identifier"),
+        "subjects": [
+            element.text.strip()
+            for element in opf.iter(f"{{{_DC_NS}}}subject") if element.text
+        ],
+        "spine_items": len(spine) if spine is not None else 0,
+    }
+
+
+def parse_epub(data: Any, threads: int = EPUB_PARSE_THREADS) -> Dict[str, Any]:
+    """
+    Legge un EPUB completo: metadati, capitoli in ordine di lettura e testo.
+
+    I capitoli sono letti dallo ZIP in sequenza e analizzati in parallelo
+    (con lxml). Ogni capitolo riporta la posizione nel testo completo, così
+    /book può sfogliare il libro senza rileggerlo.
+
+    Args:
+        data: Contenuto del file (bytes o mmap)
+        threads: Thread per il parsing dei capitoli
+
+    Returns:
+        {"title", "author", "language", "publisher", "chapters", "full_text"}
+        con chapters = [{"index", "title", "name", "offset", "length", "preview"}]
+
+    Raises:
+        zipfile.BadZipFile, KeyError, ET.ParseError: EPUB non valido
+    """
+    with zipfile.ZipFile(as_stream(data)) as zf:
+        opf_path, opf = _epub_package(zf)
+        base = posixpath.dirname(opf_path)
+
+        manifest = {
+            item.get("id"): {
+                "href": posixpath.normpath(posixpath.join(base, unquote(item.get("href", "")))),
+                "media_type": item.get("media-type", ""),
+                "properties": item.get("properties", ""),
+            }
+            for item in opf.iter(f"{{{_OPF_NS}}}item")
+        }
+        spine = opf.find(f"{{{_OPF_NS}}}spine")
+        names = set(zf.namelist())
+        documents: List[Tuple[str, bytes]] = []
+        for itemref in (spine if spine is not None else []):
+            item = manifest.get(itemref.get("idref"))
+            if item is None or item["href"] not in names:
+                continue
+            if "html" in item["media_type"] or item["href"].endswith((".xhtml", ".html", ".htm")):
+                documents.append((item["href"], zf.read(item["href"])))
+
+        titles = _epub_toc(zf, manifest, spine.get("toc") if spine is not None else None)
+
+    # Capitoli in ordine: con il budget esaurito ci si ferma a quelli pronti
+    parsed: List[Tuple[str, Optional[str]]] = []
+    workers = max(1, min(threads, len(documents))) if HAS_LXML else 1
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="epub") as executor:
+            futures = [executor.submit(_xhtml_text, content) for _, content in documents]
+            for future in futures:
+                if _budget_exceeded():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                parsed.append(future.result())
+    else:
+        for _, content in documents:
+            if _budget_exceeded():
+                break
+            parsed.append(_xhtml_text(content))
+
+    chapters: List[Dict[str, Any]] = []
+    parts: List[str] = []
+    offset = 0
+    for (href, _), (text, heading) in zip(documents, parsed):
+        if not text:
+            continue  # Copertina o pagina senza testo
+        if parts:
+            offset += 2  # Separatore "\n\n"
+        chapters.append({
+            "index": len(chapters),
+            "title": titles.get(href) or heading or Path(href).stem,
+            "name": href,
+            "offset": offset,
+            "length": len(text),
+            "preview": text[:300],
+        })
+        parts.append(text)
+        offset += len(text)
+
+    return {
+        "title": _opf_meta(opf, "title"),
+        "author": _opf_meta(opf, "creator"),
+        "language": _opf_meta(opf, "language"),
+        "publisher": _opf_meta(opf, "publisher"),
+        "chapters": chapters,
+        "full_text": "\n\n".join(parts),
+    }
+
+
+def _chapter_at(chapters: List[Dict[str, Any]], position: int) -> Optional[int]:
+    """Indice del capitolo che contiene una posizione del testo completo."""
+    if not chapters:
+        return None
+    index = bisect.bisect_right([c["offset"] for c in chapters], position) - 1
+    return max(0, index)
+
+
+def book_page(
+    result: Dict[str, Any],
+    chapter: Optional[int] = None,
+    offset: int = 0,
+    limit: int = BOOK_PAGE_CHARS,
+    toc: bool = False
+) -> Dict[str, Any]:
+    """
+    Una pagina di testo di un libro (o di un documento lungo) letto da read().
+
+    Senza capitolo l'offset è relativo all'intero testo, altrimenti
+    all'inizio del capitolo e la pagina non va oltre la sua fine. La
+    pagina termina su uno spazio o un a capo per non spezzare le parole.
+    Per leggere tutto il libro basta richiedere next_offset (e, finito un
+    capitolo, next_chapter) finché entrambi sono None.
+
+    Args:
+        result: Risultato completo di read() (con "chapters" per gli EPUB)
+        chapter: Indice del capitolo (None = tutto il testo)
+        offset: Carattere di partenza
+        limit: Caratteri massimi della pagina
+        toc: Includi l'indice dei capitoli
+
+    Returns:
+        Dizionario con testo della pagina, posizione e seguito
+
+    Raises:
+        ValueError: Se il capitolo non esiste
+    """
+    text = result.get("full_text", "")
+    chapters = result.get("chapters") or []
+
+    if chapter is not None:
+        if not 0 <= chapter < len(chapters):
+            raise ValueError(f"Capitolo inesistente: {chapter} (il documento ha {len(chapters)} capitoli)")
+        base = chapters[chapter]["offset"]
+        end = base + chapters[chapter]["length"]
+    else:
+        base, end = 0, len(text)
+
+    limit = max(1, limit)
+    start = min(base + max(0, offset), end)
+    stop = min(start + limit, end)
+    if stop < end:
+        # Non spezzare una parola: chiudi la pagina sull'ultimo a capo o spazio
+        cut = text.rfind("\n", start + limit // 2, stop)
+        if cut < 0:
+            cut = text.rfind(" ", start + limit // 2, stop)
+        if cut > start:
+            stop = cut + 1
+
+    current = chapter if chapter is not None else _chapter_at(chapters, start)
+    next_chapter = None
+    if chapter is not None and stop >= end and chapter + 1 < len(chapters):
+        next_chapter = chapter + 1
+
+    page = {
+        "filename": result.get("filename"),
+        "format": result.get("format"),
+        "title": result.get("title"),
+        "hash": result.get("hash"),
+        "chapter": current,
+        "chapter_title": chapters[current]["title"] if current is not None else None,
+        "chapters_count": len(chapters),
+        "offset": start - base,
+        "characters": stop - start,
+        "total_characters": len(text),
+        "text": text[start:stop],
+        "next_offset": stop - base if stop < end else None,
+        "next_chapter": next_chapter,
+    }
+    if toc:
+        page["chapters"] = book_toc(result)
+    return page
+
+
+def book_toc(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Indice dei capitoli: indice, titolo, posizione e lunghezza nel testo."""
+    return [
+        {key: c[key] for key in ("index", "title", "offset", "length")}
+        for c in result.get("chapters") or []
+    ]
+
+
+def iter_book_chapters(result: Dict[str, Any], start: int = 0) -> Any:
+    """
+    Capitoli di un risultato di read(), uno alla volta (per /book/stream).
+
+    Un documento senza capitoli è restituito come un unico capitolo.
+
+    Yields:
+        {"index", "title", "text"}
+    """
+    text = result.get("full_text", "")
+    chapters = result.get("chapters") or [{
+        "index": 0,
+        "title": result.get("title") or result.get("filename"),
+        "offset": 0,
+        "length": len(text),
+    }]
+    for chapter in chapters[max(0, start):]:
+        yield {
+            "index": chapter["index"],
+            "title": chapter["title"],
+            "text": text[chapter["offset"]:chapter["offset"] + chapter["length"]],
+        }
+
+
+# ============================================================================
+# POOL LIBREOFFICE
+# ============================================================================
+# Avviare soffice costa secondi: le istanze restano accese tra le richieste
+
+class _LibreOfficeSlot:
+    """Un'istanza LibreOffice con il suo profilo utente dedicato."""
+
+    def __init__(self, index: int, profile_dir: Path):
+        self.index = index
+        self.profile_dir = profile_dir
+        # Nome pipe UNO univoco anche tra più processi worker
+        self.pipe_name = f"owuim_lo_{os.getpid()}_{index}"
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop: Any = None
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def kill(self) -> None:
+        """Termina l'istanza (anche se bloccata)."""
+        self.desktop = None
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    pass
+            self.process = None
+
+
+class LibreOfficePool:
+    """
+    Pool di istanze LibreOffice headless per i formati legacy.
+
+    Ogni istanza ha un profilo utente proprio (-env:UserInstallation), così
+    conversioni concorrenti non si contendono lo stesso profilo. Le
+    richieste prendono un'istanza libera dalla coda e la restituiscono
+    a conversione finita.
+
+    Due modalità:
+    - Bridge UNO disponibile: istanze sempre avviate, il testo viene letto
+      direttamente dal documento aperto. Un'istanza che supera il timeout
+      viene terminata e riavviata alla richiesta successiva.
+    - Senza UNO: conversione "--convert-to" per richiesta, ma sul profilo
+      dello slot (già inizializzato dopo il primo uso).
+
+    Esempio:
+        pool = LibreOfficePool(instances=2)
+        text = pool.convert(file_bytes, ".doc")
+        pool.shutdown()
+    """
+
+    def __init__(
+        self,
+        instances: int = LIBREOFFICE_INSTANCES,
+        timeout: int = LIBREOFFICE_TIMEOUT,
+        profile_root: Optional[Path] = None
+    ):
+        self.soffice = shutil.which("soffice") or shutil.which("libreoffice")
+        self.instances = max(1, instances)
+        self.timeout = timeout
+        self.use_uno = HAS_UNO
+        root = profile_root or (CACHE_DIR / "lo_profiles")
+        if _IN_WORKER_PROCESS:
+            # Ogni worker ha i suoi profili: slot0 del processo principale
+            # e degli altri worker non va condiviso (come pipe_name)
+            root = root / f"pid{os.getpid()}"
+
+        self._slots = [
+            _LibreOfficeSlot(i, root / f"slot{i}") for i in range(self.instances)
+        ]
+        self._idle: "queue.Queue[_LibreOfficeSlot]" = queue.Queue()
+        for slot in self._slots:
+            self._idle.put(slot)
+
+        # Thread per applicare il timeout alle chiamate UNO
+        self._uno_executor: Optional[ThreadPoolExecutor] = None
+
+        self.conversions = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def available(self) -> bool:
+        """True se LibreOffice è installato."""
+        return self.soffice is not None
+
+    @property
+    def method(self) -> str:
+        return "LibreOffice (UNO)" if self.use_uno else "LibreOffice"
+
+    def convert(self, file_bytes: bytes, ext: str) -> str:
+        """
+        Estrae il testo di un documento usando un'istanza libera.
+
+        Raises:
+            subprocess.TimeoutExpired: Nessuna istanza libera o conversione troppo lenta
+            RuntimeError: Conversione fallita
+        """
+        try:
+            slot = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise subprocess.TimeoutExpired("soffice", self.timeout)
+
+        try:
+            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                tmp.write(file_bytes)
+                tmp_path = tmp.name
+            try:
+                if self.use_uno:
+                    text = self._convert_uno(slot, tmp_path)
+                else:
+                    text = self._convert_cli(slot, tmp_path)
+            finally:
+                os.unlink(tmp_path)
+            self.conversions += 1
+            return text
+        finally:
+            self._idle.put(slot)
+
+    # ------------------------------------------------------------------------
+    # Modalità UNO (istanze sempre avviate)
+    # ------------------------------------------------------------------------
+
+    def _start(self, slot: _LibreOfficeSlot) -> None:
+        """Avvia l'istanza dello slot (se non attiva) e si collega via UNO."""
+        if slot.alive() and slot.desktop is not None:
+            return
+
+        if slot.process is not None:
+            # Istanza morta o scollegata: riavvio
+            slot.kill()
+            self.restarts += 1
+
+        slot.profile_dir.mkdir(parents=True, exist_ok=True)
+        slot.process = subprocess.Popen(
+            [
+                self.soffice,
+                "--headless", "--invisible", "--nologo",
+                "--norestore", "--nodefault", "--nolockcheck",
+                f"-env:UserInstallation={slot.profile_dir.resolve().as_uri()}",
+                f"--accept=pipe,name={slot.pipe_name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        # Attende che l'istanza accetti connessioni
+        deadline = time.time() + LIBREOFFICE_START_TIMEOUT
+        while True:
+            try:
+                slot.desktop = self._connect(slot.pipe_name)
+                return
+            except Exception:
+                if not slot.alive() or time.time() > deadline:
+                    slot.kill()
+                    raise RuntimeError("Avvio istanza LibreOffice fallito")
+                time.sleep(0.25)
+
+    @staticmethod
+    def _connect(pipe_name: str) -> Any:
+        """Si collega a un'istanza in ascolto e restituisce il Desktop."""
+        local_ctx = _load_parser("uno").getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        ctx = resolver.resolve(
+            f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext"
+        )
+        return ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", ctx
+        )
+
+    def _convert_uno(self, slot: _LibreOfficeSlot, path: str) -> str:
+        """Apre il documento nell'istanza e ne legge il testo, con timeout."""
+        self._start(slot)
+
+        if self._uno_executor is None:
+            self._uno_executor = ThreadPoolExecutor(max_workers=self.instances)
+        future = self._uno_executor.submit(_uno_document_text, slot.desktop, path)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            # Istanza bloccata: la terminiamo (sblocca anche il thread)
+            self.timeouts += 1
+            slot.kill()
+            raise subprocess.TimeoutExpired("soffice", self.timeout)
+        except Exception:
+            # Connessione persa o istanza crashata: riavvio al prossimo uso
+            slot.desktop = None
+            raise
+
+    # ------------------------------------------------------------------------
+    # Modalità CLI (senza bridge UNO)
+    # ------------------------------------------------------------------------
+
+    def _convert_cli(self, slot: _LibreOfficeSlot, path: str) -> str:
+        """Conversione --convert-to sul profilo dedicato dello slot."""
+        slot.profile_dir.mkdir(parents=True, exist_ok=True)
+        output_dir = tempfile.mkdtemp()
+        try:
+            subprocess.run(
+                [
+                    self.soffice,
+                    "--headless",
+                    f"-env:UserInstallation={slot.profile_dir.resolve().as_uri()}",
+                    "--convert-to", "txt:Text",
+                    "--outdir", output_dir,
+                    path
+                ],
+                capture_output=True,
+                timeout=self.timeout
+            )
+
+            txt_file = Path(output_dir) / (Path(path).stem + ".txt")
+            if not txt_file.exists():
+                raise RuntimeError("Conversione LibreOffice fallita - file output non creato")
+            return txt_file.read_text(encoding="utf-8", errors="ignore")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Stato del pool."""
+        return {
+            "available": self.available(),
+            "mode": "uno" if self.use_uno else "cli",
+            "instances": self.instances,
+            "running": sum(1 for slot in self._slots if slot.alive()),
+            "conversions": self.conversions,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self) -> None:
+        """Termina tutte le istanze avviate."""
+        for slot in self._slots:
+            slot.kill()
+        if self._uno_executor is not None:
+            self._uno_executor.shutdown(wait=False)
+            self._uno_executor = None
+
+
+def _uno_document_text(desktop: Any, path: str) -> str:
+    """
+    Apre un documento (nascosto, sola lettura) e ne estrae il testo.
+
+    Testo: contenuto del documento. Fogli di calcolo: celle usate di ogni
+    foglio, separate da tab. Presentazioni/disegni: testo delle forme.
+    """
+    uno = _load_parser("uno")  # Registra l'import dei moduli com.sun.star
+    from com.sun.star.beans import PropertyValue
+
+    def prop(name: str, value: Any) -> Any:
+        p = PropertyValue()
+        p.Name = name
+        p.Value = value
+        return p
+
+    doc = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(os.path.abspath(path)), "_blank", 0,
+        (prop("Hidden", True), prop("ReadOnly", True))
+    )
+    if doc is None:
+        raise RuntimeError("Documento non riconosciuto da LibreOffice")
+
+    try:
+        if doc.supportsService("com.sun.star.text.TextDocument"):
+            return doc.getText().getString()
+
+        parts = []
+        if doc.supportsService("com.sun.star.sheet.SpreadsheetDocument"):
+            sheets = doc.getSheets()
+            for i in range(sheets.getCount()):
+                sheet = sheets.getByIndex(i)
+                cursor = sheet.createCursor()
+                cursor.gotoEndOfUsedArea(False)
+                end = cursor.getRangeAddress()
+                rows = sheet.getCellRangeByPosition(
+                    0, 0, end.EndColumn, end.EndRow
+                ).getDataArray()
+                parts.append(f"=== {sheet.getName()} ===")
+                for row in rows:
+                    parts.append("\t".join(str(v) for v in row))
+            return "\n".join(parts)
+
+        # Presentazioni e disegni: testo contenuto nelle forme
+        pages = doc.getDrawPages()
+        for i in range(pages.getCount()):
+            page = pages.getByIndex(i)
+            for j in range(page.getCount()):
+                shape = page.getByIndex(j)
+                if hasattr(shape, "getString"):
+                    text = shape.getString()
+                    if text:
+                        parts.append(text)
+        return "\n".join(parts)
+    finally:
+        doc.close(True)
+
+
+# Proprietà dei file Office (docProps/core.xml e app.xml) -> nomi nei risultati
+_OOXML_CORE_FIELDS = {
+    "title": "title",
+    "creator": "author",
+    "subject": "subject",
+    "description": "description",
+    "keywords": "keywords",
+    "category": "category",
+    "lastModifiedBy": "last_modified_by",
+    "revision": "revision",
+    "created": "created",
+    "modified": "modified",
+}
+_OOXML_APP_FIELDS = {
+    "Application": "application",
+    "Company": "company",
+    "Pages": "pages",
+    "Words": "words",
+    "Characters": "characters",
+    "Slides": "slides",
+}
+
+
+# ============================================================================
+# CLASSE: DocumentReader
+# ============================================================================
+class DocumentReader:
+    """
+    Classe principale per leggere documenti di vari formati.
+
+    Questa classe contiene tutti i metodi per leggere i diversi tipi
+    di file. Ogni formato ha il suo metodo dedicato (es. _read_pdf,
+    _read_docx, etc.).
+
+    Attributi:
+        cache: Istanza di DocumentCache per la cache
+        available_readers: Dizionario con i reader disponibili
+
+    Esempio:
+        reader = DocumentReader()
+
+        # Leggi un file
+        with open("documento.pdf", "rb") as f:
+            result = reader.read(f.read(), "documento.pdf")
+
+        print(result["full_text"])
+    """
+
+    def __init__(self) -> None:
+        """Inizializza il reader e verifica le dipendenze."""
+        self.cache = DocumentCache(CACHE_DIR)
+        self.search_index = SearchIndex(CACHE_DIR)
+        # Archivio condiviso: registra quali risultati esistono per ogni file
+        self.store = get_store()
+        # Nei processi worker una sola istanza: il parallelismo è già dei processi
+        self.libreoffice = LibreOfficePool(
+            instances=1 if _IN_WORKER_PROCESS else LIBREOFFICE_INSTANCES
+        )
+        self.available_readers = self._check_readers()
+
+    def _check_readers(self) -> Dict[str, bool]:
+        """
+        Verifica quali reader sono disponibili sul sistema.
+
+        Controlla sia le librerie Python che i programmi esterni
+        (LibreOffice, GIMP, ImageMagick, etc.).
+
+        Returns:
+            Dizionario {nome_reader: disponibile}
+        """
+        import shutil  # Per cercare programmi nel PATH
+
+        readers = {
+            # Librerie Python
             "pdf": HAS_PYPDF,
             "docx": HAS_DOCX,
             "xlsx": HAS_OPENPYXL,
@@ -499,7 +3126,7 @@ class DocumentReader:
             "markdown": HAS_MARKDOWN,
             "html": HAS_BS4,
             "image": HAS_PIL,
-            "epub": HAS_EBOOKLIB,
+            "epub": True,  # zipfile + html.parser (lxml se installato)
 
             # Sempre disponibili (usano solo libreria standard)
             "text": True,
@@ -527,25 +3154,25 @@ class DocumentReader:
         )
 
         # SVG: cairosvg o inkscape
-        try:
-            import cairosvg
-            readers["svg"] = True
-        except ImportError:
-            readers["svg"] = (
-                shutil.which("inkscape") is not None or
-                shutil.which("rsvg-convert") is not None
-            )
+        readers["svg"] = (
+            _PARSER_MODULES["cairosvg"] is not None or
+            shutil.which("inkscape") is not None or
+            shutil.which("rsvg-convert") is not None
+        )
 
         # RAW: rawpy o ImageMagick
-        try:
-            import rawpy
-            readers["raw"] = True
-        except ImportError:
-            readers["raw"] = readers.get("imagemagick", False)
+        readers["raw"] = _PARSER_MODULES["rawpy"] is not None or readers["imagemagick"]
 
         # Calibre: per e-book diversi da EPUB
         readers["ebook"] = shutil.which("ebook-convert") is not None
 
+        # OCR dei PDF scansionati: pdftoppm (poppler) + Tesseract
+        readers["ocr"] = (
+            OCR_ENABLED and HAS_PIL and HAS_TESSERACT and
+            shutil.which("pdftoppm") is not None and
+            shutil.which("tesseract") is not None
+        )
+
         return readers
 
     def get_supported_formats(self) -> Dict[str, Dict[str, Any]]:
@@ -582,7 +3209,8 @@ class DocumentReader:
 
             result[ext] = {
                 "name": info["name"],
-                "available": available
+                "available": available,
+                **READER_REGISTRY[reader].capabilities(),
             }
 
         return result
@@ -591,12 +3219,31 @@ class DocumentReader:
     # LETTORI SPECIFICI PER FORMATO
     # -------------------------------------------------------------------------
 
-    def _read_pdf(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_pdf(
+        self,
+        file_bytes: bytes,
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        file_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Legge un file PDF ed estrae il testo.
 
+        Con un budget (max_chars/max_pages) l'estrazione si ferma appena
+        il budget è soddisfatto: un riassunto di 2000 caratteri non paga
+        il parsing di tutte le pagine. I PDF con almeno
+        PDF_PARALLEL_MIN_PAGES pagine sono estratti in parallelo.
+
+        Le pagine senza testo (scansioni) passano dall'OCR, se disponibile:
+        il loro testo entra nelle pagine con "ocr": true.
+
         Args:
             file_bytes: Contenuto del file PDF
+            max_chars: Ferma l'estrazione oltre questo numero di caratteri
+            max_pages: Estrae al massimo queste pagine
+            text_only: Solo testo, senza il dettaglio per pagina
+            file_hash: Hash del file, chiave della cache OCR per pagina
 
         Returns:
             Dizionario con testo, metadati e pagine
@@ -606,52 +3253,147 @@ class DocumentReader:
 
         try:
             # Apri il PDF dalla memoria
-            reader = pypdf.PdfReader(BytesIO(file_bytes))
-
-            # Estrai testo da ogni pagina
-            pages_content = []
-            for page_num, page in enumerate(reader.pages, start=1):
-                text = page.extract_text()
-                if text and text.strip():
-                    pages_content.append({
-                        "page": page_num,
-                        "text": text.strip()
-                    })
+            reader = _load_parser("pypdf").PdfReader(as_stream(file_bytes))
+            total_pages = len(reader.pages)
+            page_limit = min(total_pages, max_pages) if max_pages else total_pages
+
+            # Estrai testo dalle pagine (fino al budget)
+            use_parallel = (
+                page_limit >= PDF_PARALLEL_MIN_PAGES
+                and PDF_PARALLEL_WORKERS > 1
+                and not _IN_WORKER_PROCESS
+            )
+            if use_parallel:
+                pages_content, pages_read = _extract_pdf_pages_parallel(
+                    file_bytes, page_limit, max_chars
+                )
+            else:
+                pages_content = []
+                pages_read = 0
+                chars = 0
+                for page_index in range(page_limit):
+                    if _budget_exceeded():
+                        break
+                    text = reader.pages[page_index].extract_text() or ""
+                    consumed, chars, done = _collect_pdf_pages(
+                        [text], page_index + 1, pages_content, chars, max_chars
+                    )
+                    pages_read += consumed
+                    if done:
+                        break
+
+            # Pagine lette ma senza testo: scansioni da passare all'OCR
+            with_text = {p["page"] for p in pages_content}
+            missing = [n for n in range(1, pages_read + 1) if n not in with_text]
+            ocr_pages: List[int] = []
+            if missing and self.available_readers.get("ocr"):
+                remaining = None
+                if max_chars is not None:
+                    remaining = max(0, max_chars - sum(len(p["text"]) for p in pages_content))
+                ocr_texts, stopped_at = self._ocr_pdf(
+                    file_bytes, file_hash or content_digest(file_bytes), missing, remaining
+                )
+                if stopped_at is not None:
+                    # Budget raggiunto durante l'OCR: il risultato si ferma lì
+                    pages_read = stopped_at
+                    pages_content = [p for p in pages_content if p["page"] <= stopped_at]
+                for page, text in ocr_texts.items():
+                    pages_content.append({"page": page, "text": text, "ocr": True})
+                pages_content.sort(key=lambda p: p["page"])
+                ocr_pages = sorted(ocr_texts)
 
             # Estrai metadati
-            metadata = {}
-            if reader.metadata:
-                metadata_keys = {
-                    "/Title": "title",
-                    "/Author": "author",
-                    "/Subject": "subject",
-                    "/Creator": "creator",
-                    "/Producer": "producer"
-                }
-                for pdf_key, clean_key in metadata_keys.items():
-                    if pdf_key in reader.metadata:
-                        metadata[clean_key] = str(reader.metadata[pdf_key])
+            metadata = self._pdf_info(reader)
 
             # Combina tutto il testo
             full_text = "\n\n".join(p["text"] for p in pages_content)
 
-            return {
+            result = {
                 "format": "PDF",
-                "pages": len(reader.pages),
+                "pages": total_pages,
                 "metadata": metadata,
-                "content": pages_content,
                 "full_text": full_text
             }
+            if not text_only:
+                result["content"] = pages_content
+            if ocr_pages:
+                result["ocr_pages"] = ocr_pages
+                result["ocr_dpi"] = OCR_DPI
+
+            if pages_read < total_pages:
+                result["truncated"] = True
+                result["pages_read"] = pages_read
+
+            return result
 
         except Exception as e:
             return {"error": f"Errore lettura PDF: {str(e)}"}
 
-    def _read_docx(self, file_bytes: bytes) -> Dict[str, Any]:
+    @staticmethod
+    def _pdf_info(pdf: Any, keys: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Voci del dizionario Info (trailer) di un PdfReader, con nomi puliti."""
+        info = pdf.metadata
+        if not info:
+            return {}
+        keys = keys or _PDF_INFO_KEYS
+        return {clean: str(info[key]) for key, clean in keys.items() if key in info}
+
+    def _ocr_pdf(
+        self,
+        file_bytes: bytes,
+        file_hash: str,
+        pages: List[int],
+        max_chars: Optional[int] = None
+    ) -> Tuple[Dict[int, str], Optional[int]]:
+        """
+        Testo OCR delle pagine indicate, dalla cache per pagina o da Tesseract.
+
+        Le pagine sono consumate in ordine: appena max_chars è raggiunto (o
+        il budget di lettura è esaurito) l'OCR delle successive è annullato.
+        Ogni pagina riconosciuta va subito in cache per (hash, pagina, dpi).
+
+        Args:
+            file_bytes: Contenuto del file PDF
+            file_hash: Hash del PDF
+            pages: Numeri di pagina (da 1, in ordine crescente)
+            max_chars: Caratteri ancora disponibili nel budget
+
+        Returns:
+            ({pagina: testo} per le pagine con testo,
+             ultima pagina elaborata se l'OCR si è fermato prima della fine)
+        """
+        cached = self.cache.get_ocr_pages(file_hash, OCR_DPI, OCR_LANG)
+        todo = [page for page in pages if page not in cached]
+        texts: Dict[int, str] = {}
+        chars = 0
+
+        with closing(_ocr_pdf_pages(file_bytes, todo, OCR_DPI, OCR_LANG)) as fresh:
+            for page in pages:
+                if page in cached:
+                    text = cached[page]
+                else:
+                    item = next(fresh, None)
+                    if item is None:
+                        # Budget di lettura esaurito prima di questa pagina
+                        return texts, page - 1
+                    text = item[1]
+                    if text is None:
+                        continue  # Errore: non va in cache, si riprova alla prossima lettura
+                    self.cache.set_ocr_page(file_hash, page, OCR_DPI, OCR_LANG, text)
+                if text:
+                    texts[page] = text
+                    chars += len(text)
+                if max_chars is not None and chars >= max_chars and page != pages[-1]:
+                    return texts, page
+        return texts, None
+
+    def _read_docx(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
         """
         Legge un file Word (.docx) ed estrae testo e tabelle.
 
         Args:
             file_bytes: Contenuto del file DOCX
+            text_only: Solo testo (niente stili, tabelle e metadati)
 
         Returns:
             Dizionario con paragrafi, tabelle e metadati
@@ -660,11 +3402,22 @@ class DocumentReader:
             return {"error": "python-docx non installato. Installa con: pip install python-docx"}
 
         try:
-            doc = WordDocument(BytesIO(file_bytes))
+            doc = _load_parser("docx").Document(as_stream(file_bytes))
+
+            if text_only:
+                texts = []
+                for para in doc.paragraphs:
+                    if _budget_exceeded():
+                        break
+                    if para.text.strip():
+                        texts.append(para.text)
+                return {"format": "Word Document", "full_text": "\n".join(texts)}
 
             # Estrai paragrafi
             paragraphs = []
             for para in doc.paragraphs:
+                if _budget_exceeded():
+                    break
                 if para.text.strip():
                     paragraphs.append({
                         "text": para.text,
@@ -674,6 +3427,8 @@ class DocumentReader:
             # Estrai tabelle
             tables = []
             for table in doc.tables:
+                if _budget_exceeded():
+                    break
                 table_data = []
                 for row in table.rows:
                     row_data = [cell.text for cell in row.cells]
@@ -693,445 +3448,809 @@ class DocumentReader:
                 if props.created:
                     metadata["created"] = str(props.created)
 
-            # Testo completo
-            full_text = "\n".join(p["text"] for p in paragraphs)
+            # Testo completo
+            full_text = "\n".join(p["text"] for p in paragraphs)
+
+            return {
+                "format": "Word Document",
+                "paragraphs_count": len(paragraphs),
+                "tables_count": len(tables),
+                "metadata": metadata,
+                "paragraphs": paragraphs,
+                "tables": tables,
+                "full_text": full_text
+            }
+
+        except Exception as e:
+            return {"error": f"Errore lettura DOCX: {str(e)}"}
+
+    def _read_xlsx(
+        self,
+        file_bytes: bytes,
+        text_only: bool = False,
+        table_summary: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Legge un file Excel (.xlsx) ed estrae i dati.
+
+        Il workbook è aperto in sola lettura e le righe sono consumate in
+        streaming: per ogni foglio restano in memoria al massimo
+        TABLE_MAX_ROWS righe e TABLE_MAX_COLS colonne.
+
+        Args:
+            file_bytes: Contenuto del file XLSX
+            text_only: Solo testo, senza la matrice delle celle
+            table_summary: Statistiche per colonna al posto delle righe
+
+        Returns:
+            Dizionario con fogli, schema delle colonne e dati
+        """
+        if not HAS_OPENPYXL:
+            return {"error": "openpyxl non installato. Installa con: pip install openpyxl"}
+
+        try:
+            # data_only=True per ottenere i valori calcolati, non le formule
+            wb = _load_parser("openpyxl").load_workbook(as_stream(file_bytes), read_only=True, data_only=True)
+
+            sheets = {}
+            text_parts = []
+            try:
+                for ws in wb.worksheets:
+                    if _budget_exceeded():
+                        break
+                    table = _TableBuilder(summary=table_summary)
+                    for row in ws.iter_rows(values_only=True):
+                        if _budget_exceeded():
+                            break
+                        table.add(row)
+
+                    text_parts.append(f"=== Foglio: {ws.title} ===")
+                    text_parts.append(table.to_text())
+
+                    if text_only:
+                        continue
+
+                    sheet: Dict[str, Any] = {
+                        "rows": table.total_rows + (1 if table.header else 0),
+                        "cols": len(table.columns),
+                        "schema": table.schema(),
+                    }
+                    if not table_summary:
+                        sheet["data"] = ([table.header] if table.header else []) + table.rows
+                        if table.rows_truncated:
+                            sheet["rows_truncated"] = True
+                    sheets[ws.title] = sheet
+            finally:
+                wb.close()  # In read_only il file resta aperto fino a close()
+
+            result = {
+                "format": "Excel Spreadsheet",
+                "sheets_count": len(wb.sheetnames),
+                "full_text": "\n".join(text_parts)
+            }
+            if not text_only:
+                result["sheets"] = sheets
+            return result
+
+        except Exception as e:
+            return {"error": f"Errore lettura XLSX: {str(e)}"}
+
+    def _read_pptx(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
+        """
+        Legge un file PowerPoint (.pptx) ed estrae testo e note.
+
+        Args:
+            file_bytes: Contenuto del file PPTX
+            text_only: Solo testo, senza il dettaglio per slide
+
+        Returns:
+            Dizionario con slide e testo
+        """
+        if not HAS_PPTX:
+            return {"error": "python-pptx non installato. Installa con: pip install python-pptx"}
+
+        try:
+            prs = _load_parser("pptx").Presentation(as_stream(file_bytes))
+
+            slides = []
+            for i, slide in enumerate(prs.slides, start=1):
+                if _budget_exceeded():
+                    break
+                slide_content = {
+                    "number": i,
+                    "texts": [],
+                    "notes": ""
+                }
+
+                # Estrai testo dalle forme
+                for shape in slide.shapes:
+                    if hasattr(shape, "text") and shape.text.strip():
+                        slide_content["texts"].append(shape.text.strip())
+
+                # Estrai note
+                if slide.has_notes_slide and slide.notes_slide.notes_text_frame:
+                    slide_content["notes"] = slide.notes_slide.notes_text_frame.text
+
+                slides.append(slide_content)
+
+            # Testo completo
+            text_parts = []
+            for slide in slides:
+                text_parts.append(f"=== Slide {slide['number']} ===")
+                text_parts.extend(slide["texts"])
+                if slide["notes"]:
+                    text_parts.append(f"[Note: {slide['notes']}]")
+
+            result = {
+                "format": "PowerPoint Presentation",
+                "slides_count": len(slides),
+                "full_text": "\n".join(text_parts)
+            }
+            if not text_only:
+                result["slides"] = slides
+            return result
+
+        except Exception as e:
+            return {"error": f"Errore lettura PPTX: {str(e)}"}
+
+    def _read_text(self, file_bytes: bytes) -> Dict[str, Any]:
+        """
+        Legge un file di testo semplice.
+
+        La codifica è stimata sui primi byte (vedi detect_encoding()) e
+        il file è decodificato una sola volta.
+
+        Args:
+            file_bytes: Contenuto del file (bytes o mmap)
+
+        Returns:
+            Dizionario con testo e info
+        """
+        text, encoding = decode_text(file_bytes)
+        return {
+            "format": "Plain Text",
+            "encoding": encoding,
+            "lines": text.count("\n") + 1,
+            "characters": len(text),
+            "full_text": text
+        }
+
+    def _read_markdown(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
+        """
+        Legge un file Markdown ed estrae la struttura.
+
+        Args:
+            file_bytes: Contenuto del file
+            text_only: Solo testo (niente header e HTML)
+
+        Returns:
+            Dizionario con testo, headers e HTML
+        """
+        result = self._read_text(file_bytes)
+        if "error" in result:
+            return result
+
+        result["format"] = "Markdown"
+        if text_only:
+            return result
+        text = result["full_text"]
+
+        # Estrai gli header (# Header)
+        headers = re.findall(r'^(#{1,6})\s+(.+)$', text, re.MULTILINE)
+        result["headers"] = [
+            {"level": len(h[0]), "text": h[1]}
+            for h in headers
+        ]
+
+        # Converti in HTML se possibile
+        if HAS_MARKDOWN:
+            result["html"] = _load_parser("markdown").markdown(text)
+
+        return result
+
+    def _read_csv(
+        self,
+        file_bytes: bytes,
+        text_only: bool = False,
+        table_summary: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Legge un file CSV/TSV e rileva automaticamente il delimitatore.
+
+        Le righe sono analizzate in streaming: restano in memoria solo le
+        prime TABLE_MAX_ROWS, e full_text si ferma allo stesso punto.
+
+        Args:
+            file_bytes: Contenuto del file
+            text_only: Solo testo, senza parsing delle righe
+            table_summary: Statistiche per colonna al posto delle righe
+
+        Returns:
+            Dizionario con dati e struttura
+        """
+        result = self._read_text(file_bytes)
+        if "error" in result or text_only:
+            if "error" not in result:
+                result["format"] = "CSV"
+            return result
+
+        try:
+            text = result["full_text"]
 
-            return {
-                "format": "Word Document",
-                "paragraphs_count": len(paragraphs),
-                "tables_count": len(tables),
-                "metadata": metadata,
-                "paragraphs": paragraphs,
-                "tables": tables,
-                "full_text": full_text
+            # Rileva il delimitatore più comune
+            sample = text[:2048]  # Usa i primi 2KB per rilevare
+            delimiters = [",", ";", "\t", "|"]
+            delimiter = max(delimiters, key=lambda d: sample.count(d))
+
+            # Parsa il CSV riga per riga, tenendo traccia di quanto testo è stato letto
+            consumed = 0
+            text_end: Optional[int] = None
+
+            def lines():
+                nonlocal consumed
+                for line in StringIO(text):
+                    consumed += len(line)
+                    yield line
+
+            table = _TableBuilder(summary=table_summary)
+            for row in csv.reader(lines(), delimiter=delimiter):
+                if _budget_exceeded():
+                    # Testo fino all'ultima riga letta
+                    text = text[:consumed]
+                    break
+                table.add(row)
+                if text_end is None and table.total_rows == table.max_rows:
+                    text_end = consumed
+
+            result = {
+                "format": "CSV",
+                "delimiter": repr(delimiter),  # Mostra il carattere in modo leggibile
+                "rows": table.total_rows + (1 if table.header else 0),
+                "columns": len(table.columns),
+                "headers": table.header or [],
+                "schema": table.schema(),
             }
 
+            if table_summary:
+                result["full_text"] = table.to_text()
+                return result
+
+            result["data"] = table.rows
+            if table.rows_truncated:
+                result["rows_truncated"] = True
+                omitted = table.total_rows - table.max_rows
+                result["full_text"] = text[:text_end] + f"...[{omitted} righe omesse]"
+            else:
+                result["full_text"] = text
+            return result
+
         except Exception as e:
-            return {"error": f"Errore lettura DOCX: {str(e)}"}
+            return {"error": f"Errore lettura CSV: {str(e)}"}
 
-    def _read_xlsx(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_json(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
         """
-        Legge un file Excel (.xlsx) ed estrae i dati.
+        Legge un file JSON e ne parsa la struttura.
 
         Args:
-            file_bytes: Contenuto del file XLSX
+            file_bytes: Contenuto del file
+            text_only: Solo testo formattato, senza i dati parsati
 
         Returns:
-            Dizionario con fogli e dati
+            Dizionario con dati JSON parsati
         """
-        if not HAS_OPENPYXL:
-            return {"error": "openpyxl non installato. Installa con: pip install openpyxl"}
+        result = self._read_text(file_bytes)
+        if "error" in result:
+            return result
 
         try:
-            # data_only=True per ottenere i valori calcolati, non le formule
-            wb = openpyxl.load_workbook(BytesIO(file_bytes), data_only=True)
+            data = json.loads(result["full_text"])
 
-            sheets = {}
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-
-                # Leggi tutte le righe
-                data = []
-                for row in ws.iter_rows(values_only=True):
-                    # Converti None in stringa vuota
-                    row_data = [str(cell) if cell is not None else "" for cell in row]
-                    # Salta righe completamente vuote
-                    if any(cell.strip() for cell in row_data):
-                        data.append(row_data)
-
-                sheets[sheet_name] = {
-                    "rows": len(data),
-                    "cols": len(data[0]) if data else 0,
-                    "data": data
+            if text_only:
+                return {
+                    "format": "JSON",
+                    "full_text": json.dumps(data, indent=2, ensure_ascii=False)
                 }
 
-            # Converti in testo leggibile
-            text_parts = []
-            for name, sheet in sheets.items():
-                text_parts.append(f"=== Foglio: {name} ===")
-                for row in sheet["data"]:
-                    text_parts.append("\t".join(row))
-
             return {
-                "format": "Excel Spreadsheet",
-                "sheets_count": len(sheets),
-                "sheets": sheets,
-                "full_text": "\n".join(text_parts)
+                "format": "JSON",
+                "type": type(data).__name__,  # list, dict, etc.
+                "keys": list(data.keys()) if isinstance(data, dict) else None,
+                "length": len(data) if isinstance(data, (list, dict)) else None,
+                "data": data,
+                "full_text": json.dumps(data, indent=2, ensure_ascii=False)
             }
 
-        except Exception as e:
-            return {"error": f"Errore lettura XLSX: {str(e)}"}
+        except json.JSONDecodeError as e:
+            return {
+                "error": f"JSON non valido: {str(e)}",
+                "full_text": result["full_text"]
+            }
 
-    def _read_pptx(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_xml(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
         """
-        Legge un file PowerPoint (.pptx) ed estrae testo e note.
+        Legge un file XML.
 
         Args:
-            file_bytes: Contenuto del file PPTX
+            file_bytes: Contenuto del file
+            text_only: Solo testo (niente elemento root)
 
         Returns:
-            Dizionario con slide e testo
+            Dizionario con info sulla struttura XML
         """
-        if not HAS_PPTX:
-            return {"error": "python-pptx non installato. Installa con: pip install python-pptx"}
+        result = self._read_text(file_bytes)
+        if "error" in result:
+            return result
 
-        try:
-            prs = Presentation(BytesIO(file_bytes))
+        result["format"] = "XML"
+        if text_only:
+            return result
+        text = result["full_text"]
 
-            slides = []
-            for i, slide in enumerate(prs.slides, start=1):
-                slide_content = {
-                    "number": i,
-                    "texts": [],
-                    "notes": ""
-                }
+        # Trova l'elemento root
+        root_match = re.search(r'<(\w+)[^>]*>', text)
+        if root_match:
+            result["root_element"] = root_match.group(1)
 
-                # Estrai testo dalle forme
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        slide_content["texts"].append(shape.text.strip())
+        return result
 
-                # Estrai note
-                if slide.has_notes_slide and slide.notes_slide.notes_text_frame:
-                    slide_content["notes"] = slide.notes_slide.notes_text_frame.text
+    def _read_html(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
+        """
+        Legge un file HTML ed estrae il testo.
 
-                slides.append(slide_content)
+        Args:
+            file_bytes: Contenuto del file
+            text_only: Solo testo (niente parsing HTML)
 
-            # Testo completo
-            text_parts = []
-            for slide in slides:
-                text_parts.append(f"=== Slide {slide['number']} ===")
-                text_parts.extend(slide["texts"])
-                if slide["notes"]:
-                    text_parts.append(f"[Note: {slide['notes']}]")
+        Returns:
+            Dizionario con testo estratto e struttura
+        """
+        result = self._read_text(file_bytes)
+        if "error" in result:
+            return result
 
-            return {
-                "format": "PowerPoint Presentation",
-                "slides_count": len(slides),
-                "slides": slides,
-                "full_text": "\n".join(text_parts)
-            }
+        result["format"] = "HTML"
+        if text_only:
+            return result
 
-        except Exception as e:
-            return {"error": f"Errore lettura PPTX: {str(e)}"}
+        if HAS_BS4:
+            soup = _load_parser("bs4").BeautifulSoup(result["full_text"], "html.parser")
 
-    def _read_text(self, file_bytes: bytes) -> Dict[str, Any]:
-        """
-        Legge un file di testo semplice.
+            # Estrai titolo
+            title = soup.find("title")
+            if title:
+                result["title"] = title.get_text()
+
+            # Estrai solo il testo leggibile
+            result["plain_text"] = soup.get_text(separator="\n", strip=True)
+
+            # Estrai gli header
+            headers = []
+            for level in range(1, 7):
+                for h in soup.find_all(f"h{level}"):
+                    headers.append({"level": level, "text": h.get_text()})
+            result["headers"] = headers
+
+        return result
 
-        Prova diverse codifiche per gestire file con encoding diversi.
+    def _read_yaml(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
+        """
+        Legge un file YAML.
 
         Args:
             file_bytes: Contenuto del file
+            text_only: Solo testo (niente parsing YAML)
 
         Returns:
-            Dizionario con testo e info
+            Dizionario con dati YAML parsati
         """
-        # Prova diverse codifiche in ordine di probabilità
-        encodings = ["utf-8", "utf-8-sig", "latin-1", "cp1252", "iso-8859-1"]
+        result = self._read_text(file_bytes)
+        if "error" in result:
+            return result
 
-        for encoding in encodings:
-            try:
-                text = file_bytes.decode(encoding)
-                return {
-                    "format": "Plain Text",
-                    "encoding": encoding,
-                    "lines": text.count("\n") + 1,
-                    "characters": len(text),
-                    "full_text": text
-                }
-            except UnicodeDecodeError:
-                continue
+        result["format"] = "YAML"
+        if text_only:
+            return result
+
+        try:
+            data = _load_parser("yaml").safe_load(result["full_text"])
+            result["data"] = data
+            result["type"] = type(data).__name__
+            if isinstance(data, dict):
+                result["keys"] = list(data.keys())
+        except ImportError:
+            pass  # PyYAML non installato, OK
+        except Exception:
+            pass  # YAML malformato, restituisci comunque il testo
 
-        return {"error": "Impossibile decodificare il file con le codifiche supportate"}
+        return result
 
-    def _read_markdown(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_code(
+        self,
+        file_bytes: bytes,
+        language: str = "unknown",
+        text_only: bool = False
+    ) -> Dict[str, Any]:
         """
-        Legge un file Markdown ed estrae la struttura.
+        Legge un file di codice sorgente.
 
         Args:
             file_bytes: Contenuto del file
+            language: Linguaggio di programmazione
+            text_only: Solo testo (niente statistiche)
 
         Returns:
-            Dizionario con testo, headers e HTML
+            Dizionario con codice e statistiche base
         """
         result = self._read_text(file_bytes)
         if "error" in result:
             return result
 
-        result["format"] = "Markdown"
+        language = language.lstrip(".")
+        result["format"] = f"Source Code ({language})"
+        result["language"] = language
+        if text_only:
+            return result
         text = result["full_text"]
 
-        # Estrai gli header (# Header)
-        headers = re.findall(r'^(#{1,6})\s+(.+)$', text, re.MULTILINE)
-        result["headers"] = [
-            {"level": len(h[0]), "text": h[1]}
-            for h in headers
-        ]
-
-        # Converti in HTML se possibile
-        if HAS_MARKDOWN:
-            result["html"] = markdown.markdown(text)
+        # Statistiche base per alcuni linguaggi
+        if language in ("py", "python"):
+            result["functions"] = len(re.findall(r'^def\s+\w+', text, re.MULTILINE))
+            result["classes"] = len(re.findall(r'^class\s+\w+', text, re.MULTILINE))
+            result["imports"] = len(re.findall(r'^(?:import|from)\s+', text, re.MULTILINE))
+        elif language in ("js", "javascript", "ts", "typescript"):
+            result["functions"] = len(re.findall(r'function\s+\w+|const\s+\w+\s*=\s*(?:async\s*)?\(', text))
+            result["classes"] = len(re.findall(r'class\s+\w+', text))
+        elif language in ("java", "cs", "csharp"):
+            result["classes"] = len(re.findall(r'class\s+\w+', text))
+            result["methods"] = len(re.findall(r'(?:public|private|protected)\s+\w+\s+\w+\s*\(', text))
 
         return result
 
-    def _read_csv(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_image(self, file_bytes: bytes, ext: str = "") -> Dict[str, Any]:
         """
-        Legge un file CSV/TSV e rileva automaticamente il delimitatore.
+        Legge i metadati di un'immagine.
+
+        Args:
+            file_bytes: Contenuto del file immagine
+            ext: Estensione del file
+
+        Returns:
+            Dizionario con metadati immagine
+        """
+        if not HAS_PIL:
+            return {"error": "Pillow non installato. Installa con: pip install Pillow"}
+
+        try:
+            img = _load_parser("PIL").open(as_stream(file_bytes))
+
+            result = {
+                "format": f"Image ({img.format or ext.upper().replace('.', '')})",
+                "width": img.size[0],
+                "height": img.size[1],
+                "mode": img.mode,  # RGB, RGBA, L (grayscale), etc.
+                "size_bytes": len(file_bytes),
+                "size_kb": round(len(file_bytes) / 1024, 2),
+            }
+
+            # Cerca dati EXIF (metadati fotografici)
+            if hasattr(img, "_getexif") and callable(img._getexif):
+                try:
+                    exif = img._getexif()
+                    if exif:
+                        exif_tags = {
+                            271: "camera_make",
+                            272: "camera_model",
+                            306: "datetime",
+                            37386: "focal_length",
+                        }
+                        result["exif"] = {}
+                        for tag_id, name in exif_tags.items():
+                            if tag_id in exif:
+                                result["exif"][name] = str(exif[tag_id])[:100]
+                except Exception:
+                    pass
+
+            # Descrizione testuale
+            result["full_text"] = (
+                f"Immagine {img.format or ext.upper()}\n"
+                f"Dimensioni: {img.size[0]}x{img.size[1]} pixel\n"
+                f"Modalità colore: {img.mode}\n"
+                f"Dimensione file: {result['size_kb']} KB"
+            )
+
+            return result
+
+        except Exception as e:
+            return {"error": f"Errore lettura immagine: {str(e)}"}
+
+    def _read_with_libreoffice(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+        """
+        Legge un documento usando il pool di istanze LibreOffice.
+
+        Questo metodo è usato per formati che non hanno una libreria
+        Python dedicata, come .doc, .xls, .odt, etc.
 
         Args:
             file_bytes: Contenuto del file
+            ext: Estensione del file
 
         Returns:
-            Dizionario con dati e struttura
+            Dizionario con testo estratto
         """
-        result = self._read_text(file_bytes)
-        if "error" in result:
-            return result
+        if not self.libreoffice.available():
+            return {
+                "error": "LibreOffice non installato.",
+                "suggestion": "Installa con: sudo apt install libreoffice (Linux) o winget install TheDocumentFoundation.LibreOffice (Windows)"
+            }
 
         try:
-            text = result["full_text"]
-
-            # Rileva il delimitatore più comune
-            sample = text[:2048]  # Usa i primi 2KB per rilevare
-            delimiters = [",", ";", "\t", "|"]
-            delimiter = max(delimiters, key=lambda d: sample.count(d))
-
-            # Parsa il CSV
-            reader = csv.reader(StringIO(text), delimiter=delimiter)
-            rows = list(reader)
-
+            text = self.libreoffice.convert(file_bytes, ext)
             return {
-                "format": "CSV",
-                "delimiter": repr(delimiter),  # Mostra il carattere in modo leggibile
-                "rows": len(rows),
-                "columns": len(rows[0]) if rows else 0,
-                "headers": rows[0] if rows else [],
-                "data": rows[1:] if len(rows) > 1 else [],
+                "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "Document"),
+                "conversion_method": self.libreoffice.method,
                 "full_text": text
             }
 
+        except subprocess.TimeoutExpired:
+            return {"error": "Timeout durante la conversione con LibreOffice"}
         except Exception as e:
-            return {"error": f"Errore lettura CSV: {str(e)}"}
+            return {"error": f"Errore LibreOffice: {str(e)}"}
 
-    def _read_json(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_gimp(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        Legge un file JSON e ne parsa la struttura.
+        Legge file di editor grafici (XCF, PSD, etc.) usando ImageMagick o GIMP.
 
         Args:
             file_bytes: Contenuto del file
+            ext: Estensione del file
 
         Returns:
-            Dizionario con dati JSON parsati
+            Dizionario con metadati immagine
         """
-        result = self._read_text(file_bytes)
-        if "error" in result:
-            return result
+        import shutil
 
-        try:
-            data = json.loads(result["full_text"])
+        # Prova prima con ImageMagick (più comune)
+        magick = shutil.which("magick") or shutil.which("convert")
+        if magick:
+            return self._read_with_imagemagick(file_bytes, ext)
 
-            return {
-                "format": "JSON",
-                "type": type(data).__name__,  # list, dict, etc.
-                "keys": list(data.keys()) if isinstance(data, dict) else None,
-                "length": len(data) if isinstance(data, (list, dict)) else None,
-                "data": data,
-                "full_text": json.dumps(data, indent=2, ensure_ascii=False)
-            }
+        # Prova con GIMP
+        if shutil.which("gimp"):
+            return self._read_with_gimp_cli(file_bytes, ext)
 
-        except json.JSONDecodeError as e:
-            return {
-                "error": f"JSON non valido: {str(e)}",
-                "full_text": result["full_text"]
-            }
+        # Fallback: Pillow per PSD (supporto limitato)
+        if ext.lower() == ".psd" and HAS_PIL:
+            return self._read_image(file_bytes, ext)
+
+        return {
+            "error": f"Nessun programma disponibile per leggere {ext}",
+            "suggestions": [
+                "sudo apt install imagemagick  # Linux",
+                "sudo apt install gimp  # Linux",
+                "winget install ImageMagick.ImageMagick  # Windows",
+                "winget install GIMP.GIMP  # Windows"
+            ]
+        }
 
-    def _read_xml(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_with_imagemagick(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        Legge un file XML.
+        Estrae informazioni da un'immagine usando ImageMagick.
 
         Args:
             file_bytes: Contenuto del file
+            ext: Estensione del file
 
         Returns:
-            Dizionario con info sulla struttura XML
+            Dizionario con metadati
         """
-        result = self._read_text(file_bytes)
-        if "error" in result:
-            return result
+        import shutil
 
-        result["format"] = "XML"
-        text = result["full_text"]
+        try:
+            # Salva temporaneamente
+            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                tmp.write(file_bytes)
+                tmp_path = tmp.name
 
-        # Trova l'elemento root
-        root_match = re.search(r'<(\w+)[^>]*>', text)
-        if root_match:
-            result["root_element"] = root_match.group(1)
+            # Usa identify per ottenere info
+            magick = shutil.which("magick")
+            if magick:
+                cmd = ["magick", "identify", "-verbose", tmp_path]
+            else:
+                cmd = ["identify", "-verbose", tmp_path]
 
-        return result
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            info_text = result.stdout
+
+            # Parse delle informazioni base
+            info = {
+                "format": ext.upper().replace(".", ""),
+                "conversion_method": "ImageMagick",
+            }
+
+            # Estrai dimensioni
+            geom_match = re.search(r'Geometry:\s*(\d+)x(\d+)', info_text)
+            if geom_match:
+                info["width"] = int(geom_match.group(1))
+                info["height"] = int(geom_match.group(2))
+
+            # Estrai tipo colore
+            type_match = re.search(r'Type:\s*(\w+)', info_text)
+            if type_match:
+                info["color_type"] = type_match.group(1)
+
+            info["full_text"] = info_text[:5000]  # Limita l'output
+
+            os.unlink(tmp_path)
+            return info
+
+        except subprocess.TimeoutExpired:
+            return {"error": "Timeout ImageMagick"}
+        except Exception as e:
+            return {"error": f"Errore ImageMagick: {str(e)}"}
 
-    def _read_html(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_with_gimp_cli(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        Legge un file HTML ed estrae il testo.
+        Legge file usando GIMP in modalità batch.
 
         Args:
             file_bytes: Contenuto del file
+            ext: Estensione del file
 
         Returns:
-            Dizionario con testo estratto e struttura
+            Dizionario con info dal file GIMP
         """
-        result = self._read_text(file_bytes)
-        if "error" in result:
-            return result
-
-        result["format"] = "HTML"
-
-        if HAS_BS4:
-            soup = BeautifulSoup(result["full_text"], "html.parser")
+        try:
+            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                tmp.write(file_bytes)
+                tmp_path = tmp.name
 
-            # Estrai titolo
-            title = soup.find("title")
-            if title:
-                result["title"] = title.get_text()
+            # GIMP script per ottenere info base
+            # Nota: GIMP batch scripting è complesso, restituiamo info minime
+            result = subprocess.run(
+                ["gimp", "-i", "-b", f'(gimp-quit 0)'],
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
 
-            # Estrai solo il testo leggibile
-            result["plain_text"] = soup.get_text(separator="\n", strip=True)
+            os.unlink(tmp_path)
 
-            # Estrai gli header
-            headers = []
-            for level in range(1, 7):
-                for h in soup.find_all(f"h{level}"):
-                    headers.append({"level": level, "text": h.get_text()})
-            result["headers"] = headers
+            return {
+                "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "GIMP Image"),
+                "conversion_method": "GIMP",
+                "full_text": f"File {ext} - usa GIMP per visualizzare i dettagli"
+            }
 
-        return result
+        except Exception as e:
+            return {"error": f"Errore GIMP: {str(e)}"}
 
-    def _read_yaml(self, file_bytes: bytes) -> Dict[str, Any]:
+    def _read_raw(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        Legge un file YAML.
+        Legge file RAW da fotocamere digitali.
 
         Args:
             file_bytes: Contenuto del file
+            ext: Estensione del file
 
         Returns:
-            Dizionario con dati YAML parsati
+            Dizionario con metadati RAW
         """
-        result = self._read_text(file_bytes)
-        if "error" in result:
-            return result
+        # Prova con rawpy
+        try:
+            rawpy = _load_parser("rawpy")
 
-        result["format"] = "YAML"
+            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                tmp.write(file_bytes)
+                tmp_path = tmp.name
+
+            with rawpy.imread(tmp_path) as raw:
+                result = {
+                    "format": f"RAW Image ({ext.upper().replace('.', '')})",
+                    "width": raw.sizes.width,
+                    "height": raw.sizes.height,
+                }
+
+                # Info fotocamera se disponibili
+                if hasattr(raw, "camera_make"):
+                    result["camera_make"] = raw.camera_make.decode() if isinstance(raw.camera_make, bytes) else str(raw.camera_make)
+                if hasattr(raw, "camera_model"):
+                    result["camera_model"] = raw.camera_model.decode() if isinstance(raw.camera_model, bytes) else str(raw.camera_model)
+
+                result["full_text"] = f"RAW {ext.upper()}: {raw.sizes.width}x{raw.sizes.height}"
+
+            os.unlink(tmp_path)
+            return result
 
-        try:
-            import yaml
-            data = yaml.safe_load(result["full_text"])
-            result["data"] = data
-            result["type"] = type(data).__name__
-            if isinstance(data, dict):
-                result["keys"] = list(data.keys())
         except ImportError:
-            pass  # PyYAML non installato, OK
+            pass
         except Exception:
-            pass  # YAML malformato, restituisci comunque il testo
+            pass
 
-        return result
+        # Fallback a ImageMagick
+        return self._read_with_imagemagick(file_bytes, ext)
 
-    def _read_code(self, file_bytes: bytes, language: str = "unknown") -> Dict[str, Any]:
+    def _read_svg(self, file_bytes: bytes) -> Dict[str, Any]:
         """
-        Legge un file di codice sorgente.
+        Legge un file SVG ed estrae informazioni sulla struttura.
 
         Args:
-            file_bytes: Contenuto del file
-            language: Linguaggio di programmazione
+            file_bytes: Contenuto del file SVG
 
         Returns:
-            Dizionario con codice e statistiche base
+            Dizionario con info sul documento SVG
         """
         result = self._read_text(file_bytes)
         if "error" in result:
             return result
 
-        result["format"] = f"Source Code ({language})"
-        result["language"] = language
+        result["format"] = "SVG Vector"
         text = result["full_text"]
 
-        # Statistiche base per alcuni linguaggi
-        if language in ("py", "python"):
-            result["functions"] = len(re.findall(r'^def\s+\w+', text, re.MULTILINE))
-            result["classes"] = len(re.findall(r'^class\s+\w+', text, re.MULTILINE))
-            result["imports"] = len(re.findall(r'^(?:import|from)\s+', text, re.MULTILINE))
-        elif language in ("js", "javascript", "ts", "typescript"):
-            result["functions"] = len(re.findall(r'function\s+\w+|const\s+\w+\s*=\s*(?:async\s*)?\(', text))
-            result["classes"] = len(re.findall(r'class\s+\w+', text))
-        elif language in ("java", "cs", "csharp"):
-            result["classes"] = len(re.findall(r'class\s+\w+', text))
-            result["methods"] = len(re.findall(r'(?:public|private|protected)\s+\w+\s+\w+\s*\(', text))
+        # Estrai dimensioni
+        width = re.search(r'width=["\']?(\d+)', text)
+        height = re.search(r'height=["\']?(\d+)', text)
+        viewbox = re.search(r'viewBox=["\']([^"\']+)["\']', text)
+
+        if width:
+            result["width"] = width.group(1)
+        if height:
+            result["height"] = height.group(1)
+        if viewbox:
+            result["viewbox"] = viewbox.group(1)
+
+        # Conta elementi comuni
+        result["elements"] = {
+            "paths": len(re.findall(r'<path', text)),
+            "circles": len(re.findall(r'<circle', text)),
+            "rects": len(re.findall(r'<rect', text)),
+            "texts": len(re.findall(r'<text', text)),
+            "groups": len(re.findall(r'<g[ >]', text)),
+        }
 
         return result
 
-    def _read_image(self, file_bytes: bytes, ext: str = "") -> Dict[str, Any]:
+    def _read_epub(self, file_bytes: bytes, text_only: bool = False) -> Dict[str, Any]:
         """
-        Legge i metadati di un'immagine.
+        Legge un file EPUB ed estrae testo e metadati.
+
+        Il libro è letto per intero (nessun limite di caratteri): i
+        capitoli, in ordine di lettura, riportano titolo e posizione nel
+        testo, usati da /book per sfogliarlo a pagine.
 
         Args:
-            file_bytes: Contenuto del file immagine
-            ext: Estensione del file
+            file_bytes: Contenuto del file EPUB
+            text_only: Solo testo, senza l'elenco dei capitoli
 
         Returns:
-            Dizionario con metadati immagine
+            Dizionario con capitoli e metadati
         """
-        if not HAS_PIL:
-            return {"error": "Pillow non installato. Installa con: pip install Pillow"}
-
         try:
-            img = Image.open(BytesIO(file_bytes))
-
-            result = {
-                "format": f"Image ({img.format or ext.upper().replace('.', '')})",
-                "width": img.size[0],
-                "height": img.size[1],
-                "mode": img.mode,  # RGB, RGBA, L (grayscale), etc.
-                "size_bytes": len(file_bytes),
-                "size_kb": round(len(file_bytes) / 1024, 2),
-            }
-
-            # Cerca dati EXIF (metadati fotografici)
-            if hasattr(img, "_getexif") and callable(img._getexif):
-                try:
-                    exif = img._getexif()
-                    if exif:
-                        exif_tags = {
-                            271: "camera_make",
-                            272: "camera_model",
-                            306: "datetime",
-                            37386: "focal_length",
-                        }
-                        result["exif"] = {}
-                        for tag_id, name in exif_tags.items():
-                            if tag_id in exif:
-                                result["exif"][name] = str(exif[tag_id])[:100]
-                except Exception:
-                    pass
-
-            # Descrizione testuale
-            result["full_text"] = (
-                f"Immagine {img.format or ext.upper()}\n"
-                f"Dimensioni: {img.size[0]}x{img.size[1]} pixel\n"
-                f"Modalità colore: {img.mode}\n"
-                f"Dimensione file: {result['size_kb']} KB"
-            )
+            book = parse_epub(file_bytes)
+        except Exception as e:
+            return {"error": f"Errore lettura EPUB: {str(e)}"}
 
-            return result
+        result = {
+            "format": "EPUB E-book",
+            "title": book["title"],
+            "author": book["author"],
+            "language": book["language"],
+            "publisher": book["publisher"],
+            "parser": "lxml" if HAS_LXML else "html.parser",
+            "chapters_count": len(book["chapters"]),
+            "characters": len(book["full_text"]),
+        }
+        if not text_only:
+            result["chapters"] = book["chapters"]
+        result["full_text"] = book["full_text"]
 
-        except Exception as e:
-            return {"error": f"Errore lettura immagine: {str(e)}"}
+        return result
 
-    def _read_with_libreoffice(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+    def _read_ebook(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        Legge un documento usando LibreOffice in modalità headless.
+        Legge altri formati e-book usando Calibre.
 
-        Questo metodo è usato per formati che non hanno una libreria
-        Python dedicata, come .doc, .xls, .odt, etc.
+        Il file è convertito in EPUB e letto da _read_epub(), così anche
+        MOBI, AZW e FB2 hanno capitoli e paginazione con /book.
 
         Args:
             file_bytes: Contenuto del file
@@ -1142,517 +4261,1529 @@ class DocumentReader:
         """
         import shutil
 
-        # Trova l'eseguibile di LibreOffice
-        soffice = shutil.which("soffice") or shutil.which("libreoffice")
-        if not soffice:
+        ebook_convert = shutil.which("ebook-convert")
+        if not ebook_convert:
+            # Prova EPUB se possibile
+            if ext.lower() == ".epub":
+                return self._read_epub(file_bytes)
+
             return {
-                "error": "LibreOffice non installato.",
-                "suggestion": "Installa con: sudo apt install libreoffice (Linux) o winget install TheDocumentFoundation.LibreOffice (Windows)"
+                "error": "Calibre non installato.",
+                "suggestion": "Installa con: sudo apt install calibre (Linux) o scarica da https://calibre-ebook.com/"
             }
 
         try:
-            # Salva il file temporaneamente
+            # Salva temporaneamente
             with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
                 tmp.write(file_bytes)
                 tmp_path = tmp.name
 
-            # Crea cartella per l'output
-            output_dir = tempfile.mkdtemp()
-
-            # Converti in testo usando LibreOffice
+            # Converti in EPUB: il libro conserva capitoli e titoli
+            epub_path = tmp_path.rsplit(".", 1)[0] + ".epub"
             subprocess.run(
-                [
-                    soffice,
-                    "--headless",  # Senza interfaccia grafica
-                    "--convert-to", "txt:Text",  # Formato output
-                    "--outdir", output_dir,
-                    tmp_path
-                ],
+                [ebook_convert, tmp_path, epub_path],
                 capture_output=True,
-                timeout=60  # Timeout di 60 secondi
+                timeout=120
             )
+            os.unlink(tmp_path)
 
-            # Leggi il file di output
-            txt_file = Path(output_dir) / (Path(tmp_path).stem + ".txt")
-            if txt_file.exists():
-                text = txt_file.read_text(encoding="utf-8", errors="ignore")
+            if os.path.exists(epub_path):
+                epub_bytes = Path(epub_path).read_bytes()
+                os.unlink(epub_path)
 
-                # Pulizia file temporanei
-                os.unlink(tmp_path)
-                txt_file.unlink()
-                os.rmdir(output_dir)
+                result = self._read_epub(epub_bytes)
+                if "error" not in result:
+                    result["format"] = SUPPORTED_FORMATS.get(ext, {}).get("name", "E-book")
+                    result["conversion_method"] = "Calibre"
+                return result
 
-                return {
-                    "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "Document"),
-                    "conversion_method": "LibreOffice",
-                    "full_text": text
-                }
-            else:
-                return {"error": "Conversione LibreOffice fallita - file output non creato"}
+            return {"error": "Conversione Calibre fallita"}
 
         except subprocess.TimeoutExpired:
-            return {"error": "Timeout durante la conversione con LibreOffice"}
+            return {"error": "Timeout Calibre"}
         except Exception as e:
-            return {"error": f"Errore LibreOffice: {str(e)}"}
+            return {"error": f"Errore Calibre: {str(e)}"}
 
-    def _read_gimp(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+    # -------------------------------------------------------------------------
+    # SOLO METADATI (senza estrarre il contenuto)
+    # -------------------------------------------------------------------------
+    # Leggono intestazioni e proprietà: il costo non dipende dalla lunghezza
+    # del testo, per questo /get-metadata risponde subito anche su file grandi.
+
+    def _meta_pdf(self, file_bytes: bytes, ext: str = ".pdf") -> Dict[str, Any]:
         """
-        Legge file di editor grafici (XCF, PSD, etc.) usando ImageMagick o GIMP.
+        Metadati di un PDF dal trailer (Info) e dal flusso XMP.
 
-        Args:
-            file_bytes: Contenuto del file
-            ext: Estensione del file
+        pypdf legge solo la tabella xref e l'albero delle pagine: i
+        contenuti delle pagine non vengono decodificati.
+        """
+        if not HAS_PYPDF:
+            return {"error": "pypdf non installato. Installa con: pip install pypdf"}
 
-        Returns:
-            Dizionario con metadati immagine
+        try:
+            pdf = _load_parser("pypdf").PdfReader(as_stream(file_bytes))
+            metadata = self._pdf_info(pdf, _PDF_INFO_EXTRA_KEYS)
+
+            # XMP: completa titolo e autore se il trailer non li ha
+            try:
+                xmp = pdf.xmp_metadata
+            except Exception:
+                xmp = None  # XMP malformato: restano i dati del trailer
+            if xmp is not None:
+                if "title" not in metadata and xmp.dc_title:
+                    metadata["title"] = next(iter(xmp.dc_title.values()))
+                if "author" not in metadata and xmp.dc_creator:
+                    metadata["author"] = ", ".join(xmp.dc_creator)
+                metadata["xmp"] = True
+
+            return {
+                "format": "PDF",
+                "pages": len(pdf.pages),
+                "pdf_version": pdf.pdf_header.lstrip("%"),
+                "encrypted": pdf.is_encrypted,
+                "metadata": metadata,
+            }
+
+        except Exception as e:
+            return {"error": f"Errore lettura PDF: {str(e)}"}
+
+    def _meta_ooxml(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
         """
-        import shutil
+        Metadati di un file Office (DOCX/XLSX/PPTX) letti direttamente dallo ZIP.
 
-        # Prova prima con ImageMagick (più comune)
-        magick = shutil.which("magick") or shutil.which("convert")
-        if magick:
-            return self._read_with_imagemagick(file_bytes, ext)
+        docProps/core.xml contiene titolo, autore e date; docProps/app.xml
+        i conteggi salvati dall'applicazione (pagine, parole, slide).
+        Per gli XLSX si aggiungono i nomi dei fogli da xl/workbook.xml.
+        """
+        try:
+            with zipfile.ZipFile(as_stream(file_bytes)) as zf:
+                names = set(zf.namelist())
 
-        # Prova con GIMP
-        if shutil.which("gimp"):
-            return self._read_with_gimp_cli(file_bytes, ext)
+                def xml(name: str) -> Optional[ET.Element]:
+                    return ET.fromstring(zf.read(name)) if name in names else None
 
-        # Fallback: Pillow per PSD (supporto limitato)
-        if ext.lower() == ".psd" and HAS_PIL:
-            return self._read_image(file_bytes, ext)
+                core = xml("docProps/core.xml")
+                app = xml("docProps/app.xml")
+                workbook = xml("xl/workbook.xml") if ext == ".xlsx" else None
 
-        return {
-            "error": f"Nessun programma disponibile per leggere {ext}",
-            "suggestions": [
-                "sudo apt install imagemagick  # Linux",
-                "sudo apt install gimp  # Linux",
-                "winget install ImageMagick.ImageMagick  # Windows",
-                "winget install GIMP.GIMP  # Windows"
-            ]
+        except (zipfile.BadZipFile, ET.ParseError) as e:
+            return {"error": f"Errore lettura metadati Office: {str(e)}"}
+
+        def local(tag: str) -> str:
+            return tag.rsplit("}", 1)[-1]
+
+        metadata = {}
+        for element in (core if core is not None else []):
+            name = _OOXML_CORE_FIELDS.get(local(element.tag))
+            if name and element.text and element.text.strip():
+                metadata[name] = element.text.strip()
+
+        result: Dict[str, Any] = {
+            "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "Office Document"),
+            "metadata": metadata,
         }
+        for element in (app if app is not None else []):
+            name = _OOXML_APP_FIELDS.get(local(element.tag))
+            if name and element.text and element.text.strip():
+                value = element.text.strip()
+                result[name] = int(value) if value.isdigit() else value
+
+        if workbook is not None:
+            result["sheet_names"] = [
+                element.get("name") for element in workbook.iter()
+                if local(element.tag) == "sheet"
+            ]
 
-    def _read_with_imagemagick(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+        return result
+
+    def _meta_image(self, file_bytes: bytes, ext: str = "") -> Dict[str, Any]:
         """
-        Estrae informazioni da un'immagine usando ImageMagick.
+        Metadati di un'immagine dall'intestazione.
+
+        Pillow apre l'immagine in modo pigro: dimensioni, modalità ed EXIF
+        sono nell'intestazione e i pixel non vengono decodificati.
+        """
+        result = self._read_image(file_bytes, ext)
+        result.pop("full_text", None)
+        return result
+
+    def _meta_epub(self, file_bytes: bytes, ext: str = ".epub") -> Dict[str, Any]:
+        """Metadati di un EPUB dal solo pacchetto OPF (nessun capitolo aperto)."""
+        try:
+            book = epub_metadata(file_bytes)
+        except Exception as e:
+            return {"error": f"Errore lettura EPUB: {str(e)}"}
+        return {"format": "EPUB E-book", **book}
+
+    # -------------------------------------------------------------------------
+    # METODO PRINCIPALE
+    # -------------------------------------------------------------------------
+
+    def read(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        use_cache: bool = True,
+        file_hash: Optional[str] = None,
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        table_summary: bool = False,
+        budget: Optional[ReadBudget] = None
+    ) -> Dict[str, Any]:
+        """
+        Legge un documento e restituisce il contenuto strutturato.
+
+        Questo è il metodo principale da chiamare. Determina automaticamente
+        il tipo di file dall'estensione e usa il reader appropriato.
 
         Args:
-            file_bytes: Contenuto del file
-            ext: Estensione del file
+            file_bytes: Contenuto del file (bytes o mmap di un upload)
+            filename: Nome del file (usato per determinare il formato)
+            use_cache: Se True, usa la cache per evitare riletture
+            file_hash: Hash già calcolato durante l'upload (evita di ricalcolarlo)
+            max_chars: Budget di caratteri: i reader che lo supportano (PDF)
+                smettono di estrarre appena raggiunto
+            max_pages: Budget di pagine (PDF)
+            text_only: Solo full_text e campi essenziali: i reader saltano
+                la costruzione delle strutture (pagine, paragrafi, celle).
+                Ha una chiave di cache propria
+            table_summary: Per XLSX/CSV, statistiche per colonna (tipo,
+                conteggi, min/max, valori distinti) al posto delle righe
+            budget: Scadenza e memoria massima (vedi ReadBudget); un
+                risultato interrotto dal budget non va in cache
 
         Returns:
-            Dizionario con metadati
+            Dizionario con:
+                - format: Tipo di documento
+                - full_text: Testo estratto
+                - truncated: True se il budget ha fermato l'estrazione
+                - truncated_reason: "timeout" o "memory" se l'ha fermata
+                  il budget di lettura
+                - Altri campi specifici per formato
+                - error: Messaggio di errore se fallisce
+
+        Esempio:
+            with open("documento.pdf", "rb") as f:
+                result = reader.read(f.read(), "documento.pdf")
+
+            if "error" not in result:
+                print(result["full_text"])
         """
-        import shutil
+        # Controlla la cache
+        if file_hash is None:
+            file_hash = self.cache.get_hash(file_bytes)
+
+        if use_cache:
+            cached = self.cache_lookup(
+                file_hash, max_chars, max_pages, text_only, table_summary
+            )
+            if cached:
+                cached["from_cache"] = True
+                return cached
+
+        result = self.parse(
+            file_bytes, filename, file_hash,
+            max_chars=max_chars, max_pages=max_pages,
+            text_only=text_only, table_summary=table_summary, budget=budget
+        )
+
+        # Salva in cache se non c'è errore
+        if use_cache:
+            self.cache_store(
+                file_hash, result, max_chars, max_pages, text_only, table_summary
+            )
+
+        return result
+
+    @staticmethod
+    def _cache_key(
+        file_hash: str,
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        table_summary: bool = False
+    ) -> str:
+        """Chiave di cache: risultati parziali, solo testo e riepiloghi hanno una chiave propria."""
+        key = f"{file_hash}:text" if text_only else file_hash
+        if table_summary:
+            key += ":table"
+        if max_chars is None and max_pages is None:
+            return key
+        return f"{key}:c{max_chars or 0}:p{max_pages or 0}"
+
+    @staticmethod
+    def _text_view(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Riduce un risultato strutturato alla forma "solo testo"."""
+        return {k: v for k, v in result.items() if k not in STRUCTURED_FIELDS}
+
+    def cache_lookup(
+        self,
+        file_hash: str,
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        table_summary: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Cerca un risultato in cache.
+
+        Con un budget va bene anche il risultato completo, se presente.
+        In modalità solo testo va bene anche il risultato strutturato.
+        """
+        if table_summary:
+            return self.cache.get(self._cache_key(file_hash, text_only=text_only, table_summary=True))
+
+        cached = self.cache.get(self._cache_key(file_hash, text_only=text_only))
+        if cached is None and text_only:
+            full = self.cache.get(file_hash)
+            if full is not None:
+                cached = self._text_view(full)
+        if cached is None and (max_chars is not None or max_pages is not None):
+            cached = self.cache.get(
+                self._cache_key(file_hash, max_chars, max_pages, text_only)
+            )
+        return cached
+
+    def cache_store(
+        self,
+        file_hash: str,
+        result: Dict[str, Any],
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        table_summary: bool = False
+    ) -> None:
+        """
+        Salva un risultato in cache e nell'indice di ricerca (solo se non
+        contiene errori).
+
+        Un risultato troncato dal budget non deve sostituire quello completo;
+        uno interrotto dal budget di lettura non viene salvato affatto.
+        """
+        if "error" in result or result.get("truncated_reason"):
+            return
+        self.search_index.add(file_hash, result)
+        if result.get("truncated"):
+            key = self._cache_key(file_hash, max_chars, max_pages, text_only, table_summary)
+        else:
+            key = self._cache_key(file_hash, text_only=text_only, table_summary=table_summary)
+        self.cache.set(key, result)
+        self.record_derived(file_hash, key, result.get("size_bytes", 0))
 
+    def record_derived(self, file_hash: str, cache_key: str, size: int) -> None:
+        """
+        Registra nell'archivio condiviso un risultato salvato in cache.
+
+        Il risultato resta nella cache del servizio: l'archivio tiene
+        traccia di quali risultati derivati esistono per ogni file.
+        """
+        kind = cache_key[len(file_hash):].lstrip(":") or "full"
         try:
-            # Salva temporaneamente
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
+            self.store.register_blob(file_hash, size)
+            self.store.put_result(file_hash, "document", kind)
+        except sqlite3.Error:
+            pass  # L'archivio condiviso è accessorio: non blocca la lettura
 
-            # Usa identify per ottenere info
-            magick = shutil.which("magick")
-            if magick:
-                cmd = ["magick", "identify", "-verbose", tmp_path]
-            else:
-                cmd = ["identify", "-verbose", tmp_path]
+    def parse(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        file_hash: str,
+        max_chars: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        text_only: bool = False,
+        table_summary: bool = False,
+        budget: Optional[ReadBudget] = None
+    ) -> Dict[str, Any]:
+        """
+        Esegue il reader adatto al formato, senza usare la cache.
 
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            info_text = result.stdout
+        Args:
+            file_bytes: Contenuto del file
+            filename: Nome del file
+            file_hash: Hash del contenuto
+            max_chars: Budget di caratteri (vedi read())
+            max_pages: Budget di pagine (vedi read())
+            text_only: Solo testo (vedi read())
+            table_summary: Riepilogo per colonna di XLSX/CSV (vedi read())
+            budget: Budget di lettura (vedi read())
 
-            # Parse delle informazioni base
-            info = {
-                "format": ext.upper().replace(".", ""),
-                "conversion_method": "ImageMagick",
+        Returns:
+            Risultato del reader con i metadati comuni
+        """
+        # Formato dal nome file, o dal contenuto se manca o non corrisponde
+        ext, sniffed = resolve_format(filename, file_bytes)
+        spec = reader_for(ext)
+
+        if spec is None:
+            return {
+                "error": f"Formato non supportato: {ext or 'sconosciuto'}",
+                "supported_formats": list(SUPPORTED_FORMATS.keys())
             }
 
-            # Estrai dimensioni
-            geom_match = re.search(r'Geometry:\s*(\d+)x(\d+)', info_text)
-            if geom_match:
-                info["width"] = int(geom_match.group(1))
-                info["height"] = int(geom_match.group(2))
+        if budget is not None:
+            budget.start()
+        _active_budget.budget = budget
+        try:
+            result = spec.call(
+                self, file_bytes, ext,
+                max_chars=max_chars, max_pages=max_pages,
+                text_only=text_only, table_summary=table_summary,
+                file_hash=file_hash
+            )
+        finally:
+            _active_budget.budget = None
 
-            # Estrai tipo colore
-            type_match = re.search(r'Type:\s*(\w+)', info_text)
-            if type_match:
-                info["color_type"] = type_match.group(1)
+        if budget is not None and budget.reason and "error" not in result:
+            # Risultato parziale: quanto letto prima dell'esaurimento del budget
+            result["truncated"] = True
+            result["truncated_reason"] = budget.reason
 
-            info["full_text"] = info_text[:5000]  # Limita l'output
+        self._add_common_fields(result, file_bytes, filename, file_hash, ext, sniffed)
+        if text_only:
+            result["text_only"] = True
+        if table_summary:
+            result["table_summary"] = True
 
-            os.unlink(tmp_path)
-            return info
+        return result
 
-        except subprocess.TimeoutExpired:
-            return {"error": "Timeout ImageMagick"}
-        except Exception as e:
-            return {"error": f"Errore ImageMagick: {str(e)}"}
+    @staticmethod
+    def _add_common_fields(
+        result: Dict[str, Any],
+        file_bytes: Any,
+        filename: str,
+        file_hash: str,
+        ext: str,
+        sniffed: bool
+    ) -> None:
+        """Aggiunge al risultato di un reader i metadati comuni a tutti i formati."""
+        result["filename"] = filename
+        result["extension"] = ext
+        if sniffed:
+            result["declared_extension"] = Path(filename).suffix.lower()
+        result["size_bytes"] = len(file_bytes)
+        result["size_kb"] = round(len(file_bytes) / 1024, 2)
+        result["hash"] = file_hash
+        result["timestamp"] = datetime.now().isoformat()
+        result["from_cache"] = False
 
-    def _read_with_gimp_cli(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+    def get_metadata(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        file_hash: Optional[str] = None,
+        use_cache: bool = True,
+        budget: Optional[ReadBudget] = None
+    ) -> Dict[str, Any]:
         """
-        Legge file usando GIMP in modalità batch.
+        Restituisce solo i metadati di un documento.
+
+        I formati con un reader di soli metadati (PDF, Office, immagini,
+        EPUB) leggono intestazioni e proprietà senza estrarre il testo; gli
+        altri passano da read() in modalità solo testo e il testo viene
+        rimosso. Il risultato ha una chiave di cache propria.
 
         Args:
             file_bytes: Contenuto del file
-            ext: Estensione del file
+            filename: Nome del file
+            file_hash: Hash già calcolato durante l'upload (opzionale)
+            use_cache: Se True, usa la cache
+            budget: Budget di lettura per i formati senza percorso rapido
 
         Returns:
-            Dizionario con info dal file GIMP
+            Metadati del documento, con "metadata_only": true se letti
+            senza estrarre il contenuto
         """
-        try:
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
+        if file_hash is None:
+            file_hash = self.cache.get_hash(file_bytes)
+        key = self.metadata_cache_key(file_hash)
 
-            # GIMP script per ottenere info base
-            # Nota: GIMP batch scripting è complesso, restituiamo info minime
-            result = subprocess.run(
-                ["gimp", "-i", "-b", f'(gimp-quit 0)'],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached:
+                cached["from_cache"] = True
+                return cached
 
-            os.unlink(tmp_path)
+        ext, sniffed = resolve_format(filename, file_bytes)
+        spec = reader_for(ext)
+        if spec is not None and spec.metadata is not None:
+            result = spec.call_metadata(self, file_bytes, ext)
+            self._add_common_fields(result, file_bytes, filename, file_hash, ext, sniffed)
+            result["metadata_only"] = True
+        else:
+            result = self.metadata_view(self.read(
+                file_bytes, filename, use_cache, file_hash=file_hash,
+                text_only=True, budget=budget
+            ))
+
+        if use_cache and "error" not in result and not result.get("truncated_reason"):
+            self.cache.set(key, result)
+            self.record_derived(file_hash, key, result.get("size_bytes", 0))
+        return result
 
-            return {
-                "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "GIMP Image"),
-                "conversion_method": "GIMP",
-                "full_text": f"File {ext} - usa GIMP per visualizzare i dettagli"
-            }
+    @staticmethod
+    def metadata_cache_key(file_hash: str) -> str:
+        """Chiave di cache dei soli metadati."""
+        return f"{file_hash}:meta"
 
-        except Exception as e:
-            return {"error": f"Errore GIMP: {str(e)}"}
+    @staticmethod
+    def metadata_view(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Riduce un risultato di lettura ai soli metadati (senza testo né strutture)."""
+        return {
+            k: v for k, v in result.items()
+            if k != "full_text" and k not in STRUCTURED_FIELDS
+        }
 
-    def _read_raw(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+    def get_summary(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        max_chars: int = 2000,
+        file_hash: Optional[str] = None,
+        budget: Optional[ReadBudget] = None
+    ) -> str:
         """
-        Legge file RAW da fotocamere digitali.
+        Restituisce un riassunto breve del documento.
 
         Args:
             file_bytes: Contenuto del file
-            ext: Estensione del file
+            filename: Nome del file
+            max_chars: Massimo numero di caratteri
+            file_hash: Hash già calcolato (opzionale)
+            budget: Budget di lettura (opzionale)
 
         Returns:
-            Dizionario con metadati RAW
+            Stringa con riassunto del documento
         """
-        # Prova con rawpy
-        try:
-            import rawpy
+        # Il budget permette ai reader paginati di fermarsi presto
+        result = self.read(
+            file_bytes, filename, file_hash=file_hash, max_chars=max_chars,
+            text_only=True, budget=budget
+        )
+        return self.format_summary(result, max_chars)
 
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
+    def get_chunks(
+        self,
+        file_bytes: bytes,
+        filename: str,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        file_hash: Optional[str] = None,
+        use_cache: bool = True,
+        budget: Optional[ReadBudget] = None
+    ) -> Dict[str, Any]:
+        """
+        Suddivide il documento in segmenti con budget di token.
 
-            with rawpy.imread(tmp_path) as raw:
-                result = {
-                    "format": f"RAW Image ({ext.upper().replace('.', '')})",
-                    "width": raw.sizes.width,
-                    "height": raw.sizes.height,
-                }
+        I segmenti sono in cache per hash e parametri; il parsing sottostante
+        usa la cache di read(), quindi cambiare i parametri non rilegge il file.
 
-                # Info fotocamera se disponibili
-                if hasattr(raw, "camera_make"):
-                    result["camera_make"] = raw.camera_make.decode() if isinstance(raw.camera_make, bytes) else str(raw.camera_make)
-                if hasattr(raw, "camera_model"):
-                    result["camera_model"] = raw.camera_model.decode() if isinstance(raw.camera_model, bytes) else str(raw.camera_model)
+        Args:
+            file_bytes: Contenuto del file
+            filename: Nome del file
+            max_tokens: Token massimi per segmento
+            overlap_tokens: Token ripetuti tra segmenti consecutivi
+            file_hash: Hash già calcolato (opzionale)
+            use_cache: Se True, usa la cache
+            budget: Budget di lettura (opzionale)
 
-                result["full_text"] = f"RAW {ext.upper()}: {raw.sizes.width}x{raw.sizes.height}"
+        Returns:
+            Dizionario con i segmenti (vedi chunk_result())
+        """
+        if file_hash is None:
+            file_hash = self.cache.get_hash(file_bytes)
 
-            os.unlink(tmp_path)
-            return result
+        key = self.chunks_cache_key(file_hash, max_tokens, overlap_tokens)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached:
+                cached["from_cache"] = True
+                return cached
 
-        except ImportError:
-            pass
-        except Exception:
-            pass
+        result = self.read(file_bytes, filename, use_cache, file_hash=file_hash, budget=budget)
+        chunked = self.chunk_result(result, max_tokens, overlap_tokens)
 
-        # Fallback a ImageMagick
-        return self._read_with_imagemagick(file_bytes, ext)
+        if use_cache and "error" not in chunked and not result.get("truncated_reason"):
+            self.cache.set(key, chunked)
+            self.record_derived(file_hash, key, result.get("size_bytes", 0))
+        return chunked
 
-    def _read_svg(self, file_bytes: bytes) -> Dict[str, Any]:
+    @staticmethod
+    def chunks_cache_key(file_hash: str, max_tokens: int, overlap_tokens: int) -> str:
+        """Chiave di cache dei segmenti."""
+        return f"{file_hash}:chunks:t{max_tokens}:o{overlap_tokens}"
+
+    @staticmethod
+    def chunk_result(
+        result: Dict[str, Any],
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+    ) -> Dict[str, Any]:
         """
-        Legge un file SVG ed estrae informazioni sulla struttura.
+        Costruisce la risposta di /chunks a partire da un risultato di read().
+
+        Returns:
+            Dizionario con filename, format, hash, parametri e lista "chunks"
+        """
+        if "error" in result:
+            return {"error": result["error"], "filename": result.get("filename")}
+
+        chunks = chunk_document(result, max_tokens, overlap_tokens)
+        chunked = {
+            "filename": result.get("filename"),
+            "format": result.get("format"),
+            "hash": result.get("hash"),
+            "max_tokens": max_tokens,
+            "overlap_tokens": overlap_tokens,
+            "chunks_count": len(chunks),
+            "chunks": chunks,
+            "from_cache": False
+        }
+        if result.get("truncated_reason"):
+            chunked["truncated_reason"] = result["truncated_reason"]
+        return chunked
+
+    @staticmethod
+    def format_summary(result: Dict[str, Any], max_chars: int = 2000) -> str:
+        """
+        Formatta il riassunto a partire da un risultato di read().
 
         Args:
-            file_bytes: Contenuto del file SVG
+            result: Risultato restituito da read()
+            max_chars: Massimo numero di caratteri
 
         Returns:
-            Dizionario con info sul documento SVG
+            Stringa con riassunto del documento
         """
-        result = self._read_text(file_bytes)
         if "error" in result:
-            return result
+            return f"Errore: {result['error']}"
 
-        result["format"] = "SVG Vector"
-        text = result["full_text"]
+        full_text = result.get("full_text", "")
+        if len(full_text) > max_chars:
+            full_text = full_text[:max_chars] + "\n...[troncato]"
 
-        # Estrai dimensioni
-        width = re.search(r'width=["\']?(\d+)', text)
-        height = re.search(r'height=["\']?(\d+)', text)
-        viewbox = re.search(r'viewBox=["\']([^"\']+)["\']', text)
+        return f"[{result.get('format', 'Documento')}] {result.get('filename', '')}\n\n{full_text}"
 
-        if width:
-            result["width"] = width.group(1)
-        if height:
-            result["height"] = height.group(1)
-        if viewbox:
-            result["viewbox"] = viewbox.group(1)
 
-        # Conta elementi comuni
-        result["elements"] = {
-            "paths": len(re.findall(r'<path', text)),
-            "circles": len(re.findall(r'<circle', text)),
-            "rects": len(re.findall(r'<rect', text)),
-            "texts": len(re.findall(r'<text', text)),
-            "groups": len(re.findall(r'<g[ >]', text)),
-        }
+# ============================================================================
+# CLASSE: DocumentWorkerPool
+# ============================================================================
 
-        return result
+class QueueFullError(Exception):
+    """La coda del worker pool è piena: il client deve riprovare più tardi."""
+    pass
 
-    def _read_epub(self, file_bytes: bytes) -> Dict[str, Any]:
-        """
-        Legge un file EPUB ed estrae testo e metadati.
 
-        Args:
-            file_bytes: Contenuto del file EPUB
+# Reader privato dei processi worker (modalità "process")
+_worker_reader: Optional[DocumentReader] = None
 
-        Returns:
-            Dizionario con capitoli e metadati
-        """
-        if not HAS_EBOOKLIB:
-            return {"error": "ebooklib non installato. Installa con: pip install ebooklib"}
 
+def _process_read(file_bytes: bytes, filename: str, file_hash: str, **options: Any) -> Dict[str, Any]:
+    """
+    Legge un documento dentro un processo worker.
+
+    La cache è gestita dal processo principale, il worker fa solo parsing.
+    """
+    global _worker_reader, _IN_WORKER_PROCESS
+    if _worker_reader is None:
+        _IN_WORKER_PROCESS = True
+        _worker_reader = DocumentReader()
+    return _worker_reader.parse(file_bytes, filename, file_hash, **options)
+
+
+def default_worker_count() -> int:
+    """
+    Numero di worker per il parsing.
+
+    Usa DOC_WORKERS se impostato, altrimenti SystemProfile.max_parallel_ops.
+    """
+    if DOC_WORKERS > 0:
+        return DOC_WORKERS
+    if HAS_PROFILER:
         try:
-            book = epub.read_epub(BytesIO(file_bytes))
+            return max(1, get_profile().max_parallel_ops)
+        except Exception:
+            pass
+    return 2
 
-            # Metadati
-            title = book.get_metadata('DC', 'title')
-            author = book.get_metadata('DC', 'creator')
-            language = book.get_metadata('DC', 'language')
 
-            result = {
-                "format": "EPUB E-book",
-                "title": title[0][0] if title else None,
-                "author": author[0][0] if author else None,
-                "language": language[0][0] if language else None,
-            }
+def _killable_worker_main(conn: Any) -> None:
+    """Ciclo di un processo di KillableProcessPool: esegue i task ricevuti."""
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        try:
+            conn.send((True, task()))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # Eccezione non serializzabile: basta il messaggio
+                conn.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
 
-            # Estrai testo dai capitoli
-            chapters = []
-            text_parts = []
 
-            for item in book.get_items():
-                if item.get_type() == 9:  # ITEM_DOCUMENT
-                    content = item.get_content().decode('utf-8', errors='ignore')
+class _KillableWorker:
+    """Processo worker con la sua pipe."""
+
+    def __init__(self, context: Any) -> None:
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_killable_worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
 
-                    # Rimuovi tag HTML
-                    if HAS_BS4:
-                        soup = BeautifulSoup(content, 'html.parser')
-                        text = soup.get_text(separator='\n', strip=True)
-                    else:
-                        text = re.sub(r'<[^>]+>', '', content)
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
 
-                    if text.strip():
-                        chapters.append({
-                            "name": item.get_name(),
-                            "preview": text[:300]  # Anteprima
-                        })
-                        text_parts.append(text)
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
 
-            result["chapters_count"] = len(chapters)
-            result["chapters"] = chapters[:20]  # Max 20 capitoli nell'output
-            result["full_text"] = "\n\n".join(text_parts)[:100000]  # Max 100k caratteri
 
-            return result
+class KillableProcessPool(Executor):
+    """
+    Pool di processi in cui un singolo task può essere interrotto.
 
-        except Exception as e:
-            return {"error": f"Errore lettura EPUB: {str(e)}"}
+    ProcessPoolExecutor non permette di fermare un task: un PDF patologico
+    o un DOCX "zip bomb" bloccherebbero il worker per sempre. Qui ogni
+    task è sorvegliato da un thread: oltre kill_after secondi o oltre
+    max_rss_growth byte di memoria aggiunta il processo viene terminato
+    (e sostituito al task successivo) e il task fallisce con
+    BudgetExceeded. Con submit_until() un task ha anche una scadenza
+    assoluta, ad esempio quella della lettura che lo ha avviato.
 
-    def _read_ebook(self, file_bytes: bytes, ext: str) -> Dict[str, Any]:
+    Attributi:
+        workers: Numero di processi
+        kill_after: Secondi concessi a un task (None = nessun limite)
+        max_rss_growth: Memoria aggiuntiva concessa (None = nessun limite)
+        killed: Processi terminati per motivo (timeout, memory)
+    """
+
+    # Intervallo tra due controlli del processo sorvegliato
+    POLL_SECONDS = 0.1
+
+    def __init__(
+        self,
+        workers: int,
+        kill_after: Optional[float] = None,
+        max_rss_growth: Optional[int] = None
+    ) -> None:
+        self.workers = max(1, workers)
+        self.kill_after = kill_after
+        self.max_rss_growth = max_rss_growth
+        self.killed = {TRUNCATED_TIMEOUT: 0, TRUNCATED_MEMORY: 0}
+        self._context = multiprocessing.get_context()
+        self._idle: List[_KillableWorker] = []
+        self._lock = threading.Lock()
+        # Un thread di sorveglianza per processo: mai più task che processi
+        self._dispatch = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="docreader-guard"
+        )
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Accoda un task (funzione serializzabile) e restituisce il Future."""
+        return self.submit_until(None, fn, *args, **kwargs)
+
+    def submit_until(
+        self,
+        deadline: Optional[float],
+        fn: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> Any:
         """
-        Legge altri formati e-book usando Calibre.
+        Come submit(), ma il task viene terminato anche oltre deadline.
 
         Args:
-            file_bytes: Contenuto del file
-            ext: Estensione del file
-
-        Returns:
-            Dizionario con testo estratto
+            deadline: Scadenza in time.monotonic() (None = solo kill_after)
         """
-        import shutil
+        return self._dispatch.submit(
+            self._call, functools.partial(fn, *args, **kwargs), deadline
+        )
 
-        ebook_convert = shutil.which("ebook-convert")
-        if not ebook_convert:
-            # Prova EPUB se possibile
-            if ext.lower() == ".epub":
-                return self._read_epub(file_bytes)
+    def _call(self, task: Callable[[], Any], until: Optional[float] = None) -> Any:
+        if until is not None and time.monotonic() > until:
+            # Scaduto in coda: inutile avviare un processo
+            raise BudgetExceeded(TRUNCATED_TIMEOUT)
 
-            return {
-                "error": "Calibre non installato.",
-                "suggestion": "Installa con: sudo apt install calibre (Linux) o scarica da https://calibre-ebook.com/"
-            }
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None or not worker.process.is_alive():
+            worker = _KillableWorker(self._context)
 
         try:
-            # Salva temporaneamente
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
+            worker.conn.send(task)
+            rss_start = _rss_bytes(worker.process.pid) if self.max_rss_growth else None
+            deadline = time.monotonic() + self.kill_after if self.kill_after else None
+            if until is not None:
+                deadline = until if deadline is None else min(deadline, until)
+
+            # poll() è vero anche se il processo muore: recv() solleva EOFError
+            while not worker.conn.poll(self.POLL_SECONDS):
+                reason = None
+                if deadline is not None and time.monotonic() > deadline:
+                    reason = TRUNCATED_TIMEOUT
+                elif rss_start is not None:
+                    rss = _rss_bytes(worker.process.pid)
+                    if rss is not None and rss - rss_start > self.max_rss_growth:
+                        reason = TRUNCATED_MEMORY
+
+                if reason is not None:
+                    worker.kill()
+                    worker = None
+                    with self._lock:
+                        self.killed[reason] += 1
+                    raise BudgetExceeded(reason)
+
+            ok, value = worker.conn.recv()
+        except (EOFError, OSError):
+            # Processo morto durante il task (es. terminato dal sistema per memoria)
+            if worker is not None:
+                worker.kill()
+                worker = None
+            raise RuntimeError("Il processo worker è terminato durante la lettura")
+        finally:
+            if worker is not None:
+                with self._lock:
+                    self._idle.append(worker)
+
+        if ok:
+            return value
+        raise value
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """Ferma i processi inattivi; quelli impegnati terminano con il loro task."""
+        self._dispatch.shutdown(wait=wait, cancel_futures=cancel_futures)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+class DocumentWorkerPool:
+    """
+    Esegue il parsing dei documenti in un pool di thread o processi.
 
-            # Converti in testo
-            txt_path = tmp_path.rsplit(".", 1)[0] + ".txt"
-            subprocess.run(
-                [ebook_convert, tmp_path, txt_path],
-                capture_output=True,
-                timeout=120
+    Gli endpoint sono async ma i reader sono sincroni: senza pool un PDF
+    grande o una conversione LibreOffice bloccherebbero l'intero event loop,
+    health check compreso. Il pool limita anche la coda: oltre
+    workers + max_queue richieste in corso viene sollevata QueueFullError.
+
+    La classe di costo del reader (vedi ReaderSpec) decide dove leggere:
+    i formati leggeri sotto INLINE_MAX_BYTES sono letti subito, senza
+    passare dal pool; in modalità "process" i reader che delegano a un
+    programma esterno usano un thread (il lavoro è già in un altro processo).
+
+    Ogni lettura ha un budget di tempo e memoria (vedi ReadBudget,
+    read_budget_limits()): i reader si fermano da soli restituendo il
+    risultato parziale. In modalità "process" (default) i worker sono anche
+    terminabili (KillableProcessPool): un reader bloccato in codice che non
+    controlla il budget viene fermato poco dopo la scadenza. In modalità
+    "thread" un reader bloccato occupa il suo thread fino alla fine.
+
+    Attributi:
+        workers: Numero di worker paralleli
+        mode: "process" oppure "thread"
+        max_queue: Richieste in attesa accettate oltre ai worker occupati
+        read_timeout: Secondi concessi a ogni lettura
+        read_max_rss: Memoria aggiuntiva concessa a ogni lettura (None = nessun limite)
+
+    Esempio:
+        pool = DocumentWorkerPool(workers=4)
+        result = await pool.read(reader, contents, "documento.pdf")
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        mode: Optional[str] = None,
+        max_queue: int = DOC_QUEUE_MAX,
+        read_timeout: Optional[float] = None,
+        read_max_rss: Optional[int] = None
+    ) -> None:
+        """
+        Inizializza il pool.
+
+        Args:
+            workers: Numero di worker (None = default_worker_count())
+            mode: "process" o "thread" (None = DOC_WORKER_MODE)
+            max_queue: Massimo numero di richieste in attesa
+            read_timeout: Secondi per lettura (None = read_budget_limits())
+            read_max_rss: Byte di memoria per lettura (None = read_budget_limits())
+        """
+        self.workers = max(1, workers or default_worker_count())
+        mode = mode or DOC_WORKER_MODE
+        self.mode = mode if mode in ("thread", "process") else "process"
+        self.max_queue = max(0, max_queue)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        default_timeout, default_rss = read_budget_limits()
+        self.read_timeout = read_timeout or default_timeout
+        self.read_max_rss = read_max_rss or default_rss
+        self.budget_stops = {TRUNCATED_TIMEOUT: 0, TRUNCATED_MEMORY: 0}
+
+        if self.mode == "process":
+            self._executor = KillableProcessPool(
+                self.workers,
+                kill_after=self.read_timeout + READ_KILL_GRACE_SECONDS,
+                max_rss_growth=(
+                    int(self.read_max_rss * READ_KILL_RSS_FACTOR) if self.read_max_rss else None
+                )
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="docreader"
             )
+        # Thread per i reader a sottoprocesso in modalità "process"
+        self._thread_executor: Optional[ThreadPoolExecutor] = None
+        self.inline_reads = 0
+
+    def _acquire(self) -> None:
+        """Riserva un posto nella coda o solleva QueueFullError."""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise QueueFullError(
+                    f"Servizio occupato: {self._pending} documenti in elaborazione. "
+                    f"Riprova tra {RETRY_AFTER_SECONDS} secondi."
+                )
+            self._pending += 1
 
-            if os.path.exists(txt_path):
-                text = Path(txt_path).read_text(encoding='utf-8', errors='ignore')
+    def _release(self) -> None:
+        """Libera un posto nella coda."""
+        with self._lock:
+            self._pending -= 1
 
-                # Pulizia
-                os.unlink(tmp_path)
-                os.unlink(txt_path)
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Esegue una funzione sincrona nel pool.
 
-                return {
-                    "format": SUPPORTED_FORMATS.get(ext, {}).get("name", "E-book"),
-                    "conversion_method": "Calibre",
-                    "full_text": text
-                }
+        In modalità "process" la funzione deve essere serializzabile
+        (funzione di modulo, non metodo legato o lambda).
 
-            os.unlink(tmp_path)
-            return {"error": "Conversione Calibre fallita"}
+        Raises:
+            QueueFullError: Se la coda è piena
+        """
+        return await self._run_in(self._executor, func, *args, **kwargs)
 
-        except subprocess.TimeoutExpired:
-            return {"error": "Timeout Calibre"}
-        except Exception as e:
-            return {"error": f"Errore Calibre: {str(e)}"}
+    async def _run_in(self, executor: Any, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Esegue una funzione in un executor rispettando il limite della coda."""
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor, functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            self._release()
 
-    # -------------------------------------------------------------------------
-    # METODO PRINCIPALE
-    # -------------------------------------------------------------------------
+    def _route(self, file_bytes: Any, filename: str) -> str:
+        """
+        Dove eseguire una lettura in base al costo del reader.
 
-    def read(
+        Returns:
+            "inline", "thread" o "pool"
+        """
+        # Stesso formato che userà parse(): un file OLE2 salvato come .pdf
+        # va trattato da .doc, cioè da reader a sottoprocesso
+        ext, _ = resolve_format(filename, file_bytes)
+        spec = reader_for(ext)
+        if spec is None:
+            return "pool"
+        if spec.cost == COST_CHEAP and len(file_bytes) <= INLINE_MAX_BYTES:
+            return "inline"
+        if spec.cost == COST_SUBPROCESS and self.mode == "process":
+            return "thread"
+        return "pool"
+
+    async def read(
         self,
+        reader: DocumentReader,
         file_bytes: bytes,
         filename: str,
-        use_cache: bool = True
+        use_cache: bool = True,
+        file_hash: Optional[str] = None,
+        **options: Any
     ) -> Dict[str, Any]:
         """
-        Legge un documento e restituisce il contenuto strutturato.
-
-        Questo è il metodo principale da chiamare. Determina automaticamente
-        il tipo di file dall'estensione e usa il reader appropriato.
+        Equivalente asincrono di DocumentReader.read().
 
         Args:
-            file_bytes: Contenuto del file in bytes
-            filename: Nome del file (usato per determinare il formato)
-            use_cache: Se True, usa la cache per evitare riletture
+            reader: Reader del processo principale (fornisce la cache)
+            file_bytes: Contenuto del file
+            filename: Nome del file
+            use_cache: Se True, usa la cache
+            file_hash: Hash già calcolato durante l'upload (opzionale)
+            **options: Budget passati a read() (max_chars, max_pages)
 
         Returns:
-            Dizionario con:
-                - format: Tipo di documento
-                - full_text: Testo estratto
-                - Altri campi specifici per formato
-                - error: Messaggio di errore se fallisce
-
-        Esempio:
-            with open("documento.pdf", "rb") as f:
-                result = reader.read(f.read(), "documento.pdf")
-
-            if "error" not in result:
-                print(result["full_text"])
+            Risultato di DocumentReader.read(); se il budget di lettura si
+            esaurisce, il risultato parziale con truncated_reason
         """
-        # Controlla la cache
-        file_hash = self.cache.get_hash(file_bytes)
-
+        route = self._route(file_bytes, filename)
+        if route == "inline":
+            # Formato leggero e file piccolo: il passaggio dal pool costerebbe più della lettura
+            with self._lock:
+                self.inline_reads += 1
+            return reader.read(file_bytes, filename, use_cache, file_hash=file_hash, **options)
+
+        budget = self.new_budget()
+        if self.mode != "process" or route == "thread":
+            executor = self._executor if route == "pool" else self._get_thread_executor()
+            return self._count_stop(await self._run_in(
+                executor, reader.read, file_bytes, filename, use_cache,
+                file_hash=file_hash, budget=budget, **options
+            ))
+
+        # Modalità processo: cache nel processo principale, parsing nel worker
+        if file_hash is None:
+            file_hash = reader.cache.get_hash(file_bytes)
         if use_cache:
-            cached = self.cache.get(file_hash)
+            cached = reader.cache_lookup(file_hash, **options)
             if cached:
                 cached["from_cache"] = True
                 return cached
 
-        # Determina il formato dal nome file
-        ext = Path(filename).suffix.lower()
-
-        if ext not in SUPPORTED_FORMATS:
-            return {
-                "error": f"Formato non supportato: {ext}",
-                "supported_formats": list(SUPPORTED_FORMATS.keys())
+        # Un mmap non è serializzabile: al worker va una copia in bytes
+        if not isinstance(file_bytes, bytes):
+            file_bytes = bytes(file_bytes)
+        try:
+            result = await self.run(
+                _process_read, file_bytes, filename, file_hash, budget=budget, **options
+            )
+        except BudgetExceeded as e:
+            # Worker terminato: nessun risultato parziale da restituire
+            result = {
+                "error": budget_message(e.reason, budget),
+                "filename": filename,
+                "truncated": True,
+                "truncated_reason": e.reason,
             }
 
-        format_info = SUPPORTED_FORMATS[ext]
-        reader_type = format_info["reader"]
-
-        # Mappa dei reader disponibili
-        readers: Dict[str, Callable[[], Dict[str, Any]]] = {
-            "pdf": lambda: self._read_pdf(file_bytes),
-            "docx": lambda: self._read_docx(file_bytes),
-            "xlsx": lambda: self._read_xlsx(file_bytes),
-            "pptx": lambda: self._read_pptx(file_bytes),
-            "text": lambda: self._read_text(file_bytes),
-            "markdown": lambda: self._read_markdown(file_bytes),
-            "csv": lambda: self._read_csv(file_bytes),
-            "json": lambda: self._read_json(file_bytes),
-            "xml": lambda: self._read_xml(file_bytes),
-            "html": lambda: self._read_html(file_bytes),
-            "yaml": lambda: self._read_yaml(file_bytes),
-            "code": lambda: self._read_code(file_bytes, ext.lstrip(".")),
-            "libreoffice": lambda: self._read_with_libreoffice(file_bytes, ext),
-            "image": lambda: self._read_image(file_bytes, ext),
-            "gimp": lambda: self._read_gimp(file_bytes, ext),
-            "raw": lambda: self._read_raw(file_bytes, ext),
-            "svg": lambda: self._read_svg(file_bytes),
-            "epub": lambda: self._read_epub(file_bytes),
-            "ebook": lambda: self._read_ebook(file_bytes, ext),
-        }
-
-        # Esegui il reader appropriato
-        if reader_type in readers:
-            result = readers[reader_type]()
-        else:
-            result = {"error": f"Reader non implementato: {reader_type}"}
+        if use_cache:
+            reader.cache_store(file_hash, result, **options)
+        return self._count_stop(result)
+
+    def new_budget(self) -> ReadBudget:
+        """Budget per una nuova lettura (il tempo parte all'inizio del parsing)."""
+        return ReadBudget(self.read_timeout, self.read_max_rss)
+
+    def _count_stop(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Conta le letture fermate dal budget (per /)."""
+        reason = result.get("truncated_reason")
+        if reason in self.budget_stops:
+            with self._lock:
+                self.budget_stops[reason] += 1
+        return result
 
-        # Aggiungi metadati comuni
-        result["filename"] = filename
-        result["extension"] = ext
-        result["size_bytes"] = len(file_bytes)
-        result["size_kb"] = round(len(file_bytes) / 1024, 2)
-        result["hash"] = file_hash
-        result["timestamp"] = datetime.now().isoformat()
-        result["from_cache"] = False
+    async def metadata(
+        self,
+        reader: DocumentReader,
+        file_bytes: bytes,
+        filename: str,
+        file_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Equivalente asincrono di DocumentReader.get_metadata().
 
-        # Salva in cache se non c'è errore
-        if use_cache and "error" not in result:
-            self.cache.set(file_hash, result)
+        La lettura delle sole intestazioni è breve: anche in modalità
+        "process" va in un thread. I formati senza percorso rapido passano
+        dal pool come una lettura in modalità solo testo.
+        """
+        if self.mode != "process":
+            return self._count_stop(await self.run(
+                reader.get_metadata, file_bytes, filename,
+                file_hash=file_hash, budget=self.new_budget()
+            ))
+        spec = reader_for(resolve_format(filename, file_bytes)[0])
+        if spec is not None and spec.metadata is not None:
+            return await self._run_in(
+                self._get_thread_executor(), reader.get_metadata, file_bytes, filename,
+                file_hash=file_hash
+            )
 
-        return result
+        result = await self.read(reader, file_bytes, filename, file_hash=file_hash, text_only=True)
+        return DocumentReader.metadata_view(result)
 
-    def get_summary(
+    async def summary(
         self,
+        reader: DocumentReader,
         file_bytes: bytes,
         filename: str,
-        max_chars: int = 2000
+        max_chars: int = 2000,
+        file_hash: Optional[str] = None
     ) -> str:
+        """Equivalente asincrono di DocumentReader.get_summary()."""
+        if self.mode != "process":
+            return await self.run(
+                reader.get_summary, file_bytes, filename, max_chars,
+                file_hash=file_hash, budget=self.new_budget()
+            )
+
+        result = await self.read(
+            reader, file_bytes, filename, file_hash=file_hash,
+            max_chars=max_chars, text_only=True
+        )
+        return DocumentReader.format_summary(result, max_chars)
+
+    async def chunks(
+        self,
+        reader: DocumentReader,
+        file_bytes: bytes,
+        filename: str,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        file_hash: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Equivalente asincrono di DocumentReader.get_chunks()."""
+        if self.mode != "process":
+            return self._count_stop(await self.run(
+                reader.get_chunks, file_bytes, filename, max_tokens, overlap_tokens,
+                file_hash=file_hash, budget=self.new_budget()
+            ))
+
+        # Modalità processo: cache dei segmenti nel processo principale
+        if file_hash is None:
+            file_hash = reader.cache.get_hash(file_bytes)
+        key = DocumentReader.chunks_cache_key(file_hash, max_tokens, overlap_tokens)
+        cached = reader.cache.get(key)
+        if cached:
+            cached["from_cache"] = True
+            return cached
+
+        result = await self.read(reader, file_bytes, filename, file_hash=file_hash)
+        chunked = DocumentReader.chunk_result(result, max_tokens, overlap_tokens)
+        if "error" not in chunked and not result.get("truncated_reason"):
+            reader.cache.set(key, chunked)
+            reader.record_derived(file_hash, key, result.get("size_bytes", 0))
+        return chunked
+
+    def _get_thread_executor(self) -> ThreadPoolExecutor:
+        """Executor a thread per i reader a sottoprocesso (creato al primo uso)."""
+        with self._lock:
+            if self._thread_executor is None:
+                self._thread_executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="docreader-io"
+                )
+            return self._thread_executor
+
+    def stats(self) -> Dict[str, Any]:
+        """Stato del pool per l'health check."""
+        with self._lock:
+            pending = self._pending
+            inline = self.inline_reads
+            stopped = dict(self.budget_stops)
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "in_progress": pending,
+            "max_queue": self.max_queue,
+            "inline_reads": inline,
+            "read_budget": {
+                "timeout_s": self.read_timeout,
+                # Il tetto di memoria vale solo per i worker di processo
+                "max_rss_mb": (
+                    self.read_max_rss // (1024 * 1024)
+                    if self.read_max_rss and self.mode == "process" else None
+                ),
+                "stopped": stopped,
+                "killed": dict(self._executor.killed) if self.mode == "process" else None,
+            },
+        }
+
+    def shutdown(self) -> None:
+        """Chiude il pool senza attendere i lavori in corso."""
+        self._executor.shutdown(wait=False)
+        if self._thread_executor is not None:
+            self._thread_executor.shutdown(wait=False)
+
+
+# ============================================================================
+# INGESTIONE CARTELLE
+# ============================================================================
+
+class FolderIngester:
+    """
+    Pre-elabora in background le cartelle collegate a Open WebUI.
+
+    Le cartelle montate dal widget Archivio vengono scansionate
+    periodicamente: i file nuovi o modificati (percorso, dimensione,
+    mtime) sono letti come da /read, tenendo calda la cache e aggiornando
+    l'indice di ricerca. I file invariati vengono saltati, salvo che il
+    loro risultato sia uscito dalla cache.
+
+    Con il DocumentWorkerPool del servizio ogni lettura passa dal pool,
+    con gli stessi limiti di coda e budget delle richieste (in modalità
+    "process" un file che si blocca viene terminato); i thread
+    dell'ingester limitano solo quante letture sono in corso insieme.
+
+    Cartelle osservate e stato dei file sono in un database SQLite
+    (ingest.db nella cartella della cache): dopo un riavvio la scansione
+    riprende senza rileggere ciò che non è cambiato.
+
+    Esempio:
+        ingester = FolderIngester(reader, pool)
+        ingester.watch("/home/utente/Documenti/progetto")
+        ingester.status()  # avanzamento per cartella
+    """
+
+    def __init__(
+        self,
+        reader: "DocumentReader",
+        pool: Optional["DocumentWorkerPool"] = None,
+        workers: int = INGEST_WORKERS,
+        interval: float = INGEST_INTERVAL,
+        db_file: Optional[Path] = None
+    ) -> None:
         """
-        Restituisce un riassunto breve del documento.
+        Inizializza l'ingester (la scansione parte con start() o watch()).
 
         Args:
-            file_bytes: Contenuto del file
-            filename: Nome del file
-            max_chars: Massimo numero di caratteri
+            reader: Reader del servizio (fornisce cache e indice di ricerca)
+            pool: Worker pool del servizio (None = lettura nel thread
+                dell'ingester, con il solo budget cooperativo)
+            workers: Letture contemporanee dedicate all'ingestione
+            interval: Secondi tra una scansione completa e la successiva
+            db_file: Database con cartelle e file (default: ingest.db nella cache)
+        """
+        self.reader = reader
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.db_file = db_file or Path(reader.cache.cache_dir) / "ingest.db"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_file), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS roots ("
+            " path TEXT PRIMARY KEY,"
+            " recursive INTEGER NOT NULL,"
+            " added REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " root TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " hash TEXT,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " ingested_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_root ON files (root)")
+        self._conn.commit()
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="docingest"
+        )
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------------
+    # Cartelle osservate
+    # ------------------------------------------------------------------------
+
+    def roots(self) -> List[Tuple[str, bool]]:
+        """Cartelle osservate con il flag ricorsivo."""
+        with self._lock:
+            rows = self._conn.execute("SELECT path, recursive FROM roots ORDER BY added").fetchall()
+        return [(path, bool(recursive)) for path, recursive in rows]
+
+    def watch(self, path: str, recursive: bool = True) -> Dict[str, Any]:
+        """
+        Aggiunge una cartella da osservare e avvia subito una scansione.
+
+        Raises:
+            ValueError: Se il percorso non è permesso o non è una cartella
+        """
+        root = validate_path(path)
+        if not root.is_dir():
+            raise ValueError(f"Non è una cartella: '{root}'")
+
+        key = str(root)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO roots (path, recursive, added) VALUES (?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET recursive = excluded.recursive",
+                (key, int(recursive), time.time())
+            )
+            self._conn.commit()
+            progress = self._progress.setdefault(key, self._new_progress(key))
+            progress["state"] = "queued"
+
+        self.start()
+        self._wake.set()
+        return dict(progress)
+
+    def unwatch(self, path: str) -> bool:
+        """Smette di osservare una cartella (la cache resta valida)."""
+        key = os.path.realpath(path)
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM roots WHERE path = ?", (key,))
+            self._conn.execute("DELETE FROM files WHERE root = ?", (key,))
+            self._conn.commit()
+            self._progress.pop(key, None)
+        return cursor.rowcount > 0
+
+    # ------------------------------------------------------------------------
+    # Scansione
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _new_progress(root: str) -> Dict[str, Any]:
+        return {
+            "root": root,
+            "state": "idle",
+            "total": 0,
+            "unchanged": 0,
+            "queued": 0,
+            "done": 0,
+            "errors": 0,
+            "removed": 0,
+            "current": None,
+            "last_scan": None,
+        }
+
+    @staticmethod
+    def _walk(root: str, recursive: bool) -> Any:
+        """File con estensione supportata (cartelle e file nascosti esclusi)."""
+        for dirpath, dirnames, filenames in os.walk(root):
+            if recursive:
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            else:
+                dirnames[:] = []
+            for name in filenames:
+                if not name.startswith(".") and Path(name).suffix.lower() in SUPPORTED_FORMATS:
+                    yield os.path.join(dirpath, name)
+
+    def scan(self, root: str, recursive: bool = True) -> Dict[str, Any]:
+        """
+        Scansiona una cartella ed elabora i file nuovi o modificati.
+
+        Blocca fino al termine dell'elaborazione.
 
         Returns:
-            Stringa con riassunto del documento
+            Avanzamento finale della cartella
         """
-        result = self.read(file_bytes, filename)
+        with self._lock:
+            known = {
+                path: (size, mtime_ns, file_hash, status)
+                for path, size, mtime_ns, file_hash, status in self._conn.execute(
+                    "SELECT path, size, mtime_ns, hash, status FROM files WHERE root = ?",
+                    (root,)
+                )
+            }
+            progress = self._new_progress(root)
+            progress["state"] = "scanning"
+            self._progress[root] = progress
 
-        if "error" in result:
-            return f"Errore: {result['error']}"
+        seen = set()
+        todo: List[Tuple[str, int, int]] = []
+        for path in self._walk(root, recursive):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            entry = known.get(path)
+            if (
+                entry is not None
+                and entry[0] == st.st_size
+                and entry[1] == st.st_mtime_ns
+                and (entry[3] != "ok" or self.reader.cache.contains(entry[2]))
+            ):
+                progress["unchanged"] += 1
+                continue
+            todo.append((path, st.st_size, st.st_mtime_ns))
+
+        removed = [path for path in known if path not in seen]
+        with self._lock:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed])
+            self._conn.commit()
+            progress.update(
+                state="ingesting" if todo else "idle",
+                total=len(seen),
+                queued=len(todo),
+                removed=len(removed),
+            )
 
-        full_text = result.get("full_text", "")
-        if len(full_text) > max_chars:
-            full_text = full_text[:max_chars] + "\n...[troncato]"
+        futures = []
+        for item in todo:
+            if self._stop.is_set():
+                break
+            futures.append(self._executor.submit(self._ingest_file, root, *item))
+        wait(futures)
+
+        with self._lock:
+            progress.update(state="idle", current=None, last_scan=time.time())
+            return dict(progress)
+
+    def _ingest_file(self, root: str, path: str, size: int, mtime_ns: int) -> None:
+        """Legge un file nel pool e ne registra lo stato."""
+        if self._stop.is_set():
+            return
+        progress = self._progress.get(root) or self._new_progress(root)
+        with self._lock:
+            progress["current"] = path
+
+        file_hash: Optional[str] = None
+        status, error = "ok", None
+        try:
+            if size > MAX_FILE_SIZE_MB * 1024 * 1024:
+                status, error = "skipped", f"File oltre {MAX_FILE_SIZE_MB}MB"
+            else:
+                data = Path(path).read_bytes()
+                file_hash = self.reader.cache.get_hash(data)
+                result = self._read(data, Path(path).name, file_hash)
+                if result is None:
+                    # Spegnimento durante l'attesa: il file resta da leggere
+                    return
+                if "error" in result:
+                    status, error = "error", str(result["error"])
+                elif result.get("truncated_reason"):
+                    # Lettura parziale: non è in cache né nell'indice di ricerca
+                    status, error = "error", f"Lettura interrotta ({result['truncated_reason']})"
+        except OSError as e:
+            status, error = "error", str(e)
+        except Exception as e:
+            # Un reader che fallisce su un file non deve fermare la scansione
+            status, error = "error", f"{type(e).__name__}: {e}"
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files"
+                " (path, root, size, mtime_ns, hash, status, error, ingested_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, root, size, mtime_ns, file_hash, status, error, time.time())
+            )
+            self._conn.commit()
+            progress["queued"] -= 1
+            progress["done"] += 1
+            if status == "error":
+                progress["errors"] += 1
 
-        return f"[{result.get('format', 'Documento')}] {result.get('filename', '')}\n\n{full_text}"
+    def _read(self, data: bytes, filename: str, file_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Legge un file come /read: nel pool del servizio, se presente.
+
+        Se la coda del pool è piena l'ingestione cede il posto alle
+        richieste e riprova dopo RETRY_AFTER_SECONDS.
+
+        Returns:
+            Risultato della lettura, o None se l'ingester è stato fermato
+        """
+        if self.pool is None:
+            return self.reader.read(
+                data, filename, file_hash=file_hash,
+                budget=ReadBudget(*read_budget_limits())
+            )
+        while not self._stop.is_set():
+            try:
+                return asyncio.run(
+                    self.pool.read(self.reader, data, filename, file_hash=file_hash)
+                )
+            except QueueFullError:
+                self._stop.wait(RETRY_AFTER_SECONDS)
+        return None
+
+    # ------------------------------------------------------------------------
+    # Ciclo in background
+    # ------------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Avvia il thread di scansione periodica (se non è già attivo)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name="docingest-scan", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            for root, recursive in self.roots():
+                if self._stop.is_set():
+                    break
+                self._scan_root(root, recursive)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _scan_root(self, root: str, recursive: bool) -> None:
+        """
+        Scansiona una cartella osservata, o la segna "missing" se non esiste
+        più (es. disco esterno scollegato). Anche in quel caso la verifica
+        conta come scansione conclusa (last_scan), così chi attende la fine
+        non resta in attesa.
+        """
+        if not os.path.isdir(root):
+            with self._lock:
+                progress = self._progress.setdefault(root, self._new_progress(root))
+                progress.update(state="missing", current=None, last_scan=time.time())
+            return
+        self.scan(root, recursive)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Avanzamento di ogni cartella osservata."""
+        roots = self.roots()
+        with self._lock:
+            return [
+                dict(self._progress.get(root) or self._new_progress(root), recursive=recursive)
+                for root, recursive in roots
+            ]
+
+    def errors(self, root: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """File di una cartella che non è stato possibile leggere."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, status, error FROM files WHERE root = ? AND status != 'ok'"
+                " ORDER BY path LIMIT ?",
+                (os.path.realpath(root), limit)
+            ).fetchall()
+        return [{"path": path, "status": status, "error": error} for path, status, error in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """Riepilogo per l'health check."""
+        roots = self.roots()
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            active = sum(1 for p in self._progress.values() if p["state"] in ("scanning", "ingesting"))
+        return {
+            "roots": len(roots),
+            "files": files,
+            "active": active,
+            "workers": self.workers,
+            "interval_seconds": self.interval,
+        }
+
+    def shutdown(self) -> None:
+        """Ferma la scansione; i file in lettura vengono completati."""
+        self._stop.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 # ============================================================================
@@ -1674,6 +5805,28 @@ except ImportError:
     DocHealthResponse = None
 
 
+def _service_busy(error: QueueFullError) -> "HTTPException":
+    """Risposta 503 con Retry-After quando il worker pool è saturo."""
+    return HTTPException(
+        503,
+        str(error),
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+
+async def _receive_upload(file: "UploadFile") -> SpooledUpload:
+    """
+    Riceve un upload a blocchi, con hash calcolato in streaming.
+
+    Raises:
+        HTTPException: 400 appena il file supera MAX_FILE_SIZE_MB
+    """
+    try:
+        return await spool_upload(file, MAX_FILE_SIZE_MB * 1024 * 1024)
+    except UploadTooLarge as e:
+        raise HTTPException(400, str(e))
+
+
 def create_app() -> "FastAPI":
     """
     Crea e configura l'applicazione FastAPI.
@@ -1681,12 +5834,31 @@ def create_app() -> "FastAPI":
     Returns:
         Istanza FastAPI configurata con tutti gli endpoint
     """
+    app_start = time.perf_counter()
+
+    # Inizializza il reader e il pool di parsing
+    reader = DocumentReader()
+    pool = DocumentWorkerPool()
+    ingester = FolderIngester(reader, pool)
+
+    @asynccontextmanager
+    async def lifespan(app: "FastAPI"):
+        """Riprende le cartelle osservate; chiude i pool allo spegnimento."""
+        if ingester.roots():
+            ingester.start()
+        yield
+        ingester.shutdown()
+        pool.shutdown()
+        shutdown_pdf_executor()
+        reader.libreoffice.shutdown()
+
     app = FastAPI(
         title="Document Reader Service",
         description="Servizio locale per lettura documenti di vari formati",
         version="2.0.0",
         docs_url="/docs",  # Swagger UI disponibile su /docs
-        redoc_url="/redoc"  # ReDoc disponibile su /redoc
+        redoc_url="/redoc",  # ReDoc disponibile su /redoc
+        lifespan=lifespan
     )
 
     # CORS ristretto a localhost
@@ -1701,8 +5873,19 @@ def create_app() -> "FastAPI":
     # API key middleware (protegge POST/PUT/DELETE)
     create_api_key_middleware(app)
 
-    # Inizializza il reader
-    reader = DocumentReader()
+    # I GET che restituiscono contenuti o percorsi locali richiedono
+    # comunque la API key (aperti restano solo health check e info)
+    require_api_key = get_api_key_header()
+
+    # Rifiuta subito upload con Content-Length oltre il limite (per i batch
+    # il limite è sulla richiesta intera, poi ogni file è verificato da solo)
+    create_upload_limit_middleware(
+        app, MAX_FILE_SIZE_MB * 1024 * 1024,
+        path_limits={
+            "/batch": BATCH_MAX_MB * 1024 * 1024,
+            "/batch/stream": BATCH_MAX_MB * 1024 * 1024,
+        }
+    )
 
     # -------------------------------------------------------------------------
     # ENDPOINT: Home / Health Check
@@ -1724,17 +5907,49 @@ def create_app() -> "FastAPI":
             "port": SERVICE_PORT,
             "formats_available": len(available),
             "formats_total": len(formats),
+            "workers": pool.stats(),
+            "cache": reader.cache.stats(),
+            "ingest": ingester.stats(),
             "documentation": f"http://localhost:{SERVICE_PORT}/docs",
             "endpoints": [
                 "POST /read - Legge un documento",
                 "POST /extract-text - Estrae solo il testo",
                 "POST /get-metadata - Restituisce solo metadati",
                 "POST /summary - Riassunto breve",
+                "POST /chunks - Segmenti con budget di token (RAG)",
+                "GET /search?q= - Cerca nei documenti già letti",
+                "POST /book?chapter=&offset= - Legge un libro a pagine",
+                "GET /book/{hash}?chapter=&offset= - Pagina di un libro già letto",
+                "POST /book/stream - Capitoli di un libro in streaming (NDJSON)",
+                "POST /batch/stream - Più documenti, risultati in streaming (NDJSON)",
+                "POST /ingest - Osserva una cartella e pre-elabora i documenti",
+                "GET /ingest - Avanzamento delle cartelle osservate",
                 "GET /formats - Lista formati supportati",
+                "GET /stats - Tempo di avvio e memoria dei parser caricati",
                 "DELETE /cache - Pulisce la cache"
             ]
         }
 
+    # -------------------------------------------------------------------------
+    # ENDPOINT: Statistiche di avvio e memoria
+    # -------------------------------------------------------------------------
+    @app.get("/stats", tags=["Info"])
+    async def service_stats() -> Dict[str, Any]:
+        """
+        Tempo di avvio, memoria del processo e parser caricati.
+
+        I parser opzionali sono importati alla prima lettura del formato:
+        per ognuno sono riportati durata dell'import e memoria aggiunta.
+        In modalità "process" i parser sono caricati nei worker e qui
+        compaiono solo quelli del processo principale.
+        """
+        rss = _rss_bytes()
+        return {
+            "startup": startup,
+            "rss_kb": rss // 1024 if rss is not None else None,
+            "parsers": parser_stats(),
+        }
+
     # -------------------------------------------------------------------------
     # ENDPOINT: Lista Formati
     # -------------------------------------------------------------------------
@@ -1753,35 +5968,33 @@ def create_app() -> "FastAPI":
     @app.post("/read", tags=["Documenti"])
     async def read_document(
         file: UploadFile = File(..., description="File documento da leggere"),
-        use_cache: bool = Form(default=True, description="Usa cache per risultati")
+        use_cache: bool = Form(default=True, description="Usa cache per risultati"),
+        table_summary: bool = Form(default=False, description="XLSX/CSV: statistiche per colonna invece delle righe")
     ) -> JSONResponse:
         """
         Legge un documento e restituisce il contenuto strutturato.
 
         Supporta PDF, Word, Excel, PowerPoint, immagini, e-book e molto altro.
-        Vedi /formats per l'elenco completo.
+        Vedi /formats per l'elenco completo. Per fogli di calcolo e CSV
+        grandi table_summary=true restituisce un riepilogo per colonna.
         """
         try:
-            # Leggi il contenuto del file
-            contents = await file.read()
-
-            # Verifica dimensione
-            size_mb = len(contents) / (1024 * 1024)
-            if size_mb > MAX_FILE_SIZE_MB:
-                raise HTTPException(
-                    400,
-                    f"File troppo grande ({size_mb:.1f}MB). Massimo: {MAX_FILE_SIZE_MB}MB"
+            # Ricevi il file a blocchi (rifiutato appena supera il limite)
+            with await _receive_upload(file) as upload:
+                # Leggi il documento nel worker pool
+                result = await pool.read(
+                    reader,
+                    upload.data,
+                    upload.filename,
+                    use_cache=use_cache,
+                    file_hash=upload.digest,
+                    table_summary=table_summary
                 )
 
-            # Leggi il documento
-            result = reader.read(
-                contents,
-                file.filename or "document",
-                use_cache=use_cache
-            )
-
             return JSONResponse(result)
 
+        except QueueFullError as e:
+            raise _service_busy(e)
         except HTTPException:
             raise
         except Exception as e:
@@ -1792,27 +6005,46 @@ def create_app() -> "FastAPI":
     # -------------------------------------------------------------------------
     @app.post("/extract-text", tags=["Documenti"])
     async def extract_text(
-        file: UploadFile = File(..., description="File da cui estrarre testo")
+        file: UploadFile = File(..., description="File da cui estrarre testo"),
+        max_chars: Optional[int] = Form(default=None, description="Massimo caratteri (il PDF smette di estrarre)"),
+        max_pages: Optional[int] = Form(default=None, description="Massimo pagine da leggere (PDF)")
     ) -> Dict[str, Any]:
         """
         Estrae solo il testo dal documento (senza metadati).
 
-        Utile quando serve solo il contenuto testuale.
+        Utile quando serve solo il contenuto testuale: i reader lavorano in
+        modalità solo testo. Con max_chars o max_pages l'estrazione dei PDF
+        si ferma appena il budget è raggiunto.
         """
         try:
-            contents = await file.read()
-            result = reader.read(contents, file.filename or "document")
+            with await _receive_upload(file) as upload:
+                result = await pool.read(
+                    reader, upload.data, upload.filename, file_hash=upload.digest,
+                    max_chars=max_chars, max_pages=max_pages, text_only=True
+                )
 
             if "error" in result:
                 return {"error": result["error"]}
 
+            text = result.get("full_text", "")
+            truncated = bool(result.get("truncated"))
+            if max_chars is not None and len(text) > max_chars:
+                text = text[:max_chars]
+                truncated = True
+
             return {
                 "filename": result.get("filename"),
                 "format": result.get("format"),
-                "text": result.get("full_text", ""),
-                "characters": len(result.get("full_text", ""))
+                "text": text,
+                "characters": len(text),
+                "truncated": truncated,
+                "truncated_reason": result.get("truncated_reason")
             }
 
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
@@ -1826,18 +6058,22 @@ def create_app() -> "FastAPI":
         """
         Restituisce solo i metadati del documento (senza contenuto testuale).
 
-        Utile per ottenere informazioni rapide su un file.
+        PDF, file Office, immagini ed EPUB sono letti dalle intestazioni e
+        dalle proprietà, senza estrarre il testo: la risposta non dipende
+        dalla lunghezza del documento. Cache con chiave propria.
         """
         try:
-            contents = await file.read()
-            result = reader.read(contents, file.filename or "document")
-
-            # Rimuovi il testo per avere solo metadati
-            fields_to_remove = ["full_text", "content", "data", "paragraphs", "slides", "sheets"]
-            metadata = {k: v for k, v in result.items() if k not in fields_to_remove}
+            with await _receive_upload(file) as upload:
+                result = await pool.metadata(
+                    reader, upload.data, upload.filename, file_hash=upload.digest
+                )
 
-            return JSONResponse(metadata)
+            return JSONResponse(result)
 
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
@@ -1855,14 +6091,228 @@ def create_app() -> "FastAPI":
         Utile per avere una panoramica veloce del contenuto.
         """
         try:
-            contents = await file.read()
-            summary = reader.get_summary(contents, file.filename or "document", max_chars)
+            with await _receive_upload(file) as upload:
+                summary = await pool.summary(
+                    reader, upload.data, upload.filename, max_chars, file_hash=upload.digest
+                )
 
             return {"summary": summary}
 
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Errore: {str(e)}")
+
+    # -------------------------------------------------------------------------
+    # ENDPOINT: Segmenti
+    # -------------------------------------------------------------------------
+    @app.post("/chunks", tags=["Documenti"])
+    async def get_chunks(
+        file: UploadFile = File(..., description="File da suddividere"),
+        max_tokens: int = Form(default=CHUNK_MAX_TOKENS, description="Token massimi per segmento"),
+        overlap_tokens: int = Form(default=CHUNK_OVERLAP_TOKENS, description="Token ripetuti tra segmenti consecutivi")
+    ) -> JSONResponse:
+        """
+        Suddivide il documento in segmenti pronti per embedding o RAG.
+
+        I segmenti rispettano pagine (PDF), titoli (Markdown, stili Word) e
+        paragrafi. Ogni segmento riporta testo, token stimati, titoli e
+        pagine di provenienza.
+        """
+        if max_tokens < 16:
+            raise HTTPException(400, "max_tokens deve essere almeno 16")
+        if overlap_tokens < 0 or overlap_tokens >= max_tokens:
+            raise HTTPException(400, "overlap_tokens deve essere tra 0 e max_tokens - 1")
+
+        try:
+            with await _receive_upload(file) as upload:
+                result = await pool.chunks(
+                    reader, upload.data, upload.filename,
+                    max_tokens, overlap_tokens, file_hash=upload.digest
+                )
+
+            return JSONResponse(result)
+
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Errore: {str(e)}")
+
+    # -------------------------------------------------------------------------
+    # ENDPOINT: Ricerca
+    # -------------------------------------------------------------------------
+    @app.get("/search", tags=["Documenti"], dependencies=[Depends(require_api_key)])
+    async def search_documents(q: str, limit: int = 10) -> Dict[str, Any]:
+        """
+        Cerca nei documenti già letti dal servizio (full-text, BM25).
+
+        Restituisce i passaggi più rilevanti con snippet e posizione
+        (pagina, slide, foglio o titoli della sezione).
+        """
+        if not reader.search_index.enabled:
+            raise HTTPException(503, "Ricerca non disponibile: SQLite senza FTS5")
+
+        limit = max(1, min(limit, 100))
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, reader.search_index.search, q, limit
+        )
+        return {"query": q, "count": len(results), "results": results}
+
+    # -------------------------------------------------------------------------
+    # ENDPOINT: Libri (lettura a pagine)
+    # -------------------------------------------------------------------------
+    def _page_or_error(
+        result: Dict[str, Any],
+        chapter: Optional[int],
+        offset: int,
+        limit: int,
+        toc: bool
+    ) -> Dict[str, Any]:
+        """Pagina di un risultato di read(), con errori tradotti in HTTP 400."""
+        if "error" in result:
+            raise HTTPException(400, result["error"])
+        if limit < 1:
+            raise HTTPException(400, "limit deve essere almeno 1")
+        try:
+            return book_page(result, chapter, offset, limit, toc)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.post("/book", tags=["Libri"])
+    async def read_book(
+        file: UploadFile = File(..., description="E-book (EPUB, MOBI, ...) o documento lungo"),
+        chapter: Optional[int] = None,
+        offset: int = 0,
+        limit: int = BOOK_PAGE_CHARS,
+        toc: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Legge un libro una pagina alla volta (?chapter=, ?offset=, ?limit=).
+
+        Il libro è letto per intero una sola volta e resta in cache: le
+        pagine successive si chiedono con next_offset/next_chapter, anche
+        senza ricaricare il file (GET /book/{hash}). Con toc=true la
+        risposta include l'indice dei capitoli.
+        """
+        try:
+            with await _receive_upload(file) as upload:
+                result = await pool.read(
+                    reader, upload.data, upload.filename, file_hash=upload.digest
+                )
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(500, f"Errore: {str(e)}")
+
+        return _page_or_error(result, chapter, offset, limit, toc)
+
+    @app.get("/book/{file_hash}", tags=["Libri"], dependencies=[Depends(require_api_key)])
+    async def book_from_cache(
+        file_hash: str,
+        chapter: Optional[int] = None,
+        offset: int = 0,
+        limit: int = BOOK_PAGE_CHARS,
+        toc: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Pagina di un libro già letto, senza ricaricare il file.
+
+        Restituisce 404 se il libro non è (più) in cache: va inviato di
+        nuovo con POST /book.
+        """
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, reader.cache.get, file_hash
+        )
+        if result is None:
+            raise HTTPException(404, "Libro non in cache: invialo con POST /book")
+        return _page_or_error(result, chapter, offset, limit, toc)
+
+    @app.post("/book/stream", tags=["Libri"])
+    async def stream_book(
+        file: UploadFile = File(..., description="E-book (EPUB, MOBI, ...) o documento lungo"),
+        chapter: int = 0
+    ) -> "StreamingResponse":
+        """
+        Testo del libro in streaming: una riga NDJSON per capitolo.
+
+        La prima riga contiene i metadati e l'indice dei capitoli, le
+        successive {"index", "title", "text"} a partire da ?chapter=.
+        """
+        try:
+            with await _receive_upload(file) as upload:
+                result = await pool.read(
+                    reader, upload.data, upload.filename, file_hash=upload.digest
+                )
+        except QueueFullError as e:
+            raise _service_busy(e)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
+        if "error" in result:
+            raise HTTPException(400, result["error"])
+
+        def stream():
+            head = {
+                "filename": result.get("filename"),
+                "format": result.get("format"),
+                "title": result.get("title"),
+                "author": result.get("author"),
+                "hash": result.get("hash"),
+                "total_characters": len(result.get("full_text", "")),
+                "chapters": book_toc(result),
+            }
+            yield json.dumps(head, ensure_ascii=False) + "\n"
+            for item in iter_book_chapters(result, chapter):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # -------------------------------------------------------------------------
+    # ENDPOINT: Cartelle osservate (widget Archivio)
+    # -------------------------------------------------------------------------
+    @app.post("/ingest", tags=["Cartelle"])
+    async def ingest_folder(
+        path: str = Form(..., description="Cartella locale da osservare"),
+        recursive: bool = Form(default=True, description="Includi le sottocartelle")
+    ) -> Dict[str, Any]:
+        """
+        Osserva una cartella e ne pre-elabora i documenti in background.
+
+        I file nuovi o modificati vengono letti e messi in cache (e
+        nell'indice di /search); la cartella viene riscansionata
+        periodicamente. L'avanzamento è in GET /ingest.
+        """
+        try:
+            return ingester.watch(path, recursive)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    @app.get("/ingest", tags=["Cartelle"], dependencies=[Depends(require_api_key)])
+    async def ingest_status() -> Dict[str, Any]:
+        """Avanzamento di ogni cartella osservata."""
+        return {"folders": ingester.status(), **ingester.stats()}
+
+    @app.get("/ingest/errors", tags=["Cartelle"], dependencies=[Depends(require_api_key)])
+    async def ingest_errors(path: str, limit: int = 50) -> Dict[str, Any]:
+        """File di una cartella che non è stato possibile leggere."""
+        errors = ingester.errors(path, max(1, min(limit, 500)))
+        return {"root": path, "count": len(errors), "files": errors}
+
+    @app.delete("/ingest", tags=["Cartelle"])
+    async def ingest_remove(path: str) -> Dict[str, str]:
+        """Smette di osservare una cartella (i risultati in cache restano)."""
+        if not ingester.unwatch(path):
+            raise HTTPException(404, f"Cartella non osservata: {path}")
+        return {"message": f"Cartella rimossa: {path}"}
+
     # -------------------------------------------------------------------------
     # ENDPOINT: Batch
     # -------------------------------------------------------------------------
@@ -1879,9 +6329,18 @@ def create_app() -> "FastAPI":
 
         for file in files:
             try:
-                contents = await file.read()
-                result = reader.read(contents, file.filename or "document")
+                with await _receive_upload(file) as upload:
+                    result = await pool.read(
+                        reader, upload.data, upload.filename, file_hash=upload.digest
+                    )
                 results.append(result)
+            except QueueFullError as e:
+                raise _service_busy(e)
+            except HTTPException as e:
+                results.append({
+                    "filename": file.filename,
+                    "error": e.detail
+                })
             except Exception as e:
                 results.append({
                     "filename": file.filename,
@@ -1890,6 +6349,51 @@ def create_app() -> "FastAPI":
 
         return {"results": results}
 
+    @app.post("/batch/stream", tags=["Documenti"])
+    async def batch_read_stream(
+        files: List[UploadFile] = File(..., description="File da leggere")
+    ) -> "StreamingResponse":
+        """
+        Variante in streaming di /batch: una riga NDJSON per documento.
+
+        I file vengono elaborati in parallelo sul worker pool (al massimo
+        un documento per worker, senza riempire la coda) e ogni risultato
+        è inviato appena pronto, con l'indice del file nella richiesta e
+        il tempo di elaborazione in millisecondi.
+        """
+        limit = asyncio.Semaphore(pool.workers)
+
+        async def process(index: int, file: UploadFile) -> Dict[str, Any]:
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    with await _receive_upload(file) as upload:
+                        result = await pool.read(
+                            reader, upload.data, upload.filename, file_hash=upload.digest
+                        )
+                except HTTPException as e:
+                    result = {"filename": file.filename, "error": e.detail}
+                except Exception as e:
+                    result = {"filename": file.filename, "error": str(e)}
+                elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            return {"index": index, "elapsed_ms": elapsed_ms, **result}
+
+        async def stream():
+            tasks = [
+                asyncio.ensure_future(process(i, file))
+                for i, file in enumerate(files)
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+            finally:
+                # Client disconnesso: non serve elaborare il resto
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
     # -------------------------------------------------------------------------
     # ENDPOINT: Cache
     # -------------------------------------------------------------------------
@@ -1903,6 +6407,12 @@ def create_app() -> "FastAPI":
         removed = reader.cache.cleanup()
         return {"message": f"Cache pulita. Rimossi {removed} documenti scaduti."}
 
+    now = time.perf_counter()
+    startup = {
+        "module_import_ms": round(_MODULE_IMPORT_SECONDS * 1000, 1),
+        "create_app_ms": round((now - app_start) * 1000, 1),
+        "total_ms": round((now - _MODULE_START) * 1000, 1),
+    }
     return app
 
 
@@ -1931,7 +6441,8 @@ def check_dependencies() -> bool:
         ("Pillow (Immagini)", HAS_PIL, "pip install Pillow"),
         ("markdown", HAS_MARKDOWN, "pip install markdown"),
         ("beautifulsoup4 (HTML)", HAS_BS4, "pip install beautifulsoup4"),
-        ("ebooklib (EPUB)", HAS_EBOOKLIB, "pip install ebooklib"),
+        ("lxml (EPUB veloce)", HAS_LXML, "pip install lxml"),
+        ("pytesseract (OCR PDF scansionati)", HAS_TESSERACT, "pip install pytesseract"),
     ]
 
     missing = []
@@ -1954,6 +6465,8 @@ def check_dependencies() -> bool:
         ("ImageMagick", shutil.which("convert") or shutil.which("magick")),
         ("Calibre", shutil.which("ebook-convert")),
         ("Inkscape", shutil.which("inkscape")),
+        ("pdftoppm (OCR PDF)", shutil.which("pdftoppm")),
+        ("Tesseract (OCR PDF)", shutil.which("tesseract")),
     ]
 
     for name, path in externals:
@@ -2004,6 +6517,7 @@ def main() -> None:
     print(f"[*] Porta: {SERVICE_PORT}")
     print(f"[*] Cache: {CACHE_DIR}")
     print(f"[*] Max file size: {MAX_FILE_SIZE_MB}MB")
+    print(f"[*] Worker pool: {default_worker_count()} ({DOC_WORKER_MODE}), coda max {DOC_QUEUE_MAX}")
     print()
     print(f"[*] Documentazione: http://localhost:{SERVICE_PORT}/docs")
     print(f"[*] Avvio servizio su http://localhost:{SERVICE_PORT}")
@@ -2020,6 +6534,10 @@ def main() -> None:
     )
 
 
+# Durata dell'import del modulo (riportata da /stats)
+_MODULE_IMPORT_SECONDS = time.perf_counter() - _MODULE_START
+
+
 # Esegui solo se chiamato direttamente (non importato)
 if __name__ == "__main__":
     main()
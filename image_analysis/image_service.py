@@ -18,18 +18,20 @@ import os
 import sys
 import json
 import base64
-import hashlib
 import time
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Awaitable, AsyncIterator, Tuple
 from datetime import datetime
 import threading
+from dataclasses import dataclass
 
 # FastAPI
 try:
-    from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+    from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, StreamingResponse
     import uvicorn
     HAS_FASTAPI = True
 except ImportError:
@@ -40,6 +42,11 @@ _security_path = str(Path(__file__).parent.parent)
 if _security_path not in sys.path:
     sys.path.insert(0, _security_path)
 from security import ALLOWED_ORIGINS, create_api_key_middleware, SAFE_HOST
+from uploads import (
+    SpooledUpload, UploadTooLarge, as_stream, spool_upload,
+    create_upload_limit_middleware
+)
+from content_store import CONTENT_STORE_DIR, ContentStore, content_digest, get_store
 
 # Pillow per elaborazione immagini
 try:
@@ -49,13 +56,20 @@ try:
 except ImportError:
     HAS_PIL = False
 
-# Requests per Ollama
+# Requests per Ollama (verifica dei modelli all'avvio)
 try:
     import requests
     HAS_REQUESTS = True
 except ImportError:
     HAS_REQUESTS = False
 
+# httpx per le richieste asincrone a Ollama (connessioni riusate)
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
 # OCR opzionale
 try:
     import pytesseract
@@ -71,64 +85,625 @@ except ImportError:
 SERVICE_PORT = 5555
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 VISION_MODEL = os.getenv("VISION_MODEL", "llava")  # o llama3.2-vision, bakllava
-CACHE_DIR = Path(__file__).parent / ".image_cache"
 MAX_IMAGE_SIZE = 1024  # px max dimension per analisi
+OCR_MAX_SIZE = int(os.getenv("IMAGE_OCR_MAX_SIZE", "2400"))  # px max per l'OCR
+OCR_ANALYSIS_TYPES = ("complete", "text", "code")  # Analisi che includono l'OCR
+MAX_FILE_SIZE_MB = int(os.getenv("IMAGE_MAX_FILE_MB", "50"))  # dimensione max upload
+BATCH_MAX_MB = int(os.getenv("IMAGE_BATCH_MAX_MB", "200"))  # richiesta /batch intera
 CACHE_EXPIRY_HOURS = 24
 
+# Cache per immagini quasi identiche (stessa immagine ri-salvata, ricompressa
+# o ridimensionata): distanza di Hamming massima tra i dHash a 64 bit.
+# Vuoto = disattivata. Con soglie alte screenshot diversi solo nel testo
+# possono risultare uguali: 0-4 è un valore prudente.
+_phash_distance = os.getenv("IMAGE_PHASH_DISTANCE", "").strip()
+PHASH_MAX_DISTANCE: Optional[int] = int(_phash_distance) if _phash_distance else None
+# Immagini nell'indice in memoria: oltre, si dimenticano le meno recenti
+PHASH_MAX_ENTRIES = int(os.getenv("IMAGE_PHASH_MAX_ENTRIES", "50000"))
+
+# Client Ollama: inferenze contemporanee per modello (come OLLAMA_NUM_PARALLEL
+# del server), connessioni mantenute aperte, timeout di una richiesta
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("IMAGE_OLLAMA_CONNECTIONS", "8"))
+OLLAMA_TIMEOUT = int(os.getenv("IMAGE_OLLAMA_TIMEOUT", "60"))  # Secondi
+DISCONNECT_POLL_SECONDS = 0.5  # Controllo della disconnessione del client
+
+# Versione della preparazione dell'immagine (ridimensionamento, JPEG per
+# Ollama, OCR): va incrementata quando cambia, così i risultati in cache
+# calcolati con la versione precedente non vengono più usati
+PREPROCESS_VERSION = 1
+JPEG_QUALITY = 85  # Qualità del JPEG inviato a Ollama
+
+# Ogni quanti secondi rileggere /api/tags: un modello ri-scaricato ha un
+# digest nuovo e invalida i risultati in cache prodotti dalla versione vecchia
+MODEL_CHECK_SECONDS = int(os.getenv("IMAGE_MODEL_CHECK_SECONDS", "60"))
+
+NO_VISION_MODEL_MESSAGE = "[Nessun modello vision disponibile. Installa llava con: ollama pull llava]"
+
 
 # ============================================================================
 # CACHE
 # ============================================================================
 
+class PerceptualIndex:
+    """
+    Indice in memoria dei dHash per trovare immagini quasi identiche.
+
+    Gli hash a 64 bit sono divisi in max_distance + 1 bande: due hash a
+    distanza <= max_distance hanno almeno una banda identica, quindi basta
+    confrontare gli hash che condividono una banda invece di tutti.
+
+    Oltre max_entries immagini si dimenticano quelle aggiunte (o
+    ri-aggiunte) meno di recente.
+
+    Esempio:
+        index = PerceptualIndex(max_distance=4)
+        index.add(digest, image.dhash())
+        index.nearest(other.dhash())  # [(distanza, digest), ...]
+    """
+
+    HASH_BITS = 64
+
+    def __init__(self, max_distance: int, max_entries: int = PHASH_MAX_ENTRIES):
+        self.max_distance = max(0, max_distance)
+        self.max_entries = max(1, max_entries)
+        bands = min(self.max_distance + 1, self.HASH_BITS)
+        width, extra = divmod(self.HASH_BITS, bands)
+        self._bands: List[Tuple[int, int]] = []  # (shift, mask) per banda
+        shift = 0
+        for band in range(bands):
+            bits = width + (1 if band < extra else 0)
+            self._bands.append((shift, (1 << bits) - 1))
+            shift += bits
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._hashes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._hashes
+
+    def add(self, digest: str, value: int) -> None:
+        with self._lock:
+            self._remove(digest)
+            self._hashes[digest] = value
+            for buckets, (shift, mask) in zip(self._buckets, self._bands):
+                buckets.setdefault((value >> shift) & mask, set()).add(digest)
+            while len(self._hashes) > self.max_entries:
+                self._remove(next(iter(self._hashes)))
+
+    def digests(self) -> List[str]:
+        with self._lock:
+            return list(self._hashes)
+
+    def discard(self, digest: str) -> None:
+        """Dimentica un'immagine (es. i suoi risultati sono scaduti)."""
+        with self._lock:
+            self._remove(digest)
+
+    def _remove(self, digest: str) -> None:
+        value = self._hashes.pop(digest, None)
+        if value is None:
+            return
+        for buckets, (shift, mask) in zip(self._buckets, self._bands):
+            key = (value >> shift) & mask
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(digest)
+                if not bucket:
+                    del buckets[key]
+
+    def nearest(self, value: int, exclude: Optional[str] = None) -> List[Tuple[int, str]]:
+        """Immagini entro max_distance, dalla più vicina."""
+        with self._lock:
+            candidates = set()
+            for buckets, (shift, mask) in zip(self._buckets, self._bands):
+                candidates |= buckets.get((value >> shift) & mask, set())
+            matches = []
+            for digest in candidates:
+                distance = bin(self._hashes[digest] ^ value).count("1")
+                if distance <= self.max_distance and digest != exclude:
+                    matches.append((distance, digest))
+        return sorted(matches)
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    """
+    Chiave canonica di un'analisi in cache.
+
+    Il digest dell'immagine è il blob dell'archivio; gli altri campi formano
+    il tipo di risultato (colonna indicizzata `kind`), ad esempio
+    "describe|llava:latest@8dd30f6b0cb1|p:1f0e...|pre:1-1024".
+
+    Attributi:
+        image: Digest dell'immagine
+        analysis_type: Tipo di analisi (describe, text, ...)
+        model: Modello vision ("" se nessuno disponibile)
+        model_digest: Digest del modello su Ollama (cambia se ri-scaricato)
+        prompt: Digest del prompt effettivo (predefinito o personalizzato)
+        preprocess: Versione e parametri della preparazione dell'immagine
+    """
+
+    image: str
+    analysis_type: str
+    model: str
+    model_digest: str
+    prompt: str
+    preprocess: str
+
+    @property
+    def kind(self) -> str:
+        return (
+            f"{self.analysis_type}|{self.model}@{self.model_digest[:12]}"
+            f"|p:{self.prompt}|pre:{self.preprocess}"
+        )
+
+
 class ImageCache:
-    """Cache per evitare ri-analisi di immagini già processate."""
+    """
+    Cache per evitare ri-analisi di immagini già processate.
 
-    def __init__(self, cache_dir: Path):
-        self.cache_dir = cache_dir
-        self.cache_dir.mkdir(exist_ok=True)
-        self.index_file = cache_dir / "index.json"
-        self.index = self._load_index()
+    I risultati sono nell'archivio content-addressed condiviso: l'immagine
+    è il blob (digest BLAKE2b), il tipo di risultato è CacheKey.kind
+    (analisi, modello e sua versione, prompt, preparazione). La stessa
+    immagine caricata da tool diversi ha un'unica entry per variante.
 
-    def _load_index(self) -> Dict:
-        if self.index_file.exists():
-            try:
-                return json.loads(self.index_file.read_text())
-            except:
-                return {}
-        return {}
+    Con phash_distance l'archivio registra anche il dHash di ogni immagine
+    analizzata (tipo "dhash"): se il digest esatto non è in cache, si cerca
+    un'immagine visivamente uguale già analizzata. Le due ricerche hanno
+    contatori separati in stats().
+    """
+
+    SERVICE = "image"
+    DHASH_KIND = "dhash"
 
-    def _save_index(self):
-        self.index_file.write_text(json.dumps(self.index, indent=2))
+    def __init__(
+        self,
+        store: Optional[ContentStore] = None,
+        phash_distance: Optional[int] = PHASH_MAX_DISTANCE
+    ):
+        self.store = store or get_store()
+        self.perceptual: Optional[PerceptualIndex] = None
+        self.lookups = 0
+        self.exact_hits = 0
+        self.perceptual_lookups = 0
+        self.perceptual_hits = 0
+        if phash_distance is not None:
+            self.perceptual = PerceptualIndex(phash_distance)
+            for digest, payload in self.store.find_results(
+                self.SERVICE, self.DHASH_KIND, max_age_hours=CACHE_EXPIRY_HOURS
+            ):
+                if payload and "dhash" in payload:
+                    self.perceptual.add(digest, int(payload["dhash"], 16))
 
     def get_hash(self, image_bytes: bytes) -> str:
-        return hashlib.md5(image_bytes).hexdigest()
-
-    def get(self, image_hash: str) -> Optional[Dict]:
-        if image_hash in self.index:
-            entry = self.index[image_hash]
-            # Verifica scadenza
-            if time.time() - entry.get("timestamp", 0) < CACHE_EXPIRY_HOURS * 3600:
-                return entry.get("result")
+        return content_digest(image_bytes)
+
+    def get(self, image_hash: str, kind: str) -> Optional[Dict]:
+        self.lookups += 1
+        hit = self.store.get_result(
+            image_hash, self.SERVICE, kind, max_age_hours=CACHE_EXPIRY_HOURS
+        )
+        if hit:
+            self.exact_hits += 1
+        return hit["payload"] if hit else None
+
+    def get_similar(self, image_hash: str, kind: str, dhash: int) -> Optional[Dict]:
+        """
+        Risultato di un'immagine quasi identica (dopo un miss esatto).
+
+        Returns:
+            Payload in cache con "near_duplicate": {"hash", "distance"},
+            oppure None (anche se l'indice è disattivato)
+        """
+        if self.perceptual is None:
+            return None
+        self.perceptual_lookups += 1
+        for distance, digest in self.perceptual.nearest(dhash, exclude=image_hash):
+            hit = self.store.get_result(
+                digest, self.SERVICE, kind, max_age_hours=CACHE_EXPIRY_HOURS
+            )
+            if hit and hit["payload"]:
+                self.perceptual_hits += 1
+                payload = hit["payload"]
+                payload["near_duplicate"] = {"hash": digest, "distance": distance}
+                return payload
         return None
 
-    def set(self, image_hash: str, result: Dict):
-        self.index[image_hash] = {
-            "timestamp": time.time(),
-            "result": result
-        }
-        self._save_index()
+    def set(
+        self,
+        image_hash: str,
+        kind: str,
+        result: Dict,
+        size: int = 0,
+        dhash: Optional[int] = None
+    ):
+        self.store.register_blob(image_hash, size)
+        self.store.put_result(image_hash, self.SERVICE, kind, result)
+        if self.perceptual is not None and dhash is not None:
+            # Riscritto a ogni risultato: scade insieme all'ultimo risultato
+            self.store.put_result(
+                image_hash, self.SERVICE, self.DHASH_KIND, {"dhash": f"{dhash:016x}"}
+            )
+            self.perceptual.add(image_hash, dhash)
 
     def cleanup(self):
-        """Rimuove entry scadute."""
-        now = time.time()
-        expired = [
-            h for h, e in self.index.items()
-            if now - e.get("timestamp", 0) > CACHE_EXPIRY_HOURS * 3600
-        ]
-        for h in expired:
-            del self.index[h]
-        self._save_index()
-        return len(expired)
+        """Rimuove entry scadute (anche dall'indice percettivo)."""
+        removed = self.store.cleanup(CACHE_EXPIRY_HOURS, service=self.SERVICE)
+        if self.perceptual is not None:
+            alive = {
+                digest for digest, _ in self.store.find_results(
+                    self.SERVICE, self.DHASH_KIND, max_age_hours=CACHE_EXPIRY_HOURS
+                )
+            }
+            for digest in self.perceptual.digests():
+                if digest not in alive:
+                    self.perceptual.discard(digest)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Ricerche e hit, esatti e per somiglianza, separati."""
+        def rate(hits: int, lookups: int) -> Optional[float]:
+            return round(hits / lookups, 3) if lookups else None
+
+        return {
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "exact_hit_rate": rate(self.exact_hits, self.lookups),
+            "perceptual": self.perceptual is not None,
+            "perceptual_max_distance": (
+                self.perceptual.max_distance if self.perceptual is not None else None
+            ),
+            "perceptual_indexed": len(self.perceptual) if self.perceptual is not None else 0,
+            "perceptual_lookups": self.perceptual_lookups,
+            "perceptual_hits": self.perceptual_hits,
+            "perceptual_hit_rate": rate(self.perceptual_hits, self.perceptual_lookups),
+        }
+
+
+# ============================================================================
+# CLIENT OLLAMA
+# ============================================================================
+
+class OllamaError(Exception):
+    """Risposta di errore da Ollama."""
+
+    def __init__(self, status: int, detail: str = ""):
+        self.status = status
+        self.detail = detail
+        super().__init__(f"Ollama error: {status}" + (f" ({detail})" if detail else ""))
+
+
+class OllamaClient:
+    """
+    Client asincrono per /api/generate di Ollama.
+
+    - Connessioni keep-alive condivise (httpx.AsyncClient)
+    - Al massimo `parallel` inferenze contemporanee per modello: le altre
+      attendono qui invece di accodarsi sul server
+    - Una richiesta annullata (es. client HTTP disconnesso) chiude la
+      connessione e Ollama interrompe la generazione
+
+    httpx è una dipendenza del servizio. Senza, la richiesta usa una
+    requests.Session condivisa in un thread: l'event loop resta libero, ma
+    il thread non si può interrompere, quindi una richiesta annullata
+    tiene occupato il posto del modello finché Ollama non risponde.
+
+    Uso:
+        client = OllamaClient(OLLAMA_URL)
+        text = await client.generate("llava", "Descrivi", images=[b64])
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        parallel: int = OLLAMA_NUM_PARALLEL,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        timeout: float = OLLAMA_TIMEOUT,
+        limits: Optional[Dict[str, int]] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.parallel = max(1, parallel)
+        self.max_connections = max(1, max_connections)
+        self.timeout = timeout
+        self.limits = dict(limits or {})  # Modello -> limite specifico
+
+        # Client e semafori appartengono all'event loop che li ha creati
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._session: Optional["requests.Session"] = None  # Solo senza httpx
+
+        self.running: Dict[str, int] = {}
+        self.waiting: Dict[str, int] = {}
+        self.completed = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def limit(self, model: str) -> int:
+        """Inferenze contemporanee consentite per un modello."""
+        return self.limits.get(model, self.parallel)
+
+    def _bind_loop(self) -> None:
+        """Ricrea client e semafori se cambia l'event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._semaphores = {}
+        self._client = None
+        if HAS_HTTPX:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=5),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(self.limit(model))
+        return semaphore
+
+    def _requests_session(self) -> "requests.Session":
+        """Sessione requests condivisa (connessioni riusate tra i thread)."""
+        if self._session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.max_connections
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    async def _in_thread(self, method: str, path: str, **kwargs: Any) -> Any:
+        """
+        Richiesta con requests in un thread (senza httpx).
+
+        Se la coroutine viene annullata il thread continua comunque: si
+        attende che finisca prima di propagare l'annullamento, così chi
+        tiene il posto del modello (_slot) lo rilascia solo quando Ollama
+        ha davvero smesso di generare.
+        """
+        session = self._requests_session()
+        work = asyncio.ensure_future(asyncio.to_thread(
+            session.request, method, f"{self.base_url}{path}", **kwargs
+        ))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            await asyncio.wait({work})
+            raise
+
+    async def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self._client is not None:
+            resp = await self._client.post("/api/generate", json=payload)
+        else:
+            resp = await self._in_thread(
+                "POST", "/api/generate", json=payload, timeout=self.timeout
+            )
+        if resp.status_code != 200:
+            raise OllamaError(resp.status_code)
+        return resp.json()
+
+    @asynccontextmanager
+    async def _slot(self, model: str) -> AsyncIterator[None]:
+        """Posto per un'inferenza sul modello, con i contatori dello stato."""
+        semaphore = self._semaphore(model)
+        self.waiting[model] = self.waiting.get(model, 0) + 1
+        try:
+            await semaphore.acquire()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.waiting[model] -= 1
+
+        self.running[model] = self.running.get(model, 0) + 1
+        try:
+            yield
+            self.completed += 1
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.running[model] -= 1
+            semaphore.release()
+
+    @staticmethod
+    def _payload(model: str, prompt: str, images: Optional[List[str]], stream: bool) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream}
+        if images:
+            payload["images"] = images
+        return payload
+
+    async def generate(self, model: str, prompt: str, images: Optional[List[str]] = None) -> str:
+        """
+        Esegue una generazione (risposta completa, non in streaming).
+
+        Raises:
+            OllamaError: Se Ollama risponde con un errore
+            asyncio.CancelledError: Se la richiesta viene annullata
+        """
+        self._bind_loop()
+        async with self._slot(model):
+            data = await self._post(self._payload(model, prompt, images, stream=False))
+        return data.get("response", "")
+
+    async def generate_stream(
+        self, model: str, prompt: str, images: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Esegue una generazione restituendo i token man mano che arrivano.
+
+        Ollama invia una riga JSON per frammento ({"response": ..., "done": ...}).
+        Chiudere il generatore (o annullare chi lo consuma) chiude la
+        connessione e libera il posto del modello. Senza httpx (installazione
+        incompleta) la risposta arriva in un unico frammento.
+
+        Raises:
+            OllamaError: Se Ollama risponde con un errore
+        """
+        self._bind_loop()
+        if self._client is None:
+            yield await self.generate(model, prompt, images)
+            return
+
+        payload = self._payload(model, prompt, images, stream=True)
+        async with self._slot(model):
+            async with self._client.stream("POST", "/api/generate", json=payload) as resp:
+                if resp.status_code != 200:
+                    raise OllamaError(resp.status_code)
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        # Errore a generazione iniziata: lo stato HTTP è già 200
+                        raise OllamaError(500, data["error"])
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+
+    async def tags(self) -> List[Dict[str, Any]]:
+        """
+        Modelli installati (/api/tags), ognuno con nome e digest.
+
+        Raises:
+            OllamaError: Se Ollama risponde con un errore
+        """
+        self._bind_loop()
+        if self._client is not None:
+            resp = await self._client.get("/api/tags", timeout=5)
+        else:
+            resp = await self._in_thread("GET", "/api/tags", timeout=5)
+        if resp.status_code != 200:
+            raise OllamaError(resp.status_code)
+        return resp.json().get("models", [])
+
+    def stats(self) -> Dict[str, Any]:
+        """Stato del client per l'health check."""
+        return {
+            "transport": "httpx" if HAS_HTTPX else "requests",
+            "parallel_per_model": self.parallel,
+            "limits": dict(self.limits),
+            "running": {m: n for m, n in self.running.items() if n},
+            "waiting": {m: n for m, n in self.waiting.items() if n},
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+        }
+
+    async def aclose(self) -> None:
+        """Chiude le connessioni aperte."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+# ============================================================================
+# IMMAGINE DECODIFICATA
+# ============================================================================
+
+class DecodedImage:
+    """
+    Immagine decodificata una sola volta per richiesta.
+
+    Metadati, colori dominanti, payload per Ollama e OCR usano la stessa
+    decodifica. I JPEG sono decodificati con draft(): libjpeg riduce
+    l'immagine di 1/2, 1/4 o 1/8 già in decodifica, fermandosi alla scala
+    più piccola che resta sopra max_size. Una foto da 12 megapixel non
+    viene mai decodificata a piena risoluzione.
+
+    Attributi:
+        image: Immagine decodificata (eventualmente ridotta)
+        width, height: Dimensioni originali, lette dall'intestazione
+        format: Formato del file (JPEG, PNG, ...)
+        mode: Modalità colore originale
+        size_bytes: Dimensione del file
+    """
+
+    def __init__(self, image_bytes: bytes, max_size: Optional[int] = MAX_IMAGE_SIZE):
+        img = Image.open(as_stream(image_bytes))
+        self.width, self.height = img.size
+        self.format = img.format or "unknown"
+        self.mode = img.mode
+        self.size_bytes = len(image_bytes)
+
+        if max_size and img.format == "JPEG" and max(img.size) > max_size:
+            ratio = max_size / max(img.size)
+            img.draft(None, (max(1, int(img.size[0] * ratio)), max(1, int(img.size[1] * ratio))))
+        img.load()
+        self.image = img
+        self._rgb: Optional["Image.Image"] = None
+        self._dhash: Optional[int] = None
+
+    def metadata(self) -> Dict:
+        """Metadati base (dimensioni originali, non quelle decodificate)."""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "format": self.format,
+            "mode": self.mode,
+            "size_bytes": self.size_bytes,
+            "size_kb": round(self.size_bytes / 1024, 2)
+        }
+
+    def rgb(self) -> "Image.Image":
+        """Versione RGB (trasparenza su sfondo bianco), calcolata una volta."""
+        if self._rgb is None:
+            img = self.image
+            if img.mode in ('RGBA', 'P', 'LA'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[3])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            self._rgb = img
+        return self._rgb
+
+    def resized(self, max_size: int) -> "Image.Image":
+        """Copia RGB con il lato maggiore al massimo max_size."""
+        img = self.rgb()
+        if max(img.size) > max_size:
+            ratio = max_size / max(img.size)
+            new_size = (max(1, int(img.size[0] * ratio)), max(1, int(img.size[1] * ratio)))
+            img = img.resize(new_size, Image.LANCZOS)
+        return img
+
+    def dhash(self) -> int:
+        """
+        Hash percettivo (dHash a 64 bit), calcolato una volta.
+
+        L'immagine in scala di grigi ridotta a 9x8: ogni bit dice se un pixel
+        è più chiaro del vicino a destra. Ricompressione e ridimensionamento
+        cambiano pochi bit, un'immagine diversa circa la metà.
+        """
+        if self._dhash is None:
+            pixels = list(self.rgb().convert("L").resize((9, 8), Image.LANCZOS).getdata())
+            value = 0
+            for row in range(8):
+                for col in range(8):
+                    left = pixels[row * 9 + col]
+                    value = (value << 1) | (left > pixels[row * 9 + col + 1])
+            self._dhash = value
+        return self._dhash
 
 
 # ============================================================================
@@ -138,12 +713,60 @@ class ImageCache:
 class ImageAnalyzer:
     """Analizza immagini usando Ollama Vision o fallback locali."""
 
+    # Prompt per tipo di analisi
+    PROMPTS = {
+        "complete": """Analizza questa immagine in modo completo. Fornisci:
+1. DESCRIZIONE: Cosa mostra l'immagine
+2. OGGETTI: Lista degli oggetti/elementi visibili
+3. TESTO: Qualsiasi testo leggibile nell'immagine
+4. COLORI: Colori predominanti
+5. CONTESTO: Possibile contesto o scopo dell'immagine
+
+Rispondi in italiano in modo strutturato.""",
+
+        "describe": "Descrivi questa immagine in italiano in modo dettagliato ma conciso.",
+
+        "objects": """Elenca tutti gli oggetti e elementi visibili in questa immagine.
+Formato: una lista puntata in italiano. Includi posizione relativa se rilevante.""",
+
+        "text": """Estrai tutto il testo visibile in questa immagine.
+Se è un documento, mantieni la struttura.
+Se contiene formule matematiche, scrivi in LaTeX.
+Rispondi solo con il testo estratto.""",
+
+        "math": """Questa immagine contiene contenuto matematico.
+1. Descrivi cosa rappresenta (grafico, formula, diagramma, etc.)
+2. Se ci sono formule, trascrivile in LaTeX
+3. Se è un grafico, descrivi assi, funzione, punti notevoli
+4. Fornisci una spiegazione matematica del contenuto
+
+Rispondi in italiano.""",
+
+        "diagram": """Analizza questo diagramma/schema:
+1. Tipo di diagramma (flowchart, UML, circuito, etc.)
+2. Elementi principali e loro relazioni
+3. Flusso o logica rappresentata
+4. Eventuali etichette o annotazioni
+
+Rispondi in italiano in modo strutturato.""",
+
+        "code": """Se questa immagine contiene codice:
+1. Identifica il linguaggio di programmazione
+2. Trascrivi il codice
+3. Spiega brevemente cosa fa
+
+Se non contiene codice, descrivi cosa mostra."""
+    }
+
     def __init__(self, ollama_url: str = OLLAMA_URL, model: str = VISION_MODEL):
         self.ollama_url = ollama_url
         self.model = model
-        self.cache = ImageCache(CACHE_DIR)
+        self.cache = ImageCache()
+        self.ollama = OllamaClient(ollama_url)
         self.available_models = []
+        self.model_digests: Dict[str, str] = {}  # Nome -> digest su Ollama
         self._check_ollama()
+        self._models_checked = time.monotonic()
 
     def _check_ollama(self):
         """Verifica disponibilità Ollama e modelli vision."""
@@ -151,16 +774,11 @@ class ImageAnalyzer:
             resp = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
             if resp.status_code == 200:
                 models = resp.json().get("models", [])
-                self.available_models = [m["name"] for m in models]
+                self._set_models(models)
 
-                # Cerca modelli vision disponibili
-                vision_models = ["llava", "llama3.2-vision", "bakllava", "moondream"]
-                for vm in vision_models:
-                    for am in self.available_models:
-                        if vm in am.lower():
-                            self.model = am
-                            print(f"[OK] Modello vision trovato: {self.model}")
-                            return True
+                if self._select_vision_model():
+                    print(f"[OK] Modello vision trovato: {self.model}")
+                    return True
 
                 print(f"[!] Nessun modello vision trovato. Modelli disponibili: {self.available_models}")
                 return False
@@ -168,50 +786,89 @@ class ImageAnalyzer:
             print(f"[X] Ollama non raggiungibile: {e}")
             return False
 
-    def _prepare_image(self, image_bytes: bytes) -> str:
-        """Prepara immagine per Ollama (ridimensiona e converte in base64)."""
-        img = Image.open(io.BytesIO(image_bytes))
+    def _set_models(self, models: List[Dict[str, Any]]) -> None:
+        """Aggiorna modelli disponibili e relativi digest da /api/tags."""
+        self.available_models = [m["name"] for m in models]
+        self.model_digests = {m["name"]: m.get("digest", "") for m in models}
+
+    def _select_vision_model(self) -> bool:
+        """Sceglie il primo modello vision installato (es. "llava:latest")."""
+        vision_models = ["llava", "llama3.2-vision", "bakllava", "moondream"]
+        for vm in vision_models:
+            for am in self.available_models:
+                if vm in am.lower():
+                    self.model = am
+                    return True
+        return False
 
-        # Ridimensiona se troppo grande
-        if max(img.size) > MAX_IMAGE_SIZE:
-            ratio = MAX_IMAGE_SIZE / max(img.size)
-            new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-            img = img.resize(new_size, Image.LANCZOS)
+    def _resolve_model(self) -> None:
+        """
+        Porta self.model al nome completo di /api/tags.
 
-        # Converti in RGB se necessario
-        if img.mode in ('RGBA', 'P', 'LA'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'RGBA':
-                background.paste(img, mask=img.split()[3])
-            else:
-                background.paste(img)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
+        Se Ollama non rispondeva all'avvio self.model è ancora il nome
+        senza tag (es. "llava") e il suo digest non si troverebbe:
+        si usa "llava:latest", oppure si rifà la scelta del modello vision.
+        """
+        if not self.model_digests or self.model in self.model_digests:
+            return
+        if f"{self.model}:latest" in self.model_digests:
+            self.model = f"{self.model}:latest"
+        else:
+            self._select_vision_model()
+
+    async def _refresh_models(self) -> None:
+        """
+        Rilegge /api/tags al massimo ogni MODEL_CHECK_SECONDS.
+
+        Se il modello è stato ri-scaricato il suo digest cambia, e con lui
+        la chiave di cache: i risultati del modello precedente non vengono
+        più restituiti. Se Ollama non risponde restano i dati precedenti.
+        """
+        if time.monotonic() - self._models_checked < MODEL_CHECK_SECONDS:
+            return
+        self._models_checked = time.monotonic()
+        try:
+            self._set_models(await self.ollama.tags())
+        except Exception:
+            return
+        self._resolve_model()
+
+    async def cache_key(
+        self, img_hash: str, analysis_type: str, custom_prompt: str = ""
+    ) -> CacheKey:
+        """Chiave di cache per un'analisi con il modello e i parametri attuali."""
+        await self._refresh_models()
+        preprocess = f"{PREPROCESS_VERSION}-{MAX_IMAGE_SIZE}-q{JPEG_QUALITY}"
+        if self._use_ocr(analysis_type):
+            preprocess += f"-ocr{OCR_MAX_SIZE}"
+        model = self.model if self.available_models else ""
+        prompt = self._prompt(analysis_type, custom_prompt)
+        return CacheKey(
+            image=img_hash,
+            analysis_type=analysis_type,
+            model=model,
+            model_digest=self.model_digests.get(model, ""),
+            prompt=content_digest(prompt.encode("utf-8"))[:16],
+            preprocess=preprocess
+        )
+
+    def _prepare_image(self, image: DecodedImage) -> str:
+        """Prepara immagine per Ollama (ridimensiona e converte in base64)."""
+        img = image.resized(MAX_IMAGE_SIZE)
 
         # Converti in base64
         buf = io.BytesIO()
-        img.save(buf, format='JPEG', quality=85)
+        img.save(buf, format='JPEG', quality=JPEG_QUALITY)
         return base64.b64encode(buf.getvalue()).decode('utf-8')
 
-    def _get_image_metadata(self, image_bytes: bytes) -> Dict:
+    def _get_image_metadata(self, image: DecodedImage) -> Dict:
         """Estrae metadati base dell'immagine."""
-        img = Image.open(io.BytesIO(image_bytes))
-        return {
-            "width": img.size[0],
-            "height": img.size[1],
-            "format": img.format or "unknown",
-            "mode": img.mode,
-            "size_bytes": len(image_bytes),
-            "size_kb": round(len(image_bytes) / 1024, 2)
-        }
+        return image.metadata()
 
-    def _analyze_colors(self, image_bytes: bytes, num_colors: int = 5) -> List[str]:
+    def _analyze_colors(self, image: DecodedImage, num_colors: int = 5) -> List[str]:
         """Analizza i colori dominanti dell'immagine."""
         try:
-            img = Image.open(io.BytesIO(image_bytes))
-            img = img.convert('RGB')
-            img = img.resize((100, 100))  # Riduci per velocità
+            img = image.rgb().resize((100, 100))  # Riduci per velocità
 
             # Conta colori
             colors = img.getcolors(10000)
@@ -226,156 +883,238 @@ class ImageAnalyzer:
             pass
         return []
 
-    def _ocr_image(self, image_bytes: bytes) -> str:
+    def _ocr_image(self, image: DecodedImage) -> str:
         """Estrae testo dall'immagine usando OCR."""
         if not HAS_TESSERACT:
             return ""
 
         try:
-            img = Image.open(io.BytesIO(image_bytes))
-            text = pytesseract.image_to_string(img, lang='ita+eng')
+            text = pytesseract.image_to_string(image.image, lang='ita+eng')
             return text.strip()
         except Exception as e:
             return f"[OCR error: {e}]"
 
-    def _analyze_with_ollama(self, image_bytes: bytes, prompt: str) -> str:
-        """Analizza immagine usando Ollama Vision."""
+    async def _analyze_with_ollama(self, image: DecodedImage, prompt: str) -> str:
+        """Analizza immagine usando Ollama Vision (senza bloccare l'event loop)."""
         try:
-            img_base64 = self._prepare_image(image_bytes)
+            img_base64 = await asyncio.to_thread(self._prepare_image, image)
+            return await self.ollama.generate(self.model, prompt, images=[img_base64])
+        except OllamaError as e:
+            return f"[Ollama error: {e.status}]"
+        except Exception as e:
+            return f"[Error: {e}]"
 
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "images": [img_base64],
-                "stream": False
-            }
+    def _local_analysis(self, image: DecodedImage, use_ocr: bool) -> Dict[str, Any]:
+        """Colori dominanti e OCR (lavoro CPU, eseguito in un thread)."""
+        result: Dict[str, Any] = {"colors": self._analyze_colors(image)}
+        if use_ocr:
+            result["ocr_text"] = self._ocr_image(image)
+        return result
 
-            resp = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=60
-            )
+    @staticmethod
+    def _use_ocr(analysis_type: str) -> bool:
+        """L'analisi include l'OCR locale."""
+        return analysis_type in OCR_ANALYSIS_TYPES and HAS_TESSERACT
 
-            if resp.status_code == 200:
-                return resp.json().get("response", "")
-            else:
-                return f"[Ollama error: {resp.status_code}]"
+    def _prompt(self, analysis_type: str, custom_prompt: str) -> str:
+        """Prompt personalizzato o predefinito per il tipo di analisi."""
+        return custom_prompt or self.PROMPTS.get(analysis_type, self.PROMPTS["describe"])
 
-        except Exception as e:
-            return f"[Error: {e}]"
+    async def _decode(self, image_bytes: bytes, analysis_type: str) -> Tuple[DecodedImage, bool]:
+        """
+        Una sola decodifica per tutta la richiesta: con l'OCR serve più
+        risoluzione che per il modello vision.
+
+        Returns:
+            (immagine decodificata, se eseguire l'OCR)
+        """
+        use_ocr = self._use_ocr(analysis_type)
+        image = await asyncio.to_thread(
+            DecodedImage, image_bytes, OCR_MAX_SIZE if use_ocr else MAX_IMAGE_SIZE
+        )
+        return image, use_ocr
+
+    def _base_result(self, img_hash: str, analysis_type: str, image: DecodedImage) -> Dict[str, Any]:
+        """Metadati base del risultato."""
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "hash": img_hash,
+            "analysis_type": analysis_type,
+            "metadata": self._get_image_metadata(image),
+            "from_cache": False
+        }
+
+    async def _cached_similar(
+        self, img_hash: str, cache_kind: str, image: DecodedImage
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Risultato di un'immagine visivamente uguale (stessa immagine
+        ricompressa o ridimensionata), se l'indice percettivo è attivo.
 
-    def analyze(
+        Il risultato trovato viene salvato anche sotto il digest esatto.
+        """
+        if self.cache.perceptual is None:
+            return None
+        dhash = await asyncio.to_thread(image.dhash)
+        cached = self.cache.get_similar(img_hash, cache_kind, dhash)
+        if cached is None:
+            return None
+        # Salvato senza il marcatore: le richieste successive dello stesso
+        # file sono hit esatti a tutti gli effetti
+        near_duplicate = cached.pop("near_duplicate")
+        cached["hash"] = img_hash
+        cached["metadata"] = self._get_image_metadata(image)
+        self.cache.set(img_hash, cache_kind, cached, image.size_bytes, dhash=dhash)
+        cached["from_cache"] = True
+        cached["near_duplicate"] = near_duplicate
+        return cached
+
+    def _store_result(
+        self, img_hash: str, cache_kind: str, result: Dict[str, Any], image: DecodedImage
+    ) -> None:
+        """Salva il risultato (con il dHash se l'indice percettivo è attivo)."""
+        dhash = image.dhash() if self.cache.perceptual is not None else None
+        self.cache.set(img_hash, cache_kind, result, image.size_bytes, dhash=dhash)
+
+    async def analyze(
         self,
         image_bytes: bytes,
         analysis_type: str = "complete",
         custom_prompt: str = "",
-        use_cache: bool = True
+        use_cache: bool = True,
+        image_hash: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Analizza un'immagine e restituisce risultati strutturati.
 
+        Decodifica, colori e OCR girano in thread; l'inferenza su Ollama è
+        asincrona e procede insieme all'analisi locale. Annullare la
+        coroutine annulla anche la richiesta a Ollama.
+
         Args:
-            image_bytes: Bytes dell'immagine
+            image_bytes: Bytes dell'immagine (o mmap di un upload)
             analysis_type: Tipo di analisi (complete, describe, objects, text, math)
             custom_prompt: Prompt personalizzato per Ollama
             use_cache: Usa cache per risultati
+            image_hash: Hash già calcolato durante l'upload (opzionale)
 
         Returns:
             Dict con risultati analisi
         """
-        # Check cache
-        img_hash = self.cache.get_hash(image_bytes)
-        cache_key = f"{img_hash}_{analysis_type}"
+        img_hash = image_hash or self.cache.get_hash(image_bytes)
+        cache_kind = (await self.cache_key(img_hash, analysis_type, custom_prompt)).kind
 
         if use_cache:
-            cached = self.cache.get(cache_key)
+            cached = self.cache.get(img_hash, cache_kind)
             if cached:
                 cached["from_cache"] = True
                 return cached
 
-        # Metadati base
-        result = {
-            "timestamp": datetime.now().isoformat(),
-            "hash": img_hash,
-            "analysis_type": analysis_type,
-            "metadata": self._get_image_metadata(image_bytes),
-            "from_cache": False
-        }
-
-        # Prompt basati sul tipo di analisi
-        prompts = {
-            "complete": """Analizza questa immagine in modo completo. Fornisci:
-1. DESCRIZIONE: Cosa mostra l'immagine
-2. OGGETTI: Lista degli oggetti/elementi visibili
-3. TESTO: Qualsiasi testo leggibile nell'immagine
-4. COLORI: Colori predominanti
-5. CONTESTO: Possibile contesto o scopo dell'immagine
-
-Rispondi in italiano in modo strutturato.""",
-
-            "describe": "Descrivi questa immagine in italiano in modo dettagliato ma conciso.",
-
-            "objects": """Elenca tutti gli oggetti e elementi visibili in questa immagine.
-Formato: una lista puntata in italiano. Includi posizione relativa se rilevante.""",
-
-            "text": """Estrai tutto il testo visibile in questa immagine.
-Se è un documento, mantieni la struttura.
-Se contiene formule matematiche, scrivi in LaTeX.
-Rispondi solo con il testo estratto.""",
-
-            "math": """Questa immagine contiene contenuto matematico.
-1. Descrivi cosa rappresenta (grafico, formula, diagramma, etc.)
-2. Se ci sono formule, trascrivile in LaTeX
-3. Se è un grafico, descrivi assi, funzione, punti notevoli
-4. Fornisci una spiegazione matematica del contenuto
+        image, use_ocr = await self._decode(image_bytes, analysis_type)
+        if use_cache:
+            similar = await self._cached_similar(img_hash, cache_kind, image)
+            if similar:
+                return similar
 
-Rispondi in italiano.""",
+        result = self._base_result(img_hash, analysis_type, image)
+        prompt = self._prompt(analysis_type, custom_prompt)
 
-            "diagram": """Analizza questo diagramma/schema:
-1. Tipo di diagramma (flowchart, UML, circuito, etc.)
-2. Elementi principali e loro relazioni
-3. Flusso o logica rappresentata
-4. Eventuali etichette o annotazioni
+        # Analisi con Ollama Vision, insieme alle analisi locali (colori, OCR)
+        local = asyncio.to_thread(self._local_analysis, image, use_ocr)
+        if self.available_models:
+            description, local_result = await asyncio.gather(
+                self._analyze_with_ollama(image, prompt), local
+            )
+        else:
+            description = NO_VISION_MODEL_MESSAGE
+            local_result = await local
+        result["description"] = description
+        result.update(local_result)
 
-Rispondi in italiano in modo strutturato.""",
+        # Salva in cache
+        if use_cache:
+            self._store_result(img_hash, cache_kind, result, image)
 
-            "code": """Se questa immagine contiene codice:
-1. Identifica il linguaggio di programmazione
-2. Trascrivi il codice
-3. Spiega brevemente cosa fa
+        return result
 
-Se non contiene codice, descrivi cosa mostra."""
-        }
+    async def analyze_stream(
+        self,
+        image_bytes: bytes,
+        analysis_type: str = "complete",
+        custom_prompt: str = "",
+        use_cache: bool = True,
+        image_hash: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Come analyze(), ma restituisce la descrizione token per token.
+
+        Eventi prodotti, come coppie (nome, dati):
+            "start":  metadati dell'immagine (subito dopo la decodifica)
+            "token":  {"text": frammento della descrizione}
+            "result": risultato completo, identico a quello di analyze()
+            "error":  {"detail", "partial"} se la generazione fallisce (al
+                      posto di "result")
+
+        Con un risultato in cache arriva solo "result". La cache viene
+        scritta solo a generazione conclusa: uno stream interrotto o fallito
+        non lascia risultati in cache.
+        """
+        img_hash = image_hash or self.cache.get_hash(image_bytes)
+        cache_kind = (await self.cache_key(img_hash, analysis_type, custom_prompt)).kind
 
-        # Usa prompt personalizzato o predefinito
-        if custom_prompt:
-            prompt = custom_prompt
-        else:
-            prompt = prompts.get(analysis_type, prompts["describe"])
+        if use_cache:
+            cached = self.cache.get(img_hash, cache_kind)
+            if cached:
+                cached["from_cache"] = True
+                yield "result", cached
+                return
 
-        # Analisi con Ollama Vision
-        if self.available_models:
-            vision_result = self._analyze_with_ollama(image_bytes, prompt)
-            result["description"] = vision_result
-        else:
-            result["description"] = "[Nessun modello vision disponibile. Installa llava con: ollama pull llava]"
+        image, use_ocr = await self._decode(image_bytes, analysis_type)
+        if use_cache:
+            similar = await self._cached_similar(img_hash, cache_kind, image)
+            if similar:
+                yield "result", similar
+                return
 
-        # Analisi aggiuntive locali
-        result["colors"] = self._analyze_colors(image_bytes)
+        result = self._base_result(img_hash, analysis_type, image)
+        yield "start", dict(result)
 
-        # OCR se disponibile e richiesto
-        if analysis_type in ("complete", "text", "code") and HAS_TESSERACT:
-            result["ocr_text"] = self._ocr_image(image_bytes)
+        # Colori e OCR procedono mentre arrivano i token
+        local = asyncio.ensure_future(asyncio.to_thread(self._local_analysis, image, use_ocr))
+        try:
+            if self.available_models:
+                parts: List[str] = []
+                try:
+                    img_base64 = await asyncio.to_thread(self._prepare_image, image)
+                    async for text in self.ollama.generate_stream(
+                        self.model, self._prompt(analysis_type, custom_prompt), images=[img_base64]
+                    ):
+                        parts.append(text)
+                        yield "token", {"text": text}
+                    description = "".join(parts)
+                except OllamaError as e:
+                    yield "error", {"detail": f"Ollama error: {e.status}", "partial": "".join(parts)}
+                    return
+                except Exception as e:
+                    yield "error", {"detail": f"Errore: {e}", "partial": "".join(parts)}
+                    return
+            else:
+                description = NO_VISION_MODEL_MESSAGE
+                yield "token", {"text": description}
+            result["description"] = description
+            result.update(await local)
+        finally:
+            if not local.done():
+                local.cancel()
 
-        # Salva in cache
         if use_cache:
-            self.cache.set(cache_key, result)
+            self._store_result(img_hash, cache_kind, result, image)
 
-        return result
+        yield "result", result
 
-    def quick_describe(self, image_bytes: bytes) -> str:
+    async def quick_describe(self, image_bytes: bytes, image_hash: Optional[str] = None) -> str:
         """Descrizione veloce per uso in chat."""
-        result = self.analyze(image_bytes, "describe")
+        result = await self.analyze(image_bytes, "describe", image_hash=image_hash)
         return result.get("description", "Impossibile analizzare l'immagine")
 
 
@@ -403,13 +1142,88 @@ except ImportError:
     ModelsResponse = None
 
 
+async def _receive_upload(file: UploadFile) -> SpooledUpload:
+    """Riceve l'upload a blocchi con hash in streaming (400 se troppo grande)."""
+    try:
+        return await spool_upload(file, MAX_FILE_SIZE_MB * 1024 * 1024)
+    except UploadTooLarge as e:
+        raise HTTPException(400, str(e))
+
+
+async def _until_disconnected(request: Request, work: Awaitable[Any]) -> Any:
+    """
+    Attende un'elaborazione annullandola se il client HTTP si disconnette.
+
+    Così un'inferenza di un minuto non continua a occupare Ollama per
+    una risposta che nessuno leggerà.
+
+    Raises:
+        HTTPException: 499 se il client si è disconnesso
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(499, "Richiesta annullata dal client")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Un evento server-sent (text/event-stream) con dati JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(
+    upload: SpooledUpload,
+    events: AsyncIterator[Tuple[str, Dict[str, Any]]]
+) -> "StreamingResponse":
+    """
+    Inoltra gli eventi di un'analisi come server-sent events.
+
+    L'upload resta aperto fino alla fine dello stream e viene chiuso qui.
+    Se il client si disconnette Starlette annulla lo stream, e con lui la
+    generazione in corso su Ollama.
+    """
+    async def stream():
+        try:
+            async for event, data in events:
+                yield _sse_event(event, data)
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Errore analisi: {str(e)}"})
+        finally:
+            await events.aclose()
+            upload.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 def create_app() -> FastAPI:
     """Crea l'applicazione FastAPI."""
 
+    # Inizializza analyzer
+    analyzer = ImageAnalyzer()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Chiude le connessioni verso Ollama allo spegnimento."""
+        yield
+        await analyzer.ollama.aclose()
+
     app = FastAPI(
         title="Image Analysis Service",
         description="Servizio locale per analisi immagini con Ollama Vision",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
 
     # CORS ristretto a localhost
@@ -424,8 +1238,11 @@ def create_app() -> FastAPI:
     # API key middleware (protegge POST/PUT/DELETE)
     create_api_key_middleware(app)
 
-    # Inizializza analyzer
-    analyzer = ImageAnalyzer()
+    # Rifiuta subito upload oltre il limite (per /batch sulla richiesta intera)
+    create_upload_limit_middleware(
+        app, MAX_FILE_SIZE_MB * 1024 * 1024,
+        path_limits={"/batch": BATCH_MAX_MB * 1024 * 1024}
+    )
 
     @app.get("/", response_model=ImageHealthResponse)
     async def root():
@@ -435,10 +1252,14 @@ def create_app() -> FastAPI:
             "status": "running",
             "ollama_url": OLLAMA_URL,
             "vision_model": analyzer.model,
+            "vision_model_digest": analyzer.model_digests.get(analyzer.model, ""),
             "available_models": analyzer.available_models,
+            "ollama_client": analyzer.ollama.stats(),
+            "cache": analyzer.cache.stats(),
             "endpoints": [
                 "POST /analyze - Analizza immagine",
                 "POST /describe - Descrizione veloce",
+                "POST /analyze, /describe con stream=true - Risposta in streaming (SSE)",
                 "POST /extract-text - Estrai testo/OCR",
                 "POST /analyze-math - Analisi contenuto matematico",
                 "GET /models - Lista modelli disponibili",
@@ -458,10 +1279,12 @@ def create_app() -> FastAPI:
 
     @app.post("/analyze")
     async def analyze_image(
+        request: Request,
         file: UploadFile = File(...),
         analysis_type: str = Form(default="complete"),
         custom_prompt: str = Form(default=""),
-        use_cache: bool = Form(default=True)
+        use_cache: bool = Form(default=True),
+        stream: bool = Form(default=False)
     ):
         """
         Analizza un'immagine e restituisce risultati strutturati.
@@ -470,61 +1293,112 @@ def create_app() -> FastAPI:
         - **analysis_type**: complete, describe, objects, text, math, diagram, code
         - **custom_prompt**: Prompt personalizzato opzionale
         - **use_cache**: Usa cache per risultati (default: true)
+        - **stream**: Risposta in server-sent events: "start" con i metadati,
+          un "token" per frammento della descrizione, "result" alla fine
         """
         try:
-            contents = await file.read()
-
-            # Se SVG, converti prima in PNG
-            if file.filename and file.filename.lower().endswith('.svg'):
-                try:
-                    import cairosvg
-                    contents = cairosvg.svg2png(bytestring=contents)
-                except ImportError:
-                    raise HTTPException(400, "SVG non supportato: installa cairosvg")
-
-            result = analyzer.analyze(
-                contents,
-                analysis_type=analysis_type,
-                custom_prompt=custom_prompt,
-                use_cache=use_cache
-            )
+            upload = await _receive_upload(file)
+            try:
+                contents = upload.data
+                image_hash = upload.digest
+
+                # Se SVG, converti prima in PNG
+                if file.filename and file.filename.lower().endswith('.svg'):
+                    try:
+                        import cairosvg
+                        contents = cairosvg.svg2png(bytestring=upload.to_bytes())
+                        image_hash = None
+                    except ImportError:
+                        raise HTTPException(400, "SVG non supportato: installa cairosvg")
+
+                options = {
+                    "analysis_type": analysis_type,
+                    "custom_prompt": custom_prompt,
+                    "use_cache": use_cache,
+                    "image_hash": image_hash,
+                }
+                if stream:
+                    return _sse_response(upload, analyzer.analyze_stream(contents, **options))
+            except BaseException:
+                upload.close()
+                raise
+
+            with upload:
+                result = await _until_disconnected(
+                    request, analyzer.analyze(contents, **options)
+                )
 
             return JSONResponse(result)
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore analisi: {str(e)}")
 
     @app.post("/describe")
-    async def quick_describe(file: UploadFile = File(...)):
-        """Descrizione veloce dell'immagine (solo testo)."""
+    async def quick_describe(
+        request: Request,
+        file: UploadFile = File(...),
+        stream: bool = Form(default=False)
+    ):
+        """
+        Descrizione veloce dell'immagine (solo testo).
+
+        Con stream=true la descrizione arriva in server-sent events: un
+        "token" per frammento e "result" con {"description"} alla fine.
+        """
         try:
-            contents = await file.read()
-            description = analyzer.quick_describe(contents)
+            upload = await _receive_upload(file)
+            if stream:
+                async def events():
+                    async for event, data in analyzer.analyze_stream(
+                        upload.data, "describe", image_hash=upload.digest
+                    ):
+                        if event == "result":
+                            data = {"description": data.get("description", "")}
+                        yield event, data
+
+                return _sse_response(upload, events())
+
+            with upload:
+                description = await _until_disconnected(
+                    request, analyzer.quick_describe(upload.data, image_hash=upload.digest)
+                )
             return {"description": description}
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
     @app.post("/extract-text")
-    async def extract_text(file: UploadFile = File(...)):
+    async def extract_text(request: Request, file: UploadFile = File(...)):
         """Estrae testo dall'immagine (OCR + Vision)."""
         try:
-            contents = await file.read()
-            result = analyzer.analyze(contents, "text")
+            with await _receive_upload(file) as upload:
+                result = await _until_disconnected(
+                    request, analyzer.analyze(upload.data, "text", image_hash=upload.digest)
+                )
             return {
                 "vision_text": result.get("description", ""),
                 "ocr_text": result.get("ocr_text", ""),
                 "combined": f"{result.get('description', '')}\n\n---\nOCR: {result.get('ocr_text', '')}"
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
     @app.post("/analyze-math")
-    async def analyze_math(file: UploadFile = File(...)):
+    async def analyze_math(request: Request, file: UploadFile = File(...)):
         """Analizza contenuto matematico (grafici, formule, diagrammi)."""
         try:
-            contents = await file.read()
-            result = analyzer.analyze(contents, "math")
+            with await _receive_upload(file) as upload:
+                result = await _until_disconnected(
+                    request, analyzer.analyze(upload.data, "math", image_hash=upload.digest)
+                )
             return result
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(500, f"Errore: {str(e)}")
 
@@ -536,22 +1410,37 @@ def create_app() -> FastAPI:
 
     @app.post("/batch")
     async def batch_analyze(
+        request: Request,
         files: List[UploadFile] = File(...),
         analysis_type: str = Form(default="describe")
     ):
-        """Analizza multiple immagini in batch."""
-        results = []
-        for file in files:
+        """
+        Analizza multiple immagini in batch.
+
+        Le immagini sono analizzate in parallelo fino al numero di
+        inferenze che Ollama esegue insieme per il modello (le altre
+        attendono senza essere ancora decodificate). I risultati restano
+        nell'ordine dei file.
+        """
+        slots = asyncio.Semaphore(analyzer.ollama.limit(analyzer.model))
+
+        async def analyze_one(file: UploadFile) -> Dict[str, Any]:
             try:
-                contents = await file.read()
-                result = analyzer.analyze(contents, analysis_type)
+                with await _receive_upload(file) as upload:
+                    async with slots:
+                        result = await analyzer.analyze(
+                            upload.data, analysis_type, image_hash=upload.digest
+                        )
                 result["filename"] = file.filename
-                results.append(result)
+                return result
+            except HTTPException as e:
+                return {"filename": file.filename, "error": e.detail}
             except Exception as e:
-                results.append({
-                    "filename": file.filename,
-                    "error": str(e)
-                })
+                return {"filename": file.filename, "error": str(e)}
+
+        results = await _until_disconnected(
+            request, asyncio.gather(*(analyze_one(file) for file in files))
+        )
         return {"results": results}
 
     return app
@@ -577,12 +1466,17 @@ def check_dependencies():
         for m in missing:
             print(f"    - {m}")
         print("\nInstalla con:")
-        print("    pip install fastapi uvicorn Pillow requests")
+        print("    pip install fastapi uvicorn Pillow requests httpx")
         print("\nOpzionale per OCR:")
         print("    pip install pytesseract")
         print("    + installa Tesseract OCR sul sistema")
         return False
 
+    if not HAS_HTTPX:
+        # Il servizio funziona, ma senza streaming né annullamento delle
+        # richieste a Ollama
+        print("[!] httpx non installato (pip install httpx): streaming e annullamento limitati")
+
     return True
 
 
@@ -603,7 +1497,7 @@ def main():
     print(f"[*] Ollama URL: {OLLAMA_URL}")
     print(f"[*] Modello Vision: {VISION_MODEL}")
     print(f"[*] Porta: {SERVICE_PORT}")
-    print(f"[*] Cache: {CACHE_DIR}")
+    print(f"[*] Cache: {CONTENT_STORE_DIR}")
     print()
 
     # Verifica Ollama
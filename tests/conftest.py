@@ -10,7 +10,7 @@ Mocking strategy:
 
 import sys
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -24,6 +24,15 @@ from security import API_KEY
 AUTH_HEADERS = {"X-API-Key": API_KEY}
 
 
+@pytest.fixture(autouse=True)
+def isolated_content_store(tmp_path, monkeypatch):
+    """Archivio content-addressed in una cartella temporanea per ogni test."""
+    import content_store
+    store = content_store.ContentStore(tmp_path / "content_store")
+    monkeypatch.setattr(content_store, "_store", store)
+    return store
+
+
 # ============================================================================
 # TTS Service Fixtures
 # ============================================================================
@@ -101,8 +110,9 @@ def mock_image_analyzer():
     mock = MagicMock()
     mock.model = "llava:latest"
     mock.available_models = ["llava:latest"]
+    mock.model_digests = {"llava:latest": "8dd30f6b0cb1" + "0" * 52}
     mock.cache = MagicMock()
-    mock.analyze.return_value = {
+    analysis = {
         "timestamp": "2026-02-11T12:00:00",
         "hash": "abc123",
         "analysis_type": "describe",
@@ -112,7 +122,20 @@ def mock_image_analyzer():
         "colors": ["#ffffff", "#000000"],
         "from_cache": False,
     }
-    mock.quick_describe.return_value = "Una foto di test"
+    # Analisi asincrone: ogni chiamata restituisce una copia del risultato
+    mock.analyze = AsyncMock(side_effect=lambda *args, **kwargs: dict(analysis))
+    mock.quick_describe = AsyncMock(return_value="Una foto di test")
+
+    async def analyze_stream(*args, **kwargs):
+        yield "start", {"hash": analysis["hash"], "metadata": analysis["metadata"]}
+        for text in ("Una foto ", "di test"):
+            yield "token", {"text": text}
+        yield "result", dict(analysis)
+
+    mock.analyze_stream = MagicMock(side_effect=analyze_stream)
+    mock.ollama.limit.return_value = 2
+    mock.ollama.stats.return_value = {"running": {}, "waiting": {}, "completed": 0}
+    mock.cache.stats.return_value = {"lookups": 0, "exact_hits": 0, "perceptual_hits": 0}
     return mock
 
 
@@ -139,10 +162,11 @@ def image_client(image_app):
 # ============================================================================
 
 @pytest.fixture
-def mock_document_reader():
+def mock_document_reader(tmp_path):
     """Mock di DocumentReader che simula lettura senza dipendenze."""
     mock = MagicMock()
     mock.cache = MagicMock()
+    mock.cache.cache_dir = tmp_path
     mock.available_readers = {
         "pdf": True, "docx": True, "xlsx": True, "pptx": True,
         "text": True, "csv": True, "json": True, "xml": True,
@@ -164,19 +188,41 @@ def mock_document_reader():
         "from_cache": False,
     }
     mock.get_summary.return_value = "[PDF] test.pdf\n\nContenuto di test."
+    mock.get_metadata.return_value = {
+        "format": "PDF",
+        "pages": 3,
+        "metadata": {"title": "Test Doc"},
+        "filename": "test.pdf",
+        "extension": ".pdf",
+        "hash": "abc123",
+        "metadata_only": True,
+        "from_cache": False,
+    }
     mock.get_supported_formats.return_value = {
         ".pdf": {"name": "PDF Document", "available": True},
         ".docx": {"name": "Word Document", "available": True},
         ".txt": {"name": "Plain Text", "available": True},
     }
     mock.cache.cleanup.return_value = 2
+    mock.search_index.enabled = True
+    mock.search_index.search.return_value = [{
+        "hash": "abc123", "filename": "test.pdf", "format": "PDF",
+        "location": {"page": 2}, "snippet": "testo [trovato]", "score": 1.5,
+    }]
+    mock.cache.stats.return_value = {
+        "memory_entries": 0, "memory_bytes": 0, "disk_entries": 0, "disk_bytes": 0,
+        "hits_memory": 0, "hits_disk": 0, "misses": 0,
+        "evictions_memory": 0, "evictions_disk": 0,
+    }
     return mock
 
 
 @pytest.fixture
 def document_app(mock_document_reader):
     """App FastAPI Document con reader mockato."""
-    with patch("document_service.document_service.DocumentReader", return_value=mock_document_reader):
+    # Pool a thread: il reader mockato non può attraversare i processi
+    with patch("document_service.document_service.DocumentReader", return_value=mock_document_reader), \
+            patch("document_service.document_service.DOC_WORKER_MODE", "thread"):
         from document_service.document_service import create_app
         app = create_app()
         return app
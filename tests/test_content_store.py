@@ -0,0 +1,74 @@
+"""Test per l'archivio content-addressed condiviso (content_store.py)."""
+
+import time
+
+import pytest
+
+from content_store import ContentStore, content_digest
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(tmp_path / "store")
+
+
+class TestBlobs:
+    """Blob salvati una sola volta per contenuto."""
+
+    def test_put_blob_is_idempotent(self, store):
+        first = store.put_blob(b"audio")
+        second = store.put_blob(b"audio")
+        assert first == second == content_digest(b"audio")
+        assert store.get_blob(first) == b"audio"
+        assert len(list(store.blob_dir.rglob("*"))) == 2  # cartella + file
+        assert store.stats()["stored_bytes"] == 5
+
+    def test_registered_blob_has_no_bytes(self, store):
+        store.register_blob("abc", 10)
+        assert store.get_blob("abc") is None
+        assert store.stats()["blobs"] == 1
+
+
+class TestResults:
+    """Risultati derivati per (blob, servizio, tipo)."""
+
+    def test_results_shared_across_services(self, store):
+        digest = content_digest(b"immagine")
+        store.put_result(digest, "image", "describe", {"description": "un gatto"})
+        store.put_result(digest, "document", "full")
+
+        hit = store.get_result(digest, "image", "describe")
+        assert hit["payload"] == {"description": "un gatto"}
+        assert store.get_result(digest, "image", "text") is None
+        assert {r["service"] for r in store.derived(digest)} == {"image", "document"}
+
+    def test_find_results_by_kind(self, store):
+        store.put_result("a", "image", "dhash", {"dhash": "ff"})
+        store.put_result("b", "image", "dhash", {"dhash": "0f"})
+        store.put_result("a", "image", "describe", {"description": "x"})
+        store._conn.execute("UPDATE results SET created = ? WHERE blob = 'b'", (time.time() - 7200,))
+
+        assert sorted(store.find_results("image", "dhash")) == [
+            ("a", {"dhash": "ff"}), ("b", {"dhash": "0f"})
+        ]
+        assert store.find_results("image", "dhash", max_age_hours=1) == [("a", {"dhash": "ff"})]
+
+    def test_expired_result_is_a_miss(self, store):
+        store.put_result("abc", "image", "describe", {"x": 1})
+        store._conn.execute("UPDATE results SET created = ?", (time.time() - 7200,))
+        assert store.get_result("abc", "image", "describe", max_age_hours=1) is None
+        assert store.get_result("abc", "image", "describe") is not None
+
+    def test_cleanup_removes_orphan_output_blobs(self, store):
+        audio = store.put_blob(b"audio")
+        store.put_result("testo", "tts", "edge:voce", output=audio)
+        old = time.time() - 7200
+        store._conn.execute("UPDATE results SET created = ?", (old,))
+        store._conn.execute("UPDATE blobs SET accessed = ?", (old,))
+
+        assert store.cleanup(1, service="image") == 0
+        assert store.get_blob(audio) == b"audio"
+
+        assert store.cleanup(1, service="tts") == 1
+        assert store.get_blob(audio) is None
+        assert store.stats()["blobs"] == 0
@@ -2,6 +2,9 @@
 
 import io
 import json
+import subprocess
+from pathlib import Path
+
 import pytest
 
 
@@ -114,6 +117,15 @@ class TestDocumentMetadata:
         data = resp.json()
         assert "full_text" not in data
 
+    def test_metadata_skips_full_read(self, document_client, mock_document_reader):
+        resp = document_client.post(
+            "/get-metadata",
+            files={"file": ("doc.pdf", io.BytesIO(b"%PDF-1.4 fake"), "application/pdf")},
+        )
+        assert resp.json()["metadata_only"] is True
+        mock_document_reader.read.assert_not_called()
+        assert mock_document_reader.get_metadata.call_args.kwargs["file_hash"]
+
 
 class TestDocumentSummary:
     """Test endpoint riassunto."""
@@ -144,3 +156,1379 @@ class TestDocumentCache:
         assert resp.status_code == 200
         data = resp.json()
         assert "message" in data
+
+
+class TestDocumentWorkerPool:
+    """Test worker pool e gestione coda piena."""
+
+    def test_root_reports_workers(self, document_client):
+        data = document_client.get("/").json()
+        assert data["workers"]["workers"] >= 1
+        assert data["workers"]["in_progress"] == 0
+
+    def test_root_reports_cache_counters(self, document_client):
+        data = document_client.get("/").json()
+        assert "misses" in data["cache"]
+        assert "evictions_disk" in data["cache"]
+
+    def test_queue_full_returns_503_with_retry_after(self, document_client):
+        from unittest.mock import AsyncMock, patch
+        from document_service.document_service import DocumentWorkerPool, QueueFullError
+
+        with patch.object(DocumentWorkerPool, "read", new=AsyncMock(side_effect=QueueFullError("occupato"))):
+            resp = document_client.post(
+                "/read",
+                files={"file": ("test.txt", io.BytesIO(b"ciao"), "text/plain")},
+            )
+        assert resp.status_code == 503
+        assert "Retry-After" in resp.headers
+
+    def test_pool_rejects_beyond_queue_limit(self):
+        import asyncio
+        import threading
+        from document_service.document_service import DocumentWorkerPool, QueueFullError
+
+        pool = DocumentWorkerPool(workers=1, mode="thread", max_queue=0)
+        release = threading.Event()
+
+        async def scenario():
+            busy = asyncio.ensure_future(pool.run(release.wait, 5))
+            await asyncio.sleep(0.05)
+            with pytest.raises(QueueFullError):
+                await pool.run(lambda: None)
+            release.set()
+            await busy
+
+        asyncio.run(scenario())
+        assert pool.stats()["in_progress"] == 0
+        pool.shutdown()
+
+
+class TestDocumentBatchStream:
+    """Test /batch/stream (NDJSON, un risultato per riga)."""
+
+    def test_one_line_per_file_with_timing(self, document_client):
+        files = [
+            ("files", (f"doc{i}.txt", io.BytesIO(b"contenuto %d" % i), "text/plain"))
+            for i in range(3)
+        ]
+        resp = document_client.post("/batch/stream", files=files)
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+
+        lines = [json.loads(line) for line in resp.text.splitlines() if line]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        for line in lines:
+            assert "elapsed_ms" in line
+            assert "full_text" in line
+
+    def test_reader_error_stays_on_its_line(self, document_client, mock_document_reader):
+        mock_document_reader.read.side_effect = [
+            {"full_text": "ok", "filename": "a.txt"},
+            RuntimeError("file rotto"),
+        ]
+        files = [
+            ("files", ("a.txt", io.BytesIO(b"a"), "text/plain")),
+            ("files", ("b.txt", io.BytesIO(b"b"), "text/plain")),
+        ]
+        resp = document_client.post("/batch/stream", files=files)
+        lines = [json.loads(line) for line in resp.text.splitlines() if line]
+        assert len(lines) == 2
+        errors = [line for line in lines if "error" in line]
+        assert len(errors) == 1
+        assert "file rotto" in errors[0]["error"]
+
+
+class TestDocumentCacheStore:
+    """Test della cache su SQLite (classe reale, cartella temporanea)."""
+
+    def test_set_then_get_roundtrip(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        cache = DocumentCache(tmp_path)
+        cache.set("abc", {"full_text": "ciao", "pages": 1})
+        assert cache.get("abc") == {"full_text": "ciao", "pages": 1}
+        assert cache.get("missing") is None
+
+    def test_entries_survive_reopen(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        DocumentCache(tmp_path).set("abc", {"full_text": "persistente"})
+        assert DocumentCache(tmp_path).get("abc")["full_text"] == "persistente"
+
+    def test_legacy_index_is_migrated(self, tmp_path):
+        import time
+        from document_service.document_service import DocumentCache
+
+        legacy = {"old": {"timestamp": time.time(), "result": {"full_text": "vecchio"}}}
+        (tmp_path / "index.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+        cache = DocumentCache(tmp_path)
+        assert cache.get("old") == {"full_text": "vecchio"}
+        assert not (tmp_path / "index.json").exists()
+
+    def test_cleanup_removes_expired(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        cache = DocumentCache(tmp_path)
+        cache.set("fresh", {"full_text": "a"})
+        cache._conn.execute(
+            "INSERT INTO entries (hash, timestamp, size, result) VALUES ('stale', 0, 2, '{}')"
+        )
+        assert cache.cleanup() == 1
+        assert cache.get("fresh") is not None
+
+    def test_disk_budget_evicts_least_recently_used(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        cache = DocumentCache(tmp_path, memory_budget_mb=1, disk_budget_mb=0.001)  # ~1 KB
+        cache.set("old", {"full_text": "a" * 400})
+        cache.set("recent", {"full_text": "b" * 400})
+        cache.get("old")  # "old" ora è il più recente
+        cache.set("new", {"full_text": "c" * 400})
+
+        assert cache.get("recent") is None
+        assert cache.get("old") is not None
+        assert cache.stats()["evictions_disk"] == 1
+
+    def test_memory_tier_counts_hits(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        cache = DocumentCache(tmp_path)
+        cache.set("abc", {"full_text": "ciao"})
+        cache.get("abc")
+        DocumentCache(tmp_path).get("abc")  # nuova istanza: solo disco
+        cache.get("nope")
+
+        stats = cache.stats()
+        assert stats["hits_memory"] == 1
+        assert stats["misses"] == 1
+
+    def test_cached_result_is_not_shared(self, tmp_path):
+        from document_service.document_service import DocumentCache
+
+        cache = DocumentCache(tmp_path)
+        cache.set("abc", {"full_text": "ciao"})
+        cache.get("abc")["from_cache"] = True
+        assert "from_cache" not in cache.get("abc")
+
+
+class TestDocumentUploadLimits:
+    """Test limiti di dimensione sugli upload."""
+
+    def test_oversized_upload_returns_400(self, document_client, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "MAX_FILE_SIZE_MB", 0)
+        resp = document_client.post(
+            "/read",
+            files={"file": ("big.txt", io.BytesIO(b"x" * 1000), "text/plain")},
+        )
+        assert resp.status_code == 400
+
+    def test_content_length_over_limit_returns_413(self, document_client):
+        import document_service.document_service as ds
+        big = b"x" * (ds.MAX_FILE_SIZE_MB * 1024 * 1024 + 200 * 1024)
+        resp = document_client.post(
+            "/extract-text",
+            files={"file": ("big.txt", io.BytesIO(big), "text/plain")},
+        )
+        assert resp.status_code == 413
+
+    def test_reader_receives_upload_hash(self, document_client, mock_document_reader):
+        from content_store import content_digest
+        document_client.post(
+            "/read",
+            files={"file": ("a.txt", io.BytesIO(b"contenuto"), "text/plain")},
+        )
+        _, kwargs = mock_document_reader.read.call_args
+        assert kwargs["file_hash"] == content_digest(b"contenuto")
+
+
+def _make_pdf_bytes(pages):
+    """Crea un PDF minimo con una riga di testo per pagina."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, compilato sotto
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        stream = b"BT /F1 12 Tf 72 720 Td (" + text.encode("latin-1") + b") Tj ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class TestPdfBudget:
+    """Estrazione PDF con budget e parallelismo (richiede pypdf)."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        pytest.importorskip("pypdf")
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        return ds.DocumentReader()
+
+    def test_full_read_has_all_pages(self, reader):
+        pdf = _make_pdf_bytes([f"Pagina {i}" for i in range(1, 6)])
+        result = reader.read(pdf, "doc.pdf", use_cache=False)
+        assert result["pages"] == 5
+        assert len(result["content"]) == 5
+        assert "truncated" not in result
+
+    def test_max_chars_stops_early(self, reader):
+        pdf = _make_pdf_bytes([f"Pagina numero {i}" for i in range(1, 21)])
+        result = reader.read(pdf, "doc.pdf", use_cache=False, max_chars=30)
+        assert result["truncated"] is True
+        assert result["pages_read"] == 2
+        assert result["pages"] == 20
+
+    def test_max_pages_limits_extraction(self, reader):
+        pdf = _make_pdf_bytes([f"Pagina {i}" for i in range(1, 11)])
+        result = reader.read(pdf, "doc.pdf", use_cache=False, max_pages=3)
+        assert [p["page"] for p in result["content"]] == [1, 2, 3]
+
+    def test_truncated_result_does_not_replace_full_cache(self, reader):
+        pdf = _make_pdf_bytes([f"Pagina {i}" for i in range(1, 11)])
+        reader.read(pdf, "doc.pdf", max_pages=2)
+        full = reader.read(pdf, "doc.pdf")
+        assert full["from_cache"] is False
+        assert len(full["content"]) == 10
+
+    def test_text_only_has_no_page_content(self, reader):
+        pdf = _make_pdf_bytes([f"Pagina {i}" for i in range(1, 4)])
+        result = reader.read(pdf, "doc.pdf", use_cache=False, text_only=True)
+        assert "content" not in result
+        assert "Pagina 3" in result["full_text"]
+
+    def test_parallel_extraction_matches_sequential(self, reader, monkeypatch):
+        import document_service.document_service as ds
+        pdf = _make_pdf_bytes([f"Pagina {i}" for i in range(1, 31)])
+        sequential = reader.read(pdf, "doc.pdf", use_cache=False)
+
+        monkeypatch.setattr(ds, "PDF_PARALLEL_MIN_PAGES", 10)
+        monkeypatch.setattr(ds, "PDF_PARALLEL_WORKERS", 2)
+        try:
+            parallel = reader.read(pdf, "doc.pdf", use_cache=False)
+            budget = reader.read(pdf, "doc.pdf", use_cache=False, max_chars=40)
+        finally:
+            ds.shutdown_pdf_executor()
+
+        assert parallel["content"] == sequential["content"]
+        assert budget["truncated"] is True
+        assert budget["pages_read"] < 30
+
+
+class TestPdfOcr:
+    """OCR delle pagine senza testo, con cache per (hash, pagina, dpi)."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        pytest.importorskip("pypdf")
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        # OCR in sequenza: la funzione finta non deve attraversare processi
+        monkeypatch.setattr(ds, "PDF_PARALLEL_WORKERS", 1)
+        self.calls = []
+        self.failing = set()
+
+        def fake_ocr(pdf_path, page, dpi, lang):
+            self.calls.append((page, dpi))
+            if page in self.failing:
+                raise subprocess.CalledProcessError(1, "pdftoppm")
+            return f"Scansione {page}"
+
+        monkeypatch.setattr(ds, "_ocr_pdf_page", fake_ocr)
+        reader = ds.DocumentReader()
+        reader.available_readers["ocr"] = True
+        return reader
+
+    def test_textless_pages_are_recognized(self, reader):
+        pdf = _make_pdf_bytes(["Pagina 1", "", "Pagina 3", ""])
+        result = reader.read(pdf, "scan.pdf", use_cache=False)
+
+        assert [p["page"] for p in result["content"]] == [1, 2, 3, 4]
+        assert result["content"][1] == {"page": 2, "text": "Scansione 2", "ocr": True}
+        assert "ocr" not in result["content"][0]
+        assert result["ocr_pages"] == [2, 4]
+        assert "Pagina 1\n\nScansione 2" in result["full_text"]
+        assert self.calls == [(2, 200), (4, 200)]
+
+    def test_pages_are_cached_per_dpi(self, reader, monkeypatch):
+        import document_service.document_service as ds
+        pdf = _make_pdf_bytes(["", ""])
+        reader.read(pdf, "scan.pdf", use_cache=False)
+        reader.read(pdf, "scan.pdf", use_cache=False, text_only=True)
+        assert len(self.calls) == 2
+        assert reader.cache.stats()["ocr_pages"] == 2
+
+        monkeypatch.setattr(ds, "OCR_DPI", 300)
+        result = reader.read(pdf, "scan.pdf", use_cache=False)
+        assert self.calls[2:] == [(1, 300), (2, 300)]
+        assert result["ocr_dpi"] == 300
+
+    def test_failed_page_is_retried(self, reader):
+        pdf = _make_pdf_bytes(["", ""])
+        self.failing.add(2)
+        first = reader.read(pdf, "scan.pdf", use_cache=False)
+        assert first["ocr_pages"] == [1]
+
+        self.failing.clear()
+        second = reader.read(pdf, "scan.pdf", use_cache=False)
+        assert second["ocr_pages"] == [1, 2]
+        assert self.calls == [(1, 200), (2, 200), (2, 200)]
+
+    def test_max_chars_stops_ocr(self, reader):
+        pdf = _make_pdf_bytes(["", "", "", ""])
+        result = reader.read(pdf, "scan.pdf", use_cache=False, max_chars=15)
+        assert result["truncated"] is True
+        assert result["pages_read"] == 2
+        assert result["ocr_pages"] == [1, 2]
+        assert len(self.calls) == 2
+
+    def test_without_ocr_pages_stay_empty(self, reader):
+        reader.available_readers["ocr"] = False
+        result = reader.read(_make_pdf_bytes(["Pagina 1", ""]), "scan.pdf", use_cache=False)
+        assert [p["page"] for p in result["content"]] == [1]
+        assert "ocr_pages" not in result
+        assert self.calls == []
+
+
+class TestLibreOfficePool:
+    """Pool LibreOffice in modalità CLI (soffice simulato)."""
+
+    @pytest.fixture
+    def pool(self, tmp_path, monkeypatch):
+        import subprocess
+        import document_service.document_service as ds
+
+        import threading
+        import time
+
+        calls = []
+        in_use = set()
+        lock = threading.Lock()
+
+        def fake_run(cmd, **kwargs):
+            profile = next(a for a in cmd if a.startswith("-env:UserInstallation="))
+            with lock:
+                # Due conversioni contemporanee non devono condividere il profilo
+                assert profile not in in_use
+                in_use.add(profile)
+                calls.append(cmd)
+            time.sleep(0.01)
+            with lock:
+                in_use.discard(profile)
+            outdir = Path(cmd[cmd.index("--outdir") + 1])
+            (outdir / (Path(cmd[-1]).stem + ".txt")).write_text("testo convertito")
+            return subprocess.CompletedProcess(cmd, 0)
+
+        monkeypatch.setattr(ds.shutil, "which", lambda name: "/usr/bin/soffice")
+        monkeypatch.setattr(ds.subprocess, "run", fake_run)
+        pool = ds.LibreOfficePool(instances=2, profile_root=tmp_path)
+        pool.use_uno = False
+        pool.calls = calls
+        return pool
+
+    def test_convert_returns_text(self, pool):
+        assert pool.convert(b"dati", ".doc") == "testo convertito"
+        assert pool.stats()["conversions"] == 1
+
+    def test_concurrent_conversions_use_distinct_profiles(self, pool):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: pool.convert(b"dati", ".doc"), range(8)))
+
+        profiles = {
+            arg for cmd in pool.calls for arg in cmd
+            if arg.startswith("-env:UserInstallation=")
+        }
+        assert len(pool.calls) == 8
+        assert len(profiles) <= 2
+
+    def test_worker_process_gets_own_profiles(self, tmp_path, monkeypatch):
+        import os
+        import document_service.document_service as ds
+
+        monkeypatch.setattr(ds, "_IN_WORKER_PROCESS", True)
+        pool = ds.LibreOfficePool(instances=1, profile_root=tmp_path)
+        assert pool._slots[0].profile_dir == tmp_path / f"pid{os.getpid()}" / "slot0"
+
+    def test_reader_reports_missing_libreoffice(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(ds.shutil, "which", lambda name: None)
+        reader = ds.DocumentReader()
+        result = reader._read_with_libreoffice(b"dati", ".doc")
+        assert "LibreOffice non installato" in result["error"]
+
+
+class TestTextOnlyMode:
+    """Modalità solo testo: niente strutture, chiave di cache separata."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        return ds.DocumentReader()
+
+    MD = b"# Titolo\n\nTesto del documento.\n\n## Sezione\n\nAltro testo."
+
+    def test_text_only_skips_structure(self, reader):
+        result = reader.read(self.MD, "note.md", use_cache=False, text_only=True)
+        assert "Testo del documento." in result["full_text"]
+        assert result["text_only"] is True
+        assert "headers" not in result
+
+    def test_text_only_does_not_replace_full_result(self, reader):
+        reader.read(self.MD, "note.md", text_only=True)
+        full = reader.read(self.MD, "note.md")
+        assert full["from_cache"] is False
+        assert len(full["headers"]) == 2
+
+    def test_text_only_served_from_full_result(self, reader):
+        reader.read(self.MD, "note.md")
+        result = reader.read(self.MD, "note.md", text_only=True)
+        assert result["from_cache"] is True
+        assert "headers" not in result
+        assert "Altro testo." in result["full_text"]
+
+    def test_csv_text_only_keeps_full_text(self, reader):
+        data = b"a;b\n1;2\n"
+        full = reader.read(data, "t.csv", use_cache=False)
+        text = reader.read(data, "t.csv", use_cache=False, text_only=True)
+        assert text["full_text"] == full["full_text"]
+        assert "data" not in text
+
+    def test_extract_text_uses_text_only(self, document_client, mock_document_reader):
+        document_client.post(
+            "/extract-text",
+            files={"file": ("test.txt", io.BytesIO(b"ciao"), "text/plain")},
+        )
+        assert mock_document_reader.read.call_args.kwargs["text_only"] is True
+
+
+class TestTabularReader:
+    """Lettura in streaming di CSV/XLSX con limiti di righe e riepilogo."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(ds, "TABLE_MAX_ROWS", 5)
+        return ds.DocumentReader()
+
+    CSV = b"id;nome;prezzo;data\n" + b"".join(
+        b"%d;art%d;%d,5;2026-01-%02d\n" % (i, i % 3, i, i) for i in range(1, 21)
+    )
+
+    def test_csv_rows_capped(self, reader):
+        result = reader.read(self.CSV, "t.csv", use_cache=False)
+        assert result["rows"] == 21
+        assert len(result["data"]) == 5
+        assert result["rows_truncated"] is True
+        assert "15 righe omesse" in result["full_text"]
+        assert "art1" in result["full_text"]
+
+    def test_csv_column_types(self, reader):
+        result = reader.read(self.CSV, "t.csv", use_cache=False)
+        types = {c["name"]: c["type"] for c in result["schema"]}
+        assert types == {"id": "int", "nome": "text", "prezzo": "float", "data": "date"}
+
+    def test_csv_summary(self, reader):
+        result = reader.read(self.CSV, "t.csv", use_cache=False, table_summary=True)
+        assert "data" not in result
+        columns = {c["name"]: c for c in result["schema"]}
+        assert columns["id"]["min"] == 1
+        assert columns["id"]["max"] == 20
+        assert columns["nome"]["distinct"] == 3
+        assert columns["data"]["max"].startswith("2026-01-20")
+
+    def test_summary_has_own_cache_entry(self, reader):
+        reader.read(self.CSV, "t.csv")
+        summary = reader.read(self.CSV, "t.csv", table_summary=True)
+        assert summary["from_cache"] is False
+        assert "data" not in summary
+
+    def test_xlsx_read_only_streaming(self, reader):
+        openpyxl = pytest.importorskip("openpyxl")
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Vendite"
+        ws.append(["id", "importo"])
+        for i in range(1, 13):
+            ws.append([i, i * 1.5])
+        buf = io.BytesIO()
+        wb.save(buf)
+
+        result = reader.read(buf.getvalue(), "v.xlsx", use_cache=False)
+        sheet = result["sheets"]["Vendite"]
+        assert sheet["rows"] == 13
+        assert len(sheet["data"]) == 6  # Intestazione + 5 righe
+        assert sheet["rows_truncated"] is True
+        assert {c["name"]: c["type"] for c in sheet["schema"]} == {"id": "int", "importo": "float"}
+
+        summary = reader.read(buf.getvalue(), "v.xlsx", use_cache=False, table_summary=True)
+        columns = summary["sheets"]["Vendite"]["schema"]
+        assert columns[1]["max"] == 18.0
+
+
+class TestDistinctSketch:
+    """Stima dei valori distinti a memoria costante."""
+
+    def test_exact_below_k(self):
+        from document_service.document_service import _DistinctSketch
+        sketch = _DistinctSketch()
+        for i in range(100):
+            sketch.add(str(i % 40))
+        assert sketch.estimate() == 40
+
+    def test_estimate_above_k(self):
+        from document_service.document_service import _DistinctSketch
+        sketch = _DistinctSketch()
+        for i in range(20000):
+            sketch.add(str(i))
+        assert 15000 < sketch.estimate() < 25000
+
+
+class TestChunks:
+    """Segmentazione con budget di token (/chunks)."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        return ds.DocumentReader()
+
+    MD = (
+        "# Capitolo 1\n\n" + "Primo paragrafo del capitolo uno. " * 20 + "\n\n"
+        + "Secondo paragrafo del capitolo uno. " * 20 + "\n\n"
+        "## Sezione 1.1\n\nTesto breve della sezione.\n\n"
+        "# Capitolo 2\n\nTesto del secondo capitolo.\n"
+    ).encode()
+
+    def test_chunks_respect_budget_and_headings(self, reader):
+        result = reader.get_chunks(self.MD, "libro.md", max_tokens=200, overlap_tokens=0)
+        chunks = result["chunks"]
+        assert all(c["tokens"] <= 200 for c in chunks)
+        assert chunks[0]["headings"] == ["Capitolo 1"]
+        assert chunks[-1]["headings"] == ["Capitolo 2"]
+        assert chunks[-1]["text"].startswith("Capitolo 2")
+        section = [c for c in chunks if c["headings"] == ["Capitolo 1", "Sezione 1.1"]]
+        assert len(section) == 1
+
+    def test_overlap_repeats_context(self, reader):
+        from document_service.document_service import chunk_document
+        text = " ".join(f"parola{i}" for i in range(400))
+        chunks = chunk_document({"full_text": text}, max_tokens=100, overlap_tokens=20)
+        assert len(chunks) > 1
+        last_words = chunks[0]["text"].split()[-3:]
+        assert " ".join(last_words) in chunks[1]["text"]
+
+    def test_pdf_pages_tracked(self):
+        from document_service.document_service import chunk_document
+        result = {"content": [
+            {"page": 1, "text": "Pagina uno. " * 30},
+            {"page": 2, "text": "Pagina due. " * 30},
+        ]}
+        chunks = chunk_document(result, max_tokens=100, overlap_tokens=0)
+        assert chunks[0]["page_start"] == 1
+        assert chunks[-1]["page_end"] == 2
+        assert all("Pagina due" not in c["text"] or c["page_end"] == 2 for c in chunks)
+
+    def test_rechunk_reuses_parse_cache(self, reader, monkeypatch):
+        reader.get_chunks(self.MD, "libro.md", max_tokens=200)
+        calls = []
+        original = reader.parse
+        monkeypatch.setattr(reader, "parse", lambda *a, **k: calls.append(1) or original(*a, **k))
+
+        first = reader.get_chunks(self.MD, "libro.md", max_tokens=100)
+        again = reader.get_chunks(self.MD, "libro.md", max_tokens=100)
+        assert calls == []
+        assert first["from_cache"] is False
+        assert again["from_cache"] is True
+
+    def test_endpoint_validates_overlap(self, document_client):
+        resp = document_client.post(
+            "/chunks",
+            files={"file": ("test.txt", io.BytesIO(b"ciao"), "text/plain")},
+            data={"max_tokens": "64", "overlap_tokens": "64"},
+        )
+        assert resp.status_code == 400
+
+
+class TestSearchIndex:
+    """Indice full-text dei documenti letti (SQLite FTS5)."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        reader = ds.DocumentReader()
+        if not reader.search_index.enabled:
+            pytest.skip("SQLite senza FTS5")
+        return reader
+
+    def test_read_feeds_index(self, reader):
+        reader.read(b"# Fatture\n\nLa fattura di marzo e' stata pagata.", "note.md")
+        hits = reader.search_index.search("fattura")
+        assert len(hits) == 1
+        assert hits[0]["filename"] == "note.md"
+        assert hits[0]["location"]["headings"] == ["Fatture"]
+        assert "[fattura]" in hits[0]["snippet"]
+
+    def test_pdf_hits_have_page(self, reader):
+        pytest.importorskip("pypdf")
+        pdf = _make_pdf_bytes(["introduzione generale", "bilancio consuntivo annuale"])
+        reader.read(pdf, "report.pdf")
+        hits = reader.search_index.search("bilancio")
+        assert hits[0]["location"] == {"page": 2}
+
+    def test_bm25_ranks_more_relevant_first(self, reader):
+        reader.read(b"gatto cane gatto gatto", "a.txt")
+        reader.read(b"cane cavallo mucca pecora gatto", "b.txt")
+        hits = reader.search_index.search("gatto")
+        assert [h["filename"] for h in hits] == ["a.txt", "b.txt"]
+
+    def test_invalid_syntax_falls_back_to_terms(self, reader):
+        reader.read(b"prezzo unitario (iva esclusa)", "listino.txt")
+        hits = reader.search_index.search('prezzo "iva')
+        assert len(hits) == 1
+
+    def test_partial_results_not_indexed(self, reader):
+        reader.read(b"a;b\n1;2\n", "t.csv", table_summary=True)
+        assert reader.search_index.stats()["documents"] == 0
+
+    def test_structured_result_replaces_text_only(self, reader):
+        md = b"# Titolo\n\nContenuto importante."
+        reader.read(md, "doc.md", text_only=True)
+        reader.read(md, "doc.md")
+        hits = reader.search_index.search("importante")
+        assert len(hits) == 1
+        assert reader.search_index.stats()["documents"] == 1
+
+    def test_search_endpoint(self, document_client, mock_document_reader):
+        resp = document_client.get("/search", params={"q": "trovato"})
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["count"] == 1
+        assert data["results"][0]["location"] == {"page": 2}
+        mock_document_reader.search_index.search.assert_called_once_with("trovato", 10)
+
+
+class TestFolderIngester:
+    """Pre-elaborazione delle cartelle collegate (/ingest)."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path / "cache")
+        (tmp_path / "cache").mkdir()
+        return ds.DocumentReader()
+
+    @pytest.fixture
+    def folder(self, tmp_path):
+        folder = tmp_path / "archivio"
+        (folder / "sotto").mkdir(parents=True)
+        (folder / "a.txt").write_text("primo documento")
+        (folder / "sotto" / "b.md").write_text("# Titolo\n\nsecondo documento")
+        (folder / "ignorato.bin").write_bytes(b"\x00\x01")
+        (folder / ".nascosto.txt").write_text("non letto")
+        return folder
+
+    def test_scan_reads_new_files_then_skips_unchanged(self, reader, folder):
+        from unittest.mock import patch
+        from document_service.document_service import FolderIngester
+
+        ingester = FolderIngester(reader)
+        first = ingester.scan(str(folder))
+        assert first["total"] == 2
+        assert first["done"] == 2
+        assert first["errors"] == 0
+
+        with patch.object(reader, "read", wraps=reader.read) as read:
+            second = ingester.scan(str(folder))
+        assert second["unchanged"] == 2
+        read.assert_not_called()
+        ingester.shutdown()
+
+    def test_changed_and_removed_files(self, reader, folder):
+        import os
+        from document_service.document_service import FolderIngester
+
+        ingester = FolderIngester(reader)
+        ingester.scan(str(folder))
+
+        (folder / "a.txt").write_text("primo documento, versione modificata")
+        st = os.stat(folder / "a.txt")
+        os.utime(folder / "a.txt", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        (folder / "sotto" / "b.md").unlink()
+
+        progress = ingester.scan(str(folder))
+        assert progress["done"] == 1
+        assert progress["removed"] == 1
+        if reader.search_index.enabled:
+            assert reader.search_index.search("modificata")[0]["filename"] == "a.txt"
+        ingester.shutdown()
+
+    def test_reads_go_through_the_service_pool(self, reader, folder, monkeypatch):
+        import document_service.document_service as ds
+
+        pool = ds.DocumentWorkerPool(workers=1)
+        calls = []
+        real_read = pool.read
+
+        async def busy_once(*args, **kwargs):
+            # La prima lettura trova la coda piena: l'ingester riprova
+            calls.append(args[2])
+            if len(calls) == 1:
+                raise ds.QueueFullError("occupato")
+            return await real_read(*args, **kwargs)
+
+        monkeypatch.setattr(ds, "RETRY_AFTER_SECONDS", 0)
+        monkeypatch.setattr(pool, "read", busy_once)
+        ingester = ds.FolderIngester(reader, pool)
+        progress = ingester.scan(str(folder))
+        assert progress["done"] == 2
+        assert progress["errors"] == 0
+        assert len(calls) == 3
+        assert pool.stats()["inline_reads"] == 2
+        ingester.shutdown()
+        pool.shutdown()
+
+    def test_expired_cache_is_warmed_again(self, reader, folder):
+        from document_service.document_service import FolderIngester
+
+        ingester = FolderIngester(reader)
+        ingester.scan(str(folder))
+        reader.cache._memory.clear()
+        reader.cache._conn.execute("UPDATE entries SET timestamp = 0")
+
+        assert ingester.scan(str(folder))["done"] == 2
+        ingester.shutdown()
+
+    def test_missing_root_counts_as_scanned(self, reader, folder):
+        import shutil
+        from document_service.document_service import FolderIngester
+
+        ingester = FolderIngester(reader)
+        root = ingester.watch(str(folder))["root"]
+        ingester.shutdown()
+        shutil.rmtree(folder)
+
+        ingester._scan_root(root, True)
+        status = next(f for f in ingester.status() if f["root"] == root)
+        assert status["state"] == "missing"
+        assert status["last_scan"] is not None
+
+    def test_watch_rejects_files(self, reader, folder):
+        from document_service.document_service import FolderIngester
+
+        ingester = FolderIngester(reader)
+        with pytest.raises(ValueError):
+            ingester.watch(str(folder / "a.txt"))
+        ingester.shutdown()
+
+    def test_ingest_endpoints(self, document_client, tmp_path):
+        folder = tmp_path / "cartella"
+        folder.mkdir()
+
+        resp = document_client.post("/ingest", data={"path": str(folder)})
+        assert resp.status_code == 200
+        assert resp.json()["root"] == str(folder.resolve())
+
+        status = document_client.get("/ingest").json()
+        assert [f["root"] for f in status["folders"]] == [str(folder.resolve())]
+
+        assert document_client.delete("/ingest", params={"path": str(folder)}).status_code == 200
+        assert document_client.get("/ingest").json()["folders"] == []
+
+    def test_ingest_rejects_missing_folder(self, document_client, tmp_path):
+        resp = document_client.post("/ingest", data={"path": str(tmp_path / "manca")})
+        assert resp.status_code == 400
+
+
+class TestLazyParsers:
+    """Parser opzionali importati al primo uso (/stats)."""
+
+    def test_module_import_does_not_load_parsers(self):
+        import subprocess
+        import sys
+
+        code = (
+            "import sys; sys.path.insert(0, 'document_service');"
+            "import document_service;"
+            "heavy = ['pypdf', 'openpyxl', 'docx', 'pptx', 'bs4', 'PIL.Image', 'ebooklib', 'lxml.html'];"
+            "print(','.join(m for m in heavy if m in sys.modules))"
+        )
+        root = Path(__file__).parent.parent
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=root, capture_output=True, text=True, timeout=60
+        )
+        assert out.returncode == 0, out.stderr
+        assert out.stdout.strip() == ""
+
+    def test_first_read_loads_parser(self):
+        pytest.importorskip("openpyxl")
+        import document_service.document_service as ds
+
+        module = ds._load_parser("openpyxl")
+        assert ds._load_parser("openpyxl") is module
+        stats = ds.parser_stats()["openpyxl"]
+        assert stats["available"] and stats["loaded"]
+        assert stats["import_ms"] >= 0
+
+    def test_missing_parser_raises_import_error(self, monkeypatch):
+        import document_service.document_service as ds
+
+        monkeypatch.setitem(ds._PARSER_MODULES, "rawpy", None)
+        monkeypatch.delitem(ds._loaded_parsers, "rawpy", raising=False)
+        with pytest.raises(ImportError):
+            ds._load_parser("rawpy")
+
+    def test_stats_endpoint(self, document_client):
+        data = document_client.get("/stats").json()
+        assert data["startup"]["total_ms"] > 0
+        assert "pypdf" in data["parsers"]
+        assert set(data["parsers"]["pypdf"]) >= {"available", "loaded"}
+
+
+def _zip_bytes(files):
+    import zipfile
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+class TestReaderRegistry:
+    """Registro dei reader: firme, riconoscimento del contenuto e instradamento."""
+
+    PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+    def test_every_format_has_a_reader(self):
+        from document_service.document_service import SUPPORTED_FORMATS, reader_for
+
+        assert all(reader_for(ext) is not None for ext in SUPPORTED_FORMATS)
+
+    def test_wrong_extension_is_corrected_by_magic(self):
+        from document_service.document_service import resolve_format
+
+        assert resolve_format("foto.pdf", self.PNG) == (".png", True)
+        assert resolve_format("foto.png", self.PNG) == (".png", False)
+
+    def test_text_heuristics_only_without_known_extension(self):
+        from document_service.document_service import resolve_format
+
+        # Un .pdf che non è un PDF né un altro binario noto resta .pdf
+        assert resolve_format("doc.pdf", b"solo testo") == (".pdf", False)
+        assert resolve_format("dati", b'  {"a": 1}') == (".json", True)
+        assert resolve_format("pagina.bin", b"<!DOCTYPE html><html></html>") == (".html", True)
+
+    def test_zip_containers(self):
+        from document_service.document_service import sniff_format
+
+        assert sniff_format(_zip_bytes({"[Content_Types].xml": "", "word/document.xml": ""})) == ".docx"
+        assert sniff_format(_zip_bytes({"xl/workbook.xml": ""})) == ".xlsx"
+        assert sniff_format(_zip_bytes({"mimetype": "application/epub+zip"})) == ".epub"
+        assert sniff_format(_zip_bytes({"mimetype": "application/vnd.oasis.opendocument.text"})) == ".odt"
+        assert sniff_format(_zip_bytes({"altro.txt": ""})) is None
+
+    def test_read_without_extension_uses_content(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+
+        result = ds.DocumentReader().read(b"# Titolo\n\ntesto", "senza_estensione", use_cache=False)
+        assert result["extension"] == ".txt"
+        assert result["declared_extension"] == ""
+        assert "testo" in result["full_text"]
+
+    def test_registered_function_reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(ds, "SUPPORTED_FORMATS", dict(ds.SUPPORTED_FORMATS))
+        monkeypatch.setattr(ds, "READER_REGISTRY", dict(ds.READER_REGISTRY))
+
+        def read_note(reader, file_bytes, text_only=False):
+            return {"format": "Nota", "full_text": bytes(file_bytes).decode().upper()}
+
+        spec = ds.register_reader(
+            ds.ReaderSpec("nota", read_note, cost=ds.COST_CHEAP, text_only=True),
+            formats={".nota": "Nota"}
+        )
+        assert spec.extensions == (".nota",)
+        result = ds.DocumentReader().read(b"ciao", "a.nota", use_cache=False)
+        assert result["full_text"] == "CIAO"
+
+    def test_cheap_small_files_skip_the_pool(self):
+        import asyncio
+        from unittest.mock import MagicMock
+        from document_service.document_service import DocumentWorkerPool, INLINE_MAX_BYTES
+
+        pool = DocumentWorkerPool(workers=1)
+        reader = MagicMock()
+        reader.read.return_value = {"full_text": "x"}
+
+        asyncio.run(pool.read(reader, b"testo", "a.txt"))
+        assert pool.stats()["inline_reads"] == 1
+        assert pool._route(b"x" * (INLINE_MAX_BYTES + 1), "a.txt") == "pool"
+        assert pool._route(b"%PDF-", "a.pdf") == "pool"
+        pool.shutdown()
+
+    def test_route_uses_sniffed_format(self):
+        from document_service.document_service import DocumentWorkerPool
+
+        # Un .doc salvato come .pdf va a LibreOffice: in process mode
+        # resta su un thread come ogni reader a sottoprocesso
+        pool = DocumentWorkerPool(workers=1, mode="process")
+        ole2 = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\0" * 600
+        assert pool._route(ole2, "a.pdf") == "thread"
+        pool.shutdown()
+
+
+def _epub_bytes(chapters, toc=True):
+    """EPUB minimo: capitoli {file: (titolo, paragrafi)} nell'ordine della spine."""
+    files = {
+        "mimetype": "application/epub+zip",
+        "META-INF/container.xml": (
+            '<?xml version="1.0"?><container version="1.0" '
+            'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ),
+    }
+    # Manifest in ordine inverso: conta solo la spine
+    items = "".join(
+        f'<item id="c{i}" href="{name}" media-type="application/xhtml+xml"/>'
+        for i, name in reversed(list(enumerate(chapters)))
+    )
+    if toc:
+        items += '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+        links = "".join(
+            f'<li><a href="{name}#inizio">{title}</a></li>'
+            for name, (title, _) in chapters.items()
+        )
+        files["OEBPS/nav.xhtml"] = (
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            f'<body><nav epub:type="toc"><ol>{links}</ol></nav></body></html>'
+        )
+    spine = "".join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+    files["OEBPS/content.opf"] = (
+        '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        '<dc:title>Il Romanzo</dc:title><dc:creator>Autrice</dc:creator>'
+        '<dc:language>it</dc:language></metadata>'
+        f'<manifest>{items}</manifest><spine>{spine}</spine></package>'
+    )
+    for name, (title, paragraphs) in chapters.items():
+        body = "".join(f"<p>{p}</p>" for p in paragraphs)
+        files[f"OEBPS/{name}"] = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>x</title>'
+            f'<style>p {{ margin: 0 }}</style></head><body><h1>{title}</h1>{body}</body></html>'
+        )
+    return _zip_bytes(files)
+
+
+class TestBooks:
+    """EPUB completi, paginazione (/book) e streaming dei capitoli."""
+
+    LONG = ["Frase numero {} del capitolo lungo.".format(i) for i in range(4000)]
+
+    @pytest.fixture
+    def book(self):
+        return _epub_bytes({
+            "uno.xhtml": ("Primo capitolo", ["C'era una volta &amp; poi", "Secondo paragrafo."]),
+            "due.xhtml": ("Il lungo viaggio", self.LONG),
+            "tre.xhtml": ("Epilogo", ["Fine."]),
+        })
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        return ds.DocumentReader()
+
+    def test_whole_book_in_spine_order(self, reader, book):
+        result = reader.read(book, "romanzo.epub", use_cache=False)
+        assert result["title"] == "Il Romanzo"
+        assert result["author"] == "Autrice"
+        assert [c["title"] for c in result["chapters"]] == ["Primo capitolo", "Il lungo viaggio", "Epilogo"]
+        # Nessun taglio a 100k caratteri: c'è anche l'ultimo capitolo
+        assert len(result["full_text"]) > 100000
+        assert result["full_text"].endswith("Fine.")
+        assert "C'era una volta & poi\n\nSecondo paragrafo." in result["full_text"]
+        assert "margin" not in result["full_text"]
+        for chapter in result["chapters"]:
+            text = result["full_text"][chapter["offset"]:chapter["offset"] + chapter["length"]]
+            assert text.startswith(chapter["title"])
+
+    def test_titles_from_headings_without_toc(self):
+        from document_service.document_service import parse_epub
+
+        book = parse_epub(_epub_bytes({"a.xhtml": ("Alba", ["testo"])}, toc=False))
+        assert book["chapters"][0]["title"] == "Alba"
+
+    def test_paging_walks_the_whole_book(self, reader, book):
+        from document_service.document_service import book_page
+
+        result = reader.read(book, "romanzo.epub", use_cache=False)
+        pages, offset = [], 0
+        while offset is not None:
+            page = book_page(result, offset=offset, limit=5000)
+            assert page["characters"] <= 5000
+            pages.append(page["text"])
+            offset = page["next_offset"]
+        assert "".join(pages) == result["full_text"]
+        assert pages[-1].endswith("Fine.")
+
+    def test_chapter_paging(self, reader, book):
+        from document_service.document_service import book_page
+
+        result = reader.read(book, "romanzo.epub", use_cache=False)
+        first = book_page(result, chapter=0, toc=True)
+        assert first["next_offset"] is None and first["next_chapter"] == 1
+        assert len(first["chapters"]) == 3
+
+        page = book_page(result, chapter=1, limit=1000)
+        assert page["offset"] == 0 and page["next_offset"] is not None
+        assert not page["text"].endswith("capit")  # Nessuna parola spezzata
+        with pytest.raises(ValueError):
+            book_page(result, chapter=3)
+
+    def test_chunks_use_chapter_titles(self, reader, book):
+        chunks = reader.get_chunks(book, "romanzo.epub", max_tokens=200, use_cache=False)["chunks"]
+        assert chunks[0]["headings"] == ["Primo capitolo"]
+        assert chunks[-1]["headings"] == ["Epilogo"]
+
+    def test_book_endpoints(self, document_client, mock_document_reader):
+        result = {
+            "format": "EPUB E-book", "filename": "r.epub", "hash": "abc123",
+            "full_text": "Uno\n\nDue due",
+            "chapters": [
+                {"index": 0, "title": "Uno", "offset": 0, "length": 3},
+                {"index": 1, "title": "Due", "offset": 5, "length": 7},
+            ],
+        }
+        mock_document_reader.read.return_value = result
+        mock_document_reader.cache.get.return_value = result
+
+        resp = document_client.post(
+            "/book?chapter=1&offset=4",
+            files={"file": ("r.epub", io.BytesIO(b"PK"), "application/epub+zip")},
+        )
+        assert resp.status_code == 200
+        assert resp.json()["text"] == "due"
+
+        resp = document_client.get("/book/abc123?toc=true")
+        assert resp.json()["chapters"][1]["title"] == "Due"
+        assert document_client.get("/book/abc123?chapter=5").status_code == 400
+
+        resp = document_client.post(
+            "/book/stream",
+            files={"file": ("r.epub", io.BytesIO(b"PK"), "application/epub+zip")},
+        )
+        lines = [json.loads(line) for line in resp.text.splitlines()]
+        assert lines[0]["chapters"][0]["title"] == "Uno"
+        assert [line["text"] for line in lines[1:]] == ["Uno", "Due due"]
+
+    def test_book_read_error_is_400(self, document_client, mock_document_reader):
+        mock_document_reader.cache.get.return_value = {"error": "EPUB non valido"}
+        resp = document_client.get("/book/rotto")
+        assert resp.status_code == 400
+        assert resp.json()["detail"] == "EPUB non valido"
+
+    def test_book_not_cached(self, document_client, mock_document_reader):
+        mock_document_reader.cache.get.return_value = None
+        assert document_client.get("/book/nonesiste").status_code == 404
+
+
+class TestEncodingDetection:
+    """Codifica stimata su un campione e decodifica in una sola passata."""
+
+    @pytest.mark.parametrize("text, encoding, expected", [
+        ("caffè e più", "utf-8", "utf-8"),
+        ("caffè", "utf-8-sig", "utf-8-sig"),
+        ("caffè", "utf-16", "utf-16"),
+        ("caffè al bar", "utf-16-le", "utf-16-le"),
+        ("prezzo 5€ “offerta”", "cp1252", "cp1252"),
+        ("città", "latin-1", "latin-1"),
+    ])
+    def test_detect_and_decode(self, text, encoding, expected):
+        from document_service.document_service import decode_text
+
+        assert decode_text(text.encode(encoding)) == (text, expected)
+
+    def test_multibyte_char_cut_by_sample_is_utf8(self):
+        from document_service.document_service import detect_encoding
+
+        data = ("à" * 10).encode()
+        assert detect_encoding(data, sample_size=5) == "utf-8"
+
+    def test_late_non_utf8_byte_falls_back(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+
+        data = b"a" * (ds.ENCODING_SAMPLE_BYTES + 10) + "è".encode("latin-1")
+        result = ds.DocumentReader()._read_text(data)
+        assert result["full_text"].endswith("è")
+        assert result["encoding"] == "cp1252"
+
+    def test_decodes_mmap_without_copy(self, tmp_path):
+        import mmap
+        from document_service.document_service import decode_text
+
+        path = tmp_path / "log.txt"
+        path.write_bytes("riga è\n".encode("utf-8") * 1000)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            text, encoding = decode_text(data)
+            data.close()  # Nessun buffer resta esportato
+        assert encoding == "utf-8" and text.count("è") == 1000
+
+
+def _hang(*args, **kwargs):
+    """Task che non controlla il budget (eseguito nei worker di processo)."""
+    import time
+    time.sleep(30)
+
+
+def _hog_memory(mb):
+    import time
+    data = b"x" * (mb * 1024 * 1024)
+    time.sleep(30)
+    return len(data)
+
+
+class TestReadBudget:
+    """Scadenze e tetti di memoria per lettura, con risultati parziali."""
+
+    @pytest.fixture
+    def slow_reader(self, tmp_path, monkeypatch):
+        import time
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(ds, "SUPPORTED_FORMATS", dict(ds.SUPPORTED_FORMATS))
+        monkeypatch.setattr(ds, "READER_REGISTRY", dict(ds.READER_REGISTRY))
+
+        def read_slow(reader, file_bytes, text_only=False):
+            pages = []
+            for i in range(1000):
+                if ds._budget_exceeded():
+                    break
+                pages.append(f"pagina {i}")
+                time.sleep(0.01)
+            return {"format": "Lento", "full_text": "\n".join(pages)}
+
+        ds.register_reader(ds.ReaderSpec("lento", read_slow), formats={".lento": "Lento"})
+        return ds.DocumentReader()
+
+    def test_partial_result_with_reason_is_not_cached(self, slow_reader):
+        from document_service.document_service import ReadBudget
+
+        result = slow_reader.read(b"dati", "a.lento", budget=ReadBudget(timeout=0.2))
+        assert result["truncated"] is True
+        assert result["truncated_reason"] == "timeout"
+        assert "pagina 0" in result["full_text"]
+        assert "pagina 999" not in result["full_text"]
+        assert slow_reader.cache.get(result["hash"]) is None
+
+    def test_without_budget_reads_everything(self, slow_reader, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds.time, "sleep", lambda s: None)
+
+        result = slow_reader.read(b"dati", "a.lento", use_cache=False)
+        assert "truncated_reason" not in result
+        assert result["full_text"].endswith("pagina 999")
+
+    def test_memory_cap_only_in_worker_process(self, monkeypatch):
+        import document_service.document_service as ds
+        from document_service.document_service import ReadBudget
+
+        rss = iter([100, 10_000, 100, 10_000])
+        monkeypatch.setattr(ds, "_rss_bytes", lambda pid=None: next(rss))
+
+        # Thread: altre letture nello stesso processo, la memoria non conta
+        budget = ReadBudget(timeout=60, max_rss=1000)
+        budget.start()
+        assert budget.exceeded() is None
+
+        monkeypatch.setattr(ds, "_IN_WORKER_PROCESS", True)
+        budget = ReadBudget(timeout=60, max_rss=1000)
+        budget.start()
+        assert budget.exceeded() == "memory"
+
+    def test_limits_from_environment(self, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "DOC_READ_TIMEOUT", 7)
+        monkeypatch.setattr(ds, "DOC_READ_MAX_RSS_MB", 300)
+        assert ds.read_budget_limits() == (7, 300 * 1024 * 1024)
+
+    def test_hung_task_is_killed_and_worker_replaced(self):
+        import math
+        from document_service.document_service import BudgetExceeded, KillableProcessPool
+
+        pool = KillableProcessPool(1, kill_after=0.5)
+        try:
+            with pytest.raises(BudgetExceeded) as exc:
+                pool.submit(_hang).result(timeout=10)
+            assert exc.value.reason == "timeout"
+            assert pool.killed["timeout"] == 1
+            assert pool.submit(math.factorial, 5).result(timeout=10) == 120
+        finally:
+            pool.shutdown()
+
+    def test_task_is_killed_at_read_deadline(self):
+        import time
+        from document_service.document_service import BudgetExceeded, KillableProcessPool
+
+        # Pool senza kill_after (come quello dei PDF): decide la scadenza della lettura
+        pool = KillableProcessPool(1)
+        try:
+            started = time.monotonic()
+            with pytest.raises(BudgetExceeded):
+                pool.submit_until(started + 0.5, _hang).result(timeout=10)
+            assert time.monotonic() - started < 5
+            assert pool.killed["timeout"] == 1
+            with pytest.raises(BudgetExceeded):
+                pool.submit_until(started, _hang).result(timeout=10)
+        finally:
+            pool.shutdown()
+
+    def test_memory_hog_is_killed(self):
+        from document_service.document_service import BudgetExceeded, KillableProcessPool
+
+        pool = KillableProcessPool(1, kill_after=20, max_rss_growth=32 * 1024 * 1024)
+        try:
+            with pytest.raises(BudgetExceeded) as exc:
+                pool.submit(_hog_memory, 128).result(timeout=20)
+            assert exc.value.reason == "memory"
+        finally:
+            pool.shutdown()
+
+    def test_process_pool_read_reports_killed_worker(self, monkeypatch):
+        import asyncio
+        from unittest.mock import MagicMock
+        import document_service.document_service as ds
+
+        monkeypatch.setattr(ds, "READ_KILL_GRACE_SECONDS", 0)
+        monkeypatch.setattr(ds, "_process_read", _hang)
+        pool = ds.DocumentWorkerPool(workers=1, mode="process", read_timeout=0.3)
+        reader = MagicMock()
+        reader.cache_lookup.return_value = None
+        try:
+            result = asyncio.run(pool.read(reader, b"%PDF-1.4", "a.pdf", file_hash="h"))
+        finally:
+            pool.shutdown()
+        assert result["truncated_reason"] == "timeout"
+        assert "tempo massimo" in result["error"]
+        assert pool.stats()["read_budget"]["killed"]["timeout"] == 1
+
+
+class TestMetadataOnly:
+    """Percorso solo metadati: intestazioni e proprietà, senza estrarre il testo."""
+
+    @pytest.fixture
+    def reader(self, tmp_path, monkeypatch):
+        import document_service.document_service as ds
+        monkeypatch.setattr(ds, "CACHE_DIR", tmp_path)
+        reader = ds.DocumentReader()
+
+        def no_extraction(*args, **kwargs):
+            raise AssertionError("estrazione completa non attesa")
+
+        for name in ("_read_pdf", "_read_docx", "_read_xlsx", "_read_epub"):
+            monkeypatch.setattr(reader, name, no_extraction)
+        return reader
+
+    def test_ooxml_properties_from_zip(self, reader):
+        data = _zip_bytes({
+            "word/document.xml": "<w:document/>",
+            "docProps/core.xml": (
+                '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+                'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/">'
+                '<dc:title>Relazione</dc:title><dc:creator>Ufficio</dc:creator>'
+                '<dcterms:created>2026-01-02T10:00:00Z</dcterms:created></cp:coreProperties>'
+            ),
+            "docProps/app.xml": (
+                '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+                '<Application>Microsoft Office Word</Application><Pages>12</Pages><Words>3400</Words>'
+                '</Properties>'
+            ),
+        })
+        result = reader.get_metadata(data, "relazione.docx")
+        assert result["metadata"] == {
+            "title": "Relazione", "author": "Ufficio", "created": "2026-01-02T10:00:00Z",
+        }
+        assert result["pages"] == 12
+        assert result["words"] == 3400
+        assert result["format"] == "Word Document"
+        assert result["metadata_only"] is True
+
+    def test_xlsx_sheet_names(self, reader):
+        data = _zip_bytes({
+            "xl/workbook.xml": (
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheets><sheet name="Vendite" sheetId="1"/><sheet name="Costi" sheetId="2"/></sheets>'
+                '</workbook>'
+            ),
+        })
+        result = reader.get_metadata(data, "conti.xlsx")
+        assert result["sheet_names"] == ["Vendite", "Costi"]
+        assert result["metadata"] == {}
+
+    def test_pdf_pages_without_text(self, reader):
+        pytest.importorskip("pypdf")
+        result = reader.get_metadata(_make_pdf_bytes(["Uno", "Due", "Tre"]), "doc.pdf")
+        assert result["pages"] == 3
+        assert result["pdf_version"] == "PDF-1.4"
+        assert "full_text" not in result
+
+    def test_epub_from_opf(self, reader):
+        data = _epub_bytes({"c1.xhtml": ("Uno", ["Testo."]), "c2.xhtml": ("Due", ["Altro."])})
+        result = reader.get_metadata(data, "libro.epub")
+        assert result["title"] == "Il Romanzo"
+        assert result["author"] == "Autrice"
+        assert result["spine_items"] == 2
+
+    def test_image_header(self, reader):
+        Image = pytest.importorskip("PIL.Image")
+        buf = io.BytesIO()
+        Image.new("RGB", (40, 30)).save(buf, "PNG")
+        result = reader.get_metadata(buf.getvalue(), "foto.png")
+        assert (result["width"], result["height"]) == (40, 30)
+        assert "full_text" not in result
+
+    def test_other_formats_drop_text(self, reader):
+        result = reader.get_metadata(b"riga uno\nriga due", "note.txt")
+        assert "full_text" not in result
+        assert "metadata_only" not in result
+        assert result["format"]
+
+    def test_cached_under_own_key(self, reader):
+        from document_service.document_service import DocumentReader
+        data = _epub_bytes({"c1.xhtml": ("Uno", ["Testo."])})
+        first = reader.get_metadata(data, "libro.epub")
+        second = reader.get_metadata(data, "libro.epub")
+        assert second["from_cache"] is True
+        assert reader.cache.get(DocumentReader.metadata_cache_key(first["hash"])) is not None
+        assert reader.cache.get(first["hash"]) is None
@@ -1,6 +1,8 @@
 """Test per Image Analysis Service (image_analysis/image_service.py)."""
 
+import asyncio
 import io
+import json
 import pytest
 
 
@@ -121,3 +123,553 @@ class TestImageCache:
         assert resp.status_code == 200
         data = resp.json()
         assert "message" in data
+
+
+def _make_jpeg_bytes(size):
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+class TestDecodedImage:
+    """Una sola decodifica per richiesta, con riduzione JPEG in decodifica."""
+
+    def test_jpeg_is_reduced_while_decoding(self):
+        from image_analysis.image_service import DecodedImage
+        image = DecodedImage(_make_jpeg_bytes((4000, 3000)), max_size=1024)
+        assert image.metadata()["width"] == 4000
+        assert image.metadata()["height"] == 3000
+        # draft(): scala 1/2, la più piccola che resta sopra 1024 px
+        assert image.image.size == (2000, 1500)
+        assert max(image.resized(1024).size) == 1024
+
+    def test_png_with_alpha_on_white(self):
+        from PIL import Image
+        from image_analysis.image_service import DecodedImage
+        buf = io.BytesIO()
+        Image.new("RGBA", (10, 10), (0, 0, 0, 0)).save(buf, "PNG")
+        image = DecodedImage(buf.getvalue())
+        assert image.rgb().getpixel((0, 0)) == (255, 255, 255)
+        assert image.rgb() is image.rgb()
+
+    def test_analyze_decodes_once(self, tmp_path, monkeypatch):
+        import image_analysis.image_service as svc
+        from content_store import ContentStore
+
+        monkeypatch.setattr(svc.ImageAnalyzer, "_check_ollama", lambda self: None)
+        analyzer = svc.ImageAnalyzer()
+        analyzer.cache = svc.ImageCache(ContentStore(tmp_path))
+        analyzer.available_models = ["llava"]
+        payloads = []
+
+        async def fake_generate(model, prompt, images=None):
+            payloads.extend(images)
+            return "ok"
+
+        monkeypatch.setattr(analyzer.ollama, "generate", fake_generate)
+        opened = []
+        real_open = svc.Image.open
+        monkeypatch.setattr(svc.Image, "open", lambda fp: opened.append(1) or real_open(fp))
+
+        result = asyncio.run(
+            analyzer.analyze(_make_jpeg_bytes((3000, 2000)), "describe", use_cache=False)
+        )
+        assert len(opened) == 1
+        assert result["metadata"]["width"] == 3000
+        assert result["colors"]
+        assert len(payloads) == 1
+        assert result["description"] == "ok"
+
+
+class _FakeOllama:
+    """Finto /api/generate per httpx.MockTransport: registra la concorrenza."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def handler(self, request):
+        import httpx
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return httpx.Response(200, json={"response": "descrizione"})
+
+
+class TestOllamaClient:
+    """Client asincrono: limite per modello, connessioni condivise, annullamento."""
+
+    def _client(self, fake, **kwargs):
+        import httpx
+        from image_analysis.image_service import OllamaClient
+
+        client = OllamaClient("http://ollama.test", **kwargs)
+
+        async def bind():
+            client._bind_loop()
+            client._client = httpx.AsyncClient(
+                base_url=client.base_url, transport=httpx.MockTransport(fake.handler)
+            )
+        return client, bind
+
+    def test_parallel_limit_per_model(self):
+        fake = _FakeOllama()
+        client, bind = self._client(fake, parallel=2, limits={"moondream": 3})
+
+        async def run():
+            await bind()
+            texts = await asyncio.gather(*(client.generate("llava", "p") for _ in range(6)))
+            await client.aclose()
+            return texts
+
+        assert asyncio.run(run()) == ["descrizione"] * 6
+        assert fake.peak == 2
+        assert client.limit("moondream") == 3
+        assert client.stats()["completed"] == 6
+
+    def test_cancel_releases_slot(self):
+        fake = _FakeOllama(delay=5)
+        client, bind = self._client(fake, parallel=1)
+
+        async def run():
+            await bind()
+            task = asyncio.ensure_future(client.generate("llava", "p"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            fake.delay = 0
+            text = await asyncio.wait_for(client.generate("llava", "p"), 2)
+            await client.aclose()
+            return text
+
+        assert asyncio.run(run()) == "descrizione"
+        assert client.stats()["cancelled"] == 1
+        assert client.stats()["running"] == {}
+
+    def test_requests_fallback_holds_slot_until_thread_returns(self, monkeypatch):
+        import threading
+        import image_analysis.image_service as svc
+        from unittest.mock import MagicMock
+
+        monkeypatch.setattr(svc, "HAS_HTTPX", False)
+        client = svc.OllamaClient("http://ollama.test", parallel=1)
+        release = threading.Event()
+        calls = []
+
+        def blocking_request(method, url, **kwargs):
+            calls.append(url)
+            release.wait(5)
+            return MagicMock(status_code=200, json=lambda: {"response": "fine"})
+
+        session = client._requests_session()
+        monkeypatch.setattr(session, "request", blocking_request)
+
+        async def run():
+            first = asyncio.ensure_future(client.generate("llava", "p"))
+            await asyncio.sleep(0.1)
+            first.cancel()
+            await asyncio.sleep(0.1)
+            # Il thread è ancora su Ollama: il posto resta occupato
+            assert client.stats()["running"] == {"llava": 1}
+            second = asyncio.ensure_future(client.generate("llava", "p"))
+            await asyncio.sleep(0.1)
+            assert len(calls) == 1
+            release.set()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            text = await asyncio.wait_for(second, 5)
+            await client.aclose()
+            return text
+
+        assert asyncio.run(run()) == "fine"
+        assert client.stats()["cancelled"] == 1
+
+    def test_error_status_raises(self):
+        import httpx
+        from image_analysis.image_service import OllamaClient, OllamaError
+
+        client = OllamaClient("http://ollama.test")
+
+        async def run():
+            client._bind_loop()
+            client._client = httpx.AsyncClient(
+                base_url=client.base_url,
+                transport=httpx.MockTransport(lambda request: httpx.Response(404))
+            )
+            try:
+                await client.generate("manca", "p")
+            finally:
+                await client.aclose()
+
+        with pytest.raises(OllamaError) as exc:
+            asyncio.run(run())
+        assert exc.value.status == 404
+        assert client.stats()["errors"] == 1
+
+
+class TestImageBatchFanOut:
+    """Il batch analizza le immagini in parallelo fino al limite del modello."""
+
+    def test_batch_runs_concurrently_in_order(self, image_client, mock_image_analyzer):
+        state = {"active": 0, "peak": 0}
+
+        async def slow_analyze(data, analysis_type, image_hash=None):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.05)
+            state["active"] -= 1
+            return {"description": image_hash}
+
+        mock_image_analyzer.analyze.side_effect = slow_analyze
+        png = _make_png_bytes()
+        files = [("files", (f"{i}.png", io.BytesIO(png + bytes([i])), "image/png")) for i in range(5)]
+        data = image_client.post("/batch", files=files).json()
+
+        assert [r["filename"] for r in data["results"]] == [f"{i}.png" for i in range(5)]
+        assert state["peak"] == 2  # mock: ollama.limit() == 2
+
+
+def _sse_events(body: str):
+    """Eventi (nome, dati) di una risposta text/event-stream."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class TestImageStreaming:
+    """Streaming dei token del modello vision in server-sent events."""
+
+    def test_analyze_stream_endpoint(self, image_client, mock_image_analyzer):
+        png = _make_png_bytes()
+        resp = image_client.post(
+            "/analyze",
+            files={"file": ("test.png", io.BytesIO(png), "image/png")},
+            data={"analysis_type": "describe", "stream": "true"},
+        )
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = _sse_events(resp.text)
+        assert [name for name, _ in events] == ["start", "token", "token", "result"]
+        assert events[-1][1]["description"] == "Una foto di test"
+        mock_image_analyzer.analyze.assert_not_called()
+
+    def test_describe_stream_endpoint(self, image_client):
+        png = _make_png_bytes()
+        resp = image_client.post(
+            "/describe",
+            files={"file": ("test.png", io.BytesIO(png), "image/png")},
+            data={"stream": "true"},
+        )
+        events = _sse_events(resp.text)
+        tokens = "".join(data["text"] for name, data in events if name == "token")
+        assert tokens == "Una foto di test"
+        assert events[-1] == ("result", {"description": "Una foto di test"})
+
+    def _analyzer(self, tmp_path, monkeypatch, handler):
+        import httpx
+        import image_analysis.image_service as svc
+        from content_store import ContentStore
+
+        monkeypatch.setattr(svc.ImageAnalyzer, "_check_ollama", lambda self: None)
+        analyzer = svc.ImageAnalyzer()
+        analyzer.cache = svc.ImageCache(ContentStore(tmp_path))
+        analyzer.available_models = ["llava"]
+
+        real_bind = analyzer.ollama._bind_loop
+
+        def bind():
+            real_bind()
+            analyzer.ollama._client = httpx.AsyncClient(
+                base_url="http://ollama.test", transport=httpx.MockTransport(handler)
+            )
+        monkeypatch.setattr(analyzer.ollama, "_bind_loop", bind)
+        return analyzer
+
+    @staticmethod
+    def _collect(analyzer, image_bytes, **kwargs):
+        async def run():
+            events = [e async for e in analyzer.analyze_stream(image_bytes, "describe", **kwargs)]
+            await analyzer.ollama.aclose()
+            return events
+        return asyncio.run(run())
+
+    def test_relays_ollama_tokens_and_caches(self, tmp_path, monkeypatch):
+        import httpx
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            lines = [{"response": "Un ", "done": False}, {"response": "gatto", "done": False},
+                     {"response": "", "done": True}]
+            return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines) + "\n")
+
+        analyzer = self._analyzer(tmp_path, monkeypatch, handler)
+        png = _make_png_bytes()
+        events = self._collect(analyzer, png)
+
+        assert [name for name, _ in events] == ["start", "token", "token", "result"]
+        result = events[-1][1]
+        assert result["description"] == "Un gatto"
+        assert result["colors"]
+
+        # Il risultato completo è in cache: la seconda richiesta non tocca Ollama
+        cached = self._collect(analyzer, png)
+        assert [name for name, _ in cached] == ["result"]
+        assert cached[0][1]["from_cache"] is True
+        assert cached[0][1]["description"] == "Un gatto"
+
+    def test_ollama_error_not_streamed_as_tokens(self, tmp_path, monkeypatch):
+        import httpx
+
+        analyzer = self._analyzer(tmp_path, monkeypatch, lambda request: httpx.Response(404))
+        events = self._collect(analyzer, _make_png_bytes(), use_cache=False)
+
+        assert [name for name, _ in events] == ["start", "error"]
+        assert events[-1][1]["detail"] == "Ollama error: 404"
+        assert analyzer.ollama.stats()["errors"] == 1
+
+    def test_failure_mid_stream_is_not_cached(self, tmp_path, monkeypatch):
+        import httpx
+
+        def handler(request):
+            lines = [{"response": "Un ", "done": False}, {"error": "modello scaricato"}]
+            return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines) + "\n")
+
+        analyzer = self._analyzer(tmp_path, monkeypatch, handler)
+        png = _make_png_bytes()
+        events = self._collect(analyzer, png)
+
+        assert [name for name, _ in events] == ["start", "token", "error"]
+        assert events[-1][1]["partial"] == "Un "
+        assert self._collect(analyzer, png)[0][0] == "start"  # nessun hit in cache
+
+
+def _make_photo(size=(256, 192)):
+    """Immagine con sfumature e forme (per i test del dHash)."""
+    from PIL import Image, ImageDraw
+
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2), fill=(200, 30, 30))
+    draw.rectangle((size[0] * 2 // 3, 10, size[0] - 10, size[1] // 3), fill=(20, 20, 160))
+    return img
+
+
+def _encode(img, fmt="PNG", **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+class TestPerceptualCache:
+    """Cache per immagini quasi identiche (dHash + distanza di Hamming)."""
+
+    def test_index_finds_within_distance(self):
+        from image_analysis.image_service import PerceptualIndex
+
+        index = PerceptualIndex(max_distance=3)
+        base = 0x0F0F_F0F0_1234_ABCD
+        index.add("vicino", base ^ 0b101)           # 2 bit diversi
+        index.add("lontano", base ^ 0xFFFF)         # 16 bit diversi
+        index.add("se-stesso", base)
+
+        assert index.nearest(base, exclude="se-stesso") == [(2, "vicino")]
+        assert "vicino" in index and len(index) == 3
+
+    def test_index_bounded_and_discard(self):
+        from image_analysis.image_service import PerceptualIndex
+
+        index = PerceptualIndex(max_distance=2, max_entries=2)
+        index.add("a", 1)
+        index.add("b", 2)
+        index.add("a", 1)   # ri-aggiunta: diventa la più recente
+        index.add("c", 3)
+        assert index.digests() == ["a", "c"]
+
+        index.discard("a")
+        assert index.nearest(1) == [(1, "c")]
+
+    def test_cleanup_prunes_expired_digests(self, tmp_path):
+        import time
+        from content_store import ContentStore
+        from image_analysis.image_service import ImageCache
+
+        cache = ImageCache(ContentStore(tmp_path), phash_distance=4)
+        cache.set("vecchia", "describe", {"description": "x"}, dhash=0xFF)
+        cache.set("nuova", "describe", {"description": "y"}, dhash=0xF0)
+        cache.store._conn.execute(
+            "UPDATE results SET created = ? WHERE blob = 'vecchia'", (time.time() - 48 * 3600,)
+        )
+        cache.cleanup()
+        assert cache.perceptual.digests() == ["nuova"]
+
+    def test_dhash_stable_across_recompression_and_resize(self):
+        from PIL import Image
+        from image_analysis.image_service import DecodedImage
+
+        photo = _make_photo()
+        original = DecodedImage(_encode(photo)).dhash()
+        jpeg = DecodedImage(_encode(photo, "JPEG", quality=40)).dhash()
+        smaller = DecodedImage(_encode(photo.resize((128, 96), Image.LANCZOS))).dhash()
+        other = DecodedImage(_encode(photo.transpose(Image.FLIP_LEFT_RIGHT))).dhash()
+
+        def distance(a, b):
+            return bin(a ^ b).count("1")
+
+        assert distance(original, jpeg) <= 4
+        assert distance(original, smaller) <= 4
+        assert distance(original, other) > 10
+
+    def _analyzer(self, tmp_path, monkeypatch, distance):
+        import image_analysis.image_service as svc
+        from content_store import ContentStore
+
+        monkeypatch.setattr(svc.ImageAnalyzer, "_check_ollama", lambda self: None)
+        analyzer = svc.ImageAnalyzer()
+        analyzer.cache = svc.ImageCache(ContentStore(tmp_path), phash_distance=distance)
+        analyzer.available_models = ["llava"]
+        calls = []
+
+        async def fake_generate(model, prompt, images=None):
+            calls.append(prompt)
+            return "un cerchio rosso"
+
+        monkeypatch.setattr(analyzer.ollama, "generate", fake_generate)
+        return analyzer, calls
+
+    def test_near_duplicate_served_from_cache(self, tmp_path, monkeypatch):
+        analyzer, calls = self._analyzer(tmp_path, monkeypatch, distance=4)
+        photo = _make_photo()
+        first = asyncio.run(analyzer.analyze(_encode(photo), "describe"))
+        resaved = _encode(photo, "JPEG", quality=50)
+        second = asyncio.run(analyzer.analyze(resaved, "describe"))
+
+        assert len(calls) == 1
+        assert second["from_cache"] is True
+        assert second["description"] == "un cerchio rosso"
+        assert second["near_duplicate"]["hash"] == first["hash"]
+        assert second["metadata"]["format"] == "JPEG"
+
+        stats = analyzer.cache.stats()
+        assert stats["exact_hits"] == 0
+        assert stats["perceptual_hits"] == 1
+        assert stats["perceptual_hit_rate"] == 0.5
+
+        # Salvato anche sotto il digest esatto: la volta dopo è un hit esatto
+        third = asyncio.run(analyzer.analyze(resaved, "describe"))
+        assert analyzer.cache.stats()["exact_hits"] == 1
+        assert "near_duplicate" not in third
+
+        # L'indice sopravvive al riavvio (ricostruito dall'archivio)
+        from image_analysis.image_service import ImageCache
+        assert len(ImageCache(analyzer.cache.store, phash_distance=4).perceptual) == 2
+
+    def test_disabled_without_distance(self, tmp_path, monkeypatch):
+        analyzer, calls = self._analyzer(tmp_path, monkeypatch, distance=None)
+        photo = _make_photo()
+        asyncio.run(analyzer.analyze(_encode(photo), "describe"))
+        asyncio.run(analyzer.analyze(_encode(photo, "JPEG", quality=50), "describe"))
+
+        assert len(calls) == 2
+        assert analyzer.cache.stats()["perceptual"] is False
+        assert analyzer.cache.store.find_results("image", "dhash") == []
+
+
+class TestCacheKey:
+    """Chiave di cache: immagine, modello e sua versione, prompt, preparazione."""
+
+    def _analyzer(self, tmp_path, monkeypatch):
+        import image_analysis.image_service as svc
+        from content_store import ContentStore
+
+        monkeypatch.setattr(svc.ImageAnalyzer, "_check_ollama", lambda self: None)
+        analyzer = svc.ImageAnalyzer()
+        analyzer.cache = svc.ImageCache(ContentStore(tmp_path), phash_distance=None)
+        analyzer.model = "llava:latest"
+        analyzer._set_models([{"name": "llava:latest", "digest": "aaaa" * 16}])
+        calls = []
+
+        async def fake_generate(model, prompt, images=None):
+            calls.append(prompt)
+            return f"risposta {len(calls)}"
+
+        monkeypatch.setattr(analyzer.ollama, "generate", fake_generate)
+        return analyzer, calls
+
+    def test_key_covers_prompt_and_model(self, tmp_path, monkeypatch):
+        analyzer, _ = self._analyzer(tmp_path, monkeypatch)
+
+        def kind(analysis_type, prompt=""):
+            return asyncio.run(analyzer.cache_key("img", analysis_type, prompt)).kind
+
+        base = kind("describe")
+        assert base.startswith("describe|llava:latest@aaaaaaaaaaaa|p:")
+        assert kind("describe", "Quanti gatti?") != base
+        assert kind("describe", "Quanti gatti?") == kind("describe", "Quanti gatti?")
+        assert kind("objects") != base
+
+        analyzer.model = "moondream"
+        analyzer._set_models([{"name": "moondream", "digest": "bbbb" * 16}])
+        assert kind("describe") != base
+
+    def test_preprocess_version_in_key(self, tmp_path, monkeypatch):
+        import image_analysis.image_service as svc
+
+        analyzer, _ = self._analyzer(tmp_path, monkeypatch)
+        before = asyncio.run(analyzer.cache_key("img", "describe"))
+        monkeypatch.setattr(svc, "PREPROCESS_VERSION", svc.PREPROCESS_VERSION + 1)
+        after = asyncio.run(analyzer.cache_key("img", "describe"))
+        assert before.preprocess != after.preprocess
+
+    def test_repulled_model_invalidates_cache(self, tmp_path, monkeypatch):
+        analyzer, calls = self._analyzer(tmp_path, monkeypatch)
+        png = _make_png_bytes()
+
+        assert asyncio.run(analyzer.analyze(png, "describe"))["description"] == "risposta 1"
+        assert asyncio.run(analyzer.analyze(png, "describe"))["from_cache"] is True
+
+        # Nuovo digest da /api/tags alla prossima verifica
+        async def tags():
+            return [{"name": "llava:latest", "digest": "cccc" * 16}]
+
+        monkeypatch.setattr(analyzer.ollama, "tags", tags)
+        analyzer._models_checked = 0
+        result = asyncio.run(analyzer.analyze(png, "describe"))
+        assert result["from_cache"] is False
+        assert result["description"] == "risposta 2"
+        assert analyzer.model_digests["llava:latest"] == "cccc" * 16
+
+    def test_bare_model_name_resolved_after_late_start(self, tmp_path, monkeypatch):
+        analyzer, _ = self._analyzer(tmp_path, monkeypatch)
+        # Ollama spento all'avvio: nome senza tag e nessun modello noto
+        analyzer.model = "llava"
+        analyzer._set_models([])
+
+        async def tags():
+            return [{"name": "llava:latest", "digest": "dddd" * 16}]
+
+        monkeypatch.setattr(analyzer.ollama, "tags", tags)
+        analyzer._models_checked = 0
+        key = asyncio.run(analyzer.cache_key("img", "describe"))
+        assert analyzer.model == "llava:latest"
+        assert key.kind.startswith("describe|llava:latest@dddddddddddd|")
+
+    def test_ollama_unreachable_keeps_digest(self, tmp_path, monkeypatch):
+        analyzer, _ = self._analyzer(tmp_path, monkeypatch)
+
+        async def tags():
+            raise ConnectionError("offline")
+
+        monkeypatch.setattr(analyzer.ollama, "tags", tags)
+        analyzer._models_checked = 0
+        key = asyncio.run(analyzer.cache_key("img", "describe"))
+        assert key.model_digest == "aaaa" * 16
@@ -232,6 +232,19 @@ class TestAPIKeyEndpoints:
         resp = document_client_noauth.post("/read")
         assert resp.status_code == 401
 
+    @pytest.mark.parametrize(
+        "path", ["/search?q=test", "/ingest", "/ingest/errors?path=/tmp", "/book/abc123"]
+    )
+    def test_document_get_riservati_senza_auth(self, document_client_noauth, path):
+        """GET con contenuti o percorsi locali senza API key -> 401."""
+        resp = document_client_noauth.get(path)
+        assert resp.status_code == 401
+
+    def test_document_get_info_senza_auth(self, document_client_noauth):
+        """GET / senza API key -> 200 (health check aperto)."""
+        resp = document_client_noauth.get("/")
+        assert resp.status_code == 200
+
     def test_chiave_errata_rifiutata(self, mcp_client_noauth):
         """POST con API key sbagliata -> 401."""
         resp = mcp_client_noauth.post(
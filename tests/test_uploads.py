@@ -0,0 +1,91 @@
+"""Test per il modulo upload in streaming (uploads.py)."""
+
+import asyncio
+import hashlib
+import io
+import mmap
+
+import pytest
+
+from content_store import content_digest
+from uploads import UploadTooLarge, as_stream, create_upload_limit_middleware, spool_upload
+
+
+class FakeUpload:
+    """UploadFile minimale: read(n) asincrono su un buffer."""
+
+    def __init__(self, data: bytes, filename: str = "file.bin"):
+        self._buf = io.BytesIO(data)
+        self.filename = filename
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buf.read(size)
+
+
+class TestSpoolUpload:
+    """Ricezione a blocchi con hash incrementale."""
+
+    def test_small_upload_stays_in_memory(self):
+        data = b"ciao mondo" * 10
+        upload = asyncio.run(spool_upload(FakeUpload(data), max_bytes=1024))
+        assert isinstance(upload.data, bytes)
+        assert upload.data == data
+        assert upload.digest == content_digest(data)
+        assert upload.size == len(data)
+
+    def test_large_upload_is_memory_mapped(self, monkeypatch):
+        import uploads
+        monkeypatch.setattr(uploads, "SPOOL_MEMORY_LIMIT", 1024)
+        data = bytes(range(256)) * 40
+        with asyncio.run(spool_upload(FakeUpload(data), max_bytes=1 << 20, chunk_size=500)) as upload:
+            assert isinstance(upload.data, mmap.mmap)
+            assert upload.data[:] == data
+            assert upload.digest == content_digest(data)
+            assert as_stream(upload.data).read() == data
+
+    def test_rejects_as_soon_as_limit_is_exceeded(self):
+        fake = FakeUpload(b"x" * 5000)
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(spool_upload(fake, max_bytes=1000, chunk_size=600))
+        # Interrotto al secondo blocco, il resto non è stato letto
+        assert fake._buf.tell() == 1200
+
+    def test_known_size_rejected_without_reading(self):
+        fake = FakeUpload(b"x" * 10)
+        fake.size = 10_000
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(spool_upload(fake, max_bytes=100))
+        assert fake._buf.tell() == 0
+
+    def test_explicit_hash_name(self):
+        data = b"contenuto"
+        upload = asyncio.run(spool_upload(FakeUpload(data), max_bytes=1024, hash_name="md5"))
+        assert upload.digest == hashlib.md5(data).hexdigest()
+
+
+class TestUploadLimitMiddleware:
+    """Rifiuto immediato (413) in base al Content-Length."""
+
+    @pytest.fixture
+    def client(self):
+        from fastapi import FastAPI, Request
+        from fastapi.testclient import TestClient
+
+        app = FastAPI()
+        create_upload_limit_middleware(app, 1024, path_limits={"/batch": 4096})
+
+        @app.post("/read")
+        @app.post("/batch")
+        async def echo(request: Request):
+            return {"size": len(await request.body())}
+
+        return TestClient(app)
+
+    def test_single_file_limit(self, client):
+        assert client.post("/read", content=b"x" * 1000).status_code == 200
+        assert client.post("/read", content=b"x" * 200_000).status_code == 413
+
+    def test_batch_has_its_own_limit(self, client):
+        assert client.post("/batch", content=b"x" * 3000).status_code == 200
+        resp = client.post("/batch", content=b"x" * 200_000)
+        assert resp.status_code == 413
@@ -240,6 +240,13 @@ TRANSLATIONS = {
         "no_linked_folder": "Nessuna cartella collegata",
         "unlink_tooltip": "Scollega la cartella selezionata da Open WebUI",
         "restore_tooltip": "Ricollega una cartella scollegata in precedenza",
+        "ingest_button": "⚡ Indicizza",
+        "ingest_tooltip": "Pre-elabora i documenti delle cartelle collegate (Document service)",
+        "ingest_no_folders": "Nessuna cartella collegata da indicizzare",
+        "ingest_progress": "Indicizzazione: {done}/{total} — {current}",
+        "ingest_done": "✓ Indicizzazione completata: {done} elaborati, {unchanged} invariati, {errors} errori",
+        "ingest_error": "✗ Indicizzazione non riuscita: {error}",
+        "ingest_service_unreachable": "✗ Document service non raggiungibile (porta {port})",
         "select_info": "Seleziona prima un file dalla lista",
         "export_first": "Esporta prima un file per copiare il risultato",
         "result_placeholder_archive": "Seleziona un file e clicca Esporta Testo...",
@@ -894,6 +901,13 @@ TRANSLATIONS = {
         "no_linked_folder": "No linked folders",
         "unlink_tooltip": "Unlink the selected folder from Open WebUI",
         "restore_tooltip": "Re-link a previously unlinked folder",
+        "ingest_button": "⚡ Index",
+        "ingest_tooltip": "Pre-process documents in linked folders (Document service)",
+        "ingest_no_folders": "No linked folders to index",
+        "ingest_progress": "Indexing: {done}/{total} — {current}",
+        "ingest_done": "✓ Indexing complete: {done} processed, {unchanged} unchanged, {errors} errors",
+        "ingest_error": "✗ Indexing failed: {error}",
+        "ingest_service_unreachable": "✗ Document service unreachable (port {port})",
         "select_info": "Select a file from the list first",
         "export_first": "Export a file first to copy the result",
         "result_placeholder_archive": "Select a file and click Export Text...",
@@ -20,12 +20,11 @@ Uso:
 import os
 import sys
 import json
-import hashlib
 import asyncio
 import tempfile
 import subprocess
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 import threading
 import time
@@ -52,6 +51,7 @@ _security_path = str(Path(__file__).parent.parent)
 if _security_path not in sys.path:
     sys.path.insert(0, _security_path)
 from security import ALLOWED_ORIGINS, create_api_key_middleware, SAFE_HOST
+from content_store import CONTENT_STORE_DIR, ContentStore, content_digest, get_store
 
 
 # ============================================================================
@@ -59,6 +59,7 @@ from security import ALLOWED_ORIGINS, create_api_key_middleware, SAFE_HOST
 # ============================================================================
 
 SERVICE_PORT = 5556
+# Solo per i file di prova voce: l'audio sintetizzato va nell'archivio condiviso
 CACHE_DIR = Path(__file__).parent / ".tts_cache"
 CACHE_DIR.mkdir(exist_ok=True)
 
@@ -272,7 +273,7 @@ class TTSManager:
 
     def __init__(self):
         self.backends: Dict[str, TTSBackend] = {}
-        self.cache = TTSCache(CACHE_DIR)
+        self.cache = TTSCache()
         self._init_backends()
 
     def _init_backends(self):
@@ -344,69 +345,43 @@ class TTSManager:
 
         # Salva in cache
         if use_cache:
-            self.cache.set(cache_key, audio_data)
+            self.cache.set(cache_key, audio_data, len(text.encode("utf-8")))
 
         return audio_data
 
 
 class TTSCache:
-    """Cache per audio sintetizzato."""
-
-    def __init__(self, cache_dir: Path):
-        self.cache_dir = cache_dir
-        self.cache_dir.mkdir(exist_ok=True)
-        self.index_file = cache_dir / "index.json"
-        self.index = self._load_index()
-
-    def _load_index(self) -> dict:
-        if self.index_file.exists():
-            try:
-                return json.loads(self.index_file.read_text())
-            except:
-                return {}
-        return {}
-
-    def _save_index(self):
-        self.index_file.write_text(json.dumps(self.index, indent=2))
-
-    def get_key(self, text: str, backend: str, voice: str) -> str:
-        content = f"{text}|{backend}|{voice}"
-        return hashlib.md5(content.encode()).hexdigest()
-
-    def get(self, key: str) -> Optional[bytes]:
-        if key in self.index:
-            file_path = self.cache_dir / self.index[key]["file"]
-            if file_path.exists():
-                return file_path.read_bytes()
-        return None
+    """
+    Cache per audio sintetizzato, nell'archivio content-addressed condiviso.
 
-    def set(self, key: str, data: bytes):
-        file_name = f"{key}.mp3"
-        file_path = self.cache_dir / file_name
-        file_path.write_bytes(data)
+    Il testo è il blob di partenza, backend e voce il tipo di risultato,
+    l'audio il blob prodotto: lo stesso audio è salvato una volta sola.
+    """
 
-        self.index[key] = {
-            "file": file_name,
-            "timestamp": time.time(),
-            "size": len(data)
-        }
-        self._save_index()
+    SERVICE = "tts"
 
-    def cleanup(self, max_age_hours: int = 24) -> int:
-        """Rimuove file più vecchi di max_age_hours."""
-        now = time.time()
-        removed = 0
+    def __init__(self, store: Optional[ContentStore] = None):
+        self.store = store or get_store()
 
-        for key, entry in list(self.index.items()):
-            if now - entry.get("timestamp", 0) > max_age_hours * 3600:
-                file_path = self.cache_dir / entry["file"]
-                if file_path.exists():
-                    file_path.unlink()
-                del self.index[key]
-                removed += 1
+    def get_key(self, text: str, backend: str, voice: str) -> Tuple[str, str]:
+        return content_digest(text.encode("utf-8")), f"{backend}:{voice}"
 
-        self._save_index()
-        return removed
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        text_digest, kind = key
+        hit = self.store.get_result(text_digest, self.SERVICE, kind)
+        if hit and hit["output"]:
+            return self.store.get_blob(hit["output"])
+        return None
+
+    def set(self, key: Tuple[str, str], data: bytes, text_size: int = 0):
+        text_digest, kind = key
+        audio_digest = self.store.put_blob(data)
+        self.store.register_blob(text_digest, text_size)
+        self.store.put_result(text_digest, self.SERVICE, kind, output=audio_digest)
+
+    def cleanup(self, max_age_hours: int = 24) -> int:
+        """Rimuove audio più vecchi di max_age_hours."""
+        return self.store.cleanup(max_age_hours, service=self.SERVICE)
 
 
 # ============================================================================
@@ -632,7 +607,6 @@ def create_app() -> FastAPI:
         """
         try:
             # Parse request body
-            import json
             from starlette.requests import Request
 
             text = request.get("input", "")
@@ -702,7 +676,7 @@ def main():
         print("\n[!] Alcune funzionalità potrebbero non essere disponibili")
 
     print(f"\n[*] Porta: {SERVICE_PORT}")
-    print(f"[*] Cache: {CACHE_DIR}")
+    print(f"[*] Cache: {CONTENT_STORE_DIR}")
     print()
 
     # Avvia server
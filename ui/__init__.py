@@ -7,13 +7,13 @@ Principi applicati:
 """
 
 from ui.components import ModernButton, StatusIndicator
-from ui.threads import StartupThread, WorkerThread, StatusChecker
+from ui.threads import StartupThread, WorkerThread, StatusChecker, IngestThread
 from ui.dialogs import StartupDialog
 from ui.main_window import MainWindow
 
 __all__ = [
     'ModernButton', 'StatusIndicator',
-    'StartupThread', 'WorkerThread', 'StatusChecker',
+    'StartupThread', 'WorkerThread', 'StatusChecker', 'IngestThread',
     'StartupDialog',
     'MainWindow',
 ]
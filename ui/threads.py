@@ -16,8 +16,8 @@ from PyQt5.QtCore import QThread, pyqtSignal
 
 from config import (
     IS_WINDOWS, SCRIPT_DIR, DOCKER_COMPOSE,
-    URL_WEBUI, URL_OLLAMA, URL_TTS,
-    PORT_WEBUI, PORT_OLLAMA,
+    URL_WEBUI, URL_OLLAMA, URL_TTS, URL_DOCUMENT,
+    PORT_WEBUI, PORT_OLLAMA, PORT_DOCUMENT,
     VENV_DIR, ensure_venv, ensure_env_file,
 )
 
@@ -248,6 +248,77 @@ class WorkerThread(QThread):
             self._process.terminate()
 
 
+class IngestThread(QThread):
+    """Thread che fa pre-elaborare cartelle al Document service e ne segue l'avanzamento."""
+    progress_signal = pyqtSignal(int, int, str)  # elaborati, totale da elaborare, file corrente
+    finished_signal = pyqtSignal(bool, str)  # successo, messaggio
+
+    POLL_SECONDS = 1.0
+
+    def __init__(self, folders, lang="it", parent=None):
+        super().__init__(parent)
+        self.folders = list(folders)
+        self._lang = lang
+        self._cancelled = False
+
+    def _t(self, key, **kwargs):
+        return get_text(key, self._lang, **kwargs)
+
+    def run(self):
+        try:
+            import requests
+            from security import API_KEY
+        except ImportError as e:
+            self.finished_signal.emit(False, self._t("ingest_error", error=e))
+            return
+
+        try:
+            roots = []
+            for folder in self.folders:
+                resp = requests.post(
+                    f"{URL_DOCUMENT}/ingest",
+                    data={"path": folder},
+                    headers={"X-API-Key": API_KEY},
+                    timeout=10
+                )
+                if resp.status_code != 200:
+                    detail = resp.json().get("detail", resp.status_code)
+                    self.finished_signal.emit(False, self._t("ingest_error", error=detail))
+                    return
+                roots.append(resp.json()["root"])
+
+            while not self._cancelled:
+                time.sleep(self.POLL_SECONDS)
+                status = requests.get(
+                    f"{URL_DOCUMENT}/ingest", headers={"X-API-Key": API_KEY}, timeout=10
+                ).json()
+                folders = [f for f in status.get("folders", []) if f["root"] in roots]
+
+                done = sum(f["done"] for f in folders)
+                total = done + sum(max(0, f["queued"]) for f in folders)
+                current = next((f["current"] for f in folders if f.get("current")), "")
+                self.progress_signal.emit(done, total, current or "")
+
+                # Una cartella non più raggiungibile conta come conclusa
+                if all(f["state"] == "missing" or (f["state"] == "idle" and f["last_scan"])
+                       for f in folders):
+                    self.finished_signal.emit(True, self._t(
+                        "ingest_done",
+                        done=done,
+                        unchanged=sum(f["unchanged"] for f in folders),
+                        errors=sum(f["errors"] for f in folders),
+                    ))
+                    return
+        except requests.RequestException:
+            self.finished_signal.emit(False, self._t("ingest_service_unreachable", port=PORT_DOCUMENT))
+        except (ValueError, KeyError) as e:
+            logger.error("Risposta /ingest non valida: %s", e)
+            self.finished_signal.emit(False, self._t("ingest_error", error=e))
+
+    def cancel(self):
+        self._cancelled = True
+
+
 class StatusChecker(QThread):
     """Thread per controllare periodicamente lo stato dei servizi."""
     status_signal = pyqtSignal(dict)
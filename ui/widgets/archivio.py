@@ -8,7 +8,7 @@ from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox,
     QGridLayout, QTreeView, QListWidget, QListWidgetItem,
     QLineEdit, QTextEdit, QFrame, QPushButton, QFileDialog,
-    QMessageBox, QApplication, QAbstractItemView, QInputDialog
+    QMessageBox, QApplication, QAbstractItemView, QInputDialog, QProgressBar
 )
 from PyQt5.QtCore import Qt, QSettings, QDir, QFileInfo, QUrl
 from PyQt5.QtGui import QFont, QDesktopServices
@@ -20,6 +20,7 @@ except ImportError:
     def get_text(key, lang="it", **kwargs): return key
 
 from config import SCRIPT_DIR
+from ui.threads import IngestThread
 
 
 class ArchivioWidget(QWidget):
@@ -30,6 +31,7 @@ class ArchivioWidget(QWidget):
         self.settings = QSettings("OpenWebUI", "Manager")
         self.current_path = None
         self.last_result = None
+        self.ingest_thread = None
         self.setup_ui()
         self.load_settings()
 
@@ -262,8 +264,31 @@ class ArchivioWidget(QWidget):
         self.refresh_volumes_btn.clicked.connect(self.refresh_volumes_list)
         vol_btn_row.addWidget(self.refresh_volumes_btn)
 
+        self.ingest_btn = QPushButton(t("ingest_button"))
+        self.ingest_btn.setMinimumHeight(28)
+        self.ingest_btn.setStyleSheet("font-size: 10px; padding: 4px 8px; background-color: #27ae60; color: white; border-radius: 3px;")
+        self.ingest_btn.setToolTip(t("ingest_tooltip"))
+        self.ingest_btn.clicked.connect(self.start_ingest)
+        vol_btn_row.addWidget(self.ingest_btn)
+
         right_column.addLayout(vol_btn_row)
 
+        # Avanzamento indicizzazione (visibile solo durante l'elaborazione)
+        self.ingest_bar = QProgressBar()
+        self.ingest_bar.setMaximumHeight(14)
+        self.ingest_bar.setStyleSheet("""
+            QProgressBar { border: 1px solid #bdc3c7; border-radius: 5px; text-align: center; font-size: 9px; }
+            QProgressBar::chunk { background-color: #27ae60; border-radius: 4px; }
+        """)
+        self.ingest_bar.setVisible(False)
+        right_column.addWidget(self.ingest_bar)
+
+        self.ingest_label = QLabel("")
+        self.ingest_label.setStyleSheet("font-size: 10px; color: #555;")
+        self.ingest_label.setWordWrap(True)
+        self.ingest_label.setVisible(False)
+        right_column.addWidget(self.ingest_label)
+
         # Risultato esportazione
         self._result_label = QLabel(t("export_result"))
         self._result_label.setStyleSheet("font-size: 10px; font-weight: bold; color: #555;")
@@ -362,6 +387,9 @@ class ArchivioWidget(QWidget):
 
             # Aggiungi come volume Docker in docker-compose.yml
             added = self._add_docker_volume(self.current_path)
+            if added:
+                # Pre-elabora subito i documenti della nuova cartella
+                self.start_ingest([self.current_path])
 
             if self.main_window:
                 if added:
@@ -496,6 +524,52 @@ class ArchivioWidget(QWidget):
             else:
                 QMessageBox.information(self, t("info"), t("no_volume_found"))
 
+    def start_ingest(self, folders=None):
+        """Fa pre-elaborare al Document service i documenti delle cartelle collegate."""
+        lang = self._get_lang()
+        if self.ingest_thread and self.ingest_thread.isRunning():
+            return
+
+        if not folders:
+            folders = [vol for vol in self._get_custom_volumes() if Path(vol).is_dir()]
+        if not folders:
+            self.ingest_label.setText(get_text("ingest_no_folders", lang))
+            self.ingest_label.setVisible(True)
+            return
+
+        self.ingest_btn.setEnabled(False)
+        self.ingest_bar.setRange(0, 0)  # Indeterminato finché non è noto il totale
+        self.ingest_bar.setVisible(True)
+        self.ingest_label.setStyleSheet("font-size: 10px; color: #555;")
+        self.ingest_label.setVisible(False)
+
+        self.ingest_thread = IngestThread(folders, lang, self)
+        self.ingest_thread.progress_signal.connect(self._on_ingest_progress)
+        self.ingest_thread.finished_signal.connect(self._on_ingest_finished)
+        self.ingest_thread.start()
+
+    def _on_ingest_progress(self, done, total, current):
+        if total:
+            self.ingest_bar.setRange(0, total)
+            self.ingest_bar.setValue(done)
+        if current:
+            self.ingest_label.setText(get_text(
+                "ingest_progress", self._get_lang(),
+                done=done, total=total, current=Path(current).name
+            ))
+            self.ingest_label.setVisible(True)
+
+    def _on_ingest_finished(self, success, message):
+        self.ingest_btn.setEnabled(True)
+        self.ingest_bar.setVisible(False)
+        self.ingest_label.setText(message)
+        self.ingest_label.setStyleSheet(
+            "font-size: 10px; color: %s;" % ("#27ae60" if success else "#e74c3c")
+        )
+        self.ingest_label.setVisible(True)
+        if self.main_window:
+            self.main_window.statusBar().showMessage(message, 5000)
+
     def _save_to_history(self, folder_path):
         """Salva un percorso nella cronologia per ripristino."""
         history = self.settings.value("removed_volumes_history", [], type=list)
@@ -784,6 +858,8 @@ class ArchivioWidget(QWidget):
         self.restore_volume_btn.setText(t("restore_button"))
         self.restore_volume_btn.setToolTip(t("restore_tooltip"))
         self.refresh_volumes_btn.setToolTip(t("refresh_volumes_tooltip"))
+        self.ingest_btn.setText(t("ingest_button"))
+        self.ingest_btn.setToolTip(t("ingest_tooltip"))
         self._result_label.setText(t("export_result"))
         self.result_text.setPlaceholderText(t("result_placeholder_archive"))
         self._intro_box.setText(t("archive_purpose"))
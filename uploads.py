@@ -0,0 +1,212 @@
+"""
+Upload in streaming condiviso dai servizi locali.
+
+- Lettura a blocchi con hash calcolato durante la lettura (una sola passata)
+- Rifiuto immediato appena il file supera la dimensione massima
+- File grandi su disco, esposti ai reader come mmap (nessuna copia in RAM)
+"""
+
+import hashlib
+import mmap
+import tempfile
+from io import BytesIO
+from typing import Any, BinaryIO, Dict, Iterable, Optional, Union
+
+from content_store import new_hasher
+
+# Dimensione dei blocchi letti dall'upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Sotto questa soglia il contenuto resta in memoria, sopra va su file temporaneo
+SPOOL_MEMORY_LIMIT = 4 * 1024 * 1024
+
+# Margine per intestazioni multipart nel controllo del Content-Length
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Contenuto di un upload: bytes (file piccoli) o mmap (file grandi)
+UploadData = Union[bytes, mmap.mmap]
+
+
+class UploadTooLarge(Exception):
+    """Il file caricato supera la dimensione massima consentita."""
+
+    def __init__(self, size: int, max_bytes: int):
+        self.size = size
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"File troppo grande (oltre {size / (1024 * 1024):.1f}MB). "
+            f"Massimo: {max_bytes / (1024 * 1024):.0f}MB"
+        )
+
+
+class SpooledUpload:
+    """
+    Upload già ricevuto, con hash e dimensione.
+
+    Attributi:
+        filename: Nome del file inviato dal client
+        data: Contenuto (bytes o mmap, entrambi bytes-like)
+        digest: Hash esadecimale calcolato durante la ricezione
+            (BLAKE2b dell'archivio condiviso, salvo hash_name diverso)
+        size: Dimensione in byte
+
+    Uso:
+        with await spool_upload(file, max_bytes) as upload:
+            reader.read(upload.data, upload.filename, file_hash=upload.digest)
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        data: UploadData,
+        digest: str,
+        size: int,
+        tmp_file: Optional[BinaryIO] = None
+    ):
+        self.filename = filename
+        self.data = data
+        self.digest = digest
+        self.size = size
+        self._tmp_file = tmp_file
+
+    def to_bytes(self) -> bytes:
+        """Copia il contenuto in un oggetto bytes (per API che lo richiedono)."""
+        return self.data if isinstance(self.data, bytes) else bytes(self.data)
+
+    def close(self) -> None:
+        """Rilascia mmap e file temporaneo."""
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                # Un reader usa ancora il buffer: ci pensa il garbage collector
+                pass
+        if self._tmp_file is not None:
+            self._tmp_file.close()
+            self._tmp_file = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+async def spool_upload(
+    upload: Any,
+    max_bytes: int,
+    hash_name: Optional[str] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> SpooledUpload:
+    """
+    Riceve un UploadFile a blocchi calcolando l'hash in streaming.
+
+    Args:
+        upload: UploadFile di FastAPI/Starlette
+        max_bytes: Dimensione massima accettata
+        hash_name: Algoritmo hashlib da usare (None = digest di content_store)
+        chunk_size: Dimensione dei blocchi
+
+    Returns:
+        SpooledUpload con contenuto, hash e dimensione
+
+    Raises:
+        UploadTooLarge: Appena il file supera max_bytes
+    """
+    # Dimensione già nota (es. da Starlette): rifiuta senza leggere
+    known_size = getattr(upload, "size", None)
+    if isinstance(known_size, int) and known_size > max_bytes:
+        raise UploadTooLarge(known_size, max_bytes)
+
+    hasher = new_hasher() if hash_name is None else hashlib.new(hash_name)
+    buffer = BytesIO()
+    tmp_file: Optional[BinaryIO] = None
+    size = 0
+
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(size, max_bytes)
+
+            hasher.update(chunk)
+
+            if tmp_file is None and size > SPOOL_MEMORY_LIMIT:
+                # Troppo grande per la RAM: passa su file temporaneo
+                tmp_file = tempfile.TemporaryFile()
+                tmp_file.write(buffer.getbuffer())
+                buffer = BytesIO()
+
+            if tmp_file is not None:
+                tmp_file.write(chunk)
+            else:
+                buffer.write(chunk)
+    except BaseException:
+        if tmp_file is not None:
+            tmp_file.close()
+        raise
+
+    filename = getattr(upload, "filename", None) or "document"
+
+    if tmp_file is None:
+        return SpooledUpload(filename, buffer.getvalue(), hasher.hexdigest(), size)
+
+    tmp_file.flush()
+    data = mmap.mmap(tmp_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return SpooledUpload(filename, data, hasher.hexdigest(), size, tmp_file)
+
+
+def as_stream(data: Union[UploadData, bytearray, memoryview]) -> BinaryIO:
+    """
+    Restituisce un oggetto file-like sul contenuto senza copiarlo.
+
+    Un mmap è già file-like: viene solo riportato all'inizio.
+    """
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return data  # type: ignore[return-value]
+    return BytesIO(data)
+
+
+def create_upload_limit_middleware(
+    app,
+    max_bytes: int,
+    exclude_paths: Iterable[str] = (),
+    path_limits: Optional[Dict[str, int]] = None
+):
+    """
+    Middleware che rifiuta subito (413) le richieste con Content-Length
+    oltre il limite, prima che il corpo multipart venga ricevuto.
+
+    Gli endpoint con più file (es. /batch) hanno un limite proprio per
+    l'intera richiesta in path_limits: il controllo per singolo file di
+    spool_upload arriva solo dopo che il parser multipart ha ricevuto
+    tutto il corpo.
+
+    Uso:
+        create_upload_limit_middleware(
+            app, 50 * 1024 * 1024, path_limits={"/batch": 200 * 1024 * 1024}
+        )
+    """
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+
+    excluded = set(exclude_paths)
+    limits = dict(path_limits or {})
+
+    @app.middleware("http")
+    async def _check_upload_size(request: Request, call_next):
+        path = request.url.path
+        if request.method in ("POST", "PUT") and path not in excluded:
+            allowed = limits.get(path, max_bytes)
+            length = request.headers.get("content-length")
+            if length and length.isdigit() and int(length) > allowed + MULTIPART_OVERHEAD:
+                return JSONResponse(
+                    status_code=413,
+                    content={"detail": str(UploadTooLarge(int(length), allowed))}
+                )
+        return await call_next(request)